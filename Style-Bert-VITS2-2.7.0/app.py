@@ -13,6 +13,7 @@ from gradio_tabs.style_vectors import create_style_vectors_app
 from gradio_tabs.train import create_train_app
 from style_bert_vits2.constants import GRADIO_THEME, VERSION
 from style_bert_vits2.nlp.japanese import pyopenjtalk_worker
+from style_bert_vits2.nlp.japanese.g2p_store import G2P_STORE_FILENAME, open_g2p_store
 from style_bert_vits2.nlp.japanese.user_dict import update_dict
 from style_bert_vits2.tts_model import TTSModelHolder
 from style_bert_vits2.utils import torch_device_to_onnx_providers
@@ -21,6 +22,9 @@ from style_bert_vits2.utils import torch_device_to_onnx_providers
 # このプロセスからはワーカーを起動して辞書を使いたいので、ここで初期化
 pyopenjtalk_worker.initialize_worker()
 
+# g2p の結果を前処理・学習・推論で共有する永続キャッシュを開く
+open_g2p_store(get_path_config().assets_root / G2P_STORE_FILENAME)
+
 # dict_data/ 以下の辞書データを pyopenjtalk に適用
 update_dict()
 
@@ -0,0 +1,118 @@
+"""
+複数行のテキストの BERT 特徴量の抽出について、1 行ずつ抽出する場合と、まとめて抽出する場合 (extract_bert_feature_batch()) を比較するベンチマーク。
+line_split による改行ごとの合成や、エディターの複数行の合成を想定し、以下を計測する。
+
+- 1 行ずつ extract_bert_feature() / extract_bert_feature_onnx() を呼び出した場合の所要時間
+- extract_bert_feature_batch() / extract_bert_feature_batch_onnx() でまとめて抽出した場合の所要時間
+
+補助テキストを指定した場合、1 行ずつ抽出すると行ごとに補助テキストも推論されるが、まとめて抽出すると一度だけ推論される。
+ONNX 推論でテキストをパディングしてまとめて推論するには、現在の convert_bert_onnx.py で変換したモデル (バッチ全体の出力を返すもの) が必要。
+
+Usage (リポジトリのルートで実行する):
+    python -m benchmarks.bench_bert_batch --backend onnx --lines 20 --threads 4
+    python -m benchmarks.bench_bert_batch --backend torch --lines 20 --assist_text "とても嬉しい！"
+"""
+
+import argparse
+import time
+from typing import Any, Callable, Optional
+
+from style_bert_vits2.constants import Languages
+from style_bert_vits2.nlp import (
+    bert_models,
+    clean_text,
+    extract_bert_feature,
+    extract_bert_feature_batch,
+    extract_bert_feature_batch_onnx,
+    extract_bert_feature_onnx,
+    onnx_bert_models,
+)
+
+
+SAMPLE_TEXTS = [
+    "こんにちは、初めまして。",
+    "桜の樹の下には屍体が埋まっている！これは信じていいことなんだよ。",
+    "音声合成は、機械学習を活用して、テキストから人の声を再現する技術です。",
+    "はい、わかりました。",
+    "それは、静かな冬の朝のことでした。雪が街を真っ白に染め上げ、人々はまだ深い眠りの中にいました。",
+]
+
+CPU_PROVIDERS = [
+    ("CPUExecutionProvider", {"arena_extend_strategy": "kSameAsRequested"})
+]
+
+
+def measure(extract: Callable[[], Any], num_runs: int) -> float:
+    # ウォームアップ (モデルのロードや初回推論の初期化を計測から除外する)
+    extract()
+    start_time = time.perf_counter()
+    for _ in range(num_runs):
+        extract()
+    return (time.perf_counter() - start_time) / num_runs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=["onnx", "torch"], default="onnx")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--lines", type=int, default=20)
+    parser.add_argument("--assist_text", type=str, default=None)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    lines = [SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)] for i in range(args.lines)]
+    cleaned = [clean_text(line, Languages.JP) for line in lines]
+    texts = [norm_text for norm_text, _, _, _ in cleaned]
+    word2phs = [word2ph for _, _, _, word2ph in cleaned]
+    assist_text: Optional[str] = args.assist_text
+
+    if args.backend == "onnx":
+        onnx_bert_models.load_model(
+            Languages.JP,
+            onnx_providers=CPU_PROVIDERS,
+            intra_op_num_threads=args.threads,
+        )
+        onnx_bert_models.load_tokenizer(Languages.JP)
+        candidates: dict[str, Callable[[], Any]] = {
+            "per line": lambda: [
+                extract_bert_feature_onnx(
+                    text, word2ph, Languages.JP, CPU_PROVIDERS, assist_text
+                )
+                for text, word2ph in zip(texts, word2phs)
+            ],
+            "batch": lambda: extract_bert_feature_batch_onnx(
+                texts, word2phs, Languages.JP, CPU_PROVIDERS, assist_text
+            ),
+        }
+    else:
+        if args.threads > 0:
+            import torch
+
+            torch.set_num_threads(args.threads)
+        bert_models.load_model(Languages.JP, device_map=args.device)
+        bert_models.load_tokenizer(Languages.JP)
+        candidates = {
+            "per line": lambda: [
+                extract_bert_feature(
+                    text, word2ph, Languages.JP, args.device, assist_text
+                )
+                for text, word2ph in zip(texts, word2phs)
+            ],
+            "batch": lambda: extract_bert_feature_batch(
+                texts, word2phs, Languages.JP, args.device, assist_text
+            ),
+        }
+
+    print(
+        f"backend: {args.backend}, lines: {args.lines}, assist_text: {assist_text is not None}, "
+        f"threads: {args.threads or 'default'}, runs: {args.runs}"
+    )
+    print("method   | seconds/script | lines/s")
+    for name, extract in candidates.items():
+        elapsed = measure(extract, args.runs)
+        print(f"{name:8s} | {elapsed:14.3f} | {args.lines / elapsed:7.2f}")
+
+
+if __name__ == "__main__":
+    main()
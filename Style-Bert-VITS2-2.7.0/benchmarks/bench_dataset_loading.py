@@ -0,0 +1,56 @@
+"""
+学習データの読み込みについて、音声ファイルごとに複数のファイルを開く TextAudioSpeakerLoader と、
+pack_dataset.py でまとめたファイルを memmap して読み込む PackedTextAudioSpeakerLoader を比較するベンチマーク。
+事前に pack_dataset.py で学習データをまとめておく必要がある。
+
+Usage (リポジトリのルートで実行する):
+    python -m benchmarks.bench_dataset_loading --config Data/{model_name}/config.json --items 500
+"""
+
+import argparse
+import random
+import time
+
+import torch
+
+from data_utils import (
+    PackedTextAudioSpeakerLoader,
+    TextAudioSpeakerLoader,
+    is_packed_dataset_current,
+)
+from style_bert_vits2.models.hyper_parameters import HyperParameters
+
+
+def measure(dataset: torch.utils.data.Dataset, indices: list[int]) -> float:
+    start_time = time.perf_counter()
+    for index in indices:
+        dataset[index]
+    return time.perf_counter() - start_time
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config", type=str, required=True)
+    parser.add_argument("--items", type=int, default=500)
+    args = parser.parse_args()
+
+    hps = HyperParameters.load_from_json(args.config)
+    filelist_path = hps.data.training_files
+    if not is_packed_dataset_current(filelist_path, hps.data):
+        raise SystemExit("Run pack_dataset.py before this benchmark.")
+    datasets: dict[str, torch.utils.data.Dataset] = {
+        "per-file": TextAudioSpeakerLoader(filelist_path, hps.data),
+        "packed": PackedTextAudioSpeakerLoader(filelist_path, hps.data),
+    }
+    num_items = len(datasets["packed"])  # type: ignore
+    indices = random.Random(0).choices(range(num_items), k=args.items)
+
+    print(f"items: {args.items} (dataset: {num_items})")
+    print("loader   | seconds | items/s")
+    for name, dataset in datasets.items():
+        elapsed = measure(dataset, indices)
+        print(f"{name:8s} | {elapsed:7.2f} | {args.items / elapsed:7.0f}")
+
+
+if __name__ == "__main__":
+    main()
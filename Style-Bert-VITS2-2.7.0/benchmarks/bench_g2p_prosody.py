@@ -0,0 +1,84 @@
+"""
+g2p でのフルコンテキストラベルの解析について、特徴量ごとに正規表現で検索する従来の方法と、
+ラベルごとに一度の走査で全ての特徴量を取り出す方法 (__parse_fullcontext_labels()) を比較するベンチマーク。
+参考として、OpenJTalk によるフルコンテキストラベルの生成 (extract_fullcontext()) の所要時間も表示する。
+
+Usage (リポジトリのルートで実行する):
+    python -m benchmarks.bench_g2p_prosody --repeat 20
+"""
+
+import argparse
+import re
+import time
+from typing import Any, Callable
+
+from style_bert_vits2.nlp.japanese import g2p
+from style_bert_vits2.nlp.japanese import pyopenjtalk_worker as pyopenjtalk
+from style_bert_vits2.nlp.japanese.normalizer import normalize_text
+
+
+SAMPLE_TEXTS = [
+    "こんにちは、初めまして。あなたの名前はなんていうの？",
+    "桜の樹の下には屍体が埋まっている！これは信じていいことなんだよ。",
+    "音声合成は、機械学習を活用して、テキストから人の声を再現する技術です。この技術は、言語の構造を解析し、それに基づいて音声を生成します。",
+    "それは、静かな冬の朝のことでした。雪が街を真っ白に染め上げ、人々はまだ深い眠りの中にいました。",
+]
+
+# 従来の実装で使われていた、特徴量ごとのパターン (P3, A1, A2, A3, E3, F1)
+PATTERNS = [
+    re.compile(r"\-(.*?)\+"),
+    re.compile(r"/A:([0-9\-]+)\+"),
+    re.compile(r"\+(\d+)\+"),
+    re.compile(r"\+(\d+)/"),
+    re.compile(r"!(\d+)_"),
+    re.compile(r"/F:(\d+)_"),
+]
+
+
+def parse_by_regex(labels: list[str]) -> list[list[Any]]:
+    features = []
+    for n, label in enumerate(labels):
+        matches = [pattern.search(label) for pattern in PATTERNS]
+        # 従来の実装では、次のラベルの A2 も検索していた
+        if n + 1 < len(labels):
+            matches.append(PATTERNS[2].search(labels[n + 1]))
+        values: list[Any] = [matches[0].group(1)]  # type: ignore
+        values += [-50 if m is None else int(m.group(1)) for m in matches[1:]]
+        features.append(values)
+    return features
+
+
+def measure(func: Callable[[], Any], repeat: int) -> float:
+    func()
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start_time) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    texts = [normalize_text(text) for text in SAMPLE_TEXTS]
+    labels_list = [pyopenjtalk.extract_fullcontext(text) for text in texts]
+    num_labels = sum(len(labels) for labels in labels_list)
+    parse = getattr(g2p, "__parse_fullcontext_labels")
+
+    candidates: dict[str, Callable[[], Any]] = {
+        "extract_fullcontext": lambda: [
+            pyopenjtalk.extract_fullcontext(text) for text in texts
+        ],
+        "regex per feature": lambda: [parse_by_regex(labels) for labels in labels_list],
+        "single pass": lambda: [parse(labels) for labels in labels_list],
+    }
+    print(f"texts: {len(texts)}, labels: {num_labels}, repeat: {args.repeat}")
+    print("method              | ms/texts | us/label")
+    for name, func in candidates.items():
+        elapsed = measure(func, args.repeat)
+        print(f"{name:19s} | {elapsed * 1000:8.3f} | {elapsed / num_labels * 1e6:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
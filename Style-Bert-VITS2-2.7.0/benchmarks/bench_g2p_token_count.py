@@ -0,0 +1,94 @@
+"""
+g2p での単語ごとの BERT のトークン数の計算について、単語ごとに tokenize() する従来の方法と、
+キャッシュを使う __count_tokens() (初回の呼び出しとキャッシュ済みの呼び出し) を比較するベンチマーク。
+Fast トークナイザーの場合の、キャッシュにない単語をまとめてトークナイズする経路も --fast で計測できる。
+
+Usage (リポジトリのルートで実行する):
+    python -m benchmarks.bench_g2p_token_count --words 5000 --repeat 5 [--fast]
+"""
+
+import argparse
+import random
+import time
+from typing import Any, Callable
+
+from style_bert_vits2.constants import Languages
+from style_bert_vits2.nlp import bert_models
+from style_bert_vits2.nlp.japanese import g2p
+
+
+# 単語を組み立てる文字 (漢字・ひらがな・カタカナ・英数字)
+CHARS = (
+    "今日明日私音声合成機械学習天気桜猫技術言語構造東京学校先生"
+    "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん"
+    "アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワヲンー"
+    "ABCabc0123"
+)
+
+
+def make_words(num_words: int, vocab_size: int, seed: int = 0) -> list[str]:
+    # 実際の文と同じく、少数の語彙が繰り返し現れる単語列を作る
+    rng = random.Random(seed)
+    vocab = [
+        "".join(rng.choices(CHARS, k=rng.randint(1, 6))) for _ in range(vocab_size)
+    ]
+    return rng.choices(vocab, k=num_words)
+
+
+def measure(func: Callable[[], Any], repeat: int) -> float:
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start_time) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--words", type=int, default=5000)
+    parser.add_argument("--vocab", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="tokenizer.json から構築した Fast トークナイザーを使う",
+    )
+    args = parser.parse_args()
+
+    if args.fast:
+        from transformers import PreTrainedTokenizerFast
+
+        tokenizer_file = (
+            bert_models.DEFAULT_BERT_MODEL_PATHS[Languages.JP] / "tokenizer.json"
+        )
+        tokenizer: Any = PreTrainedTokenizerFast(tokenizer_file=str(tokenizer_file))
+        bert_models.load_tokenizer = lambda *args, **kwargs: tokenizer  # type: ignore
+    else:
+        tokenizer = bert_models.load_tokenizer(Languages.JP)
+    count_tokens = getattr(g2p, "__count_tokens")
+    words = make_words(args.words, args.vocab)
+
+    def cold() -> list[int]:
+        # 別のトークナイザーが使われたと見なさせ、キャッシュを破棄する
+        setattr(g2p, "__token_count_cache_tokenizer", None)
+        return count_tokens(words)
+
+    expected = [len(tokenizer.tokenize(word)) for word in words]
+    assert cold() == expected
+
+    candidates: dict[str, Callable[[], Any]] = {
+        "tokenize per word": lambda: [len(tokenizer.tokenize(w)) for w in words],
+        "count_tokens (cold)": cold,
+        "count_tokens (warm)": lambda: count_tokens(words),
+    }
+    print(
+        f"tokenizer: {type(tokenizer).__name__}, words: {len(words)}, "
+        f"vocab: {args.vocab}, repeat: {args.repeat}"
+    )
+    print("method              |       ms | us/word")
+    for name, func in candidates.items():
+        elapsed = measure(func, args.repeat)
+        print(f"{name:19s} | {elapsed * 1000:8.2f} | {elapsed / len(words) * 1e6:7.2f}")
+
+
+if __name__ == "__main__":
+    main()
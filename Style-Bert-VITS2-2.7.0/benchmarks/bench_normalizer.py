@@ -0,0 +1,61 @@
+"""
+日本語のテキストの正規化 (normalize_text()) について、高速パスの有無による所要時間を比較するベンチマーク。
+かなと漢字と句読点のみからなるテキストは高速パスで処理され、数字や通貨記号等を含むテキストは全ての正規化が順に行われる。
+
+- full: 高速パスの判定を行わず、全ての正規化を順に行った場合の所要時間
+- fast path: normalize_text() の所要時間
+
+Usage (リポジトリのルートで実行する):
+    python -m benchmarks.bench_normalizer --lines 10000
+"""
+
+import argparse
+import time
+from typing import Callable
+
+from style_bert_vits2.nlp.japanese import normalizer
+from style_bert_vits2.nlp.japanese.normalizer import normalize_text
+
+
+# LLM の出力を想定した、かなと漢字と句読点のみからなるテキスト
+PLAIN_TEXTS = [
+    "こんにちは、初めまして。あなたの名前はなんていうの？",
+    "桜の樹の下には屍体が埋まっている！これは信じていいことなんだよ。",
+    "あなたがいなくなって、私は一人になっちゃって、泣いちゃいそうなほど悲しい。",
+    "音声合成は、機械学習を活用して、テキストから人の声を再現する技術です。",
+    "「それは、静かな冬の朝のことでした。」と彼女は言った〜",
+]
+# 数字や通貨記号等を含むテキスト
+COMPLEX_TEXTS = [
+    "今日の最高気温は25.5度、降水確率は30%です。",
+    "このケーキは1,280円、あちらは$12.99です・・・高いですね。",
+]
+
+
+def measure(func: Callable[[str], str], texts: list[str]) -> float:
+    start_time = time.perf_counter()
+    for text in texts:
+        func(text)
+    return time.perf_counter() - start_time
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=10000)
+    args = parser.parse_args()
+
+    full = getattr(normalizer, "__normalize_text_full")
+    print("texts   | method    | seconds | lines/s")
+    for name, samples in [("plain", PLAIN_TEXTS), ("complex", COMPLEX_TEXTS)]:
+        texts = [samples[i % len(samples)] for i in range(args.lines)]
+        for method, func in [("full", full), ("fast path", normalize_text)]:
+            # ウォームアップ
+            measure(func, texts[:100])
+            elapsed = measure(func, texts)
+            print(
+                f"{name:7s} | {method:9s} | {elapsed:7.3f} | {args.lines / elapsed:9.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+ONNX 版音声合成モデルの推論について、infer_onnx() と OnnxSynthesisEngine を比較するベンチマーク。
+CPU 推論で以下を計測する。
+
+- RTF (Real Time Factor: 合成にかかった時間 / 生成された音声の長さ)
+- 1 回の推論あたりの Python 側のメモリ確保 (tracemalloc によるピーク使用量と確保回数)
+
+BERT 特徴量の抽出も含めた、1 リクエストあたりの合成全体を計測する。
+
+Usage (リポジトリのルートで実行する):
+    python -m benchmarks.bench_onnx_engine --model_dir model_assets/koharune-ami --threads 4
+"""
+
+import argparse
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable
+
+import onnxruntime
+from numpy.typing import NDArray
+
+from style_bert_vits2.constants import DEFAULT_STYLE, Languages
+from style_bert_vits2.models.infer_onnx import OnnxSynthesisEngine, infer_onnx
+from style_bert_vits2.nlp import onnx_bert_models
+from style_bert_vits2.tts_model import TTSModel
+
+
+SAMPLE_TEXTS = [
+    "こんにちは、初めまして。",
+    "桜の樹の下には屍体が埋まっている！これは信じていいことなんだよ。",
+    "音声合成は、機械学習を活用して、テキストから人の声を再現する技術です。この技術は、言語の構造を解析し、それに基づいて音声を生成します。",
+]
+
+CPU_PROVIDERS = [
+    ("CPUExecutionProvider", {"arena_extend_strategy": "kSameAsRequested"})
+]
+
+
+def measure(
+    synthesize: Callable[[str], NDArray[Any]],
+    texts: list[str],
+    sampling_rate: int,
+    num_runs: int,
+) -> tuple[float, int, int]:
+    # ウォームアップ (セッションの初期化やバッファの確保を計測から除外する)
+    for text in texts:
+        synthesize(text)
+
+    # tracemalloc は実行を遅くするため、時間とメモリ確保は別々に計測する
+    elapsed = 0.0
+    audio_seconds = 0.0
+    for _ in range(num_runs):
+        for text in texts:
+            start_time = time.perf_counter()
+            audio = synthesize(text)
+            elapsed += time.perf_counter() - start_time
+            audio_seconds += len(audio) / sampling_rate
+
+    peak_bytes = 0
+    num_allocations = 0
+    for _ in range(num_runs):
+        for text in texts:
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+            synthesize(text)
+            after = tracemalloc.take_snapshot()
+            peak_bytes = max(peak_bytes, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            num_allocations += sum(
+                max(0, stat.count_diff) for stat in after.compare_to(before, "lineno")
+            )
+
+    num_calls = num_runs * len(texts)
+    return elapsed / audio_seconds, peak_bytes, num_allocations // num_calls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_dir", type=Path, required=True)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    model_path = next(args.model_dir.glob("*.onnx"))
+    model = TTSModel(
+        model_path=model_path,
+        config_path=args.model_dir / "config.json",
+        style_vec_path=args.model_dir / "style_vectors.npy",
+        onnx_providers=CPU_PROVIDERS,
+        onnx_intra_op_num_threads=args.threads,
+    )
+    model.load()
+    assert model.onnx_session is not None
+    onnx_bert_models.load_model(
+        Languages.JP, onnx_providers=CPU_PROVIDERS, intra_op_num_threads=args.threads
+    )
+    onnx_bert_models.load_tokenizer(Languages.JP)
+
+    hps = model.hyper_parameters
+    style_vec = model.get_style_vector(model.style2id[DEFAULT_STYLE])
+    params: dict[str, Any] = dict(
+        style_vec=style_vec,
+        sdp_ratio=0.2,
+        noise_scale=0.6,
+        noise_scale_w=0.8,
+        length_scale=1.0,
+        sid=0,
+        language=Languages.JP,
+    )
+
+    # 比較を公平にするため、どちらも同じ推論セッションを使う
+    session: onnxruntime.InferenceSession = model.onnx_session
+    engine = OnnxSynthesisEngine(session, CPU_PROVIDERS, hps)
+    candidates: dict[str, Callable[[str], NDArray[Any]]] = {
+        "infer_onnx": lambda text: infer_onnx(
+            text=text,
+            hps=hps,
+            onnx_session=session,
+            onnx_providers=CPU_PROVIDERS,
+            **params,
+        ),
+        "OnnxSynthesisEngine": lambda text: engine.infer(text=text, **params),
+    }
+
+    print(f"threads: {args.threads or 'default'}, runs: {args.runs}")
+    print("method              |   RTF | peak MiB | allocations/call")
+    for name, synthesize in candidates.items():
+        rtf, peak_bytes, allocations = measure(
+            synthesize, SAMPLE_TEXTS, hps.data.sampling_rate, args.runs
+        )
+        print(
+            f"{name:19s} | {rtf:.3f} | {peak_bytes / 1024**2:8.2f} | {allocations:16d}"
+        )
+
+
+if __name__ == "__main__":
+    main()
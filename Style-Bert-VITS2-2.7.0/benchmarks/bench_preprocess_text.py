@@ -0,0 +1,110 @@
+"""
+書き起こしファイルの前処理 (preprocess_text.preprocess()) について、プロセス数ごとの所要時間と速度向上率を測るベンチマーク。
+プロセス数が 1 の場合は従来通り 1 行ずつ処理し、2 以上の場合は行を複数のプロセスで並列に処理する。
+
+g2p の永続キャッシュに結果が残っていると OpenJTalk の処理が省略されるため、試行ごとに異なるテキストを使う。
+--corpus を指定しない場合は、語句を乱数で組み合わせたテキストを生成する。
+
+Usage (リポジトリのルートで実行する):
+    python -m benchmarks.bench_preprocess_text --lines 2000 --processes 1 2 4 8
+"""
+
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from preprocess_text import initialize_frontend, preprocess
+
+
+# ランダムなテキストを構成する語句
+WORDS = [
+    "今日", "明日", "私", "あなた", "彼女", "先生", "学校", "東京", "音声合成", "機械学習",
+    "天気", "桜", "猫", "コーヒー", "テキスト", "技術", "言語", "構造", "モデル", "声",
+    "は", "が", "を", "に", "で", "と", "の", "から", "まで", "も", "って", "けど",
+    "行く", "行きました", "食べる", "食べたい", "見て", "聞いた", "話しましょう", "できる",
+    "思う", "しています", "生成します", "再現する", "解析し", "綺麗だ", "嬉しい", "悲しかった",
+    "とても", "少し", "本当に", "もっと", "すぐに", "ゆっくり", "えっ", "ああ", "ふーん", "うーん",
+    "、", "。", "！", "？",
+]  # fmt: skip
+
+
+def random_texts(rng: random.Random, num_lines: int) -> list[str]:
+    return [
+        "".join(rng.choice(WORDS) for _ in range(rng.randint(5, 40)))
+        for _ in range(num_lines)
+    ]
+
+
+def run(work_dir: Path, texts: list[str], num_processes: int) -> float:
+    wavs_dir = work_dir / "wavs"
+    wavs_dir.mkdir(parents=True, exist_ok=True)
+    transcription_path = work_dir / "esd.list"
+    with transcription_path.open("w", encoding="utf-8") as f:
+        for i, text in enumerate(texts):
+            # preprocess() は音声ファイルの存在を確認するため、空のファイルを作っておく
+            wav_path = wavs_dir / f"{i}.wav"
+            wav_path.touch()
+            f.write(f"{wav_path}|speaker|JP|{text}\n")
+    config_path = work_dir / "config.json"
+    config_path.write_text(json.dumps({"data": {}}), encoding="utf-8")
+
+    start_time = time.perf_counter()
+    preprocess(
+        transcription_path=transcription_path,
+        cleaned_path=None,
+        train_path=work_dir / "train.list",
+        val_path=work_dir / "val.list",
+        config_path=config_path,
+        val_per_lang=0,
+        max_val_total=0,
+        use_jp_extra=True,
+        yomi_error="skip",
+        correct_path=False,
+        num_processes=num_processes,
+    )
+    return time.perf_counter() - start_time
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=2000)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument(
+        "--corpus",
+        type=Path,
+        default=None,
+        help="1 行に 1 文のテキストファイル (試行ごとに異なる行を使う)",
+    )
+    args = parser.parse_args()
+
+    initialize_frontend()
+    if args.corpus is not None:
+        corpus = args.corpus.read_text(encoding="utf-8").splitlines()
+        corpus = [line for line in corpus if line.strip() != ""]
+        args.lines = min(args.lines, len(corpus) // len(args.processes))
+    rng = random.Random(0)
+
+    rows = []
+    for trial, num_processes in enumerate(args.processes):
+        if args.corpus is not None:
+            texts = corpus[trial * args.lines : (trial + 1) * args.lines]
+        else:
+            texts = random_texts(rng, args.lines)
+        with tempfile.TemporaryDirectory() as work_dir:
+            elapsed = run(Path(work_dir), texts, num_processes)
+        rows.append((num_processes, elapsed))
+
+    base = rows[0][1]
+    print(f"lines: {args.lines}")
+    print("processes | seconds | lines/s | speed-up")
+    for num_processes, elapsed in rows:
+        print(
+            f"{num_processes:9d} | {elapsed:7.2f} | {args.lines / elapsed:7.0f} | {base / elapsed:7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
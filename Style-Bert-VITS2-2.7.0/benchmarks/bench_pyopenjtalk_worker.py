@@ -0,0 +1,62 @@
+"""
+pyopenjtalk ワーカープールに対する並列 g2p のスループットを計測するベンチマーク。
+ワーカー数ごとに、複数スレッドから同時に g2p() を呼び出した際の 1 秒あたりの処理数を表示する。
+
+Usage (リポジトリのルートで実行する):
+    python -m benchmarks.bench_pyopenjtalk_worker --workers 1 2 4 --threads 8
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from style_bert_vits2.nlp.japanese import pyopenjtalk_worker
+from style_bert_vits2.nlp.japanese.g2p import g2p
+from style_bert_vits2.nlp.japanese.normalizer import normalize_text
+
+
+SAMPLE_TEXTS = [
+    "こんにちは、初めまして。あなたの名前はなんていうの？",
+    "桜の樹の下には屍体が埋まっている！これは信じていいことなんだよ。",
+    "あなたがいなくなって、私は一人になっちゃって、泣いちゃいそうなほど悲しい。",
+    "音声合成は、機械学習を活用して、テキストから人の声を再現する技術です。この技術は、言語の構造を解析し、それに基づいて音声を生成します。",
+    "今日の天気は晴れ時々曇り、最高気温は二十五度の見込みです。",
+    "えっ、本当に？それならもっと早く教えてくれればよかったのに……。",
+]
+
+
+def run(num_workers: int, num_threads: int, num_calls: int) -> float:
+    pyopenjtalk_worker.initialize_worker(num_workers=num_workers)
+    try:
+        texts = [
+            normalize_text(SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)])
+            for i in range(num_calls)
+        ]
+        with ThreadPoolExecutor(num_threads) as executor:
+            # ウォームアップ (各スレッドの接続確立を計測から除外する)
+            list(executor.map(g2p, texts[: num_threads * 2]))
+            start_time = time.perf_counter()
+            list(executor.map(g2p, texts))
+            elapsed = time.perf_counter() - start_time
+    finally:
+        pyopenjtalk_worker.terminate_worker()
+
+    return num_calls / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--calls", type=int, default=400)
+    args = parser.parse_args()
+
+    print(f"threads: {args.threads}, calls: {args.calls}")
+    print("workers | g2p calls/s")
+    for num_workers in args.workers:
+        throughput = run(num_workers, args.threads, args.calls)
+        print(f"{num_workers:7d} | {throughput:11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+safetensors モデルの読み込み方法を比較するベンチマーク。
+同じモデルを複数のワーカープロセスで CPU に読み込み、推論用に weight norm を畳み込んだ状態で以下を表示する。
+
+- 1 プロセスあたりの読み込み時のピーク RSS
+- 1 ワーカーあたりの RSS (共有ページを含む) と PSS (共有ページをプロセス数で按分する。実際の物理メモリ使用量に近い)
+- 全ワーカーの PSS の合計
+
+読み込み方法は以下の 3 つ。
+
+- copy: 従来通り重みをコピーして読み込み、プロセス内で畳み込む
+- mmap: ファイルをメモリマップして読み込み、プロセス内で畳み込む (畳み込んだ decoder / WN の重みはプロセス固有になる)
+- mmap-folded: 畳み込んだ重みを保存したファイルをメモリマップする (TTSModel の既定)
+
+PSS の取得には Linux が必要。
+
+Usage (リポジトリのルートで実行する):
+    python -m benchmarks.bench_safetensors_mmap --model_dir model_assets/jvnv-F1-jp --workers 4
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+from multiprocessing.synchronize import Event
+from pathlib import Path
+from typing import Any
+
+import psutil
+
+
+# 読み込み方法の名前 -> (use_mmap, folded)
+METHODS: dict[str, tuple[bool, bool]] = {
+    "copy": (False, False),
+    "mmap": (True, False),
+    "mmap-folded": (True, True),
+}
+
+
+def worker(
+    model_dir: Path,
+    method: str,
+    results: "multiprocessing.Queue[dict[str, Any]]",
+    done: Event,
+) -> None:
+    from style_bert_vits2.models.hyper_parameters import HyperParameters
+    from style_bert_vits2.models.infer import fold_weight_norm, get_net_g
+
+    model_path = next(model_dir.glob("*.safetensors"))
+    hps = HyperParameters.load_from_json(model_dir / "config.json")
+
+    use_mmap, folded = METHODS[method]
+    rss_before = psutil.Process().memory_info().rss
+    start_time = time.perf_counter()
+    net_g = get_net_g(
+        str(model_path),
+        hps.version,
+        "cpu",
+        hps,
+        for_inference=True,
+        use_mmap=use_mmap,
+        folded=folded,
+    )
+    if not folded:
+        fold_weight_norm(net_g)
+    load_time = time.perf_counter() - start_time
+    results.put(
+        {
+            "load_time": load_time,
+            # Linux では ru_maxrss の単位は KiB
+            "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            "rss_before": rss_before,
+        }
+    )
+    # 親プロセスが全ワーカーのメモリを計測し終わるまで、モデルを保持したまま待つ
+    done.wait()
+    del net_g
+
+
+def run(model_dir: Path, method: str, num_workers: int) -> dict[str, float]:
+    context = multiprocessing.get_context("spawn")
+    results: "multiprocessing.Queue[dict[str, Any]]" = context.Queue()
+    done = context.Event()
+    processes = [
+        context.Process(target=worker, args=(model_dir, method, results, done))
+        for _ in range(num_workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        worker_results = [results.get() for _ in range(num_workers)]
+        total_rss = 0
+        total_pss = 0
+        for process in processes:
+            memory_info = psutil.Process(process.pid).memory_full_info()
+            total_rss += memory_info.rss
+            total_pss += memory_info.pss
+    finally:
+        done.set()
+        for process in processes:
+            process.join()
+
+    mib = 1024**2
+    return {
+        "load_time": max(result["load_time"] for result in worker_results),
+        "peak_rss": max(result["peak_rss"] for result in worker_results) / mib,
+        "load_rss": max(
+            result["peak_rss"] - result["rss_before"] for result in worker_results
+        )
+        / mib,
+        "worker_rss": total_rss / num_workers / mib,
+        "worker_pss": total_pss / num_workers / mib,
+        "total_pss": total_pss / mib,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_dir", type=Path, required=True)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"workers: {args.workers}")
+    # 畳み込んだ重みのファイルを作る時間を読み込み時間に含めないよう、先に作っておく
+    run(args.model_dir, "mmap-folded", 1)
+    print(
+        "method      | load (s) | peak RSS (MiB) | load peak (MiB) | RSS/worker (MiB) | PSS/worker (MiB) | total PSS (MiB)"
+    )
+    for method in METHODS:
+        result = run(args.model_dir, method, args.workers)
+        print(
+            f"{method:11s} | {result['load_time']:8.2f} | {result['peak_rss']:14.1f} | "
+            f"{result['load_rss']:15.1f} | {result['worker_rss']:16.1f} | {result['worker_pss']:16.1f} | {result['total_pss']:15.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+server_fastapi.py の起動時間と初回リクエストのレイテンシを計測するベンチマーク。
+サーバーをサブプロセスとして起動し、以下を計測する。
+
+- 起動から /health が応答するまでの時間 (リッスン開始まで)
+- 起動から /ready が 200 を返すまでの時間 (バックグラウンド初期化の完了まで)
+- 1 回目と 2 回目の /voice のレイテンシ
+
+Usage (リポジトリのルートで実行する):
+    python -m benchmarks.bench_server_startup --model_name jvnv-F1-jp --text こんにちは
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Optional
+
+from config import get_config
+
+
+def get_status(url: str) -> Optional[int]:
+    try:
+        with urllib.request.urlopen(url, timeout=2) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def wait_for(url: str, expected_status: int, timeout: float) -> float:
+    start_time = time.perf_counter()
+    while time.perf_counter() - start_time < timeout:
+        if get_status(url) == expected_status:
+            return time.perf_counter()
+        time.sleep(0.05)
+    raise TimeoutError(f"{url} did not return {expected_status} in {timeout}s")
+
+
+def request_voice(base_url: str, model_name: str, text: str) -> float:
+    query = urllib.parse.urlencode({"text": text, "model_name": model_name})
+    request = urllib.request.Request(f"{base_url}/voice?{query}", method="POST")
+    start_time = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=300) as response:
+        response.read()
+    return time.perf_counter() - start_time
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_name", type=str, required=True)
+    parser.add_argument("--text", type=str, default="今日はいい天気ですね。")
+    parser.add_argument("--cpu", action="store_true")
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{get_config().server_config.port}"
+    command = [sys.executable, "server_fastapi.py"]
+    if args.cpu:
+        command.append("--cpu")
+
+    start_time = time.perf_counter()
+    process = subprocess.Popen(command)
+    try:
+        health_time = wait_for(f"{base_url}/health", 200, args.timeout)
+        ready_time = wait_for(f"{base_url}/ready", 200, args.timeout)
+        first_latency = request_voice(base_url, args.model_name, args.text)
+        second_latency = request_voice(base_url, args.model_name, args.text)
+        with urllib.request.urlopen(f"{base_url}/ready", timeout=2) as response:
+            timings = json.loads(response.read())["timings"]
+    finally:
+        process.terminate()
+        process.wait()
+
+    print(f"startup to /health : {health_time - start_time:.2f}s")
+    print(f"startup to /ready  : {ready_time - start_time:.2f}s")
+    print(f"first /voice       : {first_latency:.2f}s")
+    print(f"second /voice      : {second_latency:.2f}s")
+    print(f"initialization steps: {timings}")
+
+
+if __name__ == "__main__":
+    main()
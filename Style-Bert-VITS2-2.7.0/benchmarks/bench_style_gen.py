@@ -0,0 +1,86 @@
+"""
+スタイルベクトルの抽出について、音声ファイルごとに埋め込みモデルで推論する従来の方法 (get_style_vector()) と、
+長さ順に並べ、fbank 特徴量のフレーム数が等しい音声ファイルをバッチにまとめて推論する方法 (get_style_vectors_batch()) を比較するベンチマーク。
+バッチにまとめた場合のスタイルベクトルと従来の方法によるスタイルベクトルの差の絶対値の最大値とコサイン類似度の最小値も表示し、
+差が --tolerance を超えた場合は終了コード 1 で終了する。
+
+Usage (リポジトリのルートで実行する):
+    python -m benchmarks.bench_style_gen --wav_dir Data/{model_name}/wavs --files 500 --batch_sizes 1 8 16 32
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from style_gen import (
+    BATCH_DEVIATION_TOLERANCE,
+    get_style_vector,
+    get_style_vectors_batch,
+    load_fbank,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--wav_dir", type=Path, required=True)
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 8, 16, 32])
+    parser.add_argument("--tolerance", type=float, default=BATCH_DEVIATION_TOLERANCE)
+    args = parser.parse_args()
+
+    wav_paths = sorted(str(path) for path in args.wav_dir.rglob("*.wav"))
+    wav_paths = wav_paths[: args.files]
+    wav_paths.sort(key=lambda path: Path(path).stat().st_size)
+
+    start_time = time.perf_counter()
+    references = [get_style_vector(path) for path in wav_paths]
+    base = time.perf_counter() - start_time
+
+    print(f"files: {len(wav_paths)}")
+    print(
+        "method      | seconds | files/s | speed-up | batches | max abs dev | min cos sim"
+    )
+    print(
+        f"per-file    | {base:7.2f} | {len(wav_paths) / base:7.1f} | {1:7.2f}x | {len(wav_paths):7d} | {0:11.2e} | {1:11.6f}"
+    )
+    max_deviation = 0.0
+    for batch_size in args.batch_sizes:
+        start_time = time.perf_counter()
+        style_vecs = []
+        num_batches = 0
+        group = []
+        for path in wav_paths + [None]:
+            fbank = load_fbank(path) if path is not None else None
+            # generate_style_vectors() と同じく、フレーム数が等しい連続した音声ファイルをまとめる
+            if group and (
+                fbank is None
+                or fbank.shape != group[0].shape
+                or len(group) >= batch_size
+            ):
+                style_vecs += get_style_vectors_batch(group)
+                num_batches += 1
+                group = []
+            if fbank is not None:
+                group.append(fbank)
+        elapsed = time.perf_counter() - start_time
+        deviation = max(
+            float(np.abs(a - b).max()) for a, b in zip(style_vecs, references)
+        )
+        similarity = min(
+            float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+            for a, b in zip(style_vecs, references)
+        )
+        max_deviation = max(max_deviation, deviation)
+        print(
+            f"batch {batch_size:5d} | {elapsed:7.2f} | {len(wav_paths) / elapsed:7.1f} | {base / elapsed:7.2f}x | {num_batches:7d} | {deviation:11.2e} | {similarity:11.6f}"
+        )
+    if max_deviation > args.tolerance:
+        print(f"max abs deviation {max_deviation:.2e} exceeds {args.tolerance:.2e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+server_fastapi.py の合成ワーカー数 (--synthesis_workers) ごとのスループットを計測する負荷試験。
+ワーカー数ごとにサーバーをサブプロセスとして起動し、複数のクライアントから同時に /voice を呼び出して以下を表示する。
+
+- 1 秒あたりに完了したリクエスト数
+- レイテンシの中央値と 95 パーセンタイル
+
+ワーカー数 0 は、サーバーのプロセス内で合成する従来の動作を表す。
+キューの上限で拒否されないよう、config.yml の server.max_queue_size は同時接続数以上にしておく。
+
+Usage (リポジトリのルートで実行する):
+    python -m benchmarks.bench_synthesis_workers --model_name jvnv-F1-jp --workers 0 1 2 4 --concurrency 8
+"""
+
+import argparse
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.bench_server_startup import request_voice, wait_for
+from config import get_config
+
+
+SAMPLE_TEXTS = [
+    "こんにちは、初めまして。",
+    "桜の樹の下には屍体が埋まっている！これは信じていいことなんだよ。",
+    "音声合成は、機械学習を活用して、テキストから人の声を再現する技術です。",
+]
+
+
+def run_load(
+    base_url: str, model_name: str, concurrency: int, duration: float
+) -> tuple[int, list[float], float]:
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(index: int) -> None:
+        nonlocal errors
+        count = index
+        while time.perf_counter() < deadline:
+            text = SAMPLE_TEXTS[count % len(SAMPLE_TEXTS)]
+            count += 1
+            try:
+                latency = request_voice(base_url, model_name, text)
+            except OSError:
+                with lock:
+                    errors += 1
+                continue
+            with lock:
+                latencies.append(latency)
+
+    start_time = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors, latencies, time.perf_counter() - start_time
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_name", type=str, required=True)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--cpu", action="store_true")
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{get_config().server_config.port}"
+    results = []
+    for num_workers in args.workers:
+        command = [
+            sys.executable,
+            "server_fastapi.py",
+            "--synthesis_workers",
+            str(num_workers),
+        ]
+        if args.cpu:
+            command.append("--cpu")
+        process = subprocess.Popen(command)
+        try:
+            wait_for(f"{base_url}/ready", 200, args.timeout)
+            # 各ワーカーでモデルをロードさせるため、計測前に同時接続数分のリクエストを流しておく
+            run_load(base_url, args.model_name, args.concurrency, 1)
+            errors, latencies, elapsed = run_load(
+                base_url, args.model_name, args.concurrency, args.duration
+            )
+        finally:
+            process.terminate()
+            process.wait()
+        results.append((num_workers, errors, latencies, elapsed))
+
+    print(f"concurrency: {args.concurrency}, duration: {args.duration}s")
+    print("workers | requests | errors | req/s | p50 (s) | p95 (s)")
+    for num_workers, errors, latencies, elapsed in results:
+        p50, p95 = np.percentile(latencies, [50, 95]) if latencies else (0.0, 0.0)
+        print(
+            f"{num_workers:7d} | {len(latencies):8d} | {errors:6d} | {len(latencies) / elapsed:5.2f} | {p50:7.2f} | {p95:7.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+PyTorch 版音声合成モデルの推論向け最適化 (TTSModel の optimize_for_inference / use_bf16) の効果を計測するベンチマーク。
+モードごとに別プロセスでモデルをロードし、以下を表示する。
+
+- モデルのロード時間
+- ロードによって増えた常駐メモリ (RSS)
+- 1 発話あたりの推論時間 (BERT 特徴量の抽出を含む)
+
+Usage (リポジトリのルートで実行する):
+    python -m benchmarks.bench_torch_inference --model_dir model_assets/jvnv-F1-jp --device cpu
+"""
+
+import argparse
+import multiprocessing
+import time
+from pathlib import Path
+from typing import Any
+
+
+SAMPLE_TEXTS = [
+    "こんにちは、初めまして。",
+    "桜の樹の下には屍体が埋まっている！これは信じていいことなんだよ。",
+    "音声合成は、機械学習を活用して、テキストから人の声を再現する技術です。この技術は、言語の構造を解析し、それに基づいて音声を生成します。",
+]
+
+MODES = {
+    "baseline": dict(optimize_for_inference=False, use_bf16=False),
+    "optimized": dict(optimize_for_inference=True, use_bf16=False),
+    "optimized+bf16": dict(optimize_for_inference=True, use_bf16=True),
+}
+
+
+def run(model_dir: Path, device: str, mode: str, num_runs: int) -> dict[str, Any]:
+    import psutil
+
+    from style_bert_vits2.constants import Languages
+    from style_bert_vits2.nlp import bert_models
+    from style_bert_vits2.tts_model import TTSModel
+
+    # BERT モデルは計測対象外なので、先にロードしておく
+    bert_models.load_model(Languages.JP, device_map=device)
+    bert_models.load_tokenizer(Languages.JP)
+
+    process = psutil.Process()
+    model = TTSModel(
+        model_path=next(model_dir.glob("*.safetensors")),
+        config_path=model_dir / "config.json",
+        style_vec_path=model_dir / "style_vectors.npy",
+        device=device,
+        **MODES[mode],
+    )
+    rss_before = process.memory_info().rss
+    start_time = time.perf_counter()
+    model.load()
+    load_time = time.perf_counter() - start_time
+    rss_after = process.memory_info().rss
+
+    # ウォームアップ
+    model.infer(SAMPLE_TEXTS[0])
+    latencies = []
+    for _ in range(num_runs):
+        for text in SAMPLE_TEXTS:
+            start_time = time.perf_counter()
+            model.infer(text)
+            latencies.append(time.perf_counter() - start_time)
+
+    return {
+        "load_time": load_time,
+        "rss_mib": (rss_after - rss_before) / 1024**2,
+        "latency": sum(latencies) / len(latencies),
+    }
+
+
+def run_in_subprocess(
+    model_dir: Path, device: str, mode: str, num_runs: int
+) -> dict[str, Any]:
+    # 常駐メモリを正しく計測するため、モードごとに新しいプロセスで実行する
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(run, (model_dir, device, mode, num_runs))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_dir", type=Path, required=True)
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    args = parser.parse_args()
+
+    print(f"device: {args.device}, runs: {args.runs}")
+    print("mode           | load (s) | RSS (MiB) | latency (s)")
+    for mode in args.modes:
+        result = run_in_subprocess(args.model_dir, args.device, mode, args.runs)
+        print(
+            f"{mode:14s} | {result['load_time']:8.2f} | {result['rss_mib']:9.1f} | {result['latency']:11.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
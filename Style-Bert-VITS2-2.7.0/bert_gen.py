@@ -1,17 +1,24 @@
 import argparse
-from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
 
 import torch
-import torch.multiprocessing as mp
 from tqdm import tqdm
 
 from config import get_config
+from feature_store import (
+    BERT_FEATURE_DIM,
+    FeatureStore,
+    get_bert_store_path,
+    get_digest,
+)
 from style_bert_vits2.constants import Languages
 from style_bert_vits2.logging import logger
 from style_bert_vits2.models import commons
 from style_bert_vits2.models.hyper_parameters import HyperParameters
-from style_bert_vits2.nlp import cleaned_text_to_sequence, extract_bert_feature
+from style_bert_vits2.nlp import cleaned_text_to_sequence, extract_bert_feature_batch
 from style_bert_vits2.nlp.japanese import pyopenjtalk_worker
+from style_bert_vits2.nlp.japanese.g2p_store import G2P_STORE_FILENAME, open_g2p_store
 from style_bert_vits2.nlp.japanese.user_dict import update_dict
 from style_bert_vits2.utils.stdout_wrapper import SAFE_STDOUT
 
@@ -20,47 +27,117 @@ config = get_config()
 # このプロセスからはワーカーを起動して辞書を使いたいので、ここで初期化
 pyopenjtalk_worker.initialize_worker()
 
+# g2p の結果を前処理・学習・推論で共有する永続キャッシュを開く
+open_g2p_store(config.assets_root / G2P_STORE_FILENAME)
+
 # dict_data/ 以下の辞書データを pyopenjtalk に適用
 update_dict()
 
 
-def process_line(x: tuple[str, bool]):
-    line, add_blank = x
-    device = config.bert_gen_config.device
-    if config.bert_gen_config.use_multi_device:
-        rank = mp.current_process()._identity
-        rank = rank[0] if len(rank) > 0 else 0
-        if torch.cuda.is_available():
-            gpu_id = rank % torch.cuda.device_count()
-            device = f"cuda:{gpu_id}"
-        else:
-            device = "cpu"
+def parse_line(
+    line: str, add_blank: bool
+) -> tuple[str, str, Languages, list[int], int]:
+    """
+    書き起こしファイルの 1 行から、BERT の特徴量の計算に必要な値を取り出す。
+
+    Returns:
+        tuple[str, str, Languages, list[int], int]: 音声ファイルのパス、テキスト、言語、(add_blank を反映した) word2ph、音素数
+    """
+
     wav_path, _, language_str, text, phones, tone, word2ph = line.strip().split("|")
     phone = phones.split(" ")
     tone = [int(i) for i in tone.split(" ")]
     word2ph = [int(i) for i in word2ph.split(" ")]
-    word2ph = [i for i in word2ph]
     phone, tone, language = cleaned_text_to_sequence(
         phone, tone, Languages[language_str]
     )
 
     if add_blank:
         phone = commons.intersperse(phone, 0)
-        tone = commons.intersperse(tone, 0)
-        language = commons.intersperse(language, 0)
         for i in range(len(word2ph)):
             word2ph[i] = word2ph[i] * 2
         word2ph[0] += 1
 
-    bert_path = wav_path.replace(".WAV", ".wav").replace(".wav", ".bert.pt")
+    return wav_path, text, Languages[language_str], word2ph, len(phone)
+
+
+def load_legacy_bert(wav_path: str, num_phones: int) -> Optional[torch.Tensor]:
+    """
+    以前のバージョンで音声ファイルごとに保存された .bert.pt があれば読み込む (再計算せずにストアへ移すため)。
+    """
 
+    bert_path = Path(wav_path.replace(".WAV", ".wav").replace(".wav", ".bert.pt"))
+    if not bert_path.exists():
+        return None
     try:
         bert = torch.load(bert_path)
-        assert bert.shape[-1] == len(phone)
     except Exception:
-        bert = extract_bert_feature(text, word2ph, Languages(language_str), device)
-        assert bert.shape[-1] == len(phone)
-        torch.save(bert, bert_path)
+        return None
+    if bert.shape != (BERT_FEATURE_DIM, num_phones):
+        return None
+    return bert
+
+
+def generate_bert_features(
+    lines: list[str],
+    store: FeatureStore,
+    add_blank: bool,
+    device: str,
+    batch_size: int,
+) -> int:
+    """
+    書き起こしファイルの各行の BERT の特徴量を計算してストアに追記する。
+    計算済みの特徴量はスキップし、残りはテキストの長さ順に並べてバッチごとにまとめて推論する。
+    バッチごとにストアに書き込むため、中断しても次回は続きから計算される。
+
+    Args:
+        lines (list[str]): 書き起こしファイルの行のリスト
+        store (FeatureStore): 書き込み可能な特徴量のストア
+        add_blank (bool): 音素の間に空白を挿入するかどうか
+        device (str): 推論に利用するデバイス
+        batch_size (int): 一度に推論する行数
+
+    Returns:
+        int: 新たに計算した特徴量の数
+    """
+
+    pending: list[tuple[str, str, Languages, list[int], int, str]] = []
+    for line in lines:
+        if line.strip() == "":
+            continue
+        wav_path, text, language, word2ph, num_phones = parse_line(line, add_blank)
+        digest = get_digest(text, language.value, word2ph, num_phones)
+        if store.is_current(wav_path, digest):
+            continue
+        bert = load_legacy_bert(wav_path, num_phones)
+        if bert is not None:
+            store.append(wav_path, bert.T.numpy(), digest)
+            continue
+        pending.append((wav_path, text, language, word2ph, num_phones, digest))
+    store.flush()
+
+    # パディングが少なくなるよう、言語ごとにテキストの長さ順に並べてからバッチにまとめる
+    pending.sort(key=lambda x: len(x[1]))
+    batches: list[list[tuple[str, str, Languages, list[int], int, str]]] = []
+    for language in dict.fromkeys(item[2] for item in pending):
+        items = [item for item in pending if item[2] == language]
+        batches += [items[i : i + batch_size] for i in range(0, len(items), batch_size)]
+    with tqdm(total=len(pending), file=SAFE_STDOUT, dynamic_ncols=True) as pbar:
+        for batch in batches:
+            berts = extract_bert_feature_batch(
+                [item[1] for item in batch],
+                [item[3] for item in batch],
+                batch[0][2],
+                device,
+                max_batch_size=batch_size,
+            )
+            for (wav_path, _, _, _, num_phones, digest), bert in zip(batch, berts):
+                assert bert.shape[-1] == num_phones
+                store.append(wav_path, bert.T.float().numpy(), digest)
+            store.flush()
+            pbar.update(len(batch))
+
+    return len(pending)
 
 
 preprocess_text_config = config.preprocess_text_config
@@ -70,28 +147,38 @@ if __name__ == "__main__":
     parser.add_argument(
         "-c", "--config", type=str, default=config.bert_gen_config.config_path
     )
+    parser.add_argument(
+        "--batch_size", type=int, default=config.bert_gen_config.batch_size
+    )
     args, _ = parser.parse_known_args()
     config_path = args.config
     hps = HyperParameters.load_from_json(config_path)
-    lines: list[str] = []
-    with open(hps.data.training_files, encoding="utf-8") as f:
-        lines.extend(f.readlines())
-
-    with open(hps.data.validation_files, encoding="utf-8") as f:
-        lines.extend(f.readlines())
-    add_blank = [hps.data.add_blank] * len(lines)
-
-    if len(lines) != 0:
-        # pyopenjtalkの別ワーカー化により、並列処理でエラーがでる模様なので、一旦シングルスレッド強制にする
-        num_processes = 1
-        with ThreadPoolExecutor(max_workers=num_processes) as executor:
-            _ = list(
-                tqdm(
-                    executor.map(process_line, zip(lines, add_blank)),
-                    total=len(lines),
-                    file=SAFE_STDOUT,
-                    dynamic_ncols=True,
-                )
+    device = config.bert_gen_config.device
+    if device.startswith("cuda") and not torch.cuda.is_available():
+        device = "cpu"
+
+    total = 0
+    for filelist_path in (hps.data.training_files, hps.data.validation_files):
+        with open(filelist_path, encoding="utf-8") as f:
+            lines = f.readlines()
+        store = FeatureStore(
+            get_bert_store_path(filelist_path), dim=BERT_FEATURE_DIM, writable=True
+        )
+        try:
+            generated = generate_bert_features(
+                lines,
+                store,
+                hps.data.add_blank,
+                device,
+                args.batch_size,
             )
-
-    logger.info(f"bert.pt is generated! total: {len(lines)} bert.pt files.")
+            # 書き起こしファイルから削除された音声ファイルの特徴量と、置き換えられた古い特徴量の領域を取り除く
+            store.compact(line.split("|")[0] for line in lines if line.strip() != "")
+        finally:
+            store.close()
+        logger.info(
+            f"{filelist_path}: {generated} BERT features generated, {len(store)} in {store.path}"
+        )
+        total += len(store)
+
+    logger.info(f"BERT features are generated! total: {total} features.")
@@ -4,7 +4,7 @@
 
 import shutil
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 
 import torch
 import yaml
@@ -54,6 +54,7 @@ class Preprocess_text_config:
         val_per_lang: int = 5,
         max_val_total: int = 10000,
         clean: bool = True,
+        num_processes: int = 1,
     ):
         self.transcription_path = Path(transcription_path)
         self.train_path = Path(train_path)
@@ -68,6 +69,7 @@ class Preprocess_text_config:
         self.val_per_lang = val_per_lang
         self.max_val_total = max_val_total
         self.clean = clean
+        self.num_processes = num_processes
 
     @classmethod
     def from_dict(cls, dataset_path: Path, data: dict[str, Any]):
@@ -94,6 +96,7 @@ class Bert_gen_config:
         num_processes: int = 1,
         device: str = "cuda",
         use_multi_device: bool = False,
+        batch_size: int = 16,
     ):
         self.config_path = Path(config_path)
         self.num_processes = num_processes
@@ -101,6 +104,7 @@ class Bert_gen_config:
             device = "cpu"
         self.device = device
         self.use_multi_device = use_multi_device
+        self.batch_size = batch_size  # 一度に BERT で推論する行数
 
     @classmethod
     def from_dict(cls, dataset_path: Path, data: dict[str, Any]):
@@ -117,12 +121,17 @@ class Style_gen_config:
         config_path: str,
         num_processes: int = 4,
         device: str = "cuda",
+        batch_size: int = 16,
+        save_npy: bool = True,
     ):
         self.config_path = Path(config_path)
         self.num_processes = num_processes
         if not cuda_available:
             device = "cpu"
         self.device = device
+        # 一度に埋め込みモデルで推論する音声ファイルの数 (fbank 特徴量のフレーム数が等しいものだけをまとめる)
+        self.batch_size = batch_size
+        self.save_npy = save_npy  # 音声ファイルごとの .npy も保存するかどうか
 
     @classmethod
     def from_dict(cls, dataset_path: Path, data: dict[str, Any]):
@@ -200,6 +209,22 @@ class Server_config:
         limit: int = 100,
         language: str = "JP",
         origins: list[str] = ["*"],
+        pyopenjtalk_workers: int = 1,
+        inference_workers: int = 2,
+        max_batch_size: int = 4,
+        batch_window_ms: int = 20,
+        max_queue_size: int = 32,
+        request_timeout: float = 60.0,
+        memory_budget_mb: int = -1,
+        pinned_models: list[str] = [],
+        preload_models: list[str] = [],
+        warmup: bool = True,
+        onnx_intra_op_threads: int = 0,
+        onnx_inter_op_threads: int = 0,
+        use_quantized_onnx: Optional[bool] = None,
+        use_bf16: bool = False,
+        synthesis_workers: int = 0,
+        synthesis_worker_threads: int = 0,
     ):
         self.port: int = port
         if not cuda_available:
@@ -208,6 +233,35 @@ class Server_config:
         self.language: str = language
         self.limit: int = limit
         self.origins: list[str] = origins
+        # pyopenjtalk ワーカープロセス数
+        self.pyopenjtalk_workers: int = pyopenjtalk_workers
+        # 音声合成を実行するスレッド数
+        self.inference_workers: int = inference_workers
+        # 1 つのバッチにまとめるリクエストの最大数と、まとめるリクエストを待つ時間 (ミリ秒)
+        self.max_batch_size: int = max_batch_size
+        self.batch_window_ms: int = batch_window_ms
+        # 待機できるリクエストの最大数 (超えると 503)
+        self.max_queue_size: int = max_queue_size
+        # リクエストの制限時間 (秒)
+        self.request_timeout: float = request_timeout
+        # 常駐させるモデルの合計サイズの上限 (MB)
+        self.memory_budget_mb: int = memory_budget_mb
+        # アンロードしないモデル名と、起動時にロードするモデル名
+        self.pinned_models: list[str] = pinned_models
+        self.preload_models: list[str] = preload_models
+        # 起動時にウォームアップ合成を行うかどうか
+        self.warmup: bool = warmup
+        # ONNX 推論のスレッド数 (0 のときは ONNX Runtime の既定値)
+        self.onnx_intra_op_threads: int = onnx_intra_op_threads
+        self.onnx_inter_op_threads: int = onnx_inter_op_threads
+        # INT8 量子化した ONNX モデルを使うかどうか (None のときは CPU 推論時のみ使う)
+        self.use_quantized_onnx: Optional[bool] = use_quantized_onnx
+        # PyTorch の CPU 推論で bfloat16 を使うかどうか (CPU が対応している場合のみ有効)
+        self.use_bf16: bool = use_bf16
+        # 音声合成を行うワーカープロセス数 (0 のときはサーバーのプロセス内で合成する)
+        self.synthesis_workers: int = synthesis_workers
+        # 合成ワーカーあたりの PyTorch のスレッド数 (0 のときは CPU コア数 / ワーカー数)
+        self.synthesis_worker_threads: int = synthesis_worker_threads
 
     @classmethod
     def from_dict(cls, data: dict[str, Any]):
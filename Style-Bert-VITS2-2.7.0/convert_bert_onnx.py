@@ -1,4 +1,5 @@
 # Usage: .venv/bin/python convert_bert_onnx.py --language JP
+#        .venv/bin/python convert_bert_onnx.py --language JP --quantize (Also generate INT8 model for CPU inference)
 
 # https://github.com/tuna2134/sbv2-api/blob/main/scripts/convert/convert_deberta.py を参考に実装した
 #
@@ -234,6 +235,11 @@ if __name__ == "__main__":
         default=Languages.JP,
         help="Language of the BERT model to be converted",
     )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="Also generate INT8 quantized model for CPU inference (see quantize_onnx.py)",
+    )
     args = parser.parse_args()
 
     # モデルの入出力先ファイルパスを取得
@@ -285,7 +291,9 @@ if __name__ == "__main__":
                 "attention_mask": attention_mask,
             }
             res = self.model(**inputs, output_hidden_states=True)
-            res = torch.cat(res["hidden_states"][-3:-2], -1)[0].cpu()
+            # 複数のテキストをまとめて推論できるよう、バッチ全体の出力を返す
+            ## 以前はバッチの先頭の出力のみを返していた (extract_bert_feature_batch_onnx() は両方に対応している)
+            res = torch.cat(res["hidden_states"][-3:-2], -1).cpu()
             return res
 
     # 再度 Fast Tokenizer でロード
@@ -319,6 +327,7 @@ if __name__ == "__main__":
             "input_ids": {0: "batch_size", 1: "sequence_length"},
             "token_type_ids": {0: "batch_size", 1: "sequence_length"},
             "attention_mask": {0: "batch_size", 1: "sequence_length"},
+            "output": {0: "batch_size", 1: "sequence_length"},
         },
     )
     print(
@@ -387,6 +396,23 @@ if __name__ == "__main__":
         color = "green" if is_valid else "red"
         print(f"[bold {color}]{message}[/bold {color}]")
 
+        # CPU 推論向けに INT8 量子化したモデルを生成
+        ## FP16 モデルは量子化できないため、FP32 モデルから量子化する
+        if args.quantize:
+            from style_bert_vits2.models.quantize_onnx import quantize_bert_onnx
+            from style_bert_vits2.utils import get_quantized_onnx_model_path
+
+            print(Rule(characters="=", style=Style(color="blue")))
+            print("[bold cyan]Quantizing to INT8...[/bold cyan]")
+            print(Rule(characters="=", style=Style(color="blue")))
+            report = quantize_bert_onnx(
+                onnx_fp32_model_path,
+                get_quantized_onnx_model_path(onnx_fp32_model_path),
+                language,
+            )
+            color = "green" if report.passed else "red"
+            print(f"[bold {color}]{report}[/bold {color}]")
+
     # サイズ情報の表示
     print(Rule(characters="=", style=Style(color="blue")))
     print("[bold cyan]Model size information:[/bold cyan]")
@@ -1,5 +1,6 @@
 # Usage: .venv/bin/python convert_onnx.py --model model_assets/koharune-ami/koharune-ami.safetensors
 #        .venv/bin/python convert_onnx.py --model model_assets/ (All models in the directory will be converted)
+#        .venv/bin/python convert_onnx.py --model model_assets/ --quantize (Also generate INT8 models for CPU inference)
 
 # https://github.com/tuna2134/sbv2-api/blob/main/scripts/convert/convert_model.py を参考に実装した
 #
@@ -103,6 +104,11 @@ if __name__ == "__main__":
         action="store_true",
         help="Already converted models will be overwritten",
     )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="Also generate INT8 quantized ONNX model for CPU inference (see quantize_onnx.py)",
+    )
     parser.add_argument(
         "--aivm",
         action="store_true",
@@ -410,6 +416,25 @@ if __name__ == "__main__":
             model_info.print_simplifying_info(onnx_model, simplified_onnx_model)
             print(Rule(characters="=", style=Style(color="blue")))
 
+            # CPU 推論向けに INT8 量子化したモデルを生成
+            if args.quantize:
+                from style_bert_vits2.models.quantize_onnx import (
+                    quantize_synthesizer_onnx,
+                )
+                from style_bert_vits2.utils import get_quantized_onnx_model_path
+
+                print("[bold cyan]Quantizing ONNX model...[/bold cyan]")
+                print(Rule(characters="=", style=Style(color="blue")))
+                report = quantize_synthesizer_onnx(
+                    onnx_optimized_model_path,
+                    get_quantized_onnx_model_path(onnx_optimized_model_path),
+                    tts_model.hyper_parameters,
+                    style_vector,
+                )
+                color = "green" if report.passed else "red"
+                print(f"[bold {color}]{report}[/bold {color}]")
+                print(Rule(characters="=", style=Style(color="blue")))
+
         # AIVM/AIVMX ファイルを生成
         if args.aivm or args.aivmx:
             try:
@@ -1,13 +1,27 @@
+import hashlib
+import json
 import os
 import random
+import shutil
 import sys
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, Optional, Union
 
 import numpy as np
 import torch
 import torch.utils.data
+from numpy.typing import NDArray
 from tqdm import tqdm
 
 from config import get_config
+from feature_store import (
+    INDEX_FILENAME,
+    get_bert_store_path,
+    get_style_store_path,
+    open_bert_store,
+    open_style_store,
+)
 from mel_processing import mel_spectrogram_torch, spectrogram_torch
 from style_bert_vits2.logging import logger
 from style_bert_vits2.models import commons
@@ -47,6 +61,11 @@ class TextAudioSpeakerLoader(torch.utils.data.Dataset):
 
         self.cleaned_text = getattr(hparams, "cleaned_text", False)
 
+        # bert_gen.py で生成した BERT の特徴量のストア (ない場合は音声ファイルごとの .bert.pt を読み込む)
+        self.bert_store = open_bert_store(audiopaths_sid_text)
+        # style_gen.py で生成したスタイルベクトルのストア (ない場合は音声ファイルごとの .npy を読み込む)
+        self.style_store = open_style_store(audiopaths_sid_text)
+
         self.add_blank = hparams.add_blank
         self.min_text_len = getattr(hparams, "min_text_len", 1)
         self.max_text_len = getattr(hparams, "max_text_len", 384)
@@ -100,7 +119,7 @@ class TextAudioSpeakerLoader(torch.utils.data.Dataset):
 
         spec, wav = self.get_audio(audiopath)
         sid = torch.LongTensor([int(self.spk_map[sid])])
-        style_vec = torch.FloatTensor(np.load(f"{audiopath}.npy"))
+        style_vec = self.get_style_vec(audiopath)
         if self.use_jp_extra:
             return (phones, spec, wav, sid, tone, language, ja_bert, style_vec)
         else:
@@ -166,9 +185,14 @@ class TextAudioSpeakerLoader(torch.utils.data.Dataset):
             for i in range(len(word2ph)):
                 word2ph[i] = word2ph[i] * 2
             word2ph[0] += 1
-        bert_path = wav_path.replace(".wav", ".bert.pt")
         try:
-            bert_ori = torch.load(bert_path)
+            if self.bert_store is not None and wav_path in self.bert_store:
+                bert_ori = torch.from_numpy(
+                    np.array(self.bert_store.get(wav_path), dtype=np.float32).T
+                )
+            else:
+                bert_path = wav_path.replace(".wav", ".bert.pt")
+                bert_ori = torch.load(bert_path)
             assert bert_ori.shape[-1] == len(phone)
         except Exception as e:
             logger.warning("Bert load Failed")
@@ -191,6 +215,11 @@ class TextAudioSpeakerLoader(torch.utils.data.Dataset):
         language = torch.LongTensor(language)
         return bert, ja_bert, en_bert, phone, tone, language
 
+    def get_style_vec(self, audiopath):
+        if self.style_store is not None and audiopath in self.style_store:
+            return torch.FloatTensor(np.array(self.style_store.get(audiopath)[0]))
+        return torch.FloatTensor(np.load(f"{audiopath}.npy"))
+
     def get_sid(self, sid):
         sid = torch.LongTensor([int(sid)])
         return sid
@@ -202,6 +231,325 @@ class TextAudioSpeakerLoader(torch.utils.data.Dataset):
         return len(self.audiopaths_sid_text)
 
 
+# 学習データをまとめた形式のバージョン (形式を変更した場合に増やし、古いファイルを使わないようにする)
+PACKED_DATASET_VERSION = 2
+
+# 学習データをまとめたファイルのインデックスの列
+PACKED_INDEX_COLUMNS = [
+    "audio_offset",
+    "audio_length",
+    "spec_offset",
+    "spec_length",
+    "text_offset",
+    "text_length",
+    "sid",
+    "bert_language",
+    "bucket_length",
+]
+
+# BERT の特徴量の言語 (インデックスの bert_language 列の値)
+PACKED_BERT_LANGUAGES = ["ZH", "JP", "EN"]
+
+
+def get_packed_dataset_path(filelist_path: Union[str, Path]) -> Path:
+    """
+    書き起こしファイル (train.list / val.list) に対応する、学習データをまとめたファイルの保存先を返す。
+    """
+
+    return Path(filelist_path).with_suffix(".packed")
+
+
+def _get_file_digest(path: Path) -> Optional[str]:
+    if not path.is_file():
+        return None
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def _get_wavs_digest(filelist_path: Union[str, Path]) -> str:
+    # 音声ファイルを差し替えた場合もまとめ直す必要があるため、各音声ファイルのサイズと更新日時を記録する
+    hasher = hashlib.sha256()
+    with open(filelist_path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip() == "":
+                continue
+            wav_path = line.split("|")[0]
+            try:
+                stat = os.stat(wav_path)
+                hasher.update(
+                    f"{wav_path}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8")
+                )
+            except OSError:
+                hasher.update(f"{wav_path}:missing\n".encode("utf-8"))
+    return hasher.hexdigest()[:16]
+
+
+def _get_packed_meta(
+    filelist_path: Union[str, Path], hparams: HyperParametersData
+) -> dict[str, Any]:
+    # 書き起こしファイルの内容や音声ファイル、BERT の特徴量・スタイルベクトル、スペクトログラムの設定が変わった場合は、まとめ直す必要がある
+    ## 特徴量のストアは追記・書き直しのたびにインデックスが書き換わるため、インデックスのハッシュで変更を検知する
+    use_mel_spec_posterior = getattr(hparams, "use_mel_posterior_encoder", False)
+    return {
+        "version": PACKED_DATASET_VERSION,
+        "filelist_digest": _get_file_digest(Path(filelist_path)),
+        "wavs_digest": _get_wavs_digest(filelist_path),
+        "bert_store_digest": _get_file_digest(
+            get_bert_store_path(filelist_path) / INDEX_FILENAME
+        ),
+        "style_store_digest": _get_file_digest(
+            get_style_store_path(filelist_path) / INDEX_FILENAME
+        ),
+        "max_wav_value": hparams.max_wav_value,
+        "sampling_rate": hparams.sampling_rate,
+        "filter_length": hparams.filter_length,
+        "hop_length": hparams.hop_length,
+        "win_length": hparams.win_length,
+        "add_blank": hparams.add_blank,
+        "use_mel_posterior_encoder": use_mel_spec_posterior,
+        "n_mel_channels": (
+            getattr(hparams, "n_mel_channels", 80) if use_mel_spec_posterior else None
+        ),
+        "spk2id": dict(hparams.spk2id),
+    }
+
+
+def _open_packed_array(
+    path: Path, dtype: Any, tail_shape: tuple[int, ...]
+) -> NDArray[Any]:
+    row_size = int(np.prod(tail_shape)) * np.dtype(dtype).itemsize
+    num_rows = path.stat().st_size // row_size
+    if num_rows == 0:
+        # 空のファイルは memmap できない
+        return np.zeros((0, *tail_shape), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(num_rows, *tail_shape))
+
+
+def pack_dataset(filelist_path: Union[str, Path], hparams: HyperParametersData) -> Path:
+    """
+    書き起こしファイルの学習データ (音声、スペクトログラム、BERT の特徴量、スタイルベクトル、音素・アクセント・言語の ID) を、
+    数個のファイルにまとめて保存する。PackedTextAudioSpeakerLoader はこれを memmap して読み込む。
+    各データは TextAudioSpeakerLoader と同じ方法で読み込むため、学習に使われる値は (float16 への変換による誤差を除き) 変わらない。
+
+    Args:
+        filelist_path (Union[str, Path]): 書き起こしファイルのパス
+        hparams (HyperParametersData): 学習データのハイパーパラメータ
+
+    Returns:
+        Path: 保存先のディレクトリのパス
+    """
+
+    meta = _get_packed_meta(filelist_path, hparams)
+    dataset = TextAudioSpeakerLoader(str(filelist_path), hparams)
+    out_path = get_packed_dataset_path(filelist_path)
+    # 途中で中断された場合に不完全なファイルが使われないよう、一時ディレクトリに書き込んでから置き換える
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+
+    index = np.zeros((len(dataset), len(PACKED_INDEX_COLUMNS)), dtype=np.int64)
+    audio_offset = spec_offset = text_offset = 0
+    with ExitStack() as stack:
+        files = {
+            name: stack.enter_context((tmp_path / f"{name}.bin").open("wb"))
+            for name in ("audio", "spec", "bert", "text", "style")
+        }
+        for i, (audiopath, sid, language_str, text, phones, tone, word2ph) in enumerate(
+            tqdm(dataset.audiopaths_sid_text, file=sys.stdout, dynamic_ncols=True)
+        ):
+            # get_text() は word2ph を書き換えるため、コピーを渡す
+            bert, ja_bert, en_bert, phone, tone, language = dataset.get_text(
+                text, list(word2ph), phones, tone, language_str, audiopath
+            )
+            bert_language = PACKED_BERT_LANGUAGES.index(language_str)
+            bert_ori = (bert, ja_bert, en_bert)[bert_language]
+            spec, wav = dataset.get_audio(audiopath)
+            audio = wav[0].numpy() * hparams.max_wav_value
+            if (
+                not np.array_equal(audio, np.round(audio))
+                or audio.min(initial=0) < -32768
+                or audio.max(initial=0) > 32767
+            ):
+                raise ValueError(f"{audiopath} is not a 16-bit PCM wav file")
+            style_vec = dataset.get_style_vec(audiopath).numpy()
+
+            files["audio"].write(audio.astype(np.int16).tobytes())
+            files["spec"].write(spec.T.numpy().astype(np.float16).tobytes())
+            files["bert"].write(bert_ori.T.float().numpy().astype(np.float16).tobytes())
+            files["text"].write(
+                np.stack([phone.numpy(), tone.numpy(), language.numpy()], axis=1)
+                .astype(np.int16)
+                .tobytes()
+            )
+            files["style"].write(style_vec.reshape(-1).tobytes())
+            index[i] = [
+                audio_offset,
+                audio.shape[0],
+                spec_offset,
+                spec.size(1),
+                text_offset,
+                phone.size(0),
+                int(dataset.spk_map[sid]),
+                bert_language,
+                dataset.lengths[i],
+            ]
+            audio_offset += audio.shape[0]
+            spec_offset += spec.size(1)
+            text_offset += phone.size(0)
+
+    np.save(tmp_path / "index.npy", index)
+    meta["spec_channels"] = (
+        meta["n_mel_channels"]
+        if meta["use_mel_posterior_encoder"]
+        else hparams.filter_length // 2 + 1
+    )
+    meta["num_items"] = len(dataset)
+    (tmp_path / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+    shutil.rmtree(out_path, ignore_errors=True)
+    tmp_path.rename(out_path)
+    logger.info(f"Packed {len(dataset)} items into {out_path}")
+    return out_path
+
+
+def is_packed_dataset_current(
+    filelist_path: Union[str, Path], hparams: HyperParametersData
+) -> bool:
+    """
+    書き起こしファイルの学習データがまとめられていて、書き起こしファイル・音声ファイル・特徴量のストアや設定が
+    まとめた時から変わっていないかどうかを返す。
+    """
+
+    meta_path = get_packed_dataset_path(filelist_path) / "meta.json"
+    if not meta_path.exists():
+        return False
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    meta.pop("spec_channels", None)
+    meta.pop("num_items", None)
+    return meta == _get_packed_meta(filelist_path, hparams)
+
+
+class PackedTextAudioSpeakerLoader(torch.utils.data.Dataset):
+    """
+    pack_dataset() でまとめた学習データを読み込む TextAudioSpeakerLoader。
+    ファイルは各ワーカーで memmap して読み込むため、複数のワーカーで同じページを共有でき、1 件ごとにファイルを開く必要もない。
+    音素・アクセント・言語の ID は空白の挿入まで済ませてあるため、読み込み時のテキストの処理も不要になる。
+    """
+
+    def __init__(self, audiopaths_sid_text: str, hparams: HyperParametersData):
+        self.path = get_packed_dataset_path(audiopaths_sid_text)
+        meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        self.max_wav_value = hparams.max_wav_value
+        self.use_jp_extra = getattr(hparams, "use_jp_extra", False)
+        self.spec_channels = meta["spec_channels"]
+        # TextAudioSpeakerLoader でシャッフルした後の順にまとめてあるため、ここではシャッフルしない
+        self.index = np.load(self.path / "index.npy")
+        self.lengths = self.index[
+            :, PACKED_INDEX_COLUMNS.index("bucket_length")
+        ].tolist()
+        self.__arrays: Optional[dict[str, NDArray[Any]]] = None
+        logger.info(f"Using packed dataset: {self.path} ({len(self.index)} items)")
+
+    def __getstate__(self) -> dict[str, Any]:
+        # DataLoader のワーカーに渡す際に memmap の内容がコピーされないよう、ワーカーで開き直す
+        state = self.__dict__.copy()
+        state["_PackedTextAudioSpeakerLoader__arrays"] = None
+        return state
+
+    def __open_arrays(self) -> dict[str, NDArray[Any]]:
+        if self.__arrays is None:
+            self.__arrays = {
+                "audio": _open_packed_array(self.path / "audio.bin", np.int16, ()),
+                "spec": _open_packed_array(
+                    self.path / "spec.bin", np.float16, (self.spec_channels,)
+                ),
+                "bert": _open_packed_array(self.path / "bert.bin", np.float16, (1024,)),
+                "text": _open_packed_array(self.path / "text.bin", np.int16, (3,)),
+                "style": _open_packed_array(
+                    self.path / "style.bin", np.float32, (256,)
+                ),
+            }
+        return self.__arrays
+
+    def __getitem__(self, index):
+        arrays = self.__open_arrays()
+        (
+            audio_offset,
+            audio_length,
+            spec_offset,
+            spec_length,
+            text_offset,
+            text_length,
+            sid,
+            bert_language,
+            _,
+        ) = self.index[index].tolist()
+
+        text = arrays["text"][text_offset : text_offset + text_length].astype(np.int64)
+        phones = torch.from_numpy(text[:, 0])
+        tone = torch.from_numpy(text[:, 1])
+        language = torch.from_numpy(text[:, 2])
+        spec = torch.from_numpy(
+            arrays["spec"][spec_offset : spec_offset + spec_length].T.astype(np.float32)
+        )
+        wav = (
+            torch.from_numpy(
+                arrays["audio"][audio_offset : audio_offset + audio_length].astype(
+                    np.float32
+                )
+            )
+            / self.max_wav_value
+        ).unsqueeze(0)
+        sid = torch.LongTensor([sid])
+        style_vec = torch.from_numpy(np.array(arrays["style"][index]))
+
+        bert_ori = torch.from_numpy(
+            arrays["bert"][text_offset : text_offset + text_length].T.astype(np.float32)
+        )
+        berts = [torch.zeros(1024, text_length) for _ in PACKED_BERT_LANGUAGES]
+        berts[bert_language] = bert_ori
+        bert, ja_bert, en_bert = berts
+        if self.use_jp_extra:
+            return (phones, spec, wav, sid, tone, language, ja_bert, style_vec)
+        else:
+            return (
+                phones,
+                spec,
+                wav,
+                sid,
+                tone,
+                language,
+                bert,
+                ja_bert,
+                en_bert,
+                style_vec,
+            )
+
+    def __len__(self):
+        return len(self.index)
+
+
+def create_dataset(
+    audiopaths_sid_text: str,
+    hparams: HyperParametersData,
+    use_packed_dataset: bool = False,
+) -> torch.utils.data.Dataset:
+    """
+    書き起こしファイルの学習データを読み込む Dataset を作成する。
+    use_packed_dataset が True で、pack_dataset.py でまとめた学習データが最新であれば PackedTextAudioSpeakerLoader を、
+    そうでなければ TextAudioSpeakerLoader を返す。
+    """
+
+    if not use_packed_dataset:
+        return TextAudioSpeakerLoader(audiopaths_sid_text, hparams)
+    if is_packed_dataset_current(audiopaths_sid_text, hparams):
+        return PackedTextAudioSpeakerLoader(audiopaths_sid_text, hparams)
+    if get_packed_dataset_path(audiopaths_sid_text).exists():
+        logger.warning(
+            f"Packed dataset for {audiopaths_sid_text} is outdated, run pack_dataset.py again. Falling back to per-file loading."
+        )
+    return TextAudioSpeakerLoader(audiopaths_sid_text, hparams)
+
+
 class TextAudioSpeakerCollate:
     """Zero-pads model inputs and targets"""
 
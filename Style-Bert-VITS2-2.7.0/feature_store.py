@@ -0,0 +1,393 @@
+"""
+学習用の特徴量 (BERT の特徴量やスタイルベクトル) を、分割 (train.list / val.list) ごとに 1 つのファイルにまとめて保存する。
+
+音声ファイルごとに .bert.pt を保存すると、数万件のデータセットでは小さなファイルが大量にでき、読み書きのたびに開く必要がある。
+特徴量は 1 つのデータファイルに行列の行として追記し、キー (音声ファイルのパス) ごとの位置を JSON Lines のインデックスに記録する。
+読み込み時はデータファイルを np.memmap で開くため、DataLoader の複数のワーカーでページを共有でき、必要な部分のみが読まれる。
+
+データファイルへの書き込みを終えてからインデックスに追記するため、処理が途中で中断されても記録済みの特徴量はそのまま使える。
+同じキーの特徴量を再度追記した場合は後のものが使われる (古い特徴量の領域は再利用しない)。
+使われなくなった領域や書き起こしファイルから削除されたキーの特徴量は、compact() でデータファイルを書き直して取り除く。
+"""
+
+import hashlib
+import json
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any, Optional, Union
+
+import numpy as np
+from numpy.typing import NDArray
+
+from style_bert_vits2.logging import logger
+
+
+# 保存形式を変更した場合に増やし、古い形式のファイルを使わないようにする
+FEATURE_STORE_VERSION = 1
+
+META_FILENAME = "meta.json"
+DATA_FILENAME = "data.bin"
+INDEX_FILENAME = "index.jsonl"
+
+# BERT の特徴量の次元数
+BERT_FEATURE_DIM = 1024
+
+# スタイルベクトルの次元数
+STYLE_VECTOR_DIM = 256
+
+# compact() で、データファイルのうち使われていない行の割合がこれを超えたら書き直す
+COMPACT_DEAD_ROW_RATIO = 0.25
+
+
+def get_bert_store_path(filelist_path: Union[str, Path]) -> Path:
+    """
+    書き起こしファイル (train.list / val.list) に対応する BERT の特徴量の保存先を返す。
+
+    Args:
+        filelist_path (Union[str, Path]): 書き起こしファイルのパス
+
+    Returns:
+        Path: 保存先のディレクトリのパス (例: train.list に対して train.bert)
+    """
+
+    return Path(filelist_path).with_suffix(".bert")
+
+
+def get_style_store_path(filelist_path: Union[str, Path]) -> Path:
+    """
+    書き起こしファイル (train.list / val.list) に対応するスタイルベクトルの保存先を返す。
+
+    Args:
+        filelist_path (Union[str, Path]): 書き起こしファイルのパス
+
+    Returns:
+        Path: 保存先のディレクトリのパス (例: train.list に対して train.style)
+    """
+
+    return Path(filelist_path).with_suffix(".style")
+
+
+def get_digest(*values: Any) -> str:
+    """
+    特徴量の計算に使った値から、特徴量が最新かどうかを判定するためのハッシュを求める。
+
+    Args:
+        *values (Any): JSON に変換できる値
+
+    Returns:
+        str: ハッシュ
+    """
+
+    return hashlib.sha1(
+        json.dumps(values, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+class FeatureStore:
+    """
+    キーごとに (行数, dim) の行列を保存する特徴量のストア。
+    行数は特徴量ごとに異なってよく (BERT の特徴量では音素数)、列数 dim とデータ型はストア全体で共通とする。
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        dim: int,
+        dtype: str = "float16",
+        writable: bool = False,
+    ) -> None:
+        """
+        特徴量のストアを開く。書き込み可能な場合、存在しなければ作成する。
+
+        Args:
+            path (Path): 保存先のディレクトリのパス
+            dim (int): 特徴量の列数
+            dtype (str, optional): 保存するデータ型 (デフォルト: "float16")
+            writable (bool, optional): 追記するかどうか (デフォルト: False)
+        """
+
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.writable = writable
+        # キー -> (開始行, 行数, ハッシュ)
+        self.__entries: dict[str, tuple[int, int, str]] = {}
+        self.__num_rows = 0
+        # flush() でインデックスに書き込むまでの行
+        self.__pending_index_lines: list[str] = []
+        self.__data: Optional[np.memmap] = None
+        self.__data_file = None
+        self.__index_file = None
+
+        meta = {"version": FEATURE_STORE_VERSION, "dim": dim, "dtype": self.dtype.name}
+        meta_path = path / META_FILENAME
+        if meta_path.exists():
+            stored_meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            if stored_meta != meta:
+                if not writable:
+                    raise ValueError(
+                        f"Feature store {path} has incompatible format: {stored_meta}"
+                    )
+                logger.warning(
+                    f"Feature store {path} has incompatible format {stored_meta}, recreating"
+                )
+                self.__reset()
+            else:
+                self.__load_index()
+        elif writable:
+            self.__reset()
+        else:
+            raise FileNotFoundError(f"Feature store {path} not found")
+
+        if writable:
+            # インデックスに記録される前に中断された特徴量をデータファイルから取り除いてから追記する
+            # インデックスも有効な行のみで書き直し、途中で中断された行の後ろに追記しないようにする
+            with (path / DATA_FILENAME).open("r+b") as f:
+                f.truncate(self.__num_rows * self.__row_bytes)
+            self.__write_index(path / INDEX_FILENAME)
+            self.__open_files()
+            meta_path.write_text(json.dumps(meta), encoding="utf-8")
+
+    @property
+    def __row_bytes(self) -> int:
+        return self.dim * self.dtype.itemsize
+
+    @staticmethod
+    def __index_line(key: str, entry: tuple[int, int, str]) -> str:
+        return json.dumps(
+            {"key": key, "offset": entry[0], "length": entry[1], "digest": entry[2]},
+            ensure_ascii=False,
+        )
+
+    def __write_index(self, index_path: Path) -> None:
+        # 一時ファイルに書き込んでから置き換え、書き込み途中のインデックスが読まれないようにする
+        tmp_index_path = self.path / (INDEX_FILENAME + ".tmp")
+        with tmp_index_path.open("w", encoding="utf-8") as f:
+            for key, entry in self.__entries.items():
+                f.write(self.__index_line(key, entry) + "\n")
+        tmp_index_path.replace(index_path)
+
+    def __open_files(self) -> None:
+        self.__data_file = (self.path / DATA_FILENAME).open("ab")
+        self.__index_file = (self.path / INDEX_FILENAME).open("a", encoding="utf-8")
+
+    def __close_files(self) -> None:
+        assert self.__data_file is not None and self.__index_file is not None
+        self.__data_file.close()
+        self.__index_file.close()
+        self.__data_file = None
+        self.__index_file = None
+
+    def __reset(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        for filename in (META_FILENAME, DATA_FILENAME, INDEX_FILENAME):
+            (self.path / filename).unlink(missing_ok=True)
+        (self.path / DATA_FILENAME).touch()
+        (self.path / INDEX_FILENAME).touch()
+        self.__entries = {}
+        self.__num_rows = 0
+
+    def __load_index(self) -> None:
+        data_size = (self.path / DATA_FILENAME).stat().st_size
+        # compact() でデータファイルを置き換える途中で中断された場合、インデックスは存在しない
+        if not (self.path / INDEX_FILENAME).exists():
+            return
+        with (self.path / INDEX_FILENAME).open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    key, offset, length, digest = (
+                        entry["key"],
+                        entry["offset"],
+                        entry["length"],
+                        entry["digest"],
+                    )
+                except (ValueError, KeyError):
+                    # 書き込み途中で中断された行は無視する
+                    continue
+                if (offset + length) * self.__row_bytes > data_size:
+                    continue
+                self.__entries[key] = (offset, length, digest)
+                self.__num_rows = max(self.__num_rows, offset + length)
+
+    def __getstate__(self) -> dict[str, Any]:
+        # DataLoader のワーカーに渡す際に memmap の内容がコピーされないよう、ワーカーで開き直す
+        state = self.__dict__.copy()
+        state["_FeatureStore__data"] = None
+        return state
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__entries
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def is_current(self, key: str, digest: str) -> bool:
+        """
+        キーの特徴量が保存されていて、同じハッシュの値から計算されたものかどうかを返す。
+        """
+
+        entry = self.__entries.get(key)
+        return entry is not None and entry[2] == digest
+
+    def get(self, key: str) -> NDArray[Any]:
+        """
+        キーの特徴量を (行数, dim) の配列として返す。
+        返す配列はデータファイルを memmap した読み取り専用のビューで、必要な部分のみがディスクから読まれる。
+
+        Args:
+            key (str): 特徴量のキー
+
+        Returns:
+            NDArray[Any]: 特徴量
+        """
+
+        offset, length, _ = self.__entries[key]
+        if self.__data is None or self.__data.shape[0] < offset + length:
+            if self.__data_file is not None:
+                self.__data_file.flush()
+            self.__data = np.memmap(
+                self.path / DATA_FILENAME,
+                dtype=self.dtype,
+                mode="r",
+                shape=(self.__num_rows, self.dim),
+            )
+        return self.__data[offset : offset + length]
+
+    def append(self, key: str, feature: NDArray[Any], digest: str) -> None:
+        """
+        キーの特徴量を追記する。同じキーの特徴量が既にある場合は置き換える。
+
+        Args:
+            key (str): 特徴量のキー
+            feature (NDArray[Any]): (行数, dim) の特徴量
+            digest (str): 特徴量の計算に使った値のハッシュ (get_digest() で求める)
+        """
+
+        assert self.__data_file is not None and self.__index_file is not None
+        assert feature.ndim == 2 and feature.shape[1] == self.dim, feature.shape
+        self.__data_file.write(
+            np.ascontiguousarray(feature, dtype=self.dtype).tobytes()
+        )
+        entry = (self.__num_rows, feature.shape[0], digest)
+        self.__pending_index_lines.append(self.__index_line(key, entry))
+        self.__entries[key] = entry
+        self.__num_rows += feature.shape[0]
+
+    def flush(self) -> None:
+        """
+        追記した特徴量をデータファイルに書き込んでから、インデックスに記録する。
+        """
+
+        assert self.__data_file is not None and self.__index_file is not None
+        self.__data_file.flush()
+        for line in self.__pending_index_lines:
+            self.__index_file.write(line + "\n")
+        self.__pending_index_lines.clear()
+        self.__index_file.flush()
+
+    def compact(
+        self,
+        keys: Optional[Iterable[str]] = None,
+        dead_row_ratio: float = COMPACT_DEAD_ROW_RATIO,
+    ) -> None:
+        """
+        keys にないキーの特徴量をインデックスから取り除き、使われていない行の割合が dead_row_ratio を超えた場合は
+        使われている特徴量のみでデータファイルを書き直す。
+
+        Args:
+            keys (Optional[Iterable[str]]): 残すキー (書き起こしファイルにある音声ファイルのパス)。None の場合は全て残す
+            dead_row_ratio (float, optional): データファイルを書き直す、使われていない行の割合 (デフォルト: COMPACT_DEAD_ROW_RATIO)
+        """
+
+        assert self.writable
+        self.flush()
+        removed_keys: list[str] = []
+        if keys is not None:
+            keys = set(keys)
+            removed_keys = [key for key in self.__entries if key not in keys]
+            for key in removed_keys:
+                del self.__entries[key]
+        live_rows = sum(length for _, length, _ in self.__entries.values())
+        dead_rows = self.__num_rows - live_rows
+        if dead_rows <= self.__num_rows * dead_row_ratio:
+            if len(removed_keys) > 0:
+                self.__close_files()
+                self.__write_index(self.path / INDEX_FILENAME)
+                self.__open_files()
+                logger.info(
+                    f"Removed {len(removed_keys)} features not in the filelist from {self.path}"
+                )
+            return
+
+        self.__close_files()
+        self.__data = None
+        old_data = np.memmap(
+            self.path / DATA_FILENAME,
+            dtype=self.dtype,
+            mode="r",
+            shape=(self.__num_rows, self.dim),
+        )
+        tmp_data_path = self.path / (DATA_FILENAME + ".tmp")
+        entries: dict[str, tuple[int, int, str]] = {}
+        num_rows = 0
+        with tmp_data_path.open("wb") as f:
+            # 元のデータファイルを先頭から順に読むよう、開始行の順に書き込む
+            for key, (offset, length, digest) in sorted(
+                self.__entries.items(), key=lambda item: item[1][0]
+            ):
+                f.write(old_data[offset : offset + length].tobytes())
+                entries[key] = (num_rows, length, digest)
+                num_rows += length
+        del old_data
+        self.__entries = entries
+        self.__num_rows = num_rows
+        # 古いインデックスが新しいデータファイルを指さないよう、インデックスを消してからデータファイルを置き換える
+        (self.path / INDEX_FILENAME).unlink()
+        tmp_data_path.replace(self.path / DATA_FILENAME)
+        self.__write_index(self.path / INDEX_FILENAME)
+        self.__open_files()
+        logger.info(
+            f"Compacted {self.path}: removed {dead_rows} unused rows ({len(removed_keys)} features not in the filelist)"
+        )
+
+    def close(self) -> None:
+        if self.writable:
+            self.flush()
+            self.__close_files()
+        self.__data = None
+
+
+def open_bert_store(filelist_path: Union[str, Path]) -> Optional[FeatureStore]:
+    """
+    書き起こしファイルに対応する BERT の特徴量のストアを読み取り専用で開く。
+
+    Args:
+        filelist_path (Union[str, Path]): 書き起こしファイルのパス
+
+    Returns:
+        Optional[FeatureStore]: 特徴量のストア (存在しない場合は None)
+    """
+
+    path = get_bert_store_path(filelist_path)
+    if not (path / META_FILENAME).exists():
+        return None
+    return FeatureStore(path, dim=BERT_FEATURE_DIM)
+
+
+def open_style_store(filelist_path: Union[str, Path]) -> Optional[FeatureStore]:
+    """
+    書き起こしファイルに対応するスタイルベクトルのストアを読み取り専用で開く。
+    スタイルベクトルは 1 行 (1, STYLE_VECTOR_DIM) の float32 の行列として保存される。
+
+    Args:
+        filelist_path (Union[str, Path]): 書き起こしファイルのパス
+
+    Returns:
+        Optional[FeatureStore]: 特徴量のストア (存在しない場合は None)
+    """
+
+    path = get_style_store_path(filelist_path)
+    if not (path / META_FILENAME).exists():
+        return None
+    return FeatureStore(path, dim=STYLE_VECTOR_DIM, dtype="float32")
@@ -7,6 +7,7 @@ import time
 import webbrowser
 from dataclasses import dataclass
 from datetime import datetime
+from functools import partial
 from multiprocessing import cpu_count
 from pathlib import Path
 
@@ -14,8 +15,11 @@ import gradio as gr
 import yaml
 
 from config import get_path_config
+from feature_store import get_bert_store_path, get_style_store_path
+from preprocess_pipeline import Stage, count_lines, run_pipeline
 from style_bert_vits2.constants import GRADIO_THEME
 from style_bert_vits2.logging import logger
+from style_bert_vits2.nlp.japanese.user_dict import get_dict_state_path
 from style_bert_vits2.utils.stdout_wrapper import SAFE_STDOUT
 from style_bert_vits2.utils.subprocess import run_script_with_log, second_elem_of
 
@@ -98,6 +102,17 @@ def initialize(
     # 今はデフォルトであるが、以前は非JP-Extra版になくバグの原因になるので念のため
     config["data"]["use_jp_extra"] = use_jp_extra
 
+    # 話者の ID は preprocess_text.py が設定するため、既存の値を引き継ぐ
+    # (前処理を再実行する際に config.json が変わらないようにし、変更のないステージをスキップできるようにする)
+    if paths.config_path.exists():
+        try:
+            with open(paths.config_path, encoding="utf-8") as f:
+                old_data = json.load(f)["data"]
+            config["data"]["spk2id"] = old_data["spk2id"]
+            config["data"]["n_speakers"] = old_data["n_speakers"]
+        except (OSError, ValueError, KeyError):
+            pass
+
     model_path = paths.dataset_path / "models"
     if model_path.exists():
         logger.warning(
@@ -165,7 +180,11 @@ def resample(model_name: str, normalize: bool, trim: bool, num_processes: int):
 
 
 def preprocess_text(
-    model_name: str, use_jp_extra: bool, val_per_lang: int, yomi_error: str
+    model_name: str,
+    use_jp_extra: bool,
+    val_per_lang: int,
+    yomi_error: str,
+    num_processes: int = 1,
 ):
     logger.info("Step 3: start preprocessing text...")
     paths = get_path(model_name)
@@ -190,6 +209,8 @@ def preprocess_text(
         str(val_per_lang),
         "--yomi_error",
         yomi_error,
+        "--num_processes",
+        str(num_processes),
         "--correct_path",  # 音声ファイルのパスを正しいパスに修正する
     ]
     if use_jp_extra:
@@ -275,6 +296,7 @@ def preprocess_all(
     val_per_lang: int,
     log_interval: int,
     yomi_error: str,
+    force: bool = False,
 ):
     if model_name == "":
         return False, "Error: モデル名を入力してください"
@@ -291,33 +313,73 @@ def preprocess_all(
         use_jp_extra=use_jp_extra,
         log_interval=log_interval,
     )
-    if not success:
-        return False, message
-    success, message = resample(
-        model_name=model_name,
-        normalize=normalize,
-        trim=trim,
-        num_processes=num_processes,
-    )
     if not success:
         return False, message
 
-    success, message = preprocess_text(
-        model_name=model_name,
-        use_jp_extra=use_jp_extra,
-        val_per_lang=val_per_lang,
-        yomi_error=yomi_error,
+    paths = get_path(model_name)
+    wavs_dir = paths.dataset_path / "wavs"
+    filelists = [paths.train_path, paths.val_path]
+    stages = [
+        Stage(
+            name="resample",
+            run=partial(
+                resample,
+                model_name=model_name,
+                normalize=normalize,
+                trim=trim,
+                num_processes=num_processes,
+            ),
+            inputs=[(paths.dataset_path / "raw", "**/*")],
+            outputs=[(wavs_dir, "**/*.wav")],
+            params={"normalize": normalize, "trim": trim},
+            count_items=lambda: sum(1 for _ in wavs_dir.glob("**/*.wav")),
+        ),
+        Stage(
+            name="preprocess_text",
+            run=partial(
+                preprocess_text,
+                model_name=model_name,
+                use_jp_extra=use_jp_extra,
+                val_per_lang=val_per_lang,
+                yomi_error=yomi_error,
+                num_processes=num_processes,
+            ),
+            deps=["resample"],
+            inputs=[paths.esd_path, (wavs_dir, "**/*.wav"), get_dict_state_path()],
+            outputs=filelists,
+            params={
+                "use_jp_extra": use_jp_extra,
+                "val_per_lang": val_per_lang,
+                "yomi_error": yomi_error,
+            },
+            count_items=lambda: count_lines(*filelists),
+        ),
+        # bert_gen と style_gen は互いに依存しないため並行して実行される
+        Stage(
+            name="bert_gen",
+            # bert_genは重いのでプロセス数いじらない
+            run=partial(bert_gen, model_name=model_name),
+            deps=["preprocess_text"],
+            inputs=filelists,
+            outputs=[(get_bert_store_path(path), "*") for path in filelists],
+            params={"use_jp_extra": use_jp_extra},
+            count_items=lambda: count_lines(*filelists),
+        ),
+        Stage(
+            name="style_gen",
+            run=partial(style_gen, model_name=model_name, num_processes=num_processes),
+            deps=["preprocess_text"],
+            inputs=filelists + [(wavs_dir, "**/*.wav")],
+            outputs=[(get_style_store_path(path), "*") for path in filelists],
+            count_items=lambda: count_lines(*filelists),
+        ),
+    ]
+    success, reports = run_pipeline(
+        stages, paths.dataset_path / "preprocess_pipeline.json", force=force
     )
     if not success:
-        return False, message
-    success, message = bert_gen(
-        model_name=model_name
-    )  # bert_genは重いのでプロセス数いじらない
-    if not success:
-        return False, message
-    success, message = style_gen(model_name=model_name, num_processes=num_processes)
-    if not success:
-        return False, message
+        failed = next(report for report in reports if report.status == "failed")
+        return False, failed.message
     logger.success("Success: All preprocess finished!")
     return (
         True,
@@ -325,14 +387,32 @@ def preprocess_all(
     )
 
 
+def pack_dataset(model_name: str):
+    logger.info("Start packing dataset...")
+    config_path = get_path(model_name).config_path
+    success, message = run_script_with_log(
+        ["pack_dataset.py", "--config", str(config_path)]
+    )
+    if not success:
+        logger.error("Packing dataset failed.")
+        return False, f"Error: 学習データのまとめに失敗しました:\n{message}"
+    logger.success("Packing dataset finished.")
+    return True, "Success: 学習データのまとめが完了しました"
+
+
 def train(
     model_name: str,
     skip_style: bool = False,
     use_jp_extra: bool = True,
     speedup: bool = False,
     not_use_custom_batch_sampler: bool = False,
+    use_packed_dataset: bool = False,
 ):
     paths = get_path(model_name)
+    if use_packed_dataset:
+        success, message = pack_dataset(model_name)
+        if not success:
+            return False, message
     # 学習再開の場合を考えて念のためconfig.ymlの名前等を更新
     with open("config.yml", encoding="utf-8") as f:
         yml_data = yaml.safe_load(f)
@@ -355,6 +435,8 @@ def train(
         cmd.append("--speedup")
     if not_use_custom_batch_sampler:
         cmd.append("--not_use_custom_batch_sampler")
+    if use_packed_dataset:
+        cmd.append("--use_packed_dataset")
     success, message = run_script_with_log(cmd, ignore_warning=True)
     if not success:
         logger.error("Train failed.")
@@ -691,6 +773,13 @@ def create_train_app():
                         ],
                         value="raise",
                     )
+                    num_processes_preprocess_text = gr.Slider(
+                        label="プロセス数",
+                        value=cpu_count() // 2,
+                        minimum=1,
+                        maximum=cpu_count(),
+                        step=1,
+                    )
                 with gr.Column():
                     preprocess_text_btn = gr.Button(value="実行", variant="primary")
                     info_preprocess_text = gr.Textbox(label="状況")
@@ -729,6 +818,11 @@ def create_train_app():
                 info="VRAMに余裕がある場合にチェックすると、長い音声ファイルも学習に使われるようになります",
                 value=False,
             )
+            use_packed_dataset = gr.Checkbox(
+                label="学習データをまとめてから学習する",
+                info="学習データを数個のファイルにまとめてから学習を開始します。データの読み込みが速くなりますが、まとめるためのディスク容量が必要です",
+                value=False,
+            )
             speedup = gr.Checkbox(
                 label="ログ等をスキップして学習を高速化する",
                 value=False,
@@ -799,6 +893,7 @@ def create_train_app():
                 use_jp_extra_manual,
                 val_per_lang_manual,
                 yomi_error_manual,
+                num_processes_preprocess_text,
             ],
             outputs=[info_preprocess_text],
         )
@@ -822,6 +917,7 @@ def create_train_app():
                 use_jp_extra_train,
                 speedup,
                 not_use_custom_batch_sampler,
+                use_packed_dataset,
             ],
             outputs=[info_train],
         )
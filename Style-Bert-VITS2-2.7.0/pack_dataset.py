@@ -0,0 +1,33 @@
+import argparse
+
+from config import get_config
+from data_utils import is_packed_dataset_current, pack_dataset
+from style_bert_vits2.logging import logger
+from style_bert_vits2.models.hyper_parameters import HyperParameters
+
+
+config = get_config()
+
+
+if __name__ == "__main__":
+    # bert_gen.py と style_gen.py の後に実行し、train_ms.py に --use_packed_dataset を指定すると、
+    # 学習時に PackedTextAudioSpeakerLoader でまとめて読み込まれるようになる
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-c", "--config", type=str, default=config.train_ms_config.config_path
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="まとめた学習データが最新でもまとめ直す",
+    )
+    args, _ = parser.parse_known_args()
+    hps = HyperParameters.load_from_json(args.config)
+
+    for filelist_path in (hps.data.training_files, hps.data.validation_files):
+        if not args.force and is_packed_dataset_current(filelist_path, hps.data):
+            logger.info(f"Packed dataset for {filelist_path} is up to date, skipping")
+            continue
+        pack_dataset(filelist_path, hps.data)
+
+    logger.info("Dataset is packed!")
@@ -0,0 +1,102 @@
+# Usage: .venv/bin/python precompute_reference_styles.py --audio_dir reference_audios/
+#        .venv/bin/python precompute_reference_styles.py --audio_dir reference_audios/ --model model_assets/koharune-ami
+
+# ディレクトリ内の参照音声からスタイルベクトルを推論し、各モデルの style_vectors.npy と同じディレクトリにキャッシュとして保存する
+# 保存した参照音声は、API の /voice の reference_audio_id (TTSModel.infer() の reference_audio_id) に ID を指定して使える
+# --model を指定しない場合は、model_assets 内の全てのモデルに保存する
+
+import json
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+from rich import print
+from rich.rule import Rule
+from rich.style import Style
+
+from config import get_path_config
+from style_bert_vits2.reference_style_vectors import ReferenceStyleVectorCache
+from style_bert_vits2.tts_model import TTSModel
+
+
+AUDIO_EXTENSIONS = {".wav", ".flac", ".mp3", ".ogg", ".opus", ".m4a"}
+
+
+if __name__ == "__main__":
+    start_time = time.time()
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--audio_dir", required=True, help="Directory containing reference audio files"
+    )
+    parser.add_argument(
+        "--model",
+        nargs="+",
+        default=None,
+        help="Model directories to store the style vectors in (default: all models in model_assets)",
+    )
+    parser.add_argument("--device", default="cpu", help="Device for inference")
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="Path to save the mapping from audio file names to reference audio ids as JSON",
+    )
+    args = parser.parse_args()
+
+    if args.model is not None:
+        model_dirs = [Path(model) for model in args.model]
+    else:
+        model_dirs = sorted(
+            path.parent
+            for path in get_path_config().assets_root.glob("*/style_vectors.npy")
+        )
+    assert len(model_dirs) > 0, "No model directory found"
+    for model_dir in model_dirs:
+        assert (
+            model_dir / "style_vectors.npy"
+        ).exists(), f"{model_dir} has no style_vectors.npy"
+
+    audio_dir = Path(args.audio_dir)
+    audio_paths = sorted(
+        path
+        for path in audio_dir.glob("**/*")
+        if path.suffix.lower() in AUDIO_EXTENSIONS and not path.name.startswith(".")
+    )
+    assert len(audio_paths) > 0, f"No audio file found in {audio_dir}"
+
+    # 話者埋め込みはモデルに依存しないため、1 つ目のモデルで推論し、他のモデルのキャッシュには結果をコピーする
+    first_dir = model_dirs[0]
+    model = TTSModel(
+        model_path=Path(""),
+        config_path=first_dir / "config.json",
+        style_vec_path=first_dir / "style_vectors.npy",
+        device=args.device,
+    )
+    other_caches = [
+        ReferenceStyleVectorCache.for_style_vectors(model_dir / "style_vectors.npy")
+        for model_dir in model_dirs[1:]
+    ]
+
+    print(Rule(characters="=", style=Style(color="blue")))
+    print(f"[bold cyan]Models:[/bold cyan] {', '.join(str(d) for d in model_dirs)}")
+    print(Rule(characters="=", style=Style(color="blue")))
+    reference_ids: dict[str, str] = {}
+    for audio_path in audio_paths:
+        reference_id = model.register_reference_audio(audio_path)
+        vector = model.reference_style_cache.get(reference_id)
+        assert vector is not None
+        for cache in other_caches:
+            if reference_id not in cache:
+                cache.add(reference_id, vector)
+        reference_ids[str(audio_path.relative_to(audio_dir))] = reference_id
+        print(
+            f"{audio_path.relative_to(audio_dir)}: [bold green]{reference_id}[/bold green]"
+        )
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reference_ids, f, indent=2, ensure_ascii=False)
+        print(f"[bold cyan]Saved reference audio ids to {args.output}[/bold cyan]")
+
+    print(Rule(characters="=", style=Style(color="blue")))
+    print(f"[bold green]Total time: {time.time() - start_time:.2f}s[/bold green]")
+    print(Rule(characters="=", style=Style(color="blue")))
@@ -90,6 +90,11 @@ if __name__ == "__main__":
         help="Yomi error. Options: raise, skip, use",
         default="raise",
     )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Run all preprocess stages even if their inputs are unchanged",
+    )
 
     args = parser.parse_args()
 
@@ -110,4 +115,5 @@ if __name__ == "__main__":
         val_per_lang=args.val_per_lang,
         log_interval=args.log_interval,
         yomi_error=args.yomi_error,
+        force=args.force,
     )
@@ -0,0 +1,180 @@
+"""
+前処理のステージ (slice.py や resample.py) ごとに、入力ファイルの内容のハッシュと処理のパラメータ、出力ファイルを記録する manifest。
+
+前処理を再実行する際、内容もパラメータも変わっていない入力ファイルはスキップし、追加・変更されたファイルのみを処理する。
+変更・削除された入力ファイルから以前に出力したファイルは、古いデータが学習に使われないよう処理の前に削除する。
+ハッシュの計算を省くため、ファイルサイズと更新日時が記録時と同じファイルは記録済みのハッシュを使う。
+"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Any
+
+from style_bert_vits2.logging import logger
+
+
+# manifest の形式を変更した場合に増やし、古い manifest を使わないようにする
+MANIFEST_VERSION = 1
+
+
+def get_manifest_path(output_dir: Path, stage: str) -> Path:
+    """
+    ステージの manifest の保存先を返す。
+    出力先のディレクトリの中に置くと次のステージの入力ファイルとして扱われるため、出力先と同じ階層に置く。
+
+    Args:
+        output_dir (Path): ステージの出力先のディレクトリ
+        stage (str): ステージ名 (例: "slice", "resample")
+
+    Returns:
+        Path: manifest のパス (例: Data/{model_name}/wavs.resample.manifest.json)
+    """
+
+    return output_dir.parent / f"{output_dir.name}.{stage}.manifest.json"
+
+
+def hash_file(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class StageManifest:
+    """
+    1 つのステージの manifest。入力ファイルは入力先のディレクトリからの相対パス、出力ファイルは出力先のディレクトリからの相対パスで記録する。
+    """
+
+    def __init__(self, path: Path, output_dir: Path, params: dict[str, Any]) -> None:
+        """
+        manifest を読み込む。パラメータが記録時と異なる場合は、全ての入力ファイルを処理し直す。
+
+        Args:
+            path (Path): manifest のパス (get_manifest_path() で求める)
+            output_dir (Path): ステージの出力先のディレクトリ
+            params (dict[str, Any]): 出力に影響する処理のパラメータ (JSON に変換できる値)
+        """
+
+        self.path = path
+        self.output_dir = output_dir
+        self.params = params
+        # 入力ファイルの相対パス -> {"hash", "size", "mtime_ns", "outputs"}
+        self.entries: dict[str, dict[str, Any]] = {}
+        # パラメータが変わったため、出力ファイルを削除する必要がある記録
+        self.__outdated_entries: dict[str, dict[str, Any]] = {}
+        self.exists = path.exists()
+        if not self.exists:
+            return
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            entries = data["entries"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Failed to read manifest {path}, processing all files: {e}")
+            self.exists = False
+            return
+        if data.get("version") == MANIFEST_VERSION and data.get("params") == params:
+            self.entries = entries
+        else:
+            logger.info("Parameters changed since last run, processing all files")
+            self.__outdated_entries = entries
+
+    def invalidate(self) -> None:
+        """
+        全ての入力ファイルを処理し直すよう、記録を破棄する (--force 用)。
+        記録済みの出力ファイルは、削除された入力ファイルの分も含めて次の plan() で削除する。
+        """
+
+        self.__outdated_entries.update(self.entries)
+        self.entries = {}
+
+    def plan(self, files: dict[str, Path]) -> tuple[list[tuple[str, Path, str]], int]:
+        """
+        処理する必要がある入力ファイルを求め、変更・削除された入力ファイルの古い出力ファイルを削除する。
+
+        Args:
+            files (dict[str, Path]): 入力ファイルの相対パス -> 入力ファイルのパス
+
+        Returns:
+            tuple[list[tuple[str, Path, str]], int]: 処理する入力ファイルの (相対パス, パス, ハッシュ) のリストと、スキップする入力ファイルの数
+        """
+
+        pending: list[tuple[str, Path, str]] = []
+        stale_outputs: set[str] = set()
+        for entry in self.__outdated_entries.values():
+            stale_outputs.update(entry["outputs"])
+        self.__outdated_entries = {}
+
+        for key in list(self.entries):
+            if key not in files:
+                stale_outputs.update(self.entries.pop(key)["outputs"])
+
+        for key, file in files.items():
+            stat = file.stat()
+            entry = self.entries.get(key)
+            if (
+                entry is not None
+                and entry["size"] == stat.st_size
+                and entry["mtime_ns"] == stat.st_mtime_ns
+            ):
+                file_hash = entry["hash"]
+            else:
+                file_hash = hash_file(file)
+            if (
+                entry is not None
+                and entry["hash"] == file_hash
+                and all((self.output_dir / o).exists() for o in entry["outputs"])
+            ):
+                # 内容が同じまま更新日時のみ変わった場合は、次回にハッシュを計算しないよう記録し直す
+                entry["size"] = stat.st_size
+                entry["mtime_ns"] = stat.st_mtime_ns
+                continue
+            if entry is not None:
+                stale_outputs.update(self.entries.pop(key)["outputs"])
+            pending.append((key, file, file_hash))
+
+        for output in stale_outputs:
+            (self.output_dir / output).unlink(missing_ok=True)
+        if stale_outputs:
+            logger.info(f"Removed {len(stale_outputs)} outdated output files")
+        return pending, len(files) - len(pending)
+
+    def record(self, key: str, file: Path, file_hash: str, outputs: list[Path]) -> None:
+        """
+        入力ファイルの処理結果を記録する。処理に失敗した場合も、出力ファイルなしとして記録し、内容が変わるまで再処理しない。
+
+        Args:
+            key (str): 入力ファイルの相対パス
+            file (Path): 入力ファイルのパス
+            file_hash (str): plan() で求めた入力ファイルのハッシュ
+            outputs (list[Path]): 出力ファイルのパスのリスト
+        """
+
+        stat = file.stat()
+        self.entries[key] = {
+            "hash": file_hash,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "outputs": [
+                output.relative_to(self.output_dir).as_posix() for output in outputs
+            ],
+        }
+
+    def save(self) -> None:
+        # 書き込み途中で中断されても manifest が壊れないよう、一時ファイルに書き込んでから置き換える
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(
+            json.dumps(
+                {
+                    "version": MANIFEST_VERSION,
+                    "params": self.params,
+                    "entries": self.entries,
+                },
+                ensure_ascii=False,
+            ),
+            encoding="utf-8",
+        )
+        tmp_path.replace(self.path)
+        self.exists = True
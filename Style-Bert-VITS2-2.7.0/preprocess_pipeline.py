@@ -0,0 +1,214 @@
+"""
+前処理のステージ (リサンプリング、書き起こしの前処理、BERT の特徴量の生成、スタイルベクトルの生成など) を、依存関係のグラフとして実行するランナー。
+
+各ステージの入力 (ファイルの内容、ディレクトリ内のファイルの一覧とサイズ・更新日時、パラメータ) と出力のフィンガープリントを記録し、
+前回の実行から入力も出力も変わっていないステージはスキップする。依存するステージが全て完了したステージから順に実行するため、
+互いに依存しないステージ (bert_gen と style_gen など) は並行して実行される。
+
+実行されたステージの中でも、発話ごとの処理は各ステージのキャッシュによって変更された発話のみに限られる
+(resample.py の manifest、preprocess_text.py の g2p の永続キャッシュ、bert_gen.py / style_gen.py の特徴量のストア)。
+"""
+
+import hashlib
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+from style_bert_vits2.logging import logger
+
+
+# ディレクトリの場合はパスとファイルの glob パターンの組で指定する (ディレクトリのパスのみの場合は全てのファイルを対象とする)
+PathSpec = Union[Path, tuple[Path, str]]
+
+
+def fingerprint(paths: list[PathSpec], params: Optional[dict[str, Any]] = None) -> str:
+    """
+    ファイルとディレクトリ、パラメータのフィンガープリントを求める。
+    ファイルは内容のハッシュを、ディレクトリは glob パターンに一致するファイルの相対パス・サイズ・更新日時を使う。
+    ディレクトリのパスのみが指定された場合は、ディレクトリ以下の全てのファイルを対象とする。
+
+    Args:
+        paths (list[PathSpec]): ファイルまたはディレクトリのパス、または (ディレクトリのパス, glob パターン) のリスト
+        params (Optional[dict[str, Any]]): パラメータ (JSON に変換できる値)
+
+    Returns:
+        str: フィンガープリント
+    """
+
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    for spec in paths:
+        if not isinstance(spec, tuple) and spec.is_dir():
+            spec = (spec, "**/*")
+        if isinstance(spec, tuple):
+            dir_path, pattern = spec
+            hasher.update(f"dir:{dir_path}:{pattern}\n".encode("utf-8"))
+            if not dir_path.is_dir():
+                hasher.update(b"missing\n")
+                continue
+            for file in sorted(f for f in dir_path.glob(pattern) if f.is_file()):
+                stat = file.stat()
+                hasher.update(
+                    f"{file.relative_to(dir_path).as_posix()}:{stat.st_size}:{stat.st_mtime_ns}\n".encode(
+                        "utf-8"
+                    )
+                )
+        else:
+            hasher.update(f"file:{spec}\n".encode("utf-8"))
+            if not spec.is_file():
+                hasher.update(b"missing\n")
+                continue
+            with spec.open("rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def count_lines(*paths: Path) -> int:
+    count = 0
+    for path in paths:
+        if path.is_file():
+            with path.open(encoding="utf-8") as f:
+                count += sum(1 for line in f if line.strip() != "")
+    return count
+
+
+@dataclass
+class Stage:
+    """
+    前処理のステージ。run は (成功したかどうか, メッセージ) を返す。
+    """
+
+    name: str
+    run: Callable[[], tuple[bool, str]]
+    deps: list[str] = field(default_factory=list)
+    inputs: list[PathSpec] = field(default_factory=list)
+    outputs: list[PathSpec] = field(default_factory=list)
+    params: dict[str, Any] = field(default_factory=dict)
+    # スループットの表示に使う、ステージが扱う発話やファイルの数
+    count_items: Optional[Callable[[], int]] = None
+
+
+@dataclass
+class StageReport:
+    name: str
+    status: str  # "done", "skipped", "failed", "not run"
+    seconds: float = 0.0
+    items: int = 0
+    message: str = ""
+
+
+def run_pipeline(
+    stages: list[Stage],
+    state_path: Path,
+    max_workers: int = 2,
+    force: bool = False,
+) -> tuple[bool, list[StageReport]]:
+    """
+    前処理のステージを依存関係に従って実行する。
+
+    Args:
+        stages (list[Stage]): ステージのリスト (deps には同じリストの中のステージ名を指定する)
+        state_path (Path): 各ステージのフィンガープリントを記録するファイルのパス
+        max_workers (int, optional): 並行して実行するステージの最大数 (デフォルト: 2)
+        force (bool, optional): フィンガープリントによらず全てのステージを実行するかどうか (デフォルト: False)
+
+    Returns:
+        tuple[bool, list[StageReport]]: 全てのステージが成功したかどうかと、ステージごとの結果
+    """
+
+    names = {stage.name for stage in stages}
+    for stage in stages:
+        for dep in stage.deps:
+            if dep not in names:
+                raise ValueError(f"Unknown dependency {dep} of stage {stage.name}")
+
+    try:
+        state: dict[str, Any] = json.loads(state_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        state = {}
+
+    reports = {stage.name: StageReport(stage.name, "not run") for stage in stages}
+    pending = {stage.name: stage for stage in stages}
+    completed: set[str] = set()
+    failed = False
+    running: dict[Future[tuple[bool, str]], tuple[Stage, float]] = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            # 依存するステージが全て完了したステージを開始する (スキップした場合は続けて次を探す)
+            started = True
+            while started and not failed:
+                started = False
+                for name, stage in list(pending.items()):
+                    if not all(dep in completed for dep in stage.deps):
+                        continue
+                    del pending[name]
+                    started = True
+                    recorded = state.get(name)
+                    if (
+                        not force
+                        and recorded is not None
+                        and recorded.get("inputs")
+                        == fingerprint(stage.inputs, stage.params)
+                        and recorded.get("outputs") == fingerprint(stage.outputs)
+                    ):
+                        logger.info(f"Stage {name} is up to date, skipping")
+                        reports[name].status = "skipped"
+                        completed.add(name)
+                        continue
+                    logger.info(f"Stage {name} started")
+                    running[executor.submit(stage.run)] = (stage, time.perf_counter())
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, start_time = running.pop(future)
+                report = reports[stage.name]
+                report.seconds = time.perf_counter() - start_time
+                try:
+                    success, report.message = future.result()
+                except Exception as e:
+                    success, report.message = False, str(e)
+                if not success:
+                    logger.error(f"Stage {stage.name} failed")
+                    report.status = "failed"
+                    failed = True
+                    continue
+                report.status = "done"
+                if stage.count_items is not None:
+                    report.items = stage.count_items()
+                completed.add(stage.name)
+
+    # 後のステージが前のステージの出力を書き換えることがあるため (style_gen.py による NaN の行の削除など)、
+    # フィンガープリントは全てのステージが終わった後の状態で記録する
+    for stage in stages:
+        if stage.name in completed:
+            state[stage.name] = {
+                "inputs": fingerprint(stage.inputs, stage.params),
+                "outputs": fingerprint(stage.outputs),
+            }
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    state_path.write_text(json.dumps(state, indent=2), encoding="utf-8")
+
+    report_list = [reports[stage.name] for stage in stages]
+    log_reports(report_list)
+    return not failed, report_list
+
+
+def log_reports(reports: list[StageReport]) -> None:
+    lines = ["stage           | status  | seconds |  items | items/s"]
+    for report in reports:
+        throughput = (
+            f"{report.items / report.seconds:7.1f}"
+            if report.status == "done" and report.seconds > 0 and report.items > 0
+            else "      -"
+        )
+        lines.append(
+            f"{report.name:15s} | {report.status:7s} | {report.seconds:7.1f} | {report.items:6d} | {throughput}"
+        )
+    logger.info("Preprocess pipeline summary:\n" + "\n".join(lines))
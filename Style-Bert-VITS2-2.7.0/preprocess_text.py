@@ -1,28 +1,50 @@
 import argparse
+import hashlib
 import json
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
 from pathlib import Path
-from random import sample
-from typing import Optional
+from typing import Optional, Union
 
 from tqdm import tqdm
 
-from config import get_config
+from config import get_config, get_path_config
 from style_bert_vits2.logging import logger
 from style_bert_vits2.nlp import clean_text
 from style_bert_vits2.nlp.japanese import pyopenjtalk_worker
+from style_bert_vits2.nlp.japanese.g2p_store import G2P_STORE_FILENAME, open_g2p_store
 from style_bert_vits2.nlp.japanese.user_dict import update_dict
 from style_bert_vits2.utils.stdout_wrapper import SAFE_STDOUT
 
 
-# このプロセスからはワーカーを起動して辞書を使いたいので、ここで初期化
-pyopenjtalk_worker.initialize_worker()
+preprocess_text_config = get_config().preprocess_text_config
 
-# dict_data/ 以下の辞書データを pyopenjtalk に適用
-update_dict()
+# 並列処理で各プロセスに一度に渡す行数
+# 小さすぎるとプロセス間通信が増え、大きすぎると処理の遅いプロセスを待つ時間が増える
+PARALLEL_CHUNK_SIZE = 64
 
 
-preprocess_text_config = get_config().preprocess_text_config
+def initialize_frontend(use_worker: bool = True) -> None:
+    """
+    テキストの前処理に使う pyopenjtalk と辞書を初期化する。
+
+    Args:
+        use_worker (bool, optional): pyopenjtalk_worker を使うかどうか。
+            並列処理の各プロセスでは、ワーカーを奪い合わないようプロセス内の pyopenjtalk を使う。Defaults to True.
+    """
+
+    # このプロセスからはワーカーを起動して辞書を使いたいので、ここで初期化
+    if use_worker:
+        pyopenjtalk_worker.initialize_worker()
+
+    # g2p の結果を前処理・学習・推論で共有する永続キャッシュを開く
+    open_g2p_store(get_path_config().assets_root / G2P_STORE_FILENAME)
+
+    # dict_data/ 以下の辞書データを pyopenjtalk に適用
+    ## コンパイル済みの辞書は再利用されるため、並列処理の各プロセスでは辞書の読み込みのみ行われる
+    update_dict()
 
 
 # Count lines for tqdm
@@ -31,7 +53,7 @@ def count_lines(file_path: Path):
         return sum(1 for _ in file)
 
 
-def write_error_log(error_log_path: Path, line: str, error: Exception):
+def write_error_log(error_log_path: Path, line: str, error: Union[Exception, str]):
     with error_log_path.open("a", encoding="utf-8") as error_log:
         error_log.write(f"{line.strip()}\n{error}\n\n")
 
@@ -67,6 +89,137 @@ def process_line(
     )
 
 
+def process_lines(
+    lines: list[str],
+    transcription_path: Path,
+    correct_path: bool,
+    use_jp_extra: bool,
+    yomi_error: str,
+) -> list[tuple[Optional[str], Optional[str]]]:
+    """
+    複数の行を process_line() で処理する (並列処理の各プロセスで実行される)。
+    例外はプロセス間で受け渡せるとは限らないため、メッセージの文字列として返す。
+
+    Returns:
+        list[tuple[Optional[str], Optional[str]]]: 行ごとの、処理した行とエラーメッセージ (どちらか一方は None)
+    """
+
+    results: list[tuple[Optional[str], Optional[str]]] = []
+    for line in lines:
+        try:
+            results.append(
+                (
+                    process_line(
+                        line, transcription_path, correct_path, use_jp_extra, yomi_error
+                    ),
+                    None,
+                )
+            )
+        except Exception as e:
+            results.append((None, str(e)))
+    return results
+
+
+def process_lines_parallel(
+    lines: list[str],
+    transcription_path: Path,
+    correct_path: bool,
+    use_jp_extra: bool,
+    yomi_error: str,
+    num_processes: int,
+):
+    """
+    行を PARALLEL_CHUNK_SIZE 行ずつに分け、num_processes 個のプロセスで並列に process_lines() を行う。
+    各プロセスはプロセス内の pyopenjtalk にユーザー辞書を読み込んで処理する。
+    結果は元の行の順番で 1 行ずつ返す。
+
+    Yields:
+        tuple[str, Optional[str], Optional[str]]: 元の行と、処理した行とエラーメッセージ (どちらか一方は None)
+    """
+
+    chunks = [
+        lines[i : i + PARALLEL_CHUNK_SIZE]
+        for i in range(0, len(lines), PARALLEL_CHUNK_SIZE)
+    ]
+    # fork すると親プロセスの pyopenjtalk_worker への接続を共有してしまうため、spawn で起動する
+    with ProcessPoolExecutor(
+        max_workers=num_processes,
+        mp_context=get_context("spawn"),
+        initializer=initialize_frontend,
+        initargs=(False,),
+    ) as executor:
+        results = executor.map(
+            partial(
+                process_lines,
+                transcription_path=transcription_path,
+                correct_path=correct_path,
+                use_jp_extra=use_jp_extra,
+                yomi_error=yomi_error,
+            ),
+            chunks,
+        )
+        for chunk, chunk_results in zip(chunks, results):
+            for line, (processed_line, error) in zip(chunk, chunk_results):
+                yield line, processed_line, error
+
+
+def split_train_val(
+    spk_utt_map: dict[str, list[str]], val_per_lang: int, max_val_total: int
+) -> tuple[list[str], list[str]]:
+    """
+    話者ごとの発話リストを、学習用とバリデーション用に分割する。
+    各話者から音声ファイルのパスのハッシュ順に val_per_lang 個をバリデーション用に選ぶ。
+    再実行や発話の追加で他の発話の分割が変わると BERT の特徴量などを分割ごとに計算し直すことになるため、乱数は使わない。
+    発話が val_per_lang 個以下の話者は、全ての発話がバリデーション用にならないよう、学習用に 1 個以上残す。
+
+    Args:
+        spk_utt_map (dict[str, list[str]]): 話者ごとの書き起こしファイルの行のリスト
+        val_per_lang (int): 話者ごとのバリデーション用の発話数
+        max_val_total (int): バリデーション用の発話数の上限
+
+    Returns:
+        tuple[list[str], list[str]]: 学習用とバリデーション用の行のリスト
+    """
+
+    train_list: list[str] = []
+    val_list: list[str] = []
+
+    # 各話者ごとに発話リストを処理
+    for spk, utts in spk_utt_map.items():
+        num_val = min(val_per_lang, len(utts) - 1)
+        if num_val < val_per_lang:
+            logger.warning(
+                f"Speaker {spk} has only {len(utts)} utterances, so {num_val} of them are used for validation instead of {val_per_lang}"
+            )
+        if num_val <= 0:
+            train_list.extend(utts)
+            continue
+        # 音声ファイルのパスのハッシュ順に num_val 個を選択
+        val_utts = set(
+            sorted(
+                utts,
+                key=lambda utt: hashlib.sha1(
+                    utt.split("|")[0].encode("utf-8")
+                ).hexdigest(),
+            )[:num_val]
+        )
+        # 元の順序を保ちながらリストを分割
+        for utt in utts:
+            if utt in val_utts:
+                val_list.append(utt)
+            else:
+                train_list.append(utt)
+
+    # バリデーションリストのサイズ調整
+    if len(val_list) > max_val_total:
+        extra_val = val_list[max_val_total:]
+        val_list = val_list[:max_val_total]
+        # 余剰のバリデーション発話をトレーニングリストに追加（元の順序を保持）
+        train_list.extend(extra_val)
+
+    return train_list, val_list
+
+
 def preprocess(
     transcription_path: Path,
     cleaned_path: Optional[Path],
@@ -79,6 +232,7 @@ def preprocess(
     use_jp_extra: bool,
     yomi_error: str,
     correct_path: bool,
+    num_processes: int = 1,
 ):
     assert yomi_error in ["raise", "skip", "use"]
     if cleaned_path == "" or cleaned_path is None:
@@ -93,30 +247,60 @@ def preprocess(
 
     total_lines = count_lines(transcription_path)
 
-    # transcription_path から 1行ずつ読み込んで文章処理して cleaned_path に書き込む
-    with (
-        transcription_path.open("r", encoding="utf-8") as trans_file,
-        cleaned_path.open("w", encoding="utf-8") as out_file,
-    ):
-        for line in tqdm(
-            trans_file, file=SAFE_STDOUT, total=total_lines, dynamic_ncols=True
-        ):
-            try:
-                processed_line = process_line(
-                    line,
+    if num_processes > 1:
+        # 行を複数のプロセスで並列に処理し、元の順番で cleaned_path に書き込む
+        with transcription_path.open("r", encoding="utf-8") as trans_file:
+            lines = trans_file.readlines()
+        with cleaned_path.open("w", encoding="utf-8") as out_file:
+            for line, processed_line, error in tqdm(
+                process_lines_parallel(
+                    lines,
                     transcription_path,
                     correct_path,
                     use_jp_extra,
                     yomi_error,
-                )
-                out_file.write(processed_line)
-            except Exception as e:
+                    num_processes,
+                ),
+                file=SAFE_STDOUT,
+                total=total_lines,
+                dynamic_ncols=True,
+            ):
+                if processed_line is not None:
+                    out_file.write(processed_line)
+                    continue
                 logger.error(
-                    f"An error occurred at line:\n{line.strip()}\n{e}", encoding="utf-8"
+                    f"An error occurred at line:\n{line.strip()}\n{error}",
+                    encoding="utf-8",
                 )
-                write_error_log(error_log_path, line, e)
+                write_error_log(error_log_path, line, str(error))
                 error_count += 1
 
+    else:
+        # transcription_path から 1行ずつ読み込んで文章処理して cleaned_path に書き込む
+        with (
+            transcription_path.open("r", encoding="utf-8") as trans_file,
+            cleaned_path.open("w", encoding="utf-8") as out_file,
+        ):
+            for line in tqdm(
+                trans_file, file=SAFE_STDOUT, total=total_lines, dynamic_ncols=True
+            ):
+                try:
+                    processed_line = process_line(
+                        line,
+                        transcription_path,
+                        correct_path,
+                        use_jp_extra,
+                        yomi_error,
+                    )
+                    out_file.write(processed_line)
+                except Exception as e:
+                    logger.error(
+                        f"An error occurred at line:\n{line.strip()}\n{e}",
+                        encoding="utf-8",
+                    )
+                    write_error_log(error_log_path, line, e)
+                    error_count += 1
+
     transcription_path = cleaned_path
 
     # 各話者ごとのlineの辞書
@@ -155,29 +339,7 @@ def preprocess(
                 f"Total repeated audios: {count_same}, Total number of audio not found: {count_not_found}"
             )
 
-    train_list: list[str] = []
-    val_list: list[str] = []
-
-    # 各話者ごとに発話リストを処理
-    for spk, utts in spk_utt_map.items():
-        if val_per_lang == 0:
-            train_list.extend(utts)
-            continue
-        # ランダムにval_per_lang個のインデックスを選択
-        val_indices = set(sample(range(len(utts)), val_per_lang))
-        # 元の順序を保ちながらリストを分割
-        for index, utt in enumerate(utts):
-            if index in val_indices:
-                val_list.append(utt)
-            else:
-                train_list.append(utt)
-
-    # バリデーションリストのサイズ調整
-    if len(val_list) > max_val_total:
-        extra_val = val_list[max_val_total:]
-        val_list = val_list[:max_val_total]
-        # 余剰のバリデーション発話をトレーニングリストに追加（元の順序を保持）
-        train_list.extend(extra_val)
+    train_list, val_list = split_train_val(spk_utt_map, val_per_lang, max_val_total)
 
     with train_path.open("w", encoding="utf-8") as f:
         for line in train_list:
@@ -238,9 +400,17 @@ if __name__ == "__main__":
     parser.add_argument("--use_jp_extra", action="store_true")
     parser.add_argument("--yomi_error", default="raise")
     parser.add_argument("--correct_path", action="store_true")
+    parser.add_argument(
+        "--num_processes",
+        type=int,
+        default=preprocess_text_config.num_processes,
+        help="Number of processes (1: process lines sequentially in this process)",
+    )
 
     args = parser.parse_args()
 
+    initialize_frontend()
+
     transcription_path = Path(args.transcription_path)
     cleaned_path = Path(args.cleaned_path) if args.cleaned_path else None
     train_path = Path(args.train_path)
@@ -263,4 +433,5 @@ if __name__ == "__main__":
         use_jp_extra=use_jp_extra,
         yomi_error=yomi_error,
         correct_path=correct_path,
+        num_processes=args.num_processes,
     )
@@ -0,0 +1,173 @@
+# Usage: .venv/bin/python quantize_onnx.py --model model_assets/koharune-ami/koharune-ami.onnx
+#        .venv/bin/python quantize_onnx.py --model model_assets/ (All ONNX models in the directory will be quantized)
+#        .venv/bin/python quantize_onnx.py --bert --language JP
+
+# ONNX 版の音声合成モデル / BERT モデルを CPU 推論向けに INT8 量子化する
+# 量子化したモデルは元のファイル名に _int8 を付けて保存され (例: koharune-ami.onnx -> koharune-ami_int8.onnx)、
+# CPU 推論時は TTSModelHolder と onnx_bert_models.load_model() が自動的に量子化したモデルを使う
+# 量子化前のモデルとの出力の差が閾値を超えた場合、量子化したモデルは保存されない
+
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import numpy as np
+from rich import print
+from rich.rule import Rule
+from rich.style import Style
+
+from style_bert_vits2.constants import (
+    DEFAULT_ONNX_BERT_MODEL_PATHS,
+    DEFAULT_STYLE,
+    Languages,
+)
+from style_bert_vits2.models.hyper_parameters import HyperParameters
+from style_bert_vits2.models.quantize_onnx import (
+    SYNTHESIZER_PARTS,
+    quantize_bert_onnx,
+    quantize_synthesizer_onnx,
+)
+from style_bert_vits2.utils import (
+    get_quantized_onnx_model_path,
+    is_quantized_onnx_model_path,
+)
+
+
+def quantize_synthesizer(
+    model_path: Path,
+    language: Languages,
+    mode: str,
+    parts: list[str],
+    max_distance: float,
+) -> bool:
+    config_path = model_path.parent / "config.json"
+    style_vec_path = model_path.parent / "style_vectors.npy"
+    assert config_path.exists(), "Config file does not exist"
+    assert style_vec_path.exists(), "Style vector file does not exist"
+
+    hyper_parameters = HyperParameters.load_from_json(config_path)
+    style_vectors = np.load(style_vec_path)
+    style2id = hyper_parameters.data.style2id
+    style_vec = style_vectors[style2id.get(DEFAULT_STYLE, 0)]
+
+    print(f"[bold cyan]Quantizing {', '.join(parts)} ({mode})...[/bold cyan]")
+    report = quantize_synthesizer_onnx(
+        model_path,
+        get_quantized_onnx_model_path(model_path),
+        hyper_parameters,
+        style_vec,
+        language=language,
+        mode=mode,
+        parts=parts,
+        max_distance=max_distance,
+    )
+    color = "green" if report.passed else "red"
+    print(f"[bold {color}]{report}[/bold {color}]")
+    return report.passed
+
+
+if __name__ == "__main__":
+    start_time = time.time()
+    parser = ArgumentParser()
+    parser.add_argument("--model", help="Path to the ONNX model file or directory")
+    parser.add_argument(
+        "--bert",
+        action="store_true",
+        help="Quantize the ONNX BERT model instead (requires model.onnx made by convert_bert_onnx.py)",
+    )
+    parser.add_argument(
+        "--language",
+        default=Languages.JP,
+        help="Language of the BERT model and the calibration texts",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["static", "dynamic"],
+        default="static",
+        help="Quantization mode of the synthesizer",
+    )
+    parser.add_argument(
+        "--parts",
+        nargs="+",
+        choices=SYNTHESIZER_PARTS,
+        default=["dec"],
+        help="Sub-graphs of the synthesizer to be quantized",
+    )
+    parser.add_argument(
+        "--max-distance",
+        type=float,
+        default=None,
+        help="Maximum distance from the original output (synthesizer: log spectral distance in dB, BERT: 1 - cosine similarity)",
+    )
+    parser.add_argument(
+        "--force-convert",
+        action="store_true",
+        help="Already quantized models will be overwritten",
+    )
+    args = parser.parse_args()
+    language = Languages(args.language)
+
+    if args.bert:
+        model_dir = DEFAULT_ONNX_BERT_MODEL_PATHS[language]
+        model_path = model_dir / "model.onnx"
+        quantized_model_path = get_quantized_onnx_model_path(model_path)
+        assert (
+            model_path.exists()
+        ), f"{model_path} does not exist. Run convert_bert_onnx.py first."
+        print(Rule(characters="=", style=Style(color="blue")))
+        print(f"[bold cyan]BERT model:[/bold cyan] {model_path}")
+        print(Rule(characters="=", style=Style(color="blue")))
+        if quantized_model_path.exists() and not args.force_convert:
+            print(
+                f"[bold yellow]Quantized model already exists: {quantized_model_path}[/bold yellow]"
+            )
+        else:
+            report = quantize_bert_onnx(
+                model_path,
+                quantized_model_path,
+                language,
+                **(
+                    {"max_distance": args.max_distance}
+                    if args.max_distance is not None
+                    else {}
+                ),
+            )
+            color = "green" if report.passed else "red"
+            print(f"[bold {color}]{report}[/bold {color}]")
+
+    else:
+        assert args.model is not None, "--model is required"
+        # --model に指定されたパスがディレクトリの時、配下にある全ての .onnx ファイルを対象に量子化する
+        model_paths: list[Path] = []
+        if Path(args.model).is_dir():
+            for path in Path(args.model).glob("**/*.onnx"):
+                # . から始まるファイルと量子化済みのファイルは除外
+                if not path.name.startswith(".") and not is_quantized_onnx_model_path(
+                    path
+                ):
+                    model_paths.append(path)
+        else:
+            model_paths.append(Path(args.model))
+
+        for model_path in model_paths:
+            quantized_model_path = get_quantized_onnx_model_path(model_path)
+            assert model_path.suffix == ".onnx", "Model file is not ONNX"
+            print(Rule(characters="=", style=Style(color="blue")))
+            print(f"[bold cyan]Model file:[/bold cyan] {model_path}")
+            print(Rule(characters="=", style=Style(color="blue")))
+            if quantized_model_path.exists() and not args.force_convert:
+                print(
+                    f"[bold yellow]Quantized model already exists: {quantized_model_path}[/bold yellow]"
+                )
+                continue
+            quantize_synthesizer(
+                model_path,
+                language,
+                args.mode,
+                args.parts,
+                args.max_distance if args.max_distance is not None else 3.0,
+            )
+
+    print(Rule(characters="=", style=Style(color="blue")))
+    print(f"[bold green]Total time: {time.time() - start_time:.2f}s[/bold green]")
+    print(Rule(characters="=", style=Style(color="blue")))
@@ -1,8 +1,8 @@
 import argparse
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from multiprocessing import cpu_count
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 
 import librosa
 import pyloudnorm as pyln
@@ -11,6 +11,7 @@ from numpy.typing import NDArray
 from tqdm import tqdm
 
 from config import get_config
+from preprocess_manifest import StageManifest, get_manifest_path
 from style_bert_vits2.logging import logger
 from style_bert_vits2.utils.stdout_wrapper import SAFE_STDOUT
 
@@ -40,10 +41,11 @@ def resample(
     target_sr: int,
     normalize: bool,
     trim: bool,
-):
+) -> Optional[Path]:
     """
     fileを読み込んで、target_srなwavファイルに変換して、
     output_dirの中に、input_dirからの相対パスを保つように保存する
+    保存したファイルのパスを返す (読み込めないファイルの場合は None)
     """
     try:
         # librosaが読めるファイルかチェック
@@ -66,8 +68,10 @@ def resample(
         output_path = output_dir / relative_path.with_suffix(".wav")
         output_path.parent.mkdir(parents=True, exist_ok=True)
         soundfile.write(output_path, wav, sr)
+        return output_path
     except Exception as e:
         logger.warning(f"Cannot load file, so skipping: {file}, {e}")
+        return None
 
 
 if __name__ == "__main__":
@@ -111,6 +115,12 @@ if __name__ == "__main__":
         default=False,
         help="trim silence (start and end only)",
     )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        default=False,
+        help="process all files even if they are unchanged since the last run",
+    )
     args = parser.parse_args()
 
     if args.num_processes == 0:
@@ -134,17 +144,43 @@ if __name__ == "__main__":
 
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    with ThreadPoolExecutor(max_workers=processes) as executor:
-        futures = [
-            executor.submit(resample, file, input_dir, output_dir, sr, normalize, trim)
-            for file in original_files
-        ]
-        for future in tqdm(
-            as_completed(futures),
-            total=len(original_files),
-            file=SAFE_STDOUT,
-            dynamic_ncols=True,
+    # 前回から内容もパラメータも変わっていないファイルはスキップする
+    manifest = StageManifest(
+        get_manifest_path(output_dir, "resample"),
+        output_dir,
+        {"sr": sr, "normalize": normalize, "trim": trim},
+    )
+    if args.force:
+        manifest.invalidate()
+    pending, skipped = manifest.plan(
+        {file.relative_to(input_dir).as_posix(): file for file in original_files}
+    )
+    logger.info(f"{len(pending)} files to process, {skipped} unchanged files skipped")
+
+    # librosa の処理は GIL を解放しない部分が多いため、スレッドではなくプロセスで並列に処理する
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {
+            executor.submit(
+                resample, file, input_dir, output_dir, sr, normalize, trim
+            ): (key, file, file_hash)
+            for key, file, file_hash in pending
+        }
+        for i, future in enumerate(
+            tqdm(
+                as_completed(futures),
+                total=len(futures),
+                file=SAFE_STDOUT,
+                dynamic_ncols=True,
+            )
         ):
-            pass
+            key, file, file_hash = futures[future]
+            output_path = future.result()
+            manifest.record(
+                key, file, file_hash, [] if output_path is None else [output_path]
+            )
+            # 中断されても処理済みのファイルを次回スキップできるよう、定期的に保存する
+            if i % 100 == 99:
+                manifest.save()
+    manifest.save()
 
     logger.info("Resampling Done!")
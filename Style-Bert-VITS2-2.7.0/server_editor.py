@@ -8,7 +8,10 @@ TODO: リファクタリングやドキュメンテーションやAPI整理、
 """
 
 import argparse
+import asyncio
+import base64
 import io
+import json
 import shutil
 import sys
 import webbrowser
@@ -16,16 +19,18 @@ import zipfile
 from datetime import datetime
 from io import BytesIO
 from pathlib import Path
-from typing import Optional
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
 
 import numpy as np
 import requests
 import torch
 import uvicorn
-from fastapi import APIRouter, FastAPI, HTTPException, status
+from fastapi import APIRouter, FastAPI, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from numpy.typing import NDArray
 from pydantic import BaseModel
 from scipy.io import wavfile
 
@@ -40,9 +45,17 @@ from style_bert_vits2.constants import (
     VERSION,
     Languages,
 )
+from style_bert_vits2.inference_scheduler import (
+    DISCONNECT_POLL_INTERVAL,
+    InferenceCancelledError,
+    InferenceScheduler,
+)
 from style_bert_vits2.logging import logger
 from style_bert_vits2.nlp import bert_models, onnx_bert_models
 from style_bert_vits2.nlp.japanese import pyopenjtalk_worker as pyopenjtalk
+from style_bert_vits2.nlp.japanese.g2p import YomiError
+from style_bert_vits2.nlp.japanese.g2p_batch import g2p_batch
+from style_bert_vits2.nlp.japanese.g2p_store import G2P_STORE_FILENAME, open_g2p_store
 from style_bert_vits2.nlp.japanese.g2p_utils import g2kata_tone, kata_tone2phone_tone
 from style_bert_vits2.nlp.japanese.normalizer import normalize_text
 from style_bert_vits2.nlp.japanese.user_dict import (
@@ -52,8 +65,9 @@ from style_bert_vits2.nlp.japanese.user_dict import (
     rewrite_word,
     update_dict,
 )
-from style_bert_vits2.tts_model import TTSModelHolder, TTSModelInfo
+from style_bert_vits2.tts_model import TTSModel, TTSModelHolder, TTSModelInfo
 from style_bert_vits2.utils import torch_device_to_onnx_providers
+from style_bert_vits2.voice import F0Method
 
 
 # ---フロントエンド部分に関する処理---
@@ -154,6 +168,9 @@ def save_last_download(latest_release):
 ## pyopenjtalk_worker は TCP ソケットサーバーのため、ここで起動する
 pyopenjtalk.initialize_worker()
 
+# g2p の結果を前処理・学習・推論で共有する永続キャッシュを開く
+open_g2p_store(get_path_config().assets_root / G2P_STORE_FILENAME)
+
 # pyopenjtalk の辞書を更新
 update_dict()
 
@@ -180,6 +197,10 @@ parser.add_argument("--line_count", type=int, default=None)
 # parser.add_argument("--skip_default_models", action="store_true")
 parser.add_argument("--skip_static_files", action="store_true")
 parser.add_argument("--preload_onnx_bert", action="store_true")
+# 複数行の合成 (/multi_synthesis) で、異なるモデルの行を並列に推論するスレッド数
+parser.add_argument("--inference_workers", type=int, default=1)
+# 複数行の合成で、同じモデル・同じ合成パラメータの行を 1 つのバッチにまとめる最大数 (1 でバッチ化を無効にする)
+parser.add_argument("--max_batch_size", type=int, default=4)
 args = parser.parse_args()
 device = args.device
 if device == "cuda" and not torch.cuda.is_available():
@@ -209,6 +230,15 @@ if len(model_holder.model_names) == 0:
     logger.error(f"Models not found in {model_dir}.")
     sys.exit(1)
 
+# 複数行の合成は、行をスケジューラにまとめて投入し、バッチ化・並列化して推論する
+## エディターのプロジェクトは数十行になることもあるため、待ち行列の上限は設けない
+scheduler = InferenceScheduler(
+    num_workers=args.inference_workers,
+    max_batch_size=args.max_batch_size,
+    max_queue_size=0,
+    model_holder=model_holder,
+)
+
 
 app = FastAPI()
 
@@ -257,6 +287,58 @@ async def normalize(item: TextRequest):
     return normalize_text(item.text)
 
 
+class TextsRequest(BaseModel):
+    texts: list[str]
+    useJpExtra: bool = True
+    raiseYomiError: bool = False
+
+
+class G2PBatchItem(BaseModel):
+    text: str
+    normalizedText: str
+    phones: list[str]
+    tones: list[int]
+    word2ph: list[int]
+    moraTones: list[MoraTone]
+    moraCount: int
+
+
+@router.post("/g2p/batch", response_model=list[G2PBatchItem])
+async def g2p_batch_endpoint(item: TextsRequest):
+    try:
+        # 結果はキャッシュされ、キャッシュにないテキストは pyopenjtalk_worker のワーカー数だけ並列に処理される
+        results = await run_in_threadpool(
+            g2p_batch,
+            item.texts,
+            use_jp_extra=item.useJpExtra,
+            raise_yomi_error=item.raiseYomiError,
+        )
+    except YomiError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Failed to convert texts to katakana and tone, {e}",
+        )
+    return [
+        G2PBatchItem(
+            text=text,
+            normalizedText=result.norm_text,
+            phones=list(result.phones),
+            tones=list(result.tones),
+            word2ph=list(result.word2ph),
+            moraTones=[
+                MoraTone(mora=kata, tone=tone) for kata, tone in result.kata_tone
+            ],
+            moraCount=result.mora_count,
+        )
+        for text, result in zip(item.texts, results)
+    ]
+
+
+@router.post("/normalize/batch")
+async def normalize_batch(item: TextsRequest):
+    return [normalize_text(text) for text in item.texts]
+
+
 @router.get("/models_info", response_model=list[TTSModelInfo])
 def models_info():
     return model_holder.models_info
@@ -279,18 +361,25 @@ class SynthesisRequest(BaseModel):
     silenceAfter: float = 0.5
     pitchScale: float = 1.0
     intonationScale: float = 1.0
+    # ピッチ・抑揚の調整時の f0 の推定アルゴリズム ("dio" は高速だが推定を誤りやすい)
+    f0Method: F0Method = "harvest"
     speaker: Optional[str] = None
+    # True の場合、ピッチ・抑揚以外が同じ直近のリクエストで合成した音声を再調整して返す
+    # (スライダーでピッチ・抑揚だけを変えた場合に使う。ノイズによる揺らぎも同じになるため、再合成では False にする)
+    reuseAudio: bool = False
 
 
-@router.post("/synthesis", response_class=AudioResponse)
-def synthesis(request: SynthesisRequest):
-    if args.line_length is not None and len(request.text) > args.line_length:
+def check_line_length(text: str) -> None:
+    if args.line_length is not None and len(text) > args.line_length:
         raise HTTPException(
             status_code=400,
             detail=f"1行の文字数は{args.line_length}文字以下にしてください。",
         )
+
+
+def get_model(request: SynthesisRequest) -> TTSModel:
     try:
-        model = model_holder.get_model(
+        return model_holder.get_model(
             model_name=request.model, model_path_str=request.modelFile
         )
     except Exception as e:
@@ -299,7 +388,11 @@ def synthesis(request: SynthesisRequest):
             status_code=500,
             detail=f"Failed to load model {request.model} from {request.modelFile}, {e}",
         )
-    text = request.text
+
+
+def get_infer_kwargs(request: SynthesisRequest, model: TTSModel) -> dict[str, Any]:
+    """SynthesisRequest を TTSModel.infer() の引数に変換する"""
+
     kata_tone_list = [
         (mora_tone.mora, mora_tone.tone) for mora_tone in request.moraToneList
     ]
@@ -312,8 +405,8 @@ def synthesis(request: SynthesisRequest):
             status_code=400,
             detail=f"Speaker {request.speaker} not found in {model.spk2id}",
         )
-    sr, audio = model.infer(
-        text=text,
+    return dict(
+        text=request.text,
         language=request.language,
         sdp_ratio=request.sdpRatio,
         noise=request.noise,
@@ -328,9 +421,18 @@ def synthesis(request: SynthesisRequest):
         line_split=False,
         pitch_scale=request.pitchScale,
         intonation_scale=request.intonationScale,
+        f0_method=request.f0Method,
+        reuse_raw_audio=request.reuseAudio,
         speaker_id=sid,
     )
 
+
+@router.post("/synthesis", response_class=AudioResponse)
+def synthesis(request: SynthesisRequest):
+    check_line_length(request.text)
+    model = get_model(request)
+    sr, audio = model.infer(**get_infer_kwargs(request, model))
+
     with BytesIO() as wavContent:
         wavfile.write(wavContent, sr, audio)
         return Response(content=wavContent.getvalue(), media_type="audio/wav")
@@ -340,64 +442,164 @@ class MultiSynthesisRequest(BaseModel):
     lines: list[SynthesisRequest]
 
 
-@router.post("/multi_synthesis", response_class=AudioResponse)
-def multi_synthesis(request: MultiSynthesisRequest):
+def prepare_lines(
+    request: MultiSynthesisRequest,
+) -> list[tuple[TTSModel, dict[str, Any]]]:
+    """
+    各行のモデルと TTSModel.infer() の引数を求める。
+    同じモデルを使う行が多数あっても、モデルの解決は 1 モデルにつき 1 回だけ行う。
+    """
+
     lines = request.lines
     if args.line_count is not None and len(lines) > args.line_count:
         raise HTTPException(
             status_code=400,
             detail=f"行数は{args.line_count}行以下にしてください。",
         )
-    audios = []
-    sr = None
-    for i, req in enumerate(lines):
-        if args.line_length is not None and len(req.text) > args.line_length:
-            raise HTTPException(
-                status_code=400,
-                detail=f"1行の文字数は{args.line_length}文字以下にしてください。",
-            )
-        try:
-            model = model_holder.get_model(
-                model_name=req.model, model_path_str=req.modelFile
-            )
-        except Exception as e:
-            logger.error(e)
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to load model {req.model} from {req.modelFile}, {e}",
+    for line in lines:
+        check_line_length(line.text)
+
+    models: dict[tuple[str, str], TTSModel] = {}
+    prepared = []
+    for line in lines:
+        model = models.get((line.model, line.modelFile))
+        if model is None:
+            model = get_model(line)
+            models[(line.model, line.modelFile)] = model
+        prepared.append((model, get_infer_kwargs(line, model)))
+    return prepared
+
+
+async def iter_line_audios(
+    prepared: list[tuple[TTSModel, dict[str, Any]]],
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+) -> AsyncIterator[tuple[int, tuple[int, NDArray[Any]]]]:
+    """
+    全ての行をスケジューラに投入し、合成が完了した順に (行番号, (サンプリングレート, 音声データ)) を返す。
+    同じモデル・同じ合成パラメータの行はスケジューラによってバッチにまとめて推論され、異なるモデルの行は並列に推論される。
+    途中で中断された場合 (クライアントの切断・エラー) は、まだ推論が始まっていない行を取り消す。
+    """
+
+    # 行ごとのバッチの間にモデルがアンロードされないよう、リクエストの間は使う全てのモデルを常駐させる
+    ## メモリ上限がないため、最後に選ばれたモデル (current_model) 以外はリクエストの完了後にアンロードされる
+    models = list({id(model): model for model, _ in prepared}.values())
+    acquired: list[TTSModel] = []
+    tasks: list[asyncio.Task[tuple[int, NDArray[Any]]]] = []
+    try:
+        for model in models:
+            await run_in_threadpool(model_holder.acquire_model, model)
+            acquired.append(model)
+        tasks = [
+            asyncio.create_task(
+                scheduler.infer(str(model.model_path), model, **infer_kwargs)
             )
-        text = req.text
-        kata_tone_list = [
-            (mora_tone.mora, mora_tone.tone) for mora_tone in req.moraToneList
+            for model, infer_kwargs in prepared
         ]
-        phone_tone = kata_tone2phone_tone(kata_tone_list)
-        tone = [t for _, t in phone_tone]
-        sr, audio = model.infer(
-            text=text,
-            language=req.language,
-            sdp_ratio=req.sdpRatio,
-            noise=req.noise,
-            noise_w=req.noisew,
-            length=1 / req.speed,
-            given_tone=tone,
-            style=req.style,
-            style_weight=req.styleWeight,
-            assist_text=req.assistText,
-            assist_text_weight=req.assistTextWeight,
-            use_assist_text=bool(req.assistText),
-            line_split=False,
-            pitch_scale=req.pitchScale,
-            intonation_scale=req.intonationScale,
-        )
+        line_indices = {task: i for i, task in enumerate(tasks)}
+        pending: set[asyncio.Task[tuple[int, NDArray[Any]]]] = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=DISCONNECT_POLL_INTERVAL,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in done:
+                yield line_indices[task], task.result()
+            if is_disconnected is not None and await is_disconnected():
+                raise InferenceCancelledError("Client disconnected")
+    finally:
+        for task in tasks:
+            task.cancel()
+            # 同時に完了した他の行のエラーが、取得されないまま破棄されないようにする
+            if task.done() and not task.cancelled():
+                task.exception()
+        # 取り消した行の推論が続いていても、スケジューラが推論の間はモデルを常駐させる
+        for model in acquired:
+            model_holder.release_model(model)
+
+
+def concat_line_audios(
+    lines: list[SynthesisRequest], results: list[tuple[int, NDArray[Any]]]
+) -> bytes:
+    """行ごとの音声を、各行の silenceAfter 秒の無音を挟んで連結し、WAV ファイルの内容を返す"""
+
+    audios = []
+    sr = results[-1][0]
+    for i, (line, (sr, audio)) in enumerate(zip(lines, results)):
         audios.append(audio)
         if i < len(lines) - 1:
-            silence = int(sr * req.silenceAfter)
+            silence = int(sr * line.silenceAfter)
             audios.append(np.zeros(silence, dtype=np.int16))
     audio = np.concatenate(audios)
 
     with BytesIO() as wavContent:
         wavfile.write(wavContent, sr, audio)
-        return Response(content=wavContent.getvalue(), media_type="audio/wav")
+        return wavContent.getvalue()
+
+
+@router.post("/multi_synthesis", response_class=AudioResponse)
+async def multi_synthesis(request: MultiSynthesisRequest, raw_request: Request):
+    prepared = await run_in_threadpool(prepare_lines, request)
+    if len(prepared) == 0:
+        raise HTTPException(status_code=400, detail="No lines to synthesize")
+    results: list[Any] = [None] * len(prepared)
+    try:
+        async for i, result in iter_line_audios(
+            prepared, is_disconnected=raw_request.is_disconnected
+        ):
+            results[i] = result
+    except InferenceCancelledError as e:
+        # クライアントは既に切断されているため、レスポンスは誰にも届かない
+        logger.info(f"Request cancelled: {e}")
+        return Response(status_code=499)
+    content = await run_in_threadpool(concat_line_audios, request.lines, results)
+    return Response(content=content, media_type="audio/wav")
+
+
+@router.post("/multi_synthesis/stream")
+async def multi_synthesis_stream(request: MultiSynthesisRequest):
+    """
+    /multi_synthesis と同じ音声を合成し、進捗を NDJSON (1 行 1 つの JSON) でストリーミングする。
+    - 1 行の合成が完了するたびに {"type": "progress", "completed": 完了した行数, "total": 行数, "line": 行番号}
+    - 最後に {"type": "audio", "data": Base64 でエンコードした WAV ファイル}
+    - エラー時は {"type": "error", "detail": エラーの内容} を送って終了する
+    クライアントが切断すると、まだ推論が始まっていない行は取り消される。
+    """
+
+    prepared = await run_in_threadpool(prepare_lines, request)
+    if len(prepared) == 0:
+        raise HTTPException(status_code=400, detail="No lines to synthesize")
+
+    async def stream() -> AsyncIterator[str]:
+        results: list[Any] = [None] * len(prepared)
+        completed = 0
+        # クライアントが切断されるとこのジェネレーターが閉じられるため、その時点で iter_line_audios() も閉じて未完了の行を取り消す
+        line_audios = iter_line_audios(prepared)
+        try:
+            async for i, result in line_audios:
+                results[i] = result
+                completed += 1
+                yield json.dumps(
+                    {
+                        "type": "progress",
+                        "completed": completed,
+                        "total": len(prepared),
+                        "line": i,
+                    }
+                ) + "\n"
+            content = await run_in_threadpool(
+                concat_line_audios, request.lines, results
+            )
+        except Exception as e:
+            logger.error(f"Multi synthesis failed: {e}")
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+            return
+        finally:
+            await line_audios.aclose()
+        data = base64.b64encode(content).decode("ascii")
+        yield json.dumps({"type": "audio", "data": data}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 
 class UserDictWordRequest(BaseModel):
@@ -5,19 +5,23 @@ TODO: server_editor.pyと統合する?
 
 import argparse
 import os
-import sys
+import tempfile
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict
 from io import BytesIO
 from pathlib import Path
 from typing import Any, Optional
 from urllib.parse import unquote
 
-import GPUtil
-import psutil
-import torch
 import uvicorn
-from fastapi import FastAPI, HTTPException, Query, Request, status
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, Response
+from fastapi.responses import FileResponse, JSONResponse, Response
+from pydantic import BaseModel
 from scipy.io import wavfile
 
 from config import get_config
@@ -33,10 +37,30 @@ from style_bert_vits2.constants import (
     DEFAULT_STYLE_WEIGHT,
     Languages,
 )
+from style_bert_vits2.inference_scheduler import (
+    InferenceCancelledError,
+    InferenceScheduler,
+    InferenceTimeoutError,
+    QueueFullError,
+)
 from style_bert_vits2.logging import logger
-from style_bert_vits2.nlp import bert_models, onnx_bert_models
+from style_bert_vits2.nlp import (
+    bert_models,
+    clean_text,
+    extract_bert_feature,
+    onnx_bert_models,
+)
 from style_bert_vits2.nlp.japanese import pyopenjtalk_worker as pyopenjtalk
+from style_bert_vits2.nlp.japanese.g2p import YomiError
+from style_bert_vits2.nlp.japanese.g2p_batch import g2p_batch
+from style_bert_vits2.nlp.japanese.g2p_store import G2P_STORE_FILENAME, open_g2p_store
+from style_bert_vits2.nlp.japanese.g2p_utils import g2kata_tone
+from style_bert_vits2.nlp.japanese.normalizer import normalize_text
 from style_bert_vits2.nlp.japanese.user_dict import update_dict
+from style_bert_vits2.synthesis_worker_pool import (
+    SynthesisWorkerConfig,
+    SynthesisWorkerPool,
+)
 from style_bert_vits2.tts_model import TTSModel, TTSModelHolder
 from style_bert_vits2.utils import torch_device_to_onnx_providers
 
@@ -44,13 +68,65 @@ from style_bert_vits2.utils import torch_device_to_onnx_providers
 config = get_config()
 ln = config.server_config.language
 
+# ウォームアップ合成に使うテキスト
+WARMUP_TEXTS = {
+    Languages.JP: "こんにちは、よろしくお願いします。",
+    Languages.EN: "Hello, nice to meet you.",
+    Languages.ZH: "你好，很高兴认识你。",
+}
+
+
+class Readiness:
+    """
+    起動時のバックグラウンド初期化の進捗。
+    サーバーは初期化の完了を待たずにリッスンを開始し、完了までは /ready が 503 を返す。
+    """
+
+    def __init__(self) -> None:
+        self.started_at = time.time()
+        self.event = threading.Event()
+        self.stage = "starting"
+        self.error: Optional[str] = None
+        # 各初期化ステップの所要時間 (秒)
+        self.timings: dict[str, float] = {}
+        self.first_request_latency: Optional[float] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.event.is_set()
+
+    @contextmanager
+    def step(self, stage: str) -> Iterator[None]:
+        self.stage = stage
+        start_time = time.time()
+        yield
+        self.timings[stage] = round(time.time() - start_time, 3)
+
+    def set_ready(self) -> None:
+        self.stage = "ready"
+        self.timings["startup_to_ready"] = round(time.time() - self.started_at, 3)
+        self.event.set()
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "ready": self.is_ready,
+            "stage": self.stage,
+            "error": self.error,
+            "timings": self.timings,
+            "first_request_latency": self.first_request_latency,
+        }
+
 
-# pyopenjtalk_worker を起動
-## pyopenjtalk_worker は TCP ソケットサーバーのため、ここで起動する
-pyopenjtalk.initialize_worker()
+readiness = Readiness()
 
-# dict_data/ 以下の辞書データを pyopenjtalk に適用
-update_dict()
+
+def require_ready():
+    if not readiness.is_ready:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Server is starting up ({readiness.stage})",
+            headers={"Retry-After": "1"},
+        )
 
 
 def raise_validation_error(msg: str, param: str):
@@ -65,7 +141,25 @@ class AudioResponse(Response):
     media_type = "audio/wav"
 
 
+class G2PBatchRequest(BaseModel):
+    # 正規化前のテキストのリスト
+    texts: list[str]
+    use_jp_extra: bool = True
+    raise_yomi_error: bool = False
+
+
 loaded_models: list[TTSModel] = []
+# synthesis_workers が 1 以上のとき、音声合成を行うワーカープロセスのプール
+synthesis_pool: Optional[SynthesisWorkerPool] = None
+
+
+def get_model_kwargs(onnx_intra_op_threads: int) -> dict[str, Any]:
+    """サーバーの設定から決まる TTSModel() の引数 (合成ワーカーでも同じ引数でモデルを構築する)"""
+    return dict(
+        onnx_intra_op_num_threads=onnx_intra_op_threads,
+        onnx_inter_op_num_threads=config.server_config.onnx_inter_op_threads,
+        use_bf16=config.server_config.use_bf16,
+    )
 
 
 def load_models(model_holder: TTSModelHolder):
@@ -77,6 +171,8 @@ def load_models(model_holder: TTSModelHolder):
             config_path=model_holder.root_dir / model_name / "config.json",
             style_vec_path=model_holder.root_dir / model_name / "style_vectors.npy",
             device=model_holder.device,
+            onnx_providers=model_holder.onnx_providers,
+            **get_model_kwargs(config.server_config.onnx_intra_op_threads),
         )
         # 起動時に全てのモデルを読み込むのは時間がかかりメモリを食うのでやめる
         # model.load()
@@ -90,35 +186,13 @@ if __name__ == "__main__":
         "--dir", "-d", type=str, help="Model directory", default=config.assets_root
     )
     parser.add_argument("--preload_onnx_bert", action="store_true")
-    args = parser.parse_args()
-
-    if args.cpu:
-        device = "cpu"
-    else:
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-
-    # 事前に BERT モデル/トークナイザーをロードしておく
-    ## ここでロードしなくても必要になった際に自動ロードされるが、時間がかかるため事前にロードしておいた方が体験が良い
-    ## 英語や中国語で音声合成するユースケースは限られていることから、VRAM 節約のため日本語の BERT モデル/トークナイザーのみロードする
-    bert_models.load_model(Languages.JP, device_map=device)
-    bert_models.load_tokenizer(Languages.JP)
-    # VRAM 節約のため、既定では ONNX 版 BERT モデル/トークナイザーは事前ロードしない
-    if args.preload_onnx_bert:
-        onnx_bert_models.load_model(
-            Languages.JP, onnx_providers=torch_device_to_onnx_providers(device)
-        )
-        onnx_bert_models.load_tokenizer(Languages.JP)
-
-    model_dir = Path(args.dir)
-    model_holder = TTSModelHolder(
-        model_dir, device, torch_device_to_onnx_providers(device)
+    parser.add_argument(
+        "--synthesis_workers",
+        type=int,
+        default=config.server_config.synthesis_workers,
+        help="Number of synthesis worker processes (0: synthesize in the server process)",
     )
-    if len(model_holder.model_names) == 0:
-        logger.error(f"Models not found in {model_dir}.")
-        sys.exit(1)
-
-    logger.info("Loading models...")
-    load_models(model_holder)
+    args = parser.parse_args()
 
     limit = config.server_config.limit
     if limit < 1:
@@ -127,6 +201,163 @@ if __name__ == "__main__":
         logger.info(
             f"The maximum length of the text is {limit}. If you want to change it, modify config.yml. Set limit to -1 to remove the limit."
         )
+    request_timeout: Optional[float] = config.server_config.request_timeout
+    if request_timeout is not None and request_timeout <= 0:
+        request_timeout = None
+    scheduler = InferenceScheduler(
+        num_workers=config.server_config.inference_workers,
+        max_batch_size=config.server_config.max_batch_size,
+        batch_window=config.server_config.batch_window_ms / 1000,
+        max_queue_size=config.server_config.max_queue_size,
+    )
+    # model_holder は warm_up() で初期化される
+    model_holder: TTSModelHolder
+
+    def warm_up():
+        """
+        起動に時間のかかる初期化をバックグラウンドで行う。
+        完了するまで、モデルを必要とするエンドポイントは 503 を返す。
+        """
+
+        global model_holder, synthesis_pool
+
+        # pyopenjtalk_worker を起動
+        ## pyopenjtalk_worker はソケットサーバーのため、ここで起動する
+        ## 複数のリクエストの g2p を並列に処理できるよう、設定された数のワーカープロセスを起動する
+        with readiness.step("pyopenjtalk_worker"):
+            pyopenjtalk.initialize_worker(
+                num_workers=config.server_config.pyopenjtalk_workers
+            )
+
+        # dict_data/ 以下の辞書データを pyopenjtalk に適用
+        ## g2p の結果を前処理・学習・推論で共有する永続キャッシュも開く
+        with readiness.step("user_dict"):
+            open_g2p_store(config.assets_root / G2P_STORE_FILENAME)
+            update_dict()
+
+        with readiness.step("bert"):
+            import torch
+
+            if args.cpu:
+                device = "cpu"
+            else:
+                device = "cuda" if torch.cuda.is_available() else "cpu"
+
+            # 事前に BERT モデル/トークナイザーをロードしておく
+            ## ここでロードしなくても必要になった際に自動ロードされるが、時間がかかるため事前にロードしておいた方が体験が良い
+            ## 英語や中国語で音声合成するユースケースは限られていることから、VRAM 節約のため日本語の BERT モデル/トークナイザーのみロードする
+            ## 合成ワーカーを使う場合、BERT モデルは各ワーカーがロードする
+            if args.synthesis_workers <= 0:
+                bert_models.load_model(Languages.JP, device_map=device)
+                bert_models.load_tokenizer(Languages.JP)
+            # VRAM 節約のため、既定では ONNX 版 BERT モデル/トークナイザーは事前ロードしない
+            if args.preload_onnx_bert and args.synthesis_workers <= 0:
+                onnx_bert_models.load_model(
+                    Languages.JP,
+                    onnx_providers=torch_device_to_onnx_providers(device),
+                    intra_op_num_threads=config.server_config.onnx_intra_op_threads,
+                    inter_op_num_threads=config.server_config.onnx_inter_op_threads,
+                    use_quantized_model=config.server_config.use_quantized_onnx,
+                )
+                onnx_bert_models.load_tokenizer(Languages.JP)
+
+        with readiness.step("models"):
+            model_dir = Path(args.dir)
+            memory_budget_mb = config.server_config.memory_budget_mb
+            memory_budget = memory_budget_mb * 1024**2 if memory_budget_mb > 0 else None
+            # 合成ワーカーを使う場合、このプロセスのモデルはリクエストの検証とモデル情報の取得にのみ使い、ロードしない
+            model_holder = TTSModelHolder(
+                model_dir,
+                device,
+                torch_device_to_onnx_providers(device),
+                memory_budget=memory_budget,
+                pinned_model_names=config.server_config.pinned_models,
+                use_quantized_onnx=config.server_config.use_quantized_onnx,
+            )
+            if len(model_holder.model_names) == 0:
+                raise RuntimeError(f"Models not found in {model_dir}.")
+            logger.info("Loading models...")
+            load_models(model_holder)
+            scheduler.model_holder = model_holder
+
+        # 音声合成をワーカープロセスで並列に行う
+        ## 各ワーカーのスレッド数の合計が CPU コア数を超えないようにする
+        if args.synthesis_workers > 0:
+            with readiness.step("synthesis_workers"):
+                num_threads = config.server_config.synthesis_worker_threads
+                if num_threads <= 0:
+                    num_threads = max(
+                        1, (os.cpu_count() or 1) // args.synthesis_workers
+                    )
+                onnx_intra_op_threads = config.server_config.onnx_intra_op_threads
+                synthesis_pool = SynthesisWorkerPool(
+                    SynthesisWorkerConfig(
+                        model_dir=model_dir,
+                        device=device,
+                        onnx_providers=torch_device_to_onnx_providers(device),
+                        num_threads=num_threads,
+                        memory_budget=memory_budget,
+                        pinned_model_names=config.server_config.pinned_models,
+                        use_quantized_onnx=config.server_config.use_quantized_onnx,
+                        model_kwargs=get_model_kwargs(
+                            onnx_intra_op_threads
+                            if onnx_intra_op_threads > 0
+                            else num_threads
+                        ),
+                        pyopenjtalk_workers=config.server_config.pyopenjtalk_workers,
+                        g2p_store_path=config.assets_root / G2P_STORE_FILENAME,
+                    ),
+                    num_workers=args.synthesis_workers,
+                    max_queue_size=config.server_config.max_queue_size,
+                )
+                synthesis_pool.start()
+
+        # よく使うモデルは起動時にロードしておき、初回リクエストの待ち時間をなくす
+        preloaded_models: list[TTSModel] = []
+        with readiness.step("preload"):
+            for model_name in config.server_config.preload_models:
+                if model_name not in model_holder.model_names:
+                    logger.warning(
+                        f"Preload model {model_name} not found in {model_dir}"
+                    )
+                    continue
+                logger.info(f"Preloading {model_name}...")
+                model = loaded_models[model_holder.model_names.index(model_name)]
+                if synthesis_pool is not None:
+                    synthesis_pool.broadcast("load_model", str(model.model_path))
+                else:
+                    model_holder.load_model(model)
+                preloaded_models.append(model)
+
+        # 初回リクエストがカーネルの初期化や JIT のコストを払わないよう、一度合成しておく
+        ## 事前ロードしたモデルがなければ、g2p と BERT 特徴量の抽出だけを行う
+        if config.server_config.warmup:
+            with readiness.step("warmup"):
+                language = Languages(ln)
+                text = WARMUP_TEXTS[language]
+                if synthesis_pool is not None:
+                    synthesis_pool.broadcast("warm_up", text, language)
+                elif len(preloaded_models) > 0:
+                    for model in preloaded_models:
+                        with model_holder.use_model(model):
+                            model.infer(text=text, language=language)
+                else:
+                    norm_text, _, _, word2ph = clean_text(text, language)
+                    extract_bert_feature(norm_text, word2ph, language, device)
+
+    def run_warm_up():
+        try:
+            warm_up()
+        except Exception as e:
+            readiness.stage = "failed"
+            readiness.error = str(e)
+            logger.exception(f"Server initialization failed: {e}")
+            return
+        readiness.set_ready()
+        logger.success(
+            f"Server is ready ({readiness.timings['startup_to_ready']:.2f}s after startup): {readiness.timings}"
+        )
+
     app = FastAPI()
     allow_origins = config.server_config.origins
     if allow_origins:
@@ -143,7 +374,28 @@ if __name__ == "__main__":
     # app.logger = logger
     # ↑効いていなさそう。loggerをどうやって上書きするかはよく分からなかった。
 
-    @app.api_route("/voice", methods=["GET", "POST"], response_class=AudioResponse)
+    @app.get("/health")
+    def health():
+        """サーバーが起動しているかどうか (初期化の完了を待たない)"""
+        return {"status": "ok"}
+
+    @app.get("/ready")
+    def ready():
+        """初期化が完了し、音声合成を受け付けられるかどうか"""
+        if not readiness.is_ready:
+            return JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content=readiness.to_dict(),
+                headers={"Retry-After": "1"},
+            )
+        return readiness.to_dict()
+
+    @app.api_route(
+        "/voice",
+        methods=["GET", "POST"],
+        response_class=AudioResponse,
+        dependencies=[Depends(require_ready)],
+    )
     async def voice(
         request: Request,
         text: str = Query(..., min_length=1, max_length=limit, description="セリフ"),
@@ -195,8 +447,13 @@ if __name__ == "__main__":
         reference_audio_path: Optional[str] = Query(
             None, description="スタイルを音声ファイルで行う"
         ),
+        reference_audio_id: Optional[str] = Query(
+            None,
+            description="スタイルを登録済みの参照音声で行う。`POST /models/{model_id}/reference_audio`が返したIDを指定",
+        ),
     ):
         """Infer text to speech(テキストから感情付き音声を生成する)"""
+        start_time = time.time()
         logger.info(
             f"{request.client.host}:{request.client.port}/voice  { unquote(str(request.query_params) )}"
         )
@@ -241,14 +498,20 @@ if __name__ == "__main__":
             speaker_id = model.spk2id[speaker_name]
         if style not in model.style2id.keys():
             raise_validation_error(f"style={style} not found", "style")
+        if reference_audio_id and reference_audio_id not in model.reference_style_cache:
+            raise_validation_error(
+                f"reference_audio_id={reference_audio_id} not found",
+                "reference_audio_id",
+            )
         assert style is not None
         if encoding is not None:
             text = unquote(text, encoding=encoding)
-        sr, audio = model.infer(
+        infer_kwargs: dict[str, Any] = dict(
             text=text,
             language=language,
             speaker_id=speaker_id,
             reference_audio_path=reference_audio_path,
+            reference_audio_id=reference_audio_id,
             sdp_ratio=sdp_ratio,
             noise=noise,
             noise_w=noisew,
@@ -261,16 +524,86 @@ if __name__ == "__main__":
             style=style,
             style_weight=style_weight,
         )
+        # 音声合成はイベントループをブロックしないよう、スケジューラ経由で専用スレッド (または合成ワーカー) で実行する
+        try:
+            if synthesis_pool is not None:
+                sr, audio = await synthesis_pool.infer(
+                    str(model.model_path),
+                    timeout=request_timeout,
+                    is_disconnected=request.is_disconnected,
+                    **infer_kwargs,
+                )
+            else:
+                sr, audio = await scheduler.infer(
+                    str(model.model_path),
+                    model,
+                    timeout=request_timeout,
+                    is_disconnected=request.is_disconnected,
+                    **infer_kwargs,
+                )
+        except QueueFullError as e:
+            logger.warning(f"Request rejected: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e),
+                headers={"Retry-After": "1"},
+            )
+        except InferenceTimeoutError as e:
+            logger.warning(f"Request aborted: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(e)
+            )
+        except InferenceCancelledError as e:
+            # クライアントは既に切断されているため、レスポンスは誰にも届かない
+            logger.info(f"Request cancelled: {e}")
+            return Response(status_code=499)
         logger.success("Audio data generated and sent successfully")
+        if readiness.first_request_latency is None:
+            readiness.first_request_latency = round(time.time() - start_time, 3)
+            logger.info(
+                f"First request latency: {readiness.first_request_latency:.2f}s"
+            )
         with BytesIO() as wavContent:
             wavfile.write(wavContent, sr, audio)
             return Response(content=wavContent.getvalue(), media_type="audio/wav")
 
-    @app.post("/g2p")
+    @app.post("/g2p", dependencies=[Depends(require_ready)])
     def g2p(text: str):
         return g2kata_tone(normalize_text(text))
 
-    @app.get("/models/info")
+    @app.post("/g2p/batch", dependencies=[Depends(require_ready)])
+    def g2p_batch_endpoint(request: G2PBatchRequest):
+        """
+        複数のテキストの正規化と g2p をまとめて行い、正規化されたテキスト・音素・音高・word2ph・モーラ数を返す。
+        結果はキャッシュされ、キャッシュにないテキストは pyopenjtalk_worker のワーカー数だけ並列に処理される。
+        """
+
+        for index, text in enumerate(request.texts):
+            if limit is not None and len(text) > limit:
+                msg = f"texts[{index}] is longer than {limit} characters"
+                logger.warning(f"Validation error: {msg}")
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail=[
+                        dict(
+                            type="invalid_params", msg=msg, loc=["body", "texts", index]
+                        )
+                    ],
+                )
+        try:
+            results = g2p_batch(
+                request.texts,
+                use_jp_extra=request.use_jp_extra,
+                raise_yomi_error=request.raise_yomi_error,
+            )
+        except YomiError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        return [
+            dict(text=text, **asdict(result))
+            for text, result in zip(request.texts, results)
+        ]
+
+    @app.get("/models/info", dependencies=[Depends(require_ready)])
     def get_loaded_models_info():
         """ロードされたモデル情報の取得"""
 
@@ -283,19 +616,103 @@ if __name__ == "__main__":
                 "spk2id": model.spk2id,
                 "id2spk": model.id2spk,
                 "style2id": model.style2id,
+                "loaded": (
+                    str(model.model_path) in synthesis_pool.resident_models
+                    if synthesis_pool is not None
+                    else model.is_loaded
+                ),
+                "pinned": model_holder.is_pinned(model),
             }
         return result
 
-    @app.post("/models/refresh")
-    def refresh():
+    def get_model_or_404(model_id: int) -> TTSModel:
+        if model_id < 0 or model_id >= len(loaded_models):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"model_id={model_id} not found",
+            )
+        return loaded_models[model_id]
+
+    @app.post("/models/{model_id}/load", dependencies=[Depends(require_ready)])
+    async def load_model(
+        model_id: int,
+        pin: bool = Query(False, description="メモリ上限を超えてもアンロードしない"),
+    ):
+        """モデルをロードして常駐させる"""
+        model = get_model_or_404(model_id)
+        if pin:
+            model_holder.pin_model(model_holder.get_model_name(model))
+        if synthesis_pool is not None:
+            await synthesis_pool.broadcast_async(
+                "load_model", str(model.model_path), pin
+            )
+        else:
+            await run_in_threadpool(model_holder.load_model, model)
+        return get_loaded_models_info()[str(model_id)]
+
+    @app.post("/models/{model_id}/unload", dependencies=[Depends(require_ready)])
+    async def unload_model(model_id: int):
+        """モデルの固定を解除してアンロードする"""
+        model = get_model_or_404(model_id)
+        model_holder.unpin_model(model_holder.get_model_name(model))
+        if synthesis_pool is not None:
+            unloaded = all(
+                await synthesis_pool.broadcast_async(
+                    "unload_model", str(model.model_path)
+                )
+            )
+        else:
+            unloaded = await run_in_threadpool(model_holder.unload_model, model)
+        if not unloaded:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"model_id={model_id} is in use",
+            )
+        return get_loaded_models_info()[str(model_id)]
+
+    @app.post(
+        "/models/{model_id}/reference_audio", dependencies=[Depends(require_ready)]
+    )
+    async def register_reference_audio(request: Request, model_id: int):
+        """
+        参照音声を登録する (リクエストボディに音声ファイルの内容をそのまま指定)。
+        返されたIDを`/voice`の`reference_audio_id`に指定すると、毎回音声からスタイルを推論せずに済む
+        """
+        model = get_model_or_404(model_id)
+        content = await request.body()
+        if len(content) == 0:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Audio file content is required in the request body",
+            )
+        # 推論はファイルから行うため、一時ファイルに書き出す (Windows では開いたままのファイルを他から開けない)
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(content)
+        try:
+            reference_id = await run_in_threadpool(
+                model.register_reference_audio, f.name
+            )
+        finally:
+            os.remove(f.name)
+        return {"reference_audio_id": reference_id}
+
+    @app.post("/models/refresh", dependencies=[Depends(require_ready)])
+    async def refresh():
         """モデルをパスに追加/削除した際などに読み込ませる"""
-        model_holder.refresh()
-        load_models(model_holder)
+        await run_in_threadpool(model_holder.refresh)
+        await run_in_threadpool(load_models, model_holder)
+        if synthesis_pool is not None:
+            await synthesis_pool.broadcast_async("refresh")
         return get_loaded_models_info()
 
     @app.get("/status")
     def get_status():
         """実行環境のステータスを取得"""
+        # 起動を速くするため、ステータス取得にしか使わないライブラリは遅延 import する
+        import GPUtil
+        import psutil
+        import torch
+
         cpu_percent = psutil.cpu_percent(interval=1)
         memory_info = psutil.virtual_memory()
         memory_total = memory_info.total
@@ -327,6 +744,20 @@ if __name__ == "__main__":
             "memory_used": memory_used,
             "memory_percent": memory_percent,
             "gpu": gpuInfo,
+            "queue_depth": (
+                synthesis_pool.queue_depth
+                if synthesis_pool is not None
+                else scheduler.queue_depth
+            ),
+            "resident_model_memory": (
+                0
+                if not readiness.is_ready
+                else (
+                    synthesis_pool.resident_memory_size
+                    if synthesis_pool is not None
+                    else model_holder.resident_memory_size
+                )
+            ),
         }
 
     @app.get("/tools/get_audio", response_class=AudioResponse)
@@ -343,6 +774,9 @@ if __name__ == "__main__":
             raise_validation_error(f"wav file not found in {path}", "path")
         return FileResponse(path=path, media_type="audio/wav")
 
+    # 重い初期化はバックグラウンドで行い、サーバーはすぐにリッスンを開始する
+    threading.Thread(target=run_warm_up, name="warm-up", daemon=True).start()
+
     logger.info(f"server listen: http://127.0.0.1:{config.server_config.port}")
     logger.info(f"API docs: http://127.0.0.1:{config.server_config.port}/docs")
     logger.info(
@@ -351,3 +785,5 @@ if __name__ == "__main__":
     uvicorn.run(
         app, port=config.server_config.port, host="0.0.0.0", log_level="warning"
     )
+    if synthesis_pool is not None:
+        synthesis_pool.shutdown()
@@ -1,15 +1,15 @@
 import argparse
 import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from queue import Queue
-from threading import Thread
-from typing import Any, Optional
+from typing import Any
 
 import soundfile as sf
 import torch
 from tqdm import tqdm
 
 from config import get_path_config
+from preprocess_manifest import StageManifest, get_manifest_path
 from style_bert_vits2.logging import logger
 from style_bert_vits2.utils.stdout_wrapper import SAFE_STDOUT
 
@@ -67,7 +67,11 @@ def split_wav(
     max_sec: float = 12,
     min_silence_dur_ms: int = 700,
     time_suffix: bool = False,
-) -> tuple[float, int]:
+) -> tuple[float, list[Path]]:
+    """
+    音声ファイルを発話ごとに分割して target_dir に保存し、保存した音声の合計時間 (秒) とファイルのパスを返す。
+    """
+
     margin: int = 200  # ミリ秒単位で、音声の前後に余裕を持たせる
     speech_timestamps = get_stamps(
         vad_model=vad_model,
@@ -86,7 +90,7 @@ def split_wav(
     target_dir.mkdir(parents=True, exist_ok=True)
 
     total_time_ms: float = 0
-    count = 0
+    outputs: list[Path] = []
 
     # タイムスタンプに従って分割し、ファイルに保存
     for i, ts in enumerate(speech_timestamps):
@@ -103,9 +107,45 @@ def split_wav(
             file = f"{file_name}-{i}.wav"
         sf.write(str(target_dir / file), segment, sr)
         total_time_ms += end_ms - start_ms
-        count += 1
+        outputs.append(target_dir / file)
+
+    return total_time_ms / 1000, outputs
+
+
+# Silero VADのモデルは、同じインスタンスで並列処理するとおかしくなるらしい
+# ワーカープロセスごとにモデルをロードする
+vad_model: Any = None
+vad_utils: Any = None
 
-    return total_time_ms / 1000, count
+
+def load_vad_model() -> None:
+    global vad_model, vad_utils
+    vad_model, vad_utils = torch.hub.load(
+        repo_or_dir="litagin02/silero-vad",
+        model="silero_vad",
+        onnx=True,
+        trust_repo=True,
+    )
+
+
+def process_file(
+    file: Path,
+    target_dir: Path,
+    min_sec: float,
+    max_sec: float,
+    min_silence_dur_ms: int,
+    time_suffix: bool,
+) -> tuple[float, list[Path]]:
+    return split_wav(
+        vad_model=vad_model,
+        utils=vad_utils,
+        audio_file=file,
+        target_dir=target_dir,
+        min_sec=min_sec,
+        max_sec=max_sec,
+        min_silence_dur_ms=min_silence_dur_ms,
+        time_suffix=time_suffix,
+    )
 
 
 if __name__ == "__main__":
@@ -148,6 +188,11 @@ if __name__ == "__main__":
         default=3,
         help="Number of processes to use. Default 3 seems to be the best.",
     )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Slice all files even if they are unchanged since the last run.",
+    )
     args = parser.parse_args()
 
     path_config = get_path_config()
@@ -165,9 +210,27 @@ if __name__ == "__main__":
     audio_files = [file for file in input_dir.rglob("*") if is_audio_file(file)]
 
     logger.info(f"Found {len(audio_files)} audio files.")
-    if output_dir.exists():
-        logger.warning(f"Output directory {output_dir} already exists, deleting...")
-        shutil.rmtree(output_dir)
+
+    # 前回から内容もパラメータも変わっていないファイルはスキップする
+    manifest = StageManifest(
+        get_manifest_path(output_dir, "slice"),
+        output_dir,
+        {
+            "min_sec": min_sec,
+            "max_sec": max_sec,
+            "min_silence_dur_ms": min_silence_dur_ms,
+            "time_suffix": time_suffix,
+        },
+    )
+    if args.force or not manifest.exists:
+        if output_dir.exists():
+            logger.warning(f"Output directory {output_dir} already exists, deleting...")
+            shutil.rmtree(output_dir)
+        manifest.invalidate()
+    pending, skipped = manifest.plan(
+        {file.relative_to(input_dir).as_posix(): file for file in audio_files}
+    )
+    logger.info(f"{len(pending)} files to slice, {skipped} unchanged files skipped")
 
     # モデルをダウンロードしておく
     _ = torch.hub.load(
@@ -177,88 +240,54 @@ if __name__ == "__main__":
         trust_repo=True,
     )
 
-    # Silero VADのモデルは、同じインスタンスで並列処理するとおかしくなるらしい
-    # ワーカーごとにモデルをロードするようにするため、Queueを使って処理する
-    def process_queue(
-        q: Queue[Optional[Path]],
-        result_queue: Queue[tuple[float, int]],
-        error_queue: Queue[tuple[Path, Exception]],
-    ):
-        # logger.debug("Worker started.")
-        vad_model, utils = torch.hub.load(
-            repo_or_dir="litagin02/silero-vad",
-            model="silero_vad",
-            onnx=True,
-            trust_repo=True,
-        )
-        while True:
-            file = q.get()
-            if file is None:  # 終了シグナルを確認
-                q.task_done()
-                break
-            try:
-                rel_path = file.relative_to(input_dir)
-                time_sec, count = split_wav(
-                    vad_model=vad_model,
-                    utils=utils,
-                    audio_file=file,
-                    target_dir=output_dir / rel_path.parent,
-                    min_sec=min_sec,
-                    max_sec=max_sec,
-                    min_silence_dur_ms=min_silence_dur_ms,
-                    time_suffix=time_suffix,
-                )
-                result_queue.put((time_sec, count))
-            except Exception as e:
-                logger.error(f"Error processing {file}: {e}")
-                error_queue.put((file, e))
-                result_queue.put((0, 0))
-            finally:
-                q.task_done()
-
-    q: Queue[Optional[Path]] = Queue()
-    result_queue: Queue[tuple[float, int]] = Queue()
-    error_queue: Queue[tuple[Path, Exception]] = Queue()
-
+    # VAD の処理は GIL を解放しない部分が多いため、スレッドではなくプロセスで並列に処理する
     # ファイル数が少ない場合は、ワーカー数をファイル数に合わせる
-    num_processes = min(num_processes, len(audio_files))
+    num_processes = max(1, min(num_processes, len(pending)))
 
-    threads = [
-        Thread(target=process_queue, args=(q, result_queue, error_queue))
-        for _ in range(num_processes)
-    ]
-    for t in threads:
-        t.start()
-
-    pbar = tqdm(total=len(audio_files), file=SAFE_STDOUT, dynamic_ncols=True)
-    for file in audio_files:
-        q.put(file)
-
-    # result_queueを監視し、要素が追加されるごとに結果を加算しプログレスバーを更新
     total_sec = 0
     total_count = 0
-    for _ in range(len(audio_files)):
-        time, count = result_queue.get()
-        total_sec += time
-        total_count += count
-        pbar.update(1)
-
-    # 全ての処理が終わるまで待つ
-    q.join()
-
-    # 終了シグナル None を送る
-    for _ in range(num_processes):
-        q.put(None)
-
-    for t in threads:
-        t.join()
-
-    pbar.close()
-
-    if not error_queue.empty():
+    errors: list[tuple[Path, Exception]] = []
+    with ProcessPoolExecutor(
+        max_workers=num_processes, initializer=load_vad_model
+    ) as executor:
+        futures = {
+            executor.submit(
+                process_file,
+                file,
+                output_dir / Path(key).parent,
+                min_sec,
+                max_sec,
+                min_silence_dur_ms,
+                time_suffix,
+            ): (key, file, file_hash)
+            for key, file, file_hash in pending
+        }
+        for i, future in enumerate(
+            tqdm(
+                as_completed(futures),
+                total=len(futures),
+                file=SAFE_STDOUT,
+                dynamic_ncols=True,
+            )
+        ):
+            key, file, file_hash = futures[future]
+            try:
+                time_sec, outputs = future.result()
+            except Exception as e:
+                logger.error(f"Error processing {file}: {e}")
+                errors.append((file, e))
+                continue
+            total_sec += time_sec
+            total_count += len(outputs)
+            manifest.record(key, file, file_hash, outputs)
+            # 中断されても処理済みのファイルを次回スキップできるよう、定期的に保存する
+            if i % 20 == 19:
+                manifest.save()
+    manifest.save()
+
+    if errors:
         error_str = "Error slicing some files:"
-        while not error_queue.empty():
-            file, e = error_queue.get()
+        for file, e in errors:
             error_str += f"\n{file}: {e}"
         raise RuntimeError(error_str)
 
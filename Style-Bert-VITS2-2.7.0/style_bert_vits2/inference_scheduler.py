@@ -0,0 +1,331 @@
+"""
+音声合成リクエストのスケジューラ。
+
+イベントループをブロックしないよう、音声合成は専用のスレッドプールで実行する。
+リクエストはモデルごとのキューに積まれ、同じモデル・同じ言語・同じ合成パラメータのリクエストが
+短い時間内に複数届いた場合は、パディングして 1 つのバッチにまとめて推論する。
+モデルごとに独立して処理されるため、あるモデルの重い合成が別のモデルのリクエストを待たせることはない。
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from numpy.typing import NDArray
+
+from style_bert_vits2.constants import (
+    DEFAULT_ASSIST_TEXT_WEIGHT,
+    DEFAULT_LENGTH,
+    DEFAULT_NOISE,
+    DEFAULT_NOISEW,
+    DEFAULT_SDP_RATIO,
+    DEFAULT_STYLE,
+    DEFAULT_STYLE_WEIGHT,
+    Languages,
+)
+from style_bert_vits2.logging import logger
+from style_bert_vits2.tts_model import TTSModel, TTSModelHolder
+
+
+# クライアントの切断を確認する間隔 (秒)
+DISCONNECT_POLL_INTERVAL = 0.5
+
+T = TypeVar("T")
+
+
+class QueueFullError(Exception):
+    """待ち行列が上限に達しており、リクエストを受け付けられない"""
+
+
+class InferenceTimeoutError(Exception):
+    """リクエストが制限時間内に完了しなかった"""
+
+
+class InferenceCancelledError(Exception):
+    """クライアントが切断されたため、リクエストが取り消された"""
+
+
+async def wait_for_result(
+    future: asyncio.Future[T],
+    timeout: Optional[float] = None,
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+) -> T:
+    """
+    制限時間とクライアントの切断を監視しながら、推論の結果を待つ。
+    future 自体は取り消さないため、必要に応じて呼び出し側で取り消す。
+
+    Args:
+        future (asyncio.Future[T]): 推論の結果を受け取る Future
+        timeout (Optional[float]): 制限時間 (秒)。None のときは無制限
+        is_disconnected (Optional[Callable[[], Awaitable[bool]]]): クライアントが切断されたかを返す関数
+
+    Returns:
+        T: 推論の結果
+
+    Raises:
+        InferenceTimeoutError: 制限時間内に完了しなかった
+        InferenceCancelledError: クライアントが切断された
+    """
+
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    while True:
+        wait_time = DISCONNECT_POLL_INTERVAL if is_disconnected is not None else None
+        if deadline is not None:
+            remaining = max(0.0, deadline - loop.time())
+            wait_time = remaining if wait_time is None else min(wait_time, remaining)
+        done, _ = await asyncio.wait({future}, timeout=wait_time)
+        if done:
+            return future.result()
+        if deadline is not None and loop.time() >= deadline:
+            raise InferenceTimeoutError(f"Inference timed out ({timeout}s)")
+        if is_disconnected is not None and await is_disconnected():
+            raise InferenceCancelledError("Client disconnected")
+
+
+@dataclass
+class _Job:
+    model: TTSModel
+    kwargs: dict[str, Any]
+    # None のときは他のリクエストとまとめずに単独で推論する
+    batch_key: Optional[tuple[Any, ...]]
+    future: asyncio.Future[tuple[int, NDArray[Any]]]
+
+
+@dataclass
+class _ModelQueue:
+    jobs: deque[_Job] = field(default_factory=deque)
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+    task: Optional[asyncio.Task[None]] = None
+
+
+class InferenceScheduler:
+    """
+    TTSModel.infer() をモデルごとのキューと専用のスレッドプールで実行するスケジューラ。
+    asyncio のイベントループ上から infer() を await して使う。
+    """
+
+    def __init__(
+        self,
+        num_workers: int = 2,
+        max_batch_size: int = 4,
+        batch_window: float = 0.02,
+        max_queue_size: int = 32,
+        model_holder: Optional[TTSModelHolder] = None,
+    ) -> None:
+        """
+        Args:
+            num_workers (int): 音声合成を実行するスレッド数 (同時に推論できるモデル数)
+            max_batch_size (int): 1 つのバッチにまとめるリクエストの最大数 (1 でバッチ化を無効にする)
+            batch_window (float): 同じバッチにまとめるリクエストを待つ時間 (秒)
+            max_queue_size (int): 全モデル合計で待機できるリクエストの最大数 (超えると QueueFullError)
+            model_holder (Optional[TTSModelHolder]): 指定された場合、推論の間 model_holder.use_model() でモデルを常駐させる
+        """
+
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_window = max(0.0, batch_window)
+        self.max_queue_size = max_queue_size
+        self.model_holder = model_holder
+        self.__executor = ThreadPoolExecutor(
+            max_workers=max(1, num_workers), thread_name_prefix="inference"
+        )
+        self.__queues: dict[str, _ModelQueue] = {}
+
+    @property
+    def queue_depth(self) -> int:
+        """推論待ちのリクエスト数 (推論中のものは含まない)"""
+        return sum(len(queue.jobs) for queue in self.__queues.values())
+
+    async def infer(
+        self,
+        model_key: str,
+        model: TTSModel,
+        timeout: Optional[float] = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        **kwargs: Any,
+    ) -> tuple[int, NDArray[Any]]:
+        """
+        音声合成リクエストをキューに積み、結果を待つ。
+
+        Args:
+            model_key (str): モデルを識別するキー (同じキーのリクエストが同じキューに積まれる)
+            model (TTSModel): 音声合成に使うモデル
+            timeout (Optional[float]): 制限時間 (秒)。None のときは無制限
+            is_disconnected (Optional[Callable[[], Awaitable[bool]]]): クライアントが切断されたかを返す関数
+            **kwargs: TTSModel.infer() に渡す引数
+
+        Returns:
+            tuple[int, NDArray[Any]]: サンプリングレートと音声データ (16bit PCM)
+
+        Raises:
+            QueueFullError: 待ち行列が上限に達している
+            InferenceTimeoutError: 制限時間内に完了しなかった
+            InferenceCancelledError: クライアントが切断された
+        """
+
+        if self.max_queue_size > 0 and self.queue_depth >= self.max_queue_size:
+            raise QueueFullError(
+                f"Too many pending requests (max_queue_size={self.max_queue_size})"
+            )
+
+        loop = asyncio.get_running_loop()
+        job = _Job(
+            model=model,
+            kwargs=kwargs,
+            batch_key=self.__get_batch_key(model, kwargs),
+            future=loop.create_future(),
+        )
+        queue = self.__queues.get(model_key)
+        if queue is None:
+            queue = _ModelQueue()
+            self.__queues[model_key] = queue
+        queue.jobs.append(job)
+        queue.wakeup.set()
+        if queue.task is None:
+            queue.task = asyncio.create_task(self.__run_queue(queue))
+
+        try:
+            return await wait_for_result(job.future, timeout, is_disconnected)
+        finally:
+            # タイムアウト・切断・タスクのキャンセル時は、まだ推論が始まっていなければキューから取り除く
+            # (推論中の場合は中断できないため、結果を破棄する)
+            if not job.future.done():
+                job.future.cancel()
+            if job in queue.jobs:
+                queue.jobs.remove(job)
+
+    def shutdown(self) -> None:
+        self.__executor.shutdown(wait=False)
+
+    @staticmethod
+    def __get_batch_key(
+        model: TTSModel, kwargs: dict[str, Any]
+    ) -> Optional[tuple[Any, ...]]:
+        # ONNX 推論はバッチ化できない
+        if model.is_onnx_model:
+            return None
+        # 改行ごとの分割・参照音声・音素指定・ヌルモデルを伴うリクエストは単独で推論する
+        ## アクセント (given_tone) の指定とピッチ・抑揚の調整はリクエストごとに行えるため、バッチにまとめられる
+        ## (バッチで推論した場合、reuse_raw_audio による合成済みの音声の再利用は行われない)
+        if "\n" in kwargs["text"]:
+            return None
+        if kwargs.get("reference_audio_path") or kwargs.get("reference_audio_id"):
+            return None
+        if kwargs.get("given_phone") is not None:
+            return None
+        if kwargs.get("null_model_params") is not None or kwargs.get(
+            "force_reload_model"
+        ):
+            return None
+        # 以下のパラメータはバッチ全体で共通でなければならない
+        return (
+            kwargs.get("language", Languages.JP),
+            kwargs.get("sdp_ratio", DEFAULT_SDP_RATIO),
+            kwargs.get("noise", DEFAULT_NOISE),
+            kwargs.get("noise_w", DEFAULT_NOISEW),
+            kwargs.get("length", DEFAULT_LENGTH),
+            kwargs.get("assist_text_weight", DEFAULT_ASSIST_TEXT_WEIGHT),
+            kwargs.get("f0_method", "harvest"),
+        )
+
+    async def __run_queue(self, queue: _ModelQueue) -> None:
+        loop = asyncio.get_running_loop()
+        while queue.jobs:
+            first = queue.jobs.popleft()
+            batch = [first]
+
+            # 同じバッチにまとめられるリクエストを batch_window の間だけ待つ
+            if first.batch_key is not None and self.max_batch_size > 1:
+                deadline = loop.time() + self.batch_window
+                while True:
+                    for job in list(queue.jobs):
+                        if len(batch) >= self.max_batch_size:
+                            break
+                        if (
+                            job.model is first.model
+                            and job.batch_key == first.batch_key
+                        ):
+                            queue.jobs.remove(job)
+                            batch.append(job)
+                    remaining = deadline - loop.time()
+                    if len(batch) >= self.max_batch_size or remaining <= 0:
+                        break
+                    queue.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(queue.wakeup.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+
+            # 待っている間に取り消されたリクエストを除く
+            batch = [job for job in batch if not job.future.done()]
+            if len(batch) == 0:
+                continue
+
+            try:
+                results = await loop.run_in_executor(
+                    self.__executor, self.__run_batch, batch
+                )
+            except Exception as e:
+                logger.error(f"Inference failed: {e}")
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+            else:
+                for job, result in zip(batch, results):
+                    if not job.future.done():
+                        job.future.set_result(result)
+
+        queue.task = None
+
+    def __run_batch(self, batch: list[_Job]) -> list[tuple[int, NDArray[Any]]]:
+        model = batch[0].model
+        with (
+            self.model_holder.use_model(model)
+            if self.model_holder is not None
+            else nullcontext()
+        ):
+            return self.__infer(batch)
+
+    @staticmethod
+    def __infer(batch: list[_Job]) -> list[tuple[int, NDArray[Any]]]:
+        model = batch[0].model
+        if len(batch) == 1:
+            return [model.infer(**batch[0].kwargs)]
+
+        logger.info(f"Merged {len(batch)} requests into a batch")
+        kwargs = batch[0].kwargs
+        return model.infer_batch(
+            texts=[job.kwargs["text"] for job in batch],
+            language=kwargs.get("language", Languages.JP),
+            speaker_ids=[job.kwargs.get("speaker_id", 0) for job in batch],
+            styles=[job.kwargs.get("style", DEFAULT_STYLE) for job in batch],
+            style_weights=[
+                job.kwargs.get("style_weight", DEFAULT_STYLE_WEIGHT) for job in batch
+            ],
+            assist_texts=[
+                (
+                    job.kwargs.get("assist_text")
+                    if job.kwargs.get("use_assist_text")
+                    else None
+                )
+                for job in batch
+            ],
+            assist_text_weight=kwargs.get(
+                "assist_text_weight", DEFAULT_ASSIST_TEXT_WEIGHT
+            ),
+            sdp_ratio=kwargs.get("sdp_ratio", DEFAULT_SDP_RATIO),
+            noise=kwargs.get("noise", DEFAULT_NOISE),
+            noise_w=kwargs.get("noise_w", DEFAULT_NOISEW),
+            length=kwargs.get("length", DEFAULT_LENGTH),
+            given_tones=[job.kwargs.get("given_tone") for job in batch],
+            pitch_scales=[job.kwargs.get("pitch_scale", 1.0) for job in batch],
+            intonation_scales=[
+                job.kwargs.get("intonation_scale", 1.0) for job in batch
+            ],
+            f0_method=kwargs.get("f0_method", "harvest"),
+        )
@@ -1,7 +1,12 @@
+import os
+from pathlib import Path
 from typing import Any, Optional, Union, cast
 
+import numpy as np
 import torch
 from numpy.typing import NDArray
+from safetensors import safe_open
+from safetensors.torch import save_file
 
 from style_bert_vits2.constants import Languages
 from style_bert_vits2.logging import logger
@@ -11,16 +16,81 @@ from style_bert_vits2.models.models import SynthesizerTrn
 from style_bert_vits2.models.models_jp_extra import (
     SynthesizerTrn as SynthesizerTrnJPExtra,
 )
+from style_bert_vits2.models.modules import WN
 from style_bert_vits2.nlp import (
     clean_text_with_given_phone_tone,
     cleaned_text_to_sequence,
     extract_bert_feature,
+    extract_bert_feature_batch,
 )
 from style_bert_vits2.nlp.symbols import SYMBOLS
 
 
+# weight norm を畳み込んだ重みのファイルの形式を変更した場合に増やし、古いファイルを使わないようにする
+FOLDED_MODEL_VERSION = "1"
+
+
 def get_net_g(
-    model_path: str, version: str, device: str, hps: HyperParameters
+    model_path: str,
+    version: str,
+    device: str,
+    hps: HyperParameters,
+    for_inference: bool = False,
+    use_mmap: Optional[bool] = None,
+    folded: bool = False,
+) -> Union[SynthesizerTrn, SynthesizerTrnJPExtra]:
+    """
+    音声合成モデルを構築し、学習済みの重みを読み込む。
+
+    Args:
+        model_path (str): モデル (.pth / .pt / .safetensors) のパス
+        version (str): モデルのバージョン (JP-Extra かどうかの判定に使う)
+        device (str): モデルを配置するデバイス
+        hps (HyperParameters): ハイパーパラメータ
+        for_inference (bool): True のとき、推論 (infer()) で使われない PosteriorEncoder (enc_q) を構築後すぐに破棄し、重みも読み込まない
+        use_mmap (Optional[bool]): safetensors をメモリマップしてコピーせずに読み込むかどうか (None のときは推論用に CPU に読み込む場合のみ有効)
+        folded (bool): True のとき、weight norm を畳み込んだ (fold_weight_norm() を適用した) モデルを返す。
+            推論用に safetensors をメモリマップして読み込む場合は、畳み込んだ重みを別のファイルに保存してからメモリマップする
+
+    Returns:
+        Union[SynthesizerTrn, SynthesizerTrnJPExtra]: 音声合成モデル
+    """
+
+    if use_mmap is None:
+        use_mmap = for_inference and torch.device(device).type == "cpu"
+    if folded and for_inference and use_mmap and model_path.endswith(".safetensors"):
+        folded_path = __prepare_folded_model(Path(model_path), version, hps)
+        if folded_path is not None:
+            net_g = __build_net_g(version, hps, for_inference=True)
+            # 重みを読み込む前に構造だけを畳み込んだ後のものにしておく
+            fold_weight_norm(net_g)
+            _ = net_g.eval()
+            _ = utils.safetensors.load_safetensors(
+                folded_path, net_g, True, device=device, use_mmap=True
+            )
+            return net_g
+
+    net_g = __build_net_g(version, hps, for_inference)
+    net_g = net_g.to(device)
+    net_g.state_dict()
+    _ = net_g.eval()
+    if model_path.endswith(".pth") or model_path.endswith(".pt"):
+        _ = utils.checkpoints.load_checkpoint(
+            model_path, net_g, None, skip_optimizer=True, device=device
+        )
+    elif model_path.endswith(".safetensors"):
+        _ = utils.safetensors.load_safetensors(
+            model_path, net_g, True, device=device, use_mmap=use_mmap
+        )
+    else:
+        raise ValueError(f"Unknown model format: {model_path}")
+    if folded:
+        fold_weight_norm(net_g)
+    return net_g
+
+
+def __build_net_g(
+    version: str, hps: HyperParameters, for_inference: bool
 ) -> Union[SynthesizerTrn, SynthesizerTrnJPExtra]:
     if version.endswith("JP-Extra"):
         logger.info("Using JP-Extra model")
@@ -52,7 +122,7 @@ def get_net_g(
             use_spectral_norm=hps.model.use_spectral_norm,
             gin_channels=hps.model.gin_channels,
             slm=hps.model.slm,
-        ).to(device)
+        )
     else:
         logger.info("Using normal model")
         net_g = SynthesizerTrn(
@@ -83,32 +153,107 @@ def get_net_g(
             use_spectral_norm=hps.model.use_spectral_norm,
             gin_channels=hps.model.gin_channels,
             slm=hps.model.slm,
-        ).to(device)
-    net_g.state_dict()
-    _ = net_g.eval()
-    if model_path.endswith(".pth") or model_path.endswith(".pt"):
-        _ = utils.checkpoints.load_checkpoint(
-            model_path, net_g, None, skip_optimizer=True, device=device
         )
-    elif model_path.endswith(".safetensors"):
-        _ = utils.safetensors.load_safetensors(model_path, net_g, True, device=device)
-    else:
-        raise ValueError(f"Unknown model format: {model_path}")
+    # PosteriorEncoder は学習時に音声から潜在変数を得るためだけに使われる
+    ## デバイスに転送する前に破棄し、転送とメモリ確保を省く
+    if for_inference:
+        del net_g.enc_q
     return net_g
 
 
-def get_text(
+def get_folded_model_path(model_path: Union[str, Path]) -> Path:
+    """
+    weight norm を畳み込んだ重みを保存するファイルのパスを返す。
+    TTSModelHolder がモデルとして一覧に含めないよう、モデルと同じディレクトリ内の隠しディレクトリに置く。
+    """
+
+    model_path = Path(model_path)
+    return model_path.parent / ".folded" / model_path.name
+
+
+def __prepare_folded_model(
+    model_path: Path, version: str, hps: HyperParameters
+) -> Optional[Path]:
+    """
+    weight norm を畳み込んだ重みを safetensors ファイルに保存し、そのパスを返す (元のモデルから保存済みの場合はそのまま返す)。
+    畳み込んだ重みはプロセスごとに新たに確保されるため、元のファイルをメモリマップしてもプロセス間で共有されない。
+    畳み込んだ重みのファイルをメモリマップすることで、合成ワーカーなどの複数のプロセス間で共有できるようにする。
+    保存できない場合は None を返す。
+    """
+
+    folded_path = get_folded_model_path(model_path)
+    stat = model_path.stat()
+    metadata = {
+        "version": FOLDED_MODEL_VERSION,
+        "source_size": str(stat.st_size),
+        "source_mtime_ns": str(stat.st_mtime_ns),
+    }
+    if folded_path.exists():
+        try:
+            with safe_open(str(folded_path), framework="pt") as f:  # type: ignore
+                if f.metadata() == metadata:
+                    return folded_path
+        except Exception as e:
+            # 壊れたファイルは作り直す
+            logger.warning(f"Failed to read {folded_path}: {e}")
+
+    logger.info(f"Saving weight-norm folded weights to {folded_path}")
+    net_g = __build_net_g(version, hps, for_inference=True)
+    _ = utils.safetensors.load_safetensors(
+        model_path, net_g, True, device="cpu", use_mmap=False
+    )
+    fold_weight_norm(net_g)
+    state_dict = {key: value.contiguous() for key, value in net_g.state_dict().items()}
+    # 複数のプロセスが同時に保存しても読み込み途中のファイルが壊れないよう、一時ファイルに保存してから置き換える
+    tmp_path = folded_path.with_name(f"{folded_path.name}.{os.getpid()}.tmp")
+    try:
+        folded_path.parent.mkdir(parents=True, exist_ok=True)
+        save_file(state_dict, str(tmp_path), metadata=metadata)
+        os.replace(tmp_path, folded_path)
+    except OSError as e:
+        logger.warning(
+            f"Failed to save weight-norm folded weights, so fold them in each process: {e}"
+        )
+        tmp_path.unlink(missing_ok=True)
+        return None
+    return folded_path
+
+
+def fold_weight_norm(net_g: Union[SynthesizerTrn, SynthesizerTrnJPExtra]) -> None:
+    """
+    decoder と WN ブロックの weight norm を重みに畳み込み、推論のたびに weight_g / weight_v から重みを計算しないようにする。
+    畳み込んだ後は学習できないため、推論専用のモデルにのみ使う。
+    ヌルモデルのマージなど、重みを直接足し合わせる処理は畳み込む前に行う必要がある (weight_g / weight_v 単位で足し合わせているため)。
+
+    Args:
+        net_g (Union[SynthesizerTrn, SynthesizerTrnJPExtra]): 重みを読み込み済みの音声合成モデル
+    """
+
+    net_g.dec.remove_weight_norm()
+    for module in net_g.modules():
+        if isinstance(module, WN):
+            module.remove_weight_norm()
+    net_g.requires_grad_(False)
+
+
+def is_cpu_bf16_supported() -> bool:
+    """
+    CPU が bfloat16 の演算を高速に実行できる (AVX512-BF16 / AMX などを備えている) かどうかを返す。
+    """
+
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def __clean_text_for_infer(
     text: str,
     language_str: Languages,
     hps: HyperParameters,
-    device: str,
-    assist_text: Optional[str] = None,
-    assist_text_weight: float = 0.7,
     given_phone: Optional[list[str]] = None,
     given_tone: Optional[list[int]] = None,
-) -> tuple[
-    torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor
-]:
+) -> tuple[str, list[int], list[int], list[int], list[int]]:
     use_jp_extra = hps.version.endswith("JP-Extra")
     norm_text, phone, tone, word2ph = clean_text_with_given_phone_tone(
         text,
@@ -128,15 +273,18 @@ def get_text(
         for i in range(len(word2ph)):
             word2ph[i] = word2ph[i] * 2
         word2ph[0] += 1
-    bert_ori = extract_bert_feature(
-        norm_text,
-        word2ph,
-        language_str,
-        device,
-        assist_text,
-        assist_text_weight,
-    )
-    del word2ph
+    return norm_text, phone, tone, language, word2ph
+
+
+def __to_text_tensors(
+    bert_ori: torch.Tensor,
+    phone: list[int],
+    tone: list[int],
+    language: list[int],
+    language_str: Languages,
+) -> tuple[
+    torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor
+]:
     assert bert_ori.shape[-1] == len(phone), phone
 
     if language_str == Languages.ZH:
@@ -158,42 +306,108 @@ def get_text(
         phone
     ), f"Bert seq len {bert.shape[-1]} != {len(phone)}"
 
-    phone = torch.LongTensor(phone)
-    tone = torch.LongTensor(tone)
-    language = torch.LongTensor(language)
-    return bert, ja_bert, en_bert, phone, tone, language
+    phone_tensor = torch.LongTensor(phone)
+    tone_tensor = torch.LongTensor(tone)
+    language_tensor = torch.LongTensor(language)
+    return bert, ja_bert, en_bert, phone_tensor, tone_tensor, language_tensor
 
 
-def infer(
+def get_text(
     text: str,
+    language_str: Languages,
+    hps: HyperParameters,
+    device: str,
+    assist_text: Optional[str] = None,
+    assist_text_weight: float = 0.7,
+    given_phone: Optional[list[str]] = None,
+    given_tone: Optional[list[int]] = None,
+) -> tuple[
+    torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor
+]:
+    norm_text, phone, tone, language, word2ph = __clean_text_for_infer(
+        text, language_str, hps, given_phone, given_tone
+    )
+    bert_ori = extract_bert_feature(
+        norm_text,
+        word2ph,
+        language_str,
+        device,
+        assist_text,
+        assist_text_weight,
+    )
+    del word2ph
+    return __to_text_tensors(bert_ori, phone, tone, language, language_str)
+
+
+def get_text_batch(
+    texts: list[str],
+    language_str: Languages,
+    hps: HyperParameters,
+    device: str,
+    assist_text: Optional[str] = None,
+    assist_text_weight: float = 0.7,
+    given_tones: Optional[list[Optional[list[int]]]] = None,
+) -> list[
+    tuple[
+        torch.Tensor,
+        torch.Tensor,
+        torch.Tensor,
+        torch.Tensor,
+        torch.Tensor,
+        torch.Tensor,
+    ]
+]:
+    """
+    複数のテキストに対して get_text() を行う。
+    BERT 特徴量はまとめて抽出し (extract_bert_feature_batch())、補助テキストは全てのテキストで共通とする。
+    given_tones を指定した場合は、テキストごとにアクセントを指定できる (None の要素は指定なし)。
+    """
+
+    if given_tones is None:
+        given_tones = [None] * len(texts)
+    cleaned = [
+        __clean_text_for_infer(text, language_str, hps, given_tone=given_tone)
+        for text, given_tone in zip(texts, given_tones)
+    ]
+    bert_oris = extract_bert_feature_batch(
+        [norm_text for norm_text, _, _, _, _ in cleaned],
+        [word2ph for _, _, _, _, word2ph in cleaned],
+        language_str,
+        device,
+        assist_text,
+        assist_text_weight,
+    )
+    return [
+        __to_text_tensors(bert_ori, phone, tone, language, language_str)
+        for bert_ori, (_, phone, tone, language, _) in zip(bert_oris, cleaned)
+    ]
+
+
+def __synthesize(
+    text_tensors: tuple[
+        torch.Tensor,
+        torch.Tensor,
+        torch.Tensor,
+        torch.Tensor,
+        torch.Tensor,
+        torch.Tensor,
+    ],
     style_vec: NDArray[Any],
     sdp_ratio: float,
     noise_scale: float,
     noise_scale_w: float,
     length_scale: float,
-    sid: int,  # In the original Bert-VITS2, its speaker_name: str, but here it's id
-    language: Languages,
+    sid: int,
     hps: HyperParameters,
     net_g: Union[SynthesizerTrn, SynthesizerTrnJPExtra],
     device: str,
     skip_start: bool = False,
     skip_end: bool = False,
-    assist_text: Optional[str] = None,
-    assist_text_weight: float = 0.7,
-    given_phone: Optional[list[str]] = None,
-    given_tone: Optional[list[int]] = None,
 ) -> NDArray[Any]:
     is_jp_extra = hps.version.endswith("JP-Extra")
-    bert, ja_bert, en_bert, phones, tones, lang_ids = get_text(
-        text,
-        language,
-        hps,
-        device,
-        assist_text=assist_text,
-        assist_text_weight=assist_text_weight,
-        given_phone=given_phone,
-        given_tone=given_tone,
-    )
+    bert, ja_bert, en_bert, phones, tones, lang_ids = text_tensors
+    del text_tensors
+
     if skip_start:
         phones = phones[3:]
         tones = tones[3:]
@@ -269,3 +483,225 @@ def infer(
             torch.cuda.empty_cache()
 
         return audio
+
+
+def infer(
+    text: str,
+    style_vec: NDArray[Any],
+    sdp_ratio: float,
+    noise_scale: float,
+    noise_scale_w: float,
+    length_scale: float,
+    sid: int,  # In the original Bert-VITS2, its speaker_name: str, but here it's id
+    language: Languages,
+    hps: HyperParameters,
+    net_g: Union[SynthesizerTrn, SynthesizerTrnJPExtra],
+    device: str,
+    skip_start: bool = False,
+    skip_end: bool = False,
+    assist_text: Optional[str] = None,
+    assist_text_weight: float = 0.7,
+    given_phone: Optional[list[str]] = None,
+    given_tone: Optional[list[int]] = None,
+) -> NDArray[Any]:
+    text_tensors = get_text(
+        text,
+        language,
+        hps,
+        device,
+        assist_text=assist_text,
+        assist_text_weight=assist_text_weight,
+        given_phone=given_phone,
+        given_tone=given_tone,
+    )
+    return __synthesize(
+        text_tensors,
+        style_vec,
+        sdp_ratio,
+        noise_scale,
+        noise_scale_w,
+        length_scale,
+        sid,
+        hps,
+        net_g,
+        device,
+        skip_start=skip_start,
+        skip_end=skip_end,
+    )
+
+
+def infer_multi(
+    texts: list[str],
+    style_vec: NDArray[Any],
+    sdp_ratio: float,
+    noise_scale: float,
+    noise_scale_w: float,
+    length_scale: float,
+    sid: int,
+    language: Languages,
+    hps: HyperParameters,
+    net_g: Union[SynthesizerTrn, SynthesizerTrnJPExtra],
+    device: str,
+    assist_text: Optional[str] = None,
+    assist_text_weight: float = 0.7,
+) -> list[NDArray[Any]]:
+    """
+    同じ話者・スタイルで複数のテキスト (改行で分割した各行など) を 1 件ずつ合成する。
+    BERT 特徴量は全てのテキストについて一度の順伝播でまとめて抽出し、補助テキストも一度だけ推論する。
+    """
+
+    features = get_text_batch(
+        texts,
+        language,
+        hps,
+        device,
+        assist_text=assist_text,
+        assist_text_weight=assist_text_weight,
+    )
+    return [
+        __synthesize(
+            text_tensors,
+            style_vec,
+            sdp_ratio,
+            noise_scale,
+            noise_scale_w,
+            length_scale,
+            sid,
+            hps,
+            net_g,
+            device,
+        )
+        for text_tensors in features
+    ]
+
+
+def infer_batch(
+    texts: list[str],
+    style_vecs: list[NDArray[Any]],
+    sdp_ratio: float,
+    noise_scale: float,
+    noise_scale_w: float,
+    length_scale: float,
+    sids: list[int],
+    language: Languages,
+    hps: HyperParameters,
+    net_g: Union[SynthesizerTrn, SynthesizerTrnJPExtra],
+    device: str,
+    assist_texts: Optional[list[Optional[str]]] = None,
+    assist_text_weight: float = 0.7,
+    given_tones: Optional[list[Optional[list[int]]]] = None,
+) -> list[NDArray[Any]]:
+    """
+    複数のテキストをパディングして 1 つのバッチにまとめ、一度の順伝播で音声を合成する。
+    sdp_ratio などのスカラーパラメータはバッチ内で共通である必要がある。
+    """
+
+    assert len(texts) == len(style_vecs) == len(sids)
+    if assist_texts is None:
+        assist_texts = [None] * len(texts)
+    if given_tones is None:
+        given_tones = [None] * len(texts)
+    is_jp_extra = hps.version.endswith("JP-Extra")
+    # BERT 特徴量は補助テキストが同じテキストごとにまとめて抽出する
+    groups: dict[Optional[str], list[int]] = {}
+    for i, assist_text in enumerate(assist_texts):
+        groups.setdefault(assist_text, []).append(i)
+    features: list[Any] = [None] * len(texts)
+    for assist_text, indices in groups.items():
+        group_features = get_text_batch(
+            [texts[i] for i in indices],
+            language,
+            hps,
+            device,
+            assist_text=assist_text,
+            assist_text_weight=assist_text_weight,
+            given_tones=[given_tones[i] for i in indices],
+        )
+        for i, text_features in zip(indices, group_features):
+            features[i] = text_features
+    lengths = [phones.size(0) for _, _, _, phones, _, _ in features]
+    batch_size = len(features)
+    max_length = max(lengths)
+
+    with torch.no_grad():
+        x_tst = torch.zeros(batch_size, max_length, dtype=torch.long)
+        tones = torch.zeros(batch_size, max_length, dtype=torch.long)
+        lang_ids = torch.zeros(batch_size, max_length, dtype=torch.long)
+        bert = torch.zeros(batch_size, 1024, max_length)
+        ja_bert = torch.zeros(batch_size, 1024, max_length)
+        en_bert = torch.zeros(batch_size, 1024, max_length)
+        for i, (b, jb, eb, phones, tone, lang_id) in enumerate(features):
+            length = lengths[i]
+            x_tst[i, :length] = phones
+            tones[i, :length] = tone
+            lang_ids[i, :length] = lang_id
+            bert[i, :, :length] = b
+            ja_bert[i, :, :length] = jb
+            en_bert[i, :, :length] = eb
+        del features
+
+        x_tst = x_tst.to(device)
+        tones = tones.to(device)
+        lang_ids = lang_ids.to(device)
+        bert = bert.to(device)
+        ja_bert = ja_bert.to(device)
+        en_bert = en_bert.to(device)
+        x_tst_lengths = torch.LongTensor(lengths).to(device)
+        style_vec_tensor = torch.from_numpy(np.stack(style_vecs)).to(device)
+        sid_tensor = torch.LongTensor(sids).to(device)
+
+        if is_jp_extra:
+            output = cast(SynthesizerTrnJPExtra, net_g).infer(
+                x_tst,
+                x_tst_lengths,
+                sid_tensor,
+                tones,
+                lang_ids,
+                ja_bert,
+                style_vec=style_vec_tensor,
+                length_scale=length_scale,
+                sdp_ratio=sdp_ratio,
+                noise_scale=noise_scale,
+                noise_scale_w=noise_scale_w,
+            )
+        else:
+            output = cast(SynthesizerTrn, net_g).infer(
+                x_tst,
+                x_tst_lengths,
+                sid_tensor,
+                tones,
+                lang_ids,
+                bert,
+                ja_bert,
+                en_bert,
+                style_vec=style_vec_tensor,
+                length_scale=length_scale,
+                sdp_ratio=sdp_ratio,
+                noise_scale=noise_scale,
+                noise_scale_w=noise_scale_w,
+            )
+
+        # パディング部分を除き、各サンプルのフレーム数分だけ音声を切り出す
+        o, _, y_mask, _ = output
+        y_lengths = y_mask.sum(dim=[1, 2]).long().cpu().tolist()
+        audios = [
+            o[i, 0, : y_lengths[i] * hps.data.hop_length].data.cpu().float().numpy()
+            for i in range(batch_size)
+        ]
+
+        del (
+            x_tst,
+            tones,
+            lang_ids,
+            bert,
+            x_tst_lengths,
+            sid_tensor,
+            ja_bert,
+            en_bert,
+            style_vec_tensor,
+            output,
+        )
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+        return audios
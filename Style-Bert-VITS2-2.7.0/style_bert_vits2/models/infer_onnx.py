@@ -1,3 +1,5 @@
+import threading
+from collections import OrderedDict
 from collections.abc import Sequence
 from typing import Any, Optional, Union
 
@@ -10,6 +12,7 @@ from style_bert_vits2.models.hyper_parameters import HyperParameters
 from style_bert_vits2.nlp import (
     clean_text_with_given_phone_tone,
     cleaned_text_to_sequence,
+    extract_bert_feature_batch_onnx,
     extract_bert_feature_onnx,
 )
 from style_bert_vits2.utils import get_onnx_device_options
@@ -33,18 +36,13 @@ def __intersperse(lst: list[Any], item: Any) -> list[Any]:
     return result
 
 
-def get_text_onnx(
+def __clean_text_for_infer(
     text: str,
     language_str: Languages,
     hps: HyperParameters,
-    onnx_providers: Sequence[Union[str, tuple[str, dict[str, Any]]]],
-    assist_text: Optional[str] = None,
-    assist_text_weight: float = 0.7,
     given_phone: Optional[list[str]] = None,
     given_tone: Optional[list[int]] = None,
-) -> tuple[
-    NDArray[Any], NDArray[Any], NDArray[Any], NDArray[Any], NDArray[Any], NDArray[Any]
-]:
+) -> tuple[str, list[int], list[int], list[int], list[int]]:
     use_jp_extra = hps.version.endswith("JP-Extra")
     norm_text, phone, tone, word2ph = clean_text_with_given_phone_tone(
         text,
@@ -64,6 +62,45 @@ def get_text_onnx(
         for i in range(len(word2ph)):
             word2ph[i] = word2ph[i] * 2
         word2ph[0] += 1
+    return norm_text, phone, tone, language, word2ph
+
+
+def __to_feature_arrays(
+    bert_ori: NDArray[Any],
+    phone: list[int],
+    tone: list[int],
+    language: list[int],
+) -> tuple[NDArray[Any], NDArray[Any], NDArray[Any], NDArray[Any]]:
+    assert bert_ori.shape[-1] == len(phone), phone
+    return (
+        bert_ori,
+        np.array(phone, dtype=np.int64),
+        np.array(tone, dtype=np.int64),
+        np.array(language, dtype=np.int64),
+    )
+
+
+def get_text_features_onnx(
+    text: str,
+    language_str: Languages,
+    hps: HyperParameters,
+    onnx_providers: Sequence[Union[str, tuple[str, dict[str, Any]]]],
+    assist_text: Optional[str] = None,
+    assist_text_weight: float = 0.7,
+    given_phone: Optional[list[str]] = None,
+    given_tone: Optional[list[int]] = None,
+) -> tuple[NDArray[Any], NDArray[Any], NDArray[Any], NDArray[Any]]:
+    """
+    テキストから、指定された言語の BERT 特徴量と音素・アクセント・言語 ID の系列を取得する
+    get_text_onnx() と異なり、使われない言語の BERT 特徴量 (ゼロ埋めの配列) は作らない
+
+    Returns:
+        tuple[NDArray[Any], NDArray[Any], NDArray[Any], NDArray[Any]]: BERT 特徴量 (1024, 音素数), 音素, アクセント, 言語 ID
+    """
+
+    norm_text, phone, tone, language, word2ph = __clean_text_for_infer(
+        text, language_str, hps, given_phone, given_tone
+    )
     bert_ori = extract_bert_feature_onnx(
         norm_text,
         word2ph,
@@ -73,7 +110,59 @@ def get_text_onnx(
         assist_text_weight,
     )
     del word2ph
-    assert bert_ori.shape[-1] == len(phone), phone
+    return __to_feature_arrays(bert_ori, phone, tone, language)
+
+
+def get_text_features_onnx_batch(
+    texts: list[str],
+    language_str: Languages,
+    hps: HyperParameters,
+    onnx_providers: Sequence[Union[str, tuple[str, dict[str, Any]]]],
+    assist_text: Optional[str] = None,
+    assist_text_weight: float = 0.7,
+) -> list[tuple[NDArray[Any], NDArray[Any], NDArray[Any], NDArray[Any]]]:
+    """
+    複数のテキストに対して get_text_features_onnx() を行う。
+    BERT 特徴量はまとめて抽出し (extract_bert_feature_batch_onnx())、補助テキストは全てのテキストで共通とする。
+    """
+
+    cleaned = [__clean_text_for_infer(text, language_str, hps) for text in texts]
+    bert_oris = extract_bert_feature_batch_onnx(
+        [norm_text for norm_text, _, _, _, _ in cleaned],
+        [word2ph for _, _, _, _, word2ph in cleaned],
+        language_str,
+        onnx_providers,
+        assist_text,
+        assist_text_weight,
+    )
+    return [
+        __to_feature_arrays(bert_ori, phone, tone, language)
+        for bert_ori, (_, phone, tone, language, _) in zip(bert_oris, cleaned)
+    ]
+
+
+def get_text_onnx(
+    text: str,
+    language_str: Languages,
+    hps: HyperParameters,
+    onnx_providers: Sequence[Union[str, tuple[str, dict[str, Any]]]],
+    assist_text: Optional[str] = None,
+    assist_text_weight: float = 0.7,
+    given_phone: Optional[list[str]] = None,
+    given_tone: Optional[list[int]] = None,
+) -> tuple[
+    NDArray[Any], NDArray[Any], NDArray[Any], NDArray[Any], NDArray[Any], NDArray[Any]
+]:
+    bert_ori, phone, tone, language = get_text_features_onnx(
+        text,
+        language_str,
+        hps,
+        onnx_providers,
+        assist_text=assist_text,
+        assist_text_weight=assist_text_weight,
+        given_phone=given_phone,
+        given_tone=given_tone,
+    )
 
     if language_str == Languages.ZH:
         bert = bert_ori
@@ -94,9 +183,6 @@ def get_text_onnx(
         phone
     ), f"Bert seq len {bert.shape[-1]} != {len(phone)}"
 
-    phone = np.array(phone, dtype=np.int64)
-    tone = np.array(tone, dtype=np.int64)
-    language = np.array(language, dtype=np.int64)
     return bert, ja_bert, en_bert, phone, tone, language
 
 
@@ -221,3 +307,271 @@ def infer_onnx(
     )  # , emo
 
     return audio
+
+
+class _InputBuffers:
+    """
+    OnnxSynthesisEngine が長さのバケットごとに保持する入力バッファ
+    """
+
+    def __init__(self, length: int, num_bert_streams: int) -> None:
+        self.length = length
+        self.x = np.zeros((1, length), dtype=np.int64)
+        self.tones = np.zeros((1, length), dtype=np.int64)
+        self.lang_ids = np.zeros((1, length), dtype=np.int64)
+        # 使われない言語の BERT 特徴量はゼロのまま使い回す
+        self.berts = [
+            np.zeros((1, 1024, length), dtype=np.float32)
+            for _ in range(num_bert_streams)
+        ]
+        # 最後に値を書き込んだ BERT 特徴量のインデックス
+        self.dirty_bert_index: Optional[int] = None
+
+
+class OnnxSynthesisEngine:
+    """
+    ONNX 版音声合成モデルの推論エンジン
+    InferenceSession と IOBinding、入力バッファを保持し続け、推論のたびに配列や IOBinding を作り直さないようにする
+
+    入力バッファは音素数を length_bucket_size 単位に切り上げた長さ (バケット) ごとに確保して使い回す
+    パディング部分は x_lengths によりマスクされるため、推論結果には影響しない
+    CPU 推論時は入力バッファのメモリをそのまま ONNX Runtime に渡す (コピーしない)
+    """
+
+    def __init__(
+        self,
+        onnx_session: onnxruntime.InferenceSession,
+        onnx_providers: Sequence[Union[str, tuple[str, dict[str, Any]]]],
+        hps: HyperParameters,
+        length_bucket_size: int = 32,
+        max_buckets: int = 8,
+    ) -> None:
+        """
+        Args:
+            onnx_session (onnxruntime.InferenceSession): 音声合成モデルの推論セッション
+            onnx_providers (Sequence[Union[str, tuple[str, dict[str, Any]]]]): ExecutionProvider のリスト
+            hps (HyperParameters): ハイパーパラメータ
+            length_bucket_size (int, optional): 入力バッファの長さの刻み. Defaults to 32.
+            max_buckets (int, optional): 保持する入力バッファの最大数 (超えると最も古いものを破棄する). Defaults to 8.
+        """
+
+        self.onnx_session = onnx_session
+        self.onnx_providers = onnx_providers
+        self.hps = hps
+        self.is_jp_extra = hps.version.endswith("JP-Extra")
+        self.length_bucket_size = max(1, length_bucket_size)
+        self.max_buckets = max(1, max_buckets)
+
+        self.input_names = [input.name for input in onnx_session.get_inputs()]
+        self.output_name = onnx_session.get_outputs()[0].name
+        # 入力テンソルの転送に使用するデバイス種別, デバイス ID, 実行オプションを取得
+        self.device_type, self.device_id, self.run_options = get_onnx_device_options(onnx_session, onnx_providers)  # fmt: skip
+        self.io_binding = onnx_session.io_binding()
+
+        # JP-Extra モデルは日本語の BERT 特徴量のみを入力に取る
+        self.__num_bert_streams = 1 if self.is_jp_extra else 3
+        self.__buckets: OrderedDict[int, _InputBuffers] = OrderedDict()
+        # 長さに依存しない入力
+        self.__x_lengths = np.zeros((1,), dtype=np.int64)
+        self.__sid = np.zeros((1,), dtype=np.int64)
+        self.__style_vec: Optional[NDArray[Any]] = None
+        self.__length_scale = np.zeros((), dtype=np.float32)
+        self.__sdp_ratio = np.zeros((), dtype=np.float32)
+        self.__noise_scale = np.zeros((), dtype=np.float32)
+        self.__noise_scale_w = np.zeros((), dtype=np.float32)
+
+        # バッファと IOBinding を共有するため、同時に 1 つの推論しか行わない
+        self.__lock = threading.Lock()
+
+    def __get_buffers(self, num_phones: int) -> _InputBuffers:
+        length = -(-num_phones // self.length_bucket_size) * self.length_bucket_size
+        buffers = self.__buckets.get(length)
+        if buffers is None:
+            buffers = _InputBuffers(length, self.__num_bert_streams)
+            self.__buckets[length] = buffers
+            if len(self.__buckets) > self.max_buckets:
+                self.__buckets.popitem(last=False)
+        self.__buckets.move_to_end(length)
+        return buffers
+
+    def __get_bert_index(self, language: Languages) -> int:
+        if self.is_jp_extra:
+            return 0
+        # bert, ja_bert, en_bert の順に入力される
+        if language == Languages.ZH:
+            return 0
+        elif language == Languages.JP:
+            return 1
+        elif language == Languages.EN:
+            return 2
+        raise ValueError("language_str should be ZH, JP or EN")
+
+    def __bind_input(self, name: str, value: NDArray[Any]) -> None:
+        # CPU 推論時は numpy 配列のメモリを共有する OrtValue が作られる (コピーは発生しない)
+        ## GPU 推論の場合、device_type + device_id に対応する GPU デバイスに入力テンソルが転送される
+        ort_value = onnxruntime.OrtValue.ortvalue_from_numpy(
+            value, self.device_type, self.device_id
+        )
+        self.io_binding.bind_ortvalue_input(name, ort_value)
+
+    def infer(
+        self,
+        text: str,
+        style_vec: NDArray[Any],
+        sdp_ratio: float,
+        noise_scale: float,
+        noise_scale_w: float,
+        length_scale: float,
+        sid: int,
+        language: Languages,
+        assist_text: Optional[str] = None,
+        assist_text_weight: float = 0.7,
+        given_phone: Optional[list[str]] = None,
+        given_tone: Optional[list[int]] = None,
+    ) -> NDArray[Any]:
+        """
+        テキストから音声を合成する (引数は infer_onnx() と同じ)
+
+        Returns:
+            NDArray[Any]: 音声データ (float32)
+        """
+
+        features = get_text_features_onnx(
+            text,
+            language,
+            self.hps,
+            self.onnx_providers,
+            assist_text=assist_text,
+            assist_text_weight=assist_text_weight,
+            given_phone=given_phone,
+            given_tone=given_tone,
+        )
+        return self.__synthesize(
+            features,
+            style_vec,
+            sdp_ratio,
+            noise_scale,
+            noise_scale_w,
+            length_scale,
+            sid,
+            language,
+        )
+
+    def infer_multi(
+        self,
+        texts: list[str],
+        style_vec: NDArray[Any],
+        sdp_ratio: float,
+        noise_scale: float,
+        noise_scale_w: float,
+        length_scale: float,
+        sid: int,
+        language: Languages,
+        assist_text: Optional[str] = None,
+        assist_text_weight: float = 0.7,
+    ) -> list[NDArray[Any]]:
+        """
+        同じ話者・スタイルで複数のテキスト (改行で分割した各行など) を 1 件ずつ合成する。
+        BERT 特徴量は全てのテキストについてまとめて抽出し、補助テキストも一度だけ推論する。
+
+        Returns:
+            list[NDArray[Any]]: テキストごとの音声データ (float32)
+        """
+
+        features = get_text_features_onnx_batch(
+            texts,
+            language,
+            self.hps,
+            self.onnx_providers,
+            assist_text=assist_text,
+            assist_text_weight=assist_text_weight,
+        )
+        return [
+            self.__synthesize(
+                text_features,
+                style_vec,
+                sdp_ratio,
+                noise_scale,
+                noise_scale_w,
+                length_scale,
+                sid,
+                language,
+            )
+            for text_features in features
+        ]
+
+    def __synthesize(
+        self,
+        features: tuple[NDArray[Any], NDArray[Any], NDArray[Any], NDArray[Any]],
+        style_vec: NDArray[Any],
+        sdp_ratio: float,
+        noise_scale: float,
+        noise_scale_w: float,
+        length_scale: float,
+        sid: int,
+        language: Languages,
+    ) -> NDArray[Any]:
+        bert_ori, phones, tones, lang_ids = features
+        num_phones = phones.shape[0]
+
+        with self.__lock:
+            buffers = self.__get_buffers(num_phones)
+            buffers.x[0, :num_phones] = phones
+            buffers.x[0, num_phones:] = 0
+            buffers.tones[0, :num_phones] = tones
+            buffers.tones[0, num_phones:] = 0
+            buffers.lang_ids[0, :num_phones] = lang_ids
+            buffers.lang_ids[0, num_phones:] = 0
+            bert_index = self.__get_bert_index(language)
+            if (
+                buffers.dirty_bert_index is not None
+                and buffers.dirty_bert_index != bert_index
+            ):
+                buffers.berts[buffers.dirty_bert_index].fill(0)
+            buffers.berts[bert_index][0, :, :num_phones] = bert_ori
+            buffers.berts[bert_index][0, :, num_phones:] = 0
+            buffers.dirty_bert_index = bert_index
+
+            self.__x_lengths[0] = num_phones
+            self.__sid[0] = sid
+            if (
+                self.__style_vec is None
+                or self.__style_vec.shape[1:] != style_vec.shape
+            ):
+                self.__style_vec = np.zeros((1, *style_vec.shape), dtype=np.float32)
+            self.__style_vec[0] = style_vec
+            self.__length_scale[...] = length_scale
+            self.__sdp_ratio[...] = sdp_ratio
+            self.__noise_scale[...] = noise_scale
+            self.__noise_scale_w[...] = noise_scale_w
+
+            input_tensor = [
+                buffers.x,
+                self.__x_lengths,
+                self.__sid,
+                buffers.tones,
+                buffers.lang_ids,
+                *buffers.berts,
+                self.__style_vec,
+                self.__length_scale,
+                self.__sdp_ratio,
+                self.__noise_scale,
+                self.__noise_scale_w,
+            ]
+            for name, value in zip(self.input_names, input_tensor):
+                self.__bind_input(name, value)
+
+            # 推論の実行
+            ## 出力の長さは推論するまで分からないため、出力テンソルは ONNX Runtime に確保させる
+            self.io_binding.bind_output(self.output_name, self.device_type)
+            self.onnx_session.run_with_iobinding(
+                self.io_binding, run_options=self.run_options
+            )
+            output = self.io_binding.get_outputs()[0]
+            # 出力は PCM に変換する直前に一度だけ numpy 配列にコピーする
+            audio = output.numpy()[0, 0]
+            # 次の推論まで出力テンソルを保持しないよう、バインディングを解除する
+            self.io_binding.clear_binding_outputs()
+            del output
+
+        return audio
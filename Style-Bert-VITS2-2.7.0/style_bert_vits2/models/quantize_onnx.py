@@ -0,0 +1,455 @@
+"""
+ONNX 版の BERT モデルと音声合成モデルを INT8 に量子化する。
+CPU 推論を高速化するためのもので、GPU 推論では量子化したモデルは使わない。
+
+- BERT モデル: 重みを持つ MatMul を動的量子化する (キャリブレーション不要)
+- 音声合成モデル: 指定したサブグラフ (既定では decoder) の演算のみを静的量子化または動的量子化する
+  静的量子化では、サンプルテキストの推論結果から活性化の値域をキャリブレーションする
+
+量子化後は量子化前のモデルと出力を比較し、品質が閾値を下回った場合は量子化したモデルを削除する。
+onnxruntime.quantization は onnx パッケージに依存するため、このモジュールは変換時にのみ import すること。
+"""
+
+from __future__ import annotations
+
+import time
+from collections.abc import Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+import onnx
+import onnxruntime
+from numpy.typing import NDArray
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    QuantFormat,
+    QuantType,
+    quantize_dynamic,
+    quantize_static,
+)
+
+from style_bert_vits2.constants import (
+    DEFAULT_LENGTH,
+    DEFAULT_NOISE,
+    DEFAULT_NOISEW,
+    DEFAULT_SDP_RATIO,
+    Languages,
+)
+from style_bert_vits2.logging import logger
+from style_bert_vits2.models.hyper_parameters import HyperParameters
+from style_bert_vits2.models.infer_onnx import get_text_onnx
+
+
+# キャリブレーションと品質チェックに使うサンプルテキスト
+CALIBRATION_TEXTS = {
+    Languages.JP: [
+        "今日はすっごく楽しかったよ！また遊ぼうね！",
+        "えー、そんなの嫌だよ。もう二度と行きたくないな…",
+        "本日のニュースをお伝えします。",
+        "それは、静かな冬の朝のことでした。雪が街を真っ白に染め上げ、人々はまだ深い眠りの中にいました。",
+        "あのね、実は昨日泣いちゃったんだ。寂しくて…",
+        "次の停車駅は、東京駅です。",
+        "ちょっと待って！その話、すっごく気になる！",
+        "音声合成は、機械学習を活用して、テキストから人の声を再現する技術です。",
+    ],
+    Languages.EN: [
+        "Today was so much fun! Let's play again!",
+        "Ugh, I hate that. I never want to go there again...",
+        "Now for today's news.",
+        "It was a quiet winter morning. Snow had painted the town white, and people were still deep in slumber.",
+        "The next stop is Tokyo Station.",
+    ],
+    Languages.ZH: [
+        "今天真是太开心了！下次再一起玩吧！",
+        "唉，我讨厌那样。我再也不想去那里了...",
+        "现在播报今日新闻。",
+        "那是个安静的冬日早晨。白雪覆盖了整个城镇，人们还在沉睡中。",
+        "下一站是东京站。",
+    ],
+}
+
+# 音声合成モデルのサブグラフ (SynthesizerTrn のモジュール名)
+## ONNX に変換すると、各ノードの名前は "/dec/ups.0/ConvTranspose" のようにモジュール名から始まる
+SYNTHESIZER_PARTS = ("enc_p", "dp", "sdp", "flow", "dec")
+
+# 量子化しないノード (出力に近い層は量子化すると音質への影響が大きい)
+SYNTHESIZER_EXCLUDED_NODE_PREFIXES = ("/dec/conv_post/",)
+
+# 品質チェックには CPU を使う (量子化モデルは CPU 推論専用)
+CPU_PROVIDERS = [
+    ("CPUExecutionProvider", {"arena_extend_strategy": "kSameAsRequested"})
+]
+
+
+@dataclass
+class QuantizationReport:
+    """
+    量子化したモデルの品質チェックの結果
+    """
+
+    # 品質チェックに合格したかどうか (不合格の場合、量子化したモデルは削除されている)
+    passed: bool
+    # 量子化前のモデルとの出力の差 (音声合成モデルは対数スペクトル距離 [dB]、BERT モデルは 1 - コサイン類似度)
+    distance: float
+    # 合格とする distance の上限
+    max_distance: float
+    # 量子化前後の推論時間の比 (量子化前 / 量子化後)
+    speedup: float
+    # 量子化前後のモデルのファイルサイズ (バイト)
+    original_size: int
+    quantized_size: int
+    # 音声合成モデルのみ: 量子化前後の RTF (推論時間 / 音声の長さ)
+    original_rtf: Optional[float] = None
+    quantized_rtf: Optional[float] = None
+
+    def __str__(self) -> str:
+        lines = [
+            f"Validation {'passed' if self.passed else 'failed'}",
+            f"Distance: {self.distance:.4f} (threshold: {self.max_distance})",
+            f"Speedup: {self.speedup:.2f}x",
+        ]
+        if self.original_rtf is not None and self.quantized_rtf is not None:
+            lines.append(
+                f"RTF: {self.original_rtf:.3f} -> {self.quantized_rtf:.3f} (CPU)"
+            )
+        lines.append(
+            f"Size: {self.original_size / 1000 / 1000:.2f}MB -> {self.quantized_size / 1000 / 1000:.2f}MB"
+        )
+        return "\n".join(lines)
+
+
+class SynthesizerCalibrationDataReader(CalibrationDataReader):
+    """
+    静的量子化のキャリブレーションに使う、音声合成モデルの入力を順に返す
+    """
+
+    def __init__(self, inputs: list[dict[str, NDArray[Any]]]) -> None:
+        self.__inputs = iter(inputs)
+
+    def get_next(self) -> Optional[dict[str, NDArray[Any]]]:
+        return next(self.__inputs, None)
+
+
+def create_cpu_session(model_path: Path) -> onnxruntime.InferenceSession:
+    sess_options = onnxruntime.SessionOptions()
+    sess_options.log_severity_level = 3
+    return onnxruntime.InferenceSession(
+        str(model_path), sess_options=sess_options, providers=CPU_PROVIDERS
+    )
+
+
+def make_synthesizer_inputs(
+    onnx_session: onnxruntime.InferenceSession,
+    hps: HyperParameters,
+    text: str,
+    language: Languages,
+    style_vec: NDArray[Any],
+    sdp_ratio: float = DEFAULT_SDP_RATIO,
+    noise_scale: float = DEFAULT_NOISE,
+    noise_scale_w: float = DEFAULT_NOISEW,
+    length_scale: float = DEFAULT_LENGTH,
+) -> dict[str, NDArray[Any]]:
+    """
+    テキストから音声合成モデルの入力を作成する (入力の順序は infer_onnx() と同じ)
+
+    Returns:
+        dict[str, NDArray[Any]]: 入力名と入力テンソルの辞書
+    """
+
+    bert, ja_bert, en_bert, phones, tones, lang_ids = get_text_onnx(
+        text, language, hps, CPU_PROVIDERS
+    )
+    berts = [ja_bert] if hps.version.endswith("JP-Extra") else [bert, ja_bert, en_bert]
+    input_tensor = [
+        np.expand_dims(phones, axis=0),
+        np.array([phones.shape[0]], dtype=np.int64),
+        np.array([0], dtype=np.int64),
+        np.expand_dims(tones, axis=0),
+        np.expand_dims(lang_ids, axis=0),
+        *[np.expand_dims(b, axis=0) for b in berts],
+        np.expand_dims(style_vec, axis=0).astype(np.float32),
+        np.array(length_scale, dtype=np.float32),
+        np.array(sdp_ratio, dtype=np.float32),
+        np.array(noise_scale, dtype=np.float32),
+        np.array(noise_scale_w, dtype=np.float32),
+    ]
+    input_names = [input.name for input in onnx_session.get_inputs()]
+    return dict(zip(input_names, input_tensor))
+
+
+def get_synthesizer_node_names(
+    model_path: Path,
+    parts: Sequence[str],
+    op_types: Sequence[str],
+) -> list[str]:
+    """
+    音声合成モデルのうち、指定したサブグラフに属する指定した種類のノードの名前を取得する
+
+    Args:
+        model_path (Path): 音声合成モデルのパス
+        parts (Sequence[str]): 量子化するサブグラフ (SYNTHESIZER_PARTS のいずれか)
+        op_types (Sequence[str]): 量子化する演算の種類
+
+    Returns:
+        list[str]: ノード名のリスト
+    """
+
+    for part in parts:
+        if part not in SYNTHESIZER_PARTS:
+            raise ValueError(f"Unknown synthesizer part: {part}")
+
+    model = onnx.load(str(model_path), load_external_data=False)
+    return [
+        node.name
+        for node in model.graph.node
+        if node.op_type in op_types
+        and any(node.name.startswith(f"/{part}/") for part in parts)
+        and not node.name.startswith(SYNTHESIZER_EXCLUDED_NODE_PREFIXES)
+    ]
+
+
+def log_spectral_distance(
+    reference: NDArray[Any],
+    target: NDArray[Any],
+    n_fft: int = 1024,
+    hop_length: int = 256,
+    floor_db: float = -60.0,
+) -> float:
+    """
+    2 つの音声の対数スペクトル距離 (LSD) [dB] を計算する
+    長さが異なる場合は短い方に合わせる
+
+    Args:
+        reference (NDArray[Any]): 基準の音声
+        target (NDArray[Any]): 比較する音声
+        n_fft (int): FFT のサイズ
+        hop_length (int): フレームのシフト幅
+        floor_db (float): 無音部分の差が過大にならないよう、基準の最大パワーからこの値 [dB] 未満のパワーを切り上げる
+
+    Returns:
+        float: フレームごとの LSD の平均
+    """
+
+    length = min(len(reference), len(target))
+    if length < n_fft:
+        raise ValueError(f"Audio is too short to compare ({length} samples)")
+    window = np.hanning(n_fft).astype(np.float32)
+
+    def log_power(audio: NDArray[Any]) -> NDArray[Any]:
+        frames = np.lib.stride_tricks.sliding_window_view(audio[:length], n_fft)
+        power = np.abs(np.fft.rfft(frames[::hop_length] * window, axis=-1)) ** 2
+        return 10 * np.log10(np.maximum(power, 1e-20))
+
+    reference_db = log_power(reference.astype(np.float32))
+    target_db = log_power(target.astype(np.float32))
+    floor = reference_db.max() + floor_db
+    reference_db = np.maximum(reference_db, floor)
+    target_db = np.maximum(target_db, floor)
+    return float(np.mean(np.sqrt(np.mean((reference_db - target_db) ** 2, axis=-1))))
+
+
+def quantize_synthesizer_onnx(
+    model_path: Path,
+    output_path: Path,
+    hps: HyperParameters,
+    style_vec: NDArray[Any],
+    language: Languages = Languages.JP,
+    mode: str = "static",
+    parts: Sequence[str] = ("dec",),
+    max_distance: float = 3.0,
+) -> QuantizationReport:
+    """
+    音声合成モデルを INT8 に量子化し、量子化前のモデルと出力を比較する
+
+    Args:
+        model_path (Path): 量子化前の音声合成モデル (.onnx) のパス
+        output_path (Path): 量子化したモデルの保存先
+        hps (HyperParameters): ハイパーパラメータ
+        style_vec (NDArray[Any]): キャリブレーションと品質チェックに使うスタイルベクトル
+        language (Languages): サンプルテキストの言語
+        mode (str): "static" (活性化もキャリブレーションして INT8 で計算する) または "dynamic" (重みのみを事前に量子化する)
+        parts (Sequence[str]): 量子化するサブグラフ
+        max_distance (float): 合格とする対数スペクトル距離 [dB] の上限
+
+    Returns:
+        QuantizationReport: 品質チェックの結果
+    """
+
+    texts = CALIBRATION_TEXTS[language]
+    original_session = create_cpu_session(model_path)
+
+    start_time = time.time()
+    if mode == "static":
+        # 静的量子化: Conv / ConvTranspose / MatMul の入力と重みを INT8 にし、前後に Q/DQ ノードを挿入する
+        ## CPU 推論時、ONNX Runtime は Q/DQ で挟まれた Conv を QLinearConv に融合する
+        nodes = get_synthesizer_node_names(
+            model_path, parts, ("Conv", "ConvTranspose", "MatMul")
+        )
+        calibration_inputs = [
+            make_synthesizer_inputs(original_session, hps, text, language, style_vec)
+            for text in texts
+        ]
+        quantize_static(
+            model_path,
+            output_path,
+            SynthesizerCalibrationDataReader(calibration_inputs),
+            quant_format=QuantFormat.QDQ,
+            op_types_to_quantize=["Conv", "ConvTranspose", "MatMul"],
+            nodes_to_quantize=nodes,
+            per_channel=True,
+            # x86 CPU では活性化を符号なし・重みを符号付きにすると VNNI 命令が使われる
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+        )
+    elif mode == "dynamic":
+        # 動的量子化: 重みを持つ MatMul の重みのみを事前に量子化し、活性化は推論時に量子化する
+        ## Conv の動的量子化 (ConvInteger) は CPU ではかえって遅くなるため対象にしない
+        nodes = get_synthesizer_node_names(model_path, parts, ("MatMul",))
+        quantize_dynamic(
+            model_path,
+            output_path,
+            op_types_to_quantize=["MatMul"],
+            nodes_to_quantize=nodes,
+            weight_type=QuantType.QInt8,
+            extra_options={"MatMulConstBOnly": True},
+        )
+    else:
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    logger.info(
+        f"Quantized {len(nodes)} nodes of {', '.join(parts)} ({mode}) to {output_path} ({time.time() - start_time:.2f}s)"
+    )
+
+    # 品質チェック
+    ## 乱数の影響をなくすため、ノイズと SDP を無効にして合成した音声を比較する
+    quantized_session = create_cpu_session(output_path)
+    validation_inputs = [
+        make_synthesizer_inputs(
+            original_session,
+            hps,
+            text,
+            language,
+            style_vec,
+            sdp_ratio=0.0,
+            noise_scale=0.0,
+            noise_scale_w=0.0,
+        )
+        for text in texts
+    ]
+    distances: list[float] = []
+    elapsed = {"original": 0.0, "quantized": 0.0}
+    audio_seconds = 0.0
+    for session in (original_session, quantized_session):
+        # ウォームアップ
+        session.run(None, validation_inputs[0])
+    for inputs in validation_inputs:
+        audios: dict[str, NDArray[Any]] = {}
+        for name, session in (
+            ("original", original_session),
+            ("quantized", quantized_session),
+        ):
+            run_start_time = time.perf_counter()
+            audios[name] = session.run(None, inputs)[0][0, 0]
+            elapsed[name] += time.perf_counter() - run_start_time
+        audio_seconds += len(audios["original"]) / hps.data.sampling_rate
+        distances.append(log_spectral_distance(audios["original"], audios["quantized"]))
+
+    distance = float(np.mean(distances))
+    report = QuantizationReport(
+        passed=distance <= max_distance,
+        distance=distance,
+        max_distance=max_distance,
+        speedup=elapsed["original"] / elapsed["quantized"],
+        original_size=model_path.stat().st_size,
+        quantized_size=output_path.stat().st_size,
+        original_rtf=elapsed["original"] / audio_seconds,
+        quantized_rtf=elapsed["quantized"] / audio_seconds,
+    )
+    del quantized_session
+    # 品質チェックに不合格の場合、推論時に使われないよう削除する
+    if not report.passed:
+        output_path.unlink()
+    return report
+
+
+def quantize_bert_onnx(
+    model_path: Path,
+    output_path: Path,
+    language: Languages,
+    max_distance: float = 0.01,
+) -> QuantizationReport:
+    """
+    BERT モデルを INT8 に動的量子化し、量子化前のモデルと出力を比較する
+
+    Args:
+        model_path (Path): 量子化前の BERT モデル (FP32 の .onnx) のパス
+        output_path (Path): 量子化したモデルの保存先
+        language (Languages): BERT モデルの言語 (サンプルテキストとトークナイザーの選択に使う)
+        max_distance (float): 合格とする 1 - コサイン類似度 (トークンごとの平均) の上限
+
+    Returns:
+        QuantizationReport: 品質チェックの結果
+    """
+
+    from style_bert_vits2.nlp import onnx_bert_models
+
+    start_time = time.time()
+    # 重みを持つ MatMul (全結合層) のみを量子化する
+    ## アテンションの MatMul (活性化同士の積) を量子化すると精度が大きく低下する
+    quantize_dynamic(
+        model_path,
+        output_path,
+        op_types_to_quantize=["MatMul"],
+        weight_type=QuantType.QInt8,
+        extra_options={"MatMulConstBOnly": True},
+    )
+    logger.info(
+        f"Quantized the {language.name} BERT model to {output_path} ({time.time() - start_time:.2f}s)"
+    )
+
+    tokenizer = onnx_bert_models.load_tokenizer(language)
+    original_session = create_cpu_session(model_path)
+    quantized_session = create_cpu_session(output_path)
+    input_names = [input.name for input in original_session.get_inputs()]
+
+    distances: list[float] = []
+    elapsed = {"original": 0.0, "quantized": 0.0}
+    for i, text in enumerate(CALIBRATION_TEXTS[language]):
+        tokenized = tokenizer(text, return_tensors="np")
+        inputs = {
+            name: tokenized[name].astype(np.int64)
+            for name in input_names
+            if name in tokenized
+        }
+        outputs: dict[str, NDArray[Any]] = {}
+        for name, session in (
+            ("original", original_session),
+            ("quantized", quantized_session),
+        ):
+            run_start_time = time.perf_counter()
+            outputs[name] = session.run(None, inputs)[0]
+            # 1 件目はウォームアップとして計測しない
+            if i > 0:
+                elapsed[name] += time.perf_counter() - run_start_time
+        original = outputs["original"].reshape(-1, outputs["original"].shape[-1])
+        quantized = outputs["quantized"].reshape(-1, outputs["quantized"].shape[-1])
+        cosine = np.sum(original * quantized, axis=-1) / (
+            np.linalg.norm(original, axis=-1) * np.linalg.norm(quantized, axis=-1)
+            + 1e-12
+        )
+        distances.append(float(np.mean(1 - cosine)))
+
+    distance = float(np.mean(distances))
+    report = QuantizationReport(
+        passed=distance <= max_distance,
+        distance=distance,
+        max_distance=max_distance,
+        speedup=elapsed["original"] / max(elapsed["quantized"], 1e-9),
+        original_size=model_path.stat().st_size,
+        quantized_size=output_path.stat().st_size,
+    )
+    del quantized_session
+    if not report.passed:
+        output_path.unlink()
+    return report
@@ -1,3 +1,6 @@
+import json
+import mmap
+import struct
 from pathlib import Path
 from typing import Any, Optional, Union
 
@@ -8,11 +11,76 @@ from safetensors.torch import save_file
 from style_bert_vits2.logging import logger
 
 
+# safetensors のヘッダーに記載される dtype 名と torch.dtype の対応
+SAFETENSORS_DTYPES: dict[str, torch.dtype] = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def map_safetensors(checkpoint_path: Union[str, Path]) -> dict[str, torch.Tensor]:
+    """
+    safetensors ファイルをメモリマップし、ファイル上のデータをコピーせずに参照するテンソルの辞書を返す。
+    マップはコピーオンライトで行うため、テンソルに書き込んでもファイルは変更されず、書き込んだページだけがプロセス固有のメモリになる。
+    書き込まれないページは OS のページキャッシュとして、同じファイルをマップした全プロセスで共有される。
+
+    Args:
+        checkpoint_path (Union[str, Path]): safetensors ファイルのパス
+
+    Returns:
+        dict[str, torch.Tensor]: テンソル名とテンソルの辞書 (CPU 上に配置される)
+    """
+
+    with open(checkpoint_path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    # safetensors のフォーマット: 8 バイトのヘッダー長 (リトルエンディアン) + JSON ヘッダー + データ
+    header_size = struct.unpack("<Q", mapped[:8])[0]
+    header: dict[str, Any] = json.loads(mapped[8 : 8 + header_size])
+    data_start = 8 + header_size
+
+    tensors: dict[str, torch.Tensor] = {}
+    for key, info in header.items():
+        if key == "__metadata__":
+            continue
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        begin, end = info["data_offsets"]
+        offset = data_start + begin
+        if begin == end:
+            tensors[key] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        if offset % dtype.itemsize != 0:
+            # アライメントが揃っていない (古い safetensors で保存された) テンソルはコピーして読み込む
+            tensor = torch.frombuffer(
+                bytearray(mapped[offset : data_start + end]), dtype=dtype
+            )
+        else:
+            # 返されるテンソルは mapped への参照を保持するため、テンソルが全て破棄されるまでマップは解放されない
+            tensor = torch.frombuffer(
+                mapped,  # type: ignore
+                dtype=dtype,
+                count=(end - begin) // dtype.itemsize,
+                offset=offset,
+            )
+        tensors[key] = tensor.view(info["shape"])
+
+    return tensors
+
+
 def load_safetensors(
     checkpoint_path: Union[str, Path],
     model: torch.nn.Module,
     for_infer: bool = False,
     device: Union[str, torch.device] = "cpu",
+    use_mmap: Optional[bool] = None,
 ) -> tuple[torch.nn.Module, Optional[int]]:
     """
     指定されたパスから safetensors モデルを読み込み、モデルとイテレーションを返す。
@@ -21,6 +89,10 @@ def load_safetensors(
         checkpoint_path (Union[str, Path]): モデルのチェックポイントファイルのパス
         model (torch.nn.Module): 読み込む対象のモデル
         for_infer (bool): 推論用に読み込むかどうかのフラグ
+        device (Union[str, torch.device]): 重みを読み込むデバイス
+        use_mmap (Optional[bool]): True のとき、ファイルをメモリマップしたテンソルをそのままモデルのパラメータとして使う (CPU のみ)。
+            重みのコピーが作られないため読み込み時のピークメモリが減り、同じモデルを読み込んだ複数のプロセス間で重みのメモリが共有される。
+            None のときは、推論用に CPU に読み込む場合のみ有効になる。
 
     Returns:
         tuple[torch.nn.Module, Optional[int]]: 読み込まれたモデルとイテレーション回数（存在する場合）
@@ -28,15 +100,36 @@ def load_safetensors(
 
     tensors: dict[str, Any] = {}
     iteration: Optional[int] = None
-    with safe_open(str(checkpoint_path), framework="pt", device=device) as f:  # type: ignore
-        for key in f.keys():
+    target = model.module if hasattr(model, "module") else model
+    # 推論用に enc_q が破棄されたモデルには、enc_q の重みを読み込まない
+    skip_enc_q = for_infer and not hasattr(target, "enc_q")
+    if use_mmap is None:
+        use_mmap = for_infer and torch.device(device).type == "cpu"
+
+    if use_mmap:
+        if torch.device(device).type != "cpu":
+            raise ValueError("use_mmap is only supported on CPU")
+        state_dict = target.state_dict()
+        for key, tensor in map_safetensors(checkpoint_path).items():
             if key == "iteration":
-                iteration = f.get_tensor(key).item()
-            tensors[key] = f.get_tensor(key)
-    if hasattr(model, "module"):
-        result = model.module.load_state_dict(tensors, strict=False)
+                iteration = tensor.item()
+            if skip_enc_q and key.startswith("enc_q."):
+                continue
+            # 半精度で保存されたモデルなど、モデル側と dtype が異なる重みは変換する (この重みはコピーになる)
+            if key in state_dict and state_dict[key].dtype != tensor.dtype:
+                tensor = tensor.to(state_dict[key].dtype)
+            tensors[key] = tensor
+        # assign=True により、パラメータへコピーせずにマップしたテンソルそのものをパラメータにする
+        result = target.load_state_dict(tensors, strict=False, assign=True)
     else:
-        result = model.load_state_dict(tensors, strict=False)
+        with safe_open(str(checkpoint_path), framework="pt", device=device) as f:  # type: ignore
+            for key in f.keys():
+                if key == "iteration":
+                    iteration = f.get_tensor(key).item()
+                if skip_enc_q and key.startswith("enc_q."):
+                    continue
+                tensors[key] = f.get_tensor(key)
+        result = target.load_state_dict(tensors, strict=False)
     for key in result.missing_keys:
         if key.startswith("enc_q") and for_infer:
             continue
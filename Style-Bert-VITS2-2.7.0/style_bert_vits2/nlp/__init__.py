@@ -98,6 +98,105 @@ def extract_bert_feature_onnx(
     )
 
 
+def extract_bert_feature_batch(
+    texts: list[str],
+    word2phs: list[list[int]],
+    language: Languages,
+    device: str,
+    assist_text: Optional[str] = None,
+    assist_text_weight: float = 0.7,
+    max_batch_size: Optional[int] = None,
+) -> list[torch.Tensor]:
+    """
+    複数のテキストから BERT の特徴量をまとめて抽出する (PyTorch 推論)
+    日本語の場合はテキストをパディングして一度の順伝播で推論し、補助テキストも一度だけ推論する。
+    他の言語の場合は 1 件ずつ extract_bert_feature() を呼び出す。
+
+    Args:
+        texts (list[str]): テキストのリスト
+        word2phs (list[list[int]]): テキストごとの、元のテキストの各文字に音素が何個割り当てられるかを表すリスト
+        language (Languages): テキストの言語
+        device (str): 推論に利用するデバイス
+        assist_text (Optional[str], optional): 全てのテキストに共通の補助テキスト (デフォルト: None)
+        assist_text_weight (float, optional): 補助テキストの重み (デフォルト: 0.7)
+        max_batch_size (Optional[int], optional): 日本語の場合に一度に推論するテキストの最大数 (デフォルト: None で BERT_MAX_BATCH_SIZE)
+
+    Returns:
+        list[torch.Tensor]: テキストごとの BERT の特徴量
+    """
+
+    if language == Languages.JP:
+        from style_bert_vits2.nlp.japanese.bert_feature import (
+            BERT_MAX_BATCH_SIZE,
+            extract_bert_feature_batch,
+        )
+
+        if max_batch_size is None:
+            max_batch_size = BERT_MAX_BATCH_SIZE
+        return extract_bert_feature_batch(
+            texts, word2phs, device, assist_text, assist_text_weight, max_batch_size
+        )
+
+    return [
+        extract_bert_feature(
+            text, word2ph, language, device, assist_text, assist_text_weight
+        )
+        for text, word2ph in zip(texts, word2phs)
+    ]
+
+
+def extract_bert_feature_batch_onnx(
+    texts: list[str],
+    word2phs: list[list[int]],
+    language: Languages,
+    onnx_providers: Sequence[Union[str, tuple[str, dict[str, Any]]]],
+    assist_text: Optional[str] = None,
+    assist_text_weight: float = 0.7,
+    max_batch_size: Optional[int] = None,
+) -> list[NDArray[Any]]:
+    """
+    複数のテキストから BERT の特徴量をまとめて抽出する (ONNX 推論)
+    日本語の場合はテキストをまとめてトークナイズし、補助テキストも一度だけ推論する。
+    他の言語の場合は 1 件ずつ extract_bert_feature_onnx() を呼び出す。
+
+    Args:
+        texts (list[str]): テキストのリスト
+        word2phs (list[list[int]]): テキストごとの、元のテキストの各文字に音素が何個割り当てられるかを表すリスト
+        language (Languages): テキストの言語
+        onnx_providers (list[str]): ONNX 推論で利用する ExecutionProvider (CPUExecutionProvider, CUDAExecutionProvider など)
+        assist_text (Optional[str], optional): 全てのテキストに共通の補助テキスト (デフォルト: None)
+        assist_text_weight (float, optional): 補助テキストの重み (デフォルト: 0.7)
+        max_batch_size (Optional[int], optional): 日本語の場合に一度に推論するテキストの最大数 (デフォルト: None で BERT_MAX_BATCH_SIZE)
+
+    Returns:
+        list[NDArray[Any]]: テキストごとの BERT の特徴量
+    """
+
+    if language == Languages.JP:
+        from style_bert_vits2.nlp.japanese.bert_feature import (
+            BERT_MAX_BATCH_SIZE,
+            extract_bert_feature_batch_onnx,
+        )
+
+        if max_batch_size is None:
+            max_batch_size = BERT_MAX_BATCH_SIZE
+        return extract_bert_feature_batch_onnx(
+            texts,
+            word2phs,
+            onnx_providers,
+            assist_text,
+            assist_text_weight,
+            max_batch_size,
+        )
+
+    return [
+        extract_bert_feature_onnx(
+            text, word2ph, language, onnx_providers, assist_text, assist_text_weight
+        )
+        for text, word2ph in zip(texts, word2phs)
+    ]
+
+
 def clean_text(
     text: str,
     language: Languages,
@@ -119,11 +218,16 @@ def clean_text(
 
     # Changed to import inside if condition to avoid unnecessary import
     if language == Languages.JP:
-        from style_bert_vits2.nlp.japanese.g2p import g2p
-        from style_bert_vits2.nlp.japanese.normalizer import normalize_text
-
-        norm_text = normalize_text(text)
-        phones, tones, word2ph = g2p(norm_text, use_jp_extra, raise_yomi_error)
+        from style_bert_vits2.nlp.japanese.g2p_batch import g2p_with_cache
+
+        # 同じテキストを何度も処理しないよう、g2p の結果のキャッシュ (永続キャッシュを含む) を使う
+        result = g2p_with_cache(text, use_jp_extra, raise_yomi_error)
+        norm_text = result.norm_text
+        phones, tones, word2ph = (
+            list(result.phones),
+            list(result.tones),
+            list(result.word2ph),
+        )
     elif language == Languages.EN:
         from style_bert_vits2.nlp.english.g2p import g2p
         from style_bert_vits2.nlp.english.normalizer import normalize_text
@@ -130,6 +130,9 @@ def extract_bert_feature_onnx(
     io_binding.bind_output(output_name, device_type)
     session.run_with_iobinding(io_binding, run_options=run_options)
     res = io_binding.get_outputs()[0].numpy()
+    # バッチ全体の出力を返すよう変換されたモデルの場合は、先頭の出力を取り出す
+    if res.ndim == 3:
+        res = res[0]
 
     style_res_mean = None
     if assist_text:
@@ -151,6 +154,8 @@ def extract_bert_feature_onnx(
         io_binding.bind_output(output_name, device_type)
         session.run_with_iobinding(io_binding, run_options=run_options)
         style_res = io_binding.get_outputs()[0].numpy()
+        if style_res.ndim == 3:
+            style_res = style_res[0]
         style_res_mean = np.mean(style_res, axis=0)
 
     assert len(word2ph) == res.shape[0], (text, res.shape[0], len(word2ph))
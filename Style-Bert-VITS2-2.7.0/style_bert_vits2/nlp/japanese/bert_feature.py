@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import threading
+import weakref
 from collections.abc import Sequence
 from typing import TYPE_CHECKING, Any, Optional, Union
 
@@ -9,7 +11,7 @@ from numpy.typing import NDArray
 
 from style_bert_vits2.constants import Languages
 from style_bert_vits2.nlp import bert_models, onnx_bert_models
-from style_bert_vits2.nlp.japanese.g2p import text_to_sep_kata
+from style_bert_vits2.nlp.japanese.g2p_batch import bert_text_with_cache
 from style_bert_vits2.utils import get_onnx_device_options
 
 
@@ -17,6 +19,72 @@ if TYPE_CHECKING:
     import torch
 
 
+# 複数のテキストの BERT 特徴量をまとめて抽出する際に、一度に推論するテキストの最大数
+## 大きくするほど速くなるが、最も長いテキストに合わせてパディングするため、メモリ使用量が増える
+BERT_MAX_BATCH_SIZE = 16
+
+# スレッドごとに、BERT モデルの推論セッションに対応する IOBinding を使い回す
+## IOBinding はスレッドセーフではないため、スレッド間では共有しない
+## セッションがアンロードされたら IOBinding も破棄されるよう、弱参照の辞書に格納する
+__io_bindings = threading.local()
+
+
+def __get_io_binding(session: onnxruntime.InferenceSession) -> onnxruntime.IOBinding:
+    io_bindings: Optional[
+        weakref.WeakKeyDictionary[onnxruntime.InferenceSession, onnxruntime.IOBinding]
+    ] = getattr(__io_bindings, "value", None)
+    if io_bindings is None:
+        io_bindings = weakref.WeakKeyDictionary()
+        __io_bindings.value = io_bindings
+    io_binding = io_bindings.get(session)
+    if io_binding is None:
+        io_binding = session.io_binding()
+        io_bindings[session] = io_binding
+    return io_binding
+
+
+def __run_with_io_binding(
+    session: onnxruntime.InferenceSession,
+    input_names: list[str],
+    input_tensor: list[NDArray[Any]],
+    output_name: str,
+    device_type: str,
+    device_id: int,
+    run_options: onnxruntime.RunOptions,
+) -> NDArray[Any]:
+    io_binding = __get_io_binding(session)
+    # 推論デバイスに入力テンソルを割り当て
+    ## GPU 推論の場合、device_type + device_id に対応する GPU デバイスに入力テンソルが割り当てられる
+    for name, value in zip(input_names, input_tensor):
+        gpu_tensor = onnxruntime.OrtValue.ortvalue_from_numpy(
+            value, device_type, device_id
+        )
+        io_binding.bind_ortvalue_input(name, gpu_tensor)
+    io_binding.bind_output(output_name, device_type)
+    session.run_with_iobinding(io_binding, run_options=run_options)
+    res = io_binding.get_outputs()[0].numpy()
+    # 次の推論まで入出力テンソルを保持しないよう、バインディングを解除する
+    io_binding.clear_binding_inputs()
+    io_binding.clear_binding_outputs()
+    return res
+
+
+def __to_bert_text(text: str) -> str:
+    # 各単語が何文字かを作る `word2ph` を使う必要があるので、読めない文字は必ず無視する
+    # でないと `word2ph` の結果とテキストの文字数結果が整合性が取れない
+    # 永続キャッシュを開いている場合は、前処理やモデルごとの bert_gen で同じテキストを何度も解析しないよう結果を再利用する
+    return bert_text_with_cache(text)
+
+
+def __split_into_batches(lengths: list[int], max_batch_size: int) -> list[list[int]]:
+    # パディングを減らすため、長さ順に並べてから max_batch_size 件ずつに分ける
+    indices = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    max_batch_size = max(1, max_batch_size)
+    return [
+        indices[i : i + max_batch_size] for i in range(0, len(indices), max_batch_size)
+    ]
+
+
 def extract_bert_feature(
     text: str,
     word2ph: list[int],
@@ -38,27 +106,66 @@ def extract_bert_feature(
         torch.Tensor: BERT の特徴量
     """
 
+    return extract_bert_feature_batch(
+        [text], [word2ph], device, assist_text, assist_text_weight
+    )[0]
+
+
+def extract_bert_feature_batch(
+    texts: list[str],
+    word2phs: list[list[int]],
+    device: str,
+    assist_text: Optional[str] = None,
+    assist_text_weight: float = 0.7,
+    max_batch_size: int = BERT_MAX_BATCH_SIZE,
+) -> list[torch.Tensor]:
+    """
+    複数の日本語のテキストから BERT の特徴量をまとめて抽出する (PyTorch 推論)
+    テキストをパディングして 1 つのバッチにまとめ、一度の順伝播で推論する。
+    パディング部分は attention mask で無視されるため、1 件ずつ推論した場合と (浮動小数点の誤差を除き) 同じ特徴量になる。
+    補助テキストは全てのテキストで共通とし、一度だけ推論する。
+
+    Args:
+        texts (list[str]): 日本語のテキストのリスト
+        word2phs (list[list[int]]): テキストごとの、元のテキストの各文字に音素が何個割り当てられるかを表すリスト
+        device (str): 推論に利用するデバイス
+        assist_text (Optional[str], optional): 補助テキスト (デフォルト: None)
+        assist_text_weight (float, optional): 補助テキストの重み (デフォルト: 0.7)
+        max_batch_size (int, optional): 一度に推論するテキストの最大数 (デフォルト: BERT_MAX_BATCH_SIZE)
+
+    Returns:
+        list[torch.Tensor]: テキストごとの BERT の特徴量
+    """
+
     import torch
 
-    # 各単語が何文字かを作る `word2ph` を使う必要があるので、読めない文字は必ず無視する
-    # でないと `word2ph` の結果とテキストの文字数結果が整合性が取れない
-    text = "".join(text_to_sep_kata(text, raise_yomi_error=False)[0])
+    assert len(texts) == len(word2phs)
+    texts = [__to_bert_text(text) for text in texts]
     if assist_text:
-        assist_text = "".join(text_to_sep_kata(assist_text, raise_yomi_error=False)[0])
+        assist_text = __to_bert_text(assist_text)
+    for text, word2ph in zip(texts, word2phs):
+        assert len(word2ph) == len(text) + 2, text
 
     if device == "cuda" and not torch.cuda.is_available():
         device = "cpu"
     model = bert_models.load_model(Languages.JP, device_map=device)
     bert_models.transfer_model(Languages.JP, device)
+    tokenizer = bert_models.load_tokenizer(Languages.JP)
 
+    results: list[Optional[torch.Tensor]] = [None] * len(texts)
     style_res_mean = None
     with torch.no_grad():
-        tokenizer = bert_models.load_tokenizer(Languages.JP)
-        inputs = tokenizer(text, return_tensors="pt")
-        for i in inputs:
-            inputs[i] = inputs[i].to(device)  # type: ignore
-        res = model(**inputs, output_hidden_states=True)
-        res = torch.cat(res["hidden_states"][-3:-2], -1)[0].cpu()
+        for indices in __split_into_batches([len(t) for t in texts], max_batch_size):
+            inputs = tokenizer(
+                [texts[i] for i in indices], padding=True, return_tensors="pt"
+            )
+            for i in inputs:
+                inputs[i] = inputs[i].to(device)  # type: ignore
+            res = model(**inputs, output_hidden_states=True)
+            res = torch.cat(res["hidden_states"][-3:-2], -1).cpu()
+            # パディング部分を除いた、各テキストのトークン数分の特徴量を取り出す
+            for batch_index, text_index in enumerate(indices):
+                results[text_index] = res[batch_index, : len(word2phs[text_index])]
         if assist_text:
             style_inputs = tokenizer(assist_text, return_tensors="pt")
             for i in style_inputs:
@@ -67,23 +174,16 @@ def extract_bert_feature(
             style_res = torch.cat(style_res["hidden_states"][-3:-2], -1)[0].cpu()
             style_res_mean = style_res.mean(0)
 
-    assert len(word2ph) == len(text) + 2, text
-    word2phone = word2ph
-    phone_level_feature = []
-    for i in range(len(word2phone)):
-        if assist_text:
-            assert style_res_mean is not None
-            repeat_feature = (
-                res[i].repeat(word2phone[i], 1) * (1 - assist_text_weight)
-                + style_res_mean.repeat(word2phone[i], 1) * assist_text_weight
-            )
-        else:
-            repeat_feature = res[i].repeat(word2phone[i], 1)
-        phone_level_feature.append(repeat_feature)
-
-    phone_level_feature = torch.cat(phone_level_feature, dim=0)
+    phone_level_features = []
+    for res, word2ph in zip(results, word2phs):
+        assert res is not None
+        if style_res_mean is not None:
+            res = res * (1 - assist_text_weight) + style_res_mean * assist_text_weight
+        # 各文字の特徴量を、その文字に割り当てられた音素の数だけ繰り返す
+        phone_level_feature = torch.repeat_interleave(res, torch.tensor(word2ph), dim=0)
+        phone_level_features.append(phone_level_feature.T)
 
-    return phone_level_feature.T
+    return phone_level_features
 
 
 def extract_bert_feature_onnx(
@@ -107,11 +207,43 @@ def extract_bert_feature_onnx(
         NDArray[Any]: BERT の特徴量
     """
 
-    # 各単語が何文字かを作る `word2ph` を使う必要があるので、読めない文字は必ず無視する
-    # でないと `word2ph` の結果とテキストの文字数結果が整合性が取れない
-    text = "".join(text_to_sep_kata(text, raise_yomi_error=False)[0])
+    return extract_bert_feature_batch_onnx(
+        [text], [word2ph], onnx_providers, assist_text, assist_text_weight
+    )[0]
+
+
+def extract_bert_feature_batch_onnx(
+    texts: list[str],
+    word2phs: list[list[int]],
+    onnx_providers: Sequence[Union[str, tuple[str, dict[str, Any]]]],
+    assist_text: Optional[str] = None,
+    assist_text_weight: float = 0.7,
+    max_batch_size: int = BERT_MAX_BATCH_SIZE,
+) -> list[NDArray[Any]]:
+    """
+    複数の日本語のテキストから BERT の特徴量をまとめて抽出する (ONNX 推論)
+    テキストはまとめてトークナイズし、補助テキストは全てのテキストで共通として一度だけ推論する。
+    BERT モデルがバッチ全体の出力を返す (出力が 3 次元の) 場合は、テキストをパディングして一度の推論で特徴量を抽出する。
+    以前の convert_bert_onnx.py で変換したモデルはバッチの先頭の出力のみを返すため、テキストごとに推論する。
+
+    Args:
+        texts (list[str]): 日本語のテキストのリスト
+        word2phs (list[list[int]]): テキストごとの、元のテキストの各文字に音素が何個割り当てられるかを表すリスト
+        onnx_providers (list[str]): ONNX 推論で利用する ExecutionProvider (CPUExecutionProvider, CUDAExecutionProvider など)
+        assist_text (Optional[str], optional): 補助テキスト (デフォルト: None)
+        assist_text_weight (float, optional): 補助テキストの重み (デフォルト: 0.7)
+        max_batch_size (int, optional): 一度に推論するテキストの最大数 (デフォルト: BERT_MAX_BATCH_SIZE)
+
+    Returns:
+        list[NDArray[Any]]: テキストごとの BERT の特徴量
+    """
+
+    assert len(texts) == len(word2phs)
+    texts = [__to_bert_text(text) for text in texts]
     if assist_text:
-        assist_text = "".join(text_to_sep_kata(assist_text, raise_yomi_error=False)[0])
+        assist_text = __to_bert_text(assist_text)
+    for text, word2ph in zip(texts, word2phs):
+        assert len(word2ph) == len(text) + 2, text
 
     # トークナイザーとモデルの読み込み
     tokenizer = onnx_bert_models.load_tokenizer(Languages.JP)
@@ -120,66 +252,62 @@ def extract_bert_feature_onnx(
         onnx_providers=onnx_providers,
     )
     input_names = [input.name for input in session.get_inputs()]
-    output_name = session.get_outputs()[0].name
+    output = session.get_outputs()[0]
+    supports_batch = len(output.shape) == 3
 
     # 入力テンソルの転送に使用するデバイス種別, デバイス ID, 実行オプションを取得
     device_type, device_id, run_options = get_onnx_device_options(session, onnx_providers)  # fmt: skip
 
-    # 入力をテンソルに変換
-    inputs = tokenizer(text, return_tensors="np")
-    input_tensor = [
-        inputs["input_ids"].astype(np.int64),  # type: ignore
-        inputs["attention_mask"].astype(np.int64),  # type: ignore
-    ]
-    # 推論デバイスに入力テンソルを割り当て
-    ## GPU 推論の場合、device_type + device_id に対応する GPU デバイスに入力テンソルが割り当てられる
-    io_binding = session.io_binding()
-    for name, value in zip(input_names, input_tensor):
-        gpu_tensor = onnxruntime.OrtValue.ortvalue_from_numpy(
-            value, device_type, device_id
+    def run(input_ids: NDArray[Any], attention_mask: NDArray[Any]) -> NDArray[Any]:
+        input_tensor = [
+            input_ids.astype(np.int64),
+            attention_mask.astype(np.int64),
+        ]
+        return __run_with_io_binding(
+            session,
+            input_names,
+            input_tensor,
+            output.name,
+            device_type,
+            device_id,
+            run_options,
         )
-        io_binding.bind_ortvalue_input(name, gpu_tensor)
-    # text から BERT 特徴量を抽出
-    io_binding.bind_output(output_name, device_type)
-    session.run_with_iobinding(io_binding, run_options=run_options)
-    res = io_binding.get_outputs()[0].numpy()
+
+    results: list[Optional[NDArray[Any]]] = [None] * len(texts)
+    if supports_batch:
+        for indices in __split_into_batches([len(t) for t in texts], max_batch_size):
+            inputs = tokenizer(
+                [texts[i] for i in indices], padding=True, return_tensors="np"
+            )
+            res = run(inputs["input_ids"], inputs["attention_mask"])  # type: ignore
+            # パディング部分を除いた、各テキストのトークン数分の特徴量を取り出す
+            for batch_index, text_index in enumerate(indices):
+                results[text_index] = res[batch_index, : len(word2phs[text_index])]
+    else:
+        # パディングなしでまとめてトークナイズし、1 件ずつ推論する
+        encodings = tokenizer(texts)
+        for i in range(len(texts)):
+            results[i] = run(
+                np.array([encodings["input_ids"][i]]),
+                np.array([encodings["attention_mask"][i]]),
+            )
 
     style_res_mean = None
     if assist_text:
-        # 入力をテンソルに変換
-        style_inputs = tokenizer(assist_text, return_tensors="np")
-        style_input_tensor = [
-            style_inputs["input_ids"].astype(np.int64),  # type: ignore
-            style_inputs["attention_mask"].astype(np.int64),  # type: ignore
-        ]
-        # 推論デバイスに入力テンソルを割り当て
-        ## GPU 推論の場合、device_type + device_id に対応する GPU デバイスに入力テンソルが割り当てられる
-        io_binding = session.io_binding()  # IOBinding は作り直す必要がある
-        for name, value in zip(input_names, style_input_tensor):
-            gpu_tensor = onnxruntime.OrtValue.ortvalue_from_numpy(
-                value, device_type, device_id
-            )
-            io_binding.bind_ortvalue_input(name, gpu_tensor)
         # assist_text から BERT 特徴量を抽出
-        io_binding.bind_output(output_name, device_type)
-        session.run_with_iobinding(io_binding, run_options=run_options)
-        style_res = io_binding.get_outputs()[0].numpy()
+        style_inputs = tokenizer(assist_text, return_tensors="np")
+        style_res = run(style_inputs["input_ids"], style_inputs["attention_mask"])  # type: ignore
+        if supports_batch:
+            style_res = style_res[0]
         style_res_mean = np.mean(style_res, axis=0)
 
-    assert len(word2ph) == len(text) + 2, text
-    word2phone = word2ph
-    phone_level_feature = []
-    for i in range(len(word2phone)):
-        if assist_text:
-            assert style_res_mean is not None
-            repeat_feature = (
-                np.tile(res[i], (word2phone[i], 1)) * (1 - assist_text_weight)
-                + np.tile(style_res_mean, (word2phone[i], 1)) * assist_text_weight
-            )
-        else:
-            repeat_feature = np.tile(res[i], (word2phone[i], 1))
-        phone_level_feature.append(repeat_feature)
-
-    phone_level_feature = np.concatenate(phone_level_feature, axis=0)
+    phone_level_features = []
+    for res, word2ph in zip(results, word2phs):
+        assert res is not None
+        if style_res_mean is not None:
+            res = res * (1 - assist_text_weight) + style_res_mean * assist_text_weight
+        # 各文字の特徴量を、その文字に割り当てられた音素の数だけ繰り返す
+        phone_level_feature = np.repeat(res, word2ph, axis=0)
+        phone_level_features.append(phone_level_feature.T)
 
-    return phone_level_feature.T
+    return phone_level_features
@@ -1,5 +1,6 @@
 import re
-from typing import TypedDict
+from functools import lru_cache
+from typing import Any, TypedDict
 
 from style_bert_vits2.constants import Languages
 from style_bert_vits2.logging import logger
@@ -58,21 +59,15 @@ def g2p(
     # word2ph は厳密な解答は不可能なので（「今日」「眼鏡」等の熟字訓が存在）、
     # Bert-VITS2 では、単語単位の分割を使って、単語の文字ごとにだいたい均等に音素を分配する
 
-    # sep_text から、各単語を1文字1文字分割して、文字のリスト（のリスト）を作る
-    sep_tokenized: list[list[str]] = []
-    for i in sep_text:
-        if i not in PUNCTUATIONS:
-            sep_tokenized.append(
-                bert_models.load_tokenizer(Languages.JP).tokenize(i)
-            )  # ここでおそらく`i`が文字単位に分割される
-        else:
-            sep_tokenized.append([i])
+    # sep_text の各単語を BERT のトークナイザーで1文字1文字分割した、単語ごとの文字数のリストを作る
+    ## 記号1文字の単語はそのまま1文字として扱う
+    word_lens = iter(__count_tokens([i for i in sep_text if i not in PUNCTUATIONS]))
+    sep_word_lens = [1 if i in PUNCTUATIONS else next(word_lens) for i in sep_text]
 
     # 各単語について、音素の数と文字の数を比較して、均等っぽく分配する
     word2ph = []
-    for token, phoneme in zip(sep_tokenized, sep_phonemes):
+    for word_len, phoneme in zip(sep_word_lens, sep_phonemes):
         phone_len = len(phoneme)
-        word_len = len(token)
         word2ph += __distribute_phone(phone_len, word_len)
 
     # 最初と最後に `_` 記号を追加、アクセントは 0（低）、word2ph もそれに合わせて追加
@@ -428,12 +423,89 @@ def __g2phone_tone_wo_punct(text: str) -> list[tuple[str, int]]:
     return result
 
 
+# フルコンテキストラベルから、__pyopenjtalk_g2p_prosody() で使う特徴量 (P3, A1, A2, A3, E3, F1) を一度に取り出すパターン
+## ラベルの形式: p1^p2-p3+p4=p5/A:a1+a2+a3/B:b1-b2_b3/C:c1_c2+c3/D:d1+d2_d3/E:e1_e2!e3_e4-e5/F:f1_f2#f3_f4@f5_f6|f7_f8/...
+## 値が未定義の場合は "xx" になる
+__FULLCONTEXT_LABEL_PATTERN = re.compile(
+    r"[^-]*-([^+]*)\+[^/]*/A:([0-9\-]+|xx)\+(\d+|xx)\+(\d+|xx)/B:[^/]*/C:[^/]*/D:[^/]*"
+    r"/E:[^!]*!(\d+|xx)_[^/]*/F:(\d+|xx)_"
+)
+# 上記のパターンにマッチしないラベルや、A3 が未定義のラベルで、特徴量を個別に取り出すパターン
 __PYOPENJTALK_G2P_PROSODY_A1_PATTERN = re.compile(r"/A:([0-9\-]+)\+")
 __PYOPENJTALK_G2P_PROSODY_A2_PATTERN = re.compile(r"\+(\d+)\+")
 __PYOPENJTALK_G2P_PROSODY_A3_PATTERN = re.compile(r"\+(\d+)/")
 __PYOPENJTALK_G2P_PROSODY_E3_PATTERN = re.compile(r"!(\d+)_")
 __PYOPENJTALK_G2P_PROSODY_F1_PATTERN = re.compile(r"/F:(\d+)_")
 __PYOPENJTALK_G2P_PROSODY_P3_PATTERN = re.compile(r"\-(.*?)\+")
+# 特徴量の文字列から整数値への対応 (int() の呼び出しを減らすため、よく現れる値を事前に変換しておく)
+## 未定義の値 "xx" は、個別のパターンにマッチしない場合と同じく -50 とする
+__FULLCONTEXT_FEATURE_VALUES = {str(i): i for i in range(-99, 100)} | {"xx": -50}
+
+
+def __numeric_feature_by_regex(pattern: re.Pattern[str], s: str) -> int:
+    match = pattern.search(s)
+    if match is None:
+        return -50
+    return int(match.group(1))
+
+
+def __parse_fullcontext_labels(
+    labels: list[str],
+) -> tuple[list[str], list[int], list[int], list[int], list[int], list[int]]:
+    """
+    フルコンテキストラベルのリストから、__pyopenjtalk_g2p_prosody() で使う特徴量をラベルごとに一度の走査で取り出す。
+    結果は、ラベルと同じ長さの特徴量ごとのリストとして返す。
+    特徴量ごとに正規表現で検索していた従来の実装と同じ値を返すよう、形式が想定と異なるラベルは従来と同じ方法で処理する。
+
+    Args:
+        labels (list[str]): pyopenjtalk.extract_fullcontext() で得られるフルコンテキストラベルのリスト
+
+    Returns:
+        tuple[list[str], list[int], list[int], list[int], list[int], list[int]]: P3 (音素), A1, A2, A3, E3, F1 のリスト (数値の特徴量は、未定義の場合 -50)
+    """
+
+    values = __FULLCONTEXT_FEATURE_VALUES
+    p3s: list[str] = []
+    a1s: list[int] = []
+    a2s: list[int] = []
+    a3s: list[int] = []
+    e3s: list[int] = []
+    f1s: list[int] = []
+    for label in labels:
+        match = __FULLCONTEXT_LABEL_PATTERN.match(label)
+        if match is None:
+            p3s.append(__PYOPENJTALK_G2P_PROSODY_P3_PATTERN.search(label).group(1))  # type: ignore
+            a1s.append(
+                __numeric_feature_by_regex(__PYOPENJTALK_G2P_PROSODY_A1_PATTERN, label)
+            )
+            a2s.append(
+                __numeric_feature_by_regex(__PYOPENJTALK_G2P_PROSODY_A2_PATTERN, label)
+            )
+            a3s.append(
+                __numeric_feature_by_regex(__PYOPENJTALK_G2P_PROSODY_A3_PATTERN, label)
+            )
+            e3s.append(
+                __numeric_feature_by_regex(__PYOPENJTALK_G2P_PROSODY_E3_PATTERN, label)
+            )
+            f1s.append(
+                __numeric_feature_by_regex(__PYOPENJTALK_G2P_PROSODY_F1_PATTERN, label)
+            )
+            continue
+        p3, a1, a2, a3, e3, f1 = match.groups()
+        p3s.append(p3)
+        a1s.append(values[a1] if a1 in values else int(a1))
+        a2s.append(values[a2] if a2 in values else int(a2))
+        # A3 が未定義の場合、従来の実装ではラベルの後方 (C や I) の値が使われるため、同じ方法で取り出す
+        if a3 == "xx":
+            a3s.append(
+                __numeric_feature_by_regex(__PYOPENJTALK_G2P_PROSODY_A3_PATTERN, label)
+            )
+        else:
+            a3s.append(values[a3] if a3 in values else int(a3))
+        e3s.append(values[e3] if e3 in values else int(e3))
+        f1s.append(values[f1] if f1 in values else int(f1))
+
+    return p3s, a1s, a2s, a3s, e3s, f1s
 
 
 def __pyopenjtalk_g2p_prosody(
@@ -465,21 +537,15 @@ def __pyopenjtalk_g2p_prosody(
         modeling for neural TTS`: https://doi.org/10.1587/transinf.2020EDP7104
     """
 
-    def _numeric_feature_by_regex(pattern: re.Pattern[str], s: str) -> int:
-        match = pattern.search(s)
-        if match is None:
-            return -50
-        return int(match.group(1))
-
-    labels = pyopenjtalk.make_label(pyopenjtalk.run_frontend(text))
+    labels = pyopenjtalk.extract_fullcontext(text)
     N = len(labels)
+    # 全てのラベルの特徴量を一度に取り出しておき、以降は線形に走査する
+    p3s, a1s, a2s, a3s, e3s, f1s = __parse_fullcontext_labels(labels)
 
     phones = []
     for n in range(N):
-        lab_curr = labels[n]
-
         # current phoneme
-        p3 = __PYOPENJTALK_G2P_PROSODY_P3_PATTERN.search(lab_curr).group(1)  # type: ignore
+        p3 = p3s[n]
         # deal unvoiced vowels as normal vowels
         if drop_unvoiced_vowels and p3 in "AEIOU":
             p3 = p3.lower()
@@ -491,9 +557,7 @@ def __pyopenjtalk_g2p_prosody(
                 phones.append("^")
             elif n == N - 1:
                 # check question form or not
-                e3 = _numeric_feature_by_regex(
-                    __PYOPENJTALK_G2P_PROSODY_E3_PATTERN, lab_curr
-                )
+                e3 = e3s[n]
                 if e3 == 0:
                     phones.append("$")
                 elif e3 == 1:
@@ -506,16 +570,14 @@ def __pyopenjtalk_g2p_prosody(
             phones.append(p3)
 
         # accent type and position info (forward or backward)
-        a1 = _numeric_feature_by_regex(__PYOPENJTALK_G2P_PROSODY_A1_PATTERN, lab_curr)
-        a2 = _numeric_feature_by_regex(__PYOPENJTALK_G2P_PROSODY_A2_PATTERN, lab_curr)
-        a3 = _numeric_feature_by_regex(__PYOPENJTALK_G2P_PROSODY_A3_PATTERN, lab_curr)
+        a1 = a1s[n]
+        a2 = a2s[n]
+        a3 = a3s[n]
 
         # number of mora in accent phrase
-        f1 = _numeric_feature_by_regex(__PYOPENJTALK_G2P_PROSODY_F1_PATTERN, lab_curr)
+        f1 = f1s[n]
 
-        a2_next = _numeric_feature_by_regex(
-            __PYOPENJTALK_G2P_PROSODY_A2_PATTERN, labels[n + 1]
-        )
+        a2_next = a2s[n + 1]
         # accent phrase border
         if a3 == 1 and a2_next == 1 and p3 in "aeiouAEIOUNcl":
             phones.append("#")
@@ -691,17 +753,64 @@ def __align_tones(
     return result
 
 
-def __distribute_phone(n_phone: int, n_word: int) -> list[int]:
+# 単語ごとのトークン数のキャッシュの最大サイズ
+__TOKEN_COUNT_CACHE_SIZE = 100000
+# 単語ごとのトークン数のキャッシュと、そのトークン数を求めたトークナイザー
+__token_count_cache: dict[str, int] = {}
+__token_count_cache_tokenizer: Any = None
+
+
+def __count_tokens(words: list[str]) -> list[int]:
+    """
+    日本語の BERT のトークナイザーで各単語を分割した際のトークン数を返す。
+    同じ単語は何度も現れるため結果はキャッシュし、キャッシュにない単語のみトークナイズする。
+    Fast トークナイザーの場合は、キャッシュにない単語を一度の呼び出しでまとめてトークナイズする。
+    単語を連結してトークナイズすると単語の境界をまたいだ分割が起こりうるため、単語ごとのトークナイズと同じ結果になるよう単語のリストのまま渡す。
+
+    Args:
+        words (list[str]): 単語のリスト
+
+    Returns:
+        list[int]: 単語ごとのトークン数
+    """
+
+    global __token_count_cache, __token_count_cache_tokenizer
+
+    tokenizer = bert_models.load_tokenizer(Languages.JP)
+    # トークナイザーが再ロードされた場合や、キャッシュが大きくなりすぎた場合はキャッシュを破棄する
+    if (
+        tokenizer is not __token_count_cache_tokenizer
+        or len(__token_count_cache) > __TOKEN_COUNT_CACHE_SIZE
+    ):
+        __token_count_cache = {}
+        __token_count_cache_tokenizer = tokenizer
+    cache = __token_count_cache
+
+    missing_words = [word for word in dict.fromkeys(words) if word not in cache]
+    if len(missing_words) > 0:
+        if tokenizer.is_fast:
+            input_ids = tokenizer(missing_words, add_special_tokens=False)["input_ids"]
+            counts = [len(ids) for ids in input_ids]
+        else:
+            counts = [len(tokenizer.tokenize(word)) for word in missing_words]
+        cache.update(zip(missing_words, counts))
+
+    return [cache[word] for word in words]
+
+
+@lru_cache(maxsize=4096)
+def __distribute_phone(n_phone: int, n_word: int) -> tuple[int, ...]:
     """
     左から右に 1 ずつ振り分け、次にまた左から右に1ずつ増やし、というふうに、
     音素の数 `n_phone` を単語の数 `n_word` に分配する。
+    同じ組み合わせで何度も呼ばれるため、結果はキャッシュする (キャッシュを共有するため、結果はタプルで返す)。
 
     Args:
         n_phone (int): 音素の数
         n_word (int): 単語の数
 
     Returns:
-        list[int]: 単語ごとの音素の数のリスト
+        tuple[int, ...]: 単語ごとの音素の数
     """
 
     phones_per_word = [0] * n_word
@@ -710,7 +819,7 @@ def __distribute_phone(n_phone: int, n_word: int) -> list[int]:
         min_index = phones_per_word.index(min_tasks)
         phones_per_word[min_index] += 1
 
-    return phones_per_word
+    return tuple(phones_per_word)
 
 
 class YomiError(Exception):
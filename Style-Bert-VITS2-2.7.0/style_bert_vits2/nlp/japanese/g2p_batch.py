@@ -0,0 +1,284 @@
+"""
+複数のテキストの正規化と g2p をまとめて行う。
+
+前処理やテキストの長さの見積もりでは、数千行のテキストの音素数やモーラ数が必要になることがある。
+同じテキストを何度も g2p しないよう、結果をプロセス内で共有する LRU キャッシュに保存する。
+キャッシュにないテキストは、pyopenjtalk_worker のワーカー数と同じ数のスレッドから並列に処理する。
+ユーザー辞書を更新すると読みやアクセントが変わるため、update_dict() はキャッシュを破棄する。
+他のプロセスがユーザー辞書を更新した場合も、辞書の状態ファイルの変更を検知してキャッシュを破棄する。
+open_g2p_store() で永続キャッシュを開いている場合は、LRU キャッシュにない結果を永続キャッシュから読み出し、
+永続キャッシュにもない場合に g2p を行った結果を書き込む。
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from style_bert_vits2.nlp.japanese import g2p_store
+from style_bert_vits2.nlp.japanese import pyopenjtalk_worker as pyopenjtalk
+from style_bert_vits2.nlp.japanese.g2p import g2p, text_to_sep_kata
+from style_bert_vits2.nlp.japanese.g2p_utils import phone_tone2kata_tone
+from style_bert_vits2.nlp.japanese.normalizer import normalize_text
+from style_bert_vits2.nlp.symbols import PUNCTUATIONS
+
+
+# キャッシュに保存する g2p の結果の最大数
+G2P_CACHE_SIZE = 65536
+
+
+def _stat_key(path: Path) -> Optional[tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    # 状態ファイルはアトミックに置き換えられるため、更新時刻の分解能内でも inode が変わる
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+@dataclass(frozen=True)
+class G2PResult:
+    """1 つのテキストの正規化と g2p の結果"""
+
+    # 正規化されたテキスト
+    norm_text: str
+    # 音素のリスト (最初と最後の "_" を含む)
+    phones: tuple[str, ...]
+    # 音素ごとの音高
+    tones: tuple[int, ...]
+    # 正規化されたテキストの 1 文字ごとの音素数
+    word2ph: tuple[int, ...]
+    # カタカナと音高のリスト (最初と最後の "_" を除く)
+    kata_tone: tuple[tuple[str, int], ...]
+    # 記号を除いたモーラ数
+    mora_count: int
+
+
+class G2PCache:
+    """
+    g2p の結果のスレッドセーフな LRU キャッシュ。
+    キーは (元のテキスト, use_jp_extra, raise_yomi_error) で、正規化も含めた結果を保存する。
+    """
+
+    def __init__(self, max_size: int = G2P_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.__entries: OrderedDict[tuple[str, bool, bool], G2PResult] = OrderedDict()
+        self.__lock = threading.Lock()
+        # clear() のたびに増える世代。破棄前に始まった g2p の結果を、破棄後に保存しないために使う
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        # 変更を監視するユーザー辞書の状態ファイルと、最後に確認した時点のファイルの状態
+        self.__watched_path: Optional[Path] = None
+        self.__watched_stat: Optional[tuple[int, int, int]] = None
+        # 読み込まれているユーザー辞書のハッシュ。永続キャッシュのキーに使い、状態ファイルを監視していない場合は None
+        self.dict_hash: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get(self, key: tuple[str, bool, bool]) -> Optional[G2PResult]:
+        with self.__lock:
+            result = self.__entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(
+        self, key: tuple[str, bool, bool], result: G2PResult, generation: int
+    ) -> None:
+        if self.max_size <= 0:
+            return
+        with self.__lock:
+            if generation != self.generation:
+                return
+            self.__entries[key] = result
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+            self.generation += 1
+
+    def watch(self, path: Path) -> None:
+        """
+        ユーザー辞書の状態ファイルの監視を始める。
+        以後 clear_if_changed() は、ファイルが更新されていればキャッシュを破棄する。
+        """
+
+        stat = _stat_key(path)
+        dict_hash = g2p_store.get_dict_hash(path)
+        with self.__lock:
+            self.__watched_path = path
+            self.__watched_stat = stat
+            self.dict_hash = dict_hash
+
+    def clear_if_changed(self) -> None:
+        path = self.__watched_path
+        if path is None:
+            return
+        stat = _stat_key(path)
+        if stat == self.__watched_stat:
+            return
+        dict_hash = g2p_store.get_dict_hash(path)
+        with self.__lock:
+            if stat == self.__watched_stat:
+                return
+            self.__watched_stat = stat
+            self.dict_hash = dict_hash
+            self.__entries.clear()
+            self.generation += 1
+
+
+# プロセス内で共有する g2p の結果のキャッシュ
+G2P_CACHE = G2PCache()
+
+# g2p_batch() で使うスレッドプール (スレッド数 -> スレッドプール)
+# pyopenjtalk_worker はスレッドごとにワーカーへの接続を持つため、呼び出しごとにスレッドを作らず使い回す
+_EXECUTORS: dict[int, ThreadPoolExecutor] = {}
+_EXECUTORS_LOCK = threading.Lock()
+
+
+def _get_executor(max_workers: int) -> ThreadPoolExecutor:
+    with _EXECUTORS_LOCK:
+        executor = _EXECUTORS.get(max_workers)
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="g2p_batch"
+            )
+            _EXECUTORS[max_workers] = executor
+        return executor
+
+
+def g2p_with_cache(
+    text: str, use_jp_extra: bool = True, raise_yomi_error: bool = False
+) -> G2PResult:
+    """
+    テキストを正規化して g2p を行い、結果をキャッシュする。
+
+    Args:
+        text (str): 正規化前のテキスト
+        use_jp_extra (bool, optional): False の場合、「ん」の音素を「N」ではなく「n」とする。Defaults to True.
+        raise_yomi_error (bool, optional): False の場合、読めない文字が消えたような扱いとして処理される。Defaults to False.
+
+    Returns:
+        G2PResult: 正規化と g2p の結果
+    """
+
+    key = (text, use_jp_extra, raise_yomi_error)
+    G2P_CACHE.clear_if_changed()
+    generation = G2P_CACHE.generation
+    dict_hash = G2P_CACHE.dict_hash
+    result = G2P_CACHE.get(key)
+    if result is not None:
+        return result
+
+    norm_text = normalize_text(text)
+    # 辞書のハッシュが分からない場合は、どの辞書による結果か区別できないため永続キャッシュを使わない
+    store = g2p_store.G2P_STORE if dict_hash is not None else None
+    stored = None
+    if store is not None and dict_hash is not None:
+        stored = store.get_g2p(norm_text, dict_hash, raise_yomi_error)
+    if stored is not None:
+        phones, tones, word2ph = stored
+    else:
+        # phone_tone2kata_tone() は「ん」の音素が「N」であることを前提としているため、常に use_jp_extra=True で g2p を行う
+        phones, tones, word2ph = g2p(
+            norm_text, use_jp_extra=True, raise_yomi_error=raise_yomi_error
+        )
+        if store is not None and dict_hash is not None:
+            store.put_g2p(
+                norm_text, dict_hash, raise_yomi_error, phones, tones, word2ph
+            )
+    kata_tone = phone_tone2kata_tone(list(zip(phones, tones)))
+    # use_jp_extra でない場合は g2p() と同様に「N」を「n」に変換
+    if not use_jp_extra:
+        phones = [phone if phone != "N" else "n" for phone in phones]
+    result = G2PResult(
+        norm_text=norm_text,
+        phones=tuple(phones),
+        tones=tuple(tones),
+        word2ph=tuple(word2ph),
+        kata_tone=tuple(kata_tone),
+        mora_count=sum(1 for kata, _ in kata_tone if kata not in PUNCTUATIONS),
+    )
+    G2P_CACHE.put(key, result, generation)
+    return result
+
+
+def bert_text_with_cache(norm_text: str) -> str:
+    """
+    BERT に入力するテキスト (正規化されたテキストを text_to_sep_kata() で単語分割して結合したもの) を求める。
+    永続キャッシュを開いている場合は、前回の結果を再利用する。
+
+    Args:
+        norm_text (str): 正規化されたテキスト
+
+    Returns:
+        str: BERT に入力するテキスト
+    """
+
+    G2P_CACHE.clear_if_changed()
+    dict_hash = G2P_CACHE.dict_hash
+    store = g2p_store.G2P_STORE if dict_hash is not None else None
+    if store is not None and dict_hash is not None:
+        bert_text = store.get_bert_text(norm_text, dict_hash)
+        if bert_text is not None:
+            return bert_text
+    # word2ph の文字数と整合性を取るため、読めない文字は必ず無視する
+    bert_text = "".join(text_to_sep_kata(norm_text, raise_yomi_error=False)[0])
+    if store is not None and dict_hash is not None:
+        store.put_bert_text(norm_text, dict_hash, bert_text)
+    return bert_text
+
+
+def g2p_batch(
+    texts: Sequence[str],
+    use_jp_extra: bool = True,
+    raise_yomi_error: bool = False,
+    max_workers: Optional[int] = None,
+) -> list[G2PResult]:
+    """
+    複数のテキストを正規化して g2p を行う。
+    重複したテキストは一度だけ処理し、キャッシュにないテキストは pyopenjtalk_worker のワーカー数と同じ数のスレッドで並列に処理する。
+
+    Args:
+        texts (Sequence[str]): 正規化前のテキストのリスト
+        use_jp_extra (bool, optional): False の場合、「ん」の音素を「N」ではなく「n」とする。Defaults to True.
+        raise_yomi_error (bool, optional): False の場合、読めない文字が消えたような扱いとして処理される。Defaults to False.
+        max_workers (Optional[int], optional): 並列に処理するスレッド数。指定しない場合は pyopenjtalk_worker のワーカー数。Defaults to None.
+
+    Returns:
+        list[G2PResult]: texts と同じ順番の正規化と g2p の結果
+    """
+
+    unique_texts = list(dict.fromkeys(texts))
+    if max_workers is None:
+        # ワーカーを使わない場合、プロセス内の pyopenjtalk は並列に呼び出せないため 1 スレッドで処理する
+        worker_client = pyopenjtalk.WORKER_CLIENT
+        max_workers = worker_client.size if worker_client is not None else 1
+    max_workers = max(1, max_workers)
+
+    if max_workers == 1 or len(unique_texts) <= 1:
+        results = [
+            g2p_with_cache(text, use_jp_extra, raise_yomi_error)
+            for text in unique_texts
+        ]
+    else:
+        results = list(
+            _get_executor(max_workers).map(
+                lambda text: g2p_with_cache(text, use_jp_extra, raise_yomi_error),
+                unique_texts,
+            )
+        )
+    result_by_text = dict(zip(unique_texts, results))
+    return [result_by_text[text] for text in texts]
@@ -0,0 +1,207 @@
+"""
+g2p の結果を SQLite のファイルに永続化し、前処理・学習・推論のプロセス間で共有する。
+
+前処理はモデルのバリエーションごとに同じコーパスに対して行われ、推論サーバーやエディタも同じテキストを何度も g2p する。
+正規化されたテキストとユーザー辞書のハッシュをキーとして音素・アクセント・word2ph を保存し、OpenJTalk の処理を省略する。
+ユーザー辞書が変わるとハッシュが変わるため、古い辞書による結果は自動的に使われなくなる。
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+from style_bert_vits2.logging import logger
+
+
+# 永続キャッシュのファイル名 (アセットのルートディレクトリに置く)
+G2P_STORE_FILENAME = "g2p_cache.sqlite3"
+
+# g2p の実装を変更して結果が変わる場合に増やし、古い結果を使わないようにする
+G2P_STORE_VERSION = 1
+
+
+def get_dict_hash(state_path: Path) -> Optional[str]:
+    """
+    update_dict() が書き込むユーザー辞書の状態ファイルから、読み込まれている辞書のハッシュを求める。
+    コンパイル済み辞書のファイル名には辞書の内容のハッシュが含まれるため、ファイル名のみから求める。
+
+    Args:
+        state_path (Path): ユーザー辞書の状態ファイルのパス
+
+    Returns:
+        Optional[str]: 辞書のハッシュ (状態ファイルを読めない場合は None)
+    """
+
+    try:
+        dict_paths = json.loads(state_path.read_text(encoding="utf-8"))["dicts"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    names = [Path(path).name for path in dict_paths]
+    return hashlib.sha256(
+        json.dumps([G2P_STORE_VERSION, names]).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+class G2PStore:
+    """
+    g2p の結果を保存する SQLite のファイル。
+    複数のプロセスから同時に読み書きできるよう WAL モードで開き、スレッド間ではロックで排他制御する。
+    読み書きに失敗しても g2p 自体は行えるため、SQLite のエラーは警告のみ出力して結果がないものとして扱う。
+    保存する g2p の結果は use_jp_extra=True の場合のもので、use_jp_extra=False の場合は読み出した後に「N」を「n」に変換する。
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.__lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.__conn = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        self.__conn.execute(
+            "CREATE TABLE IF NOT EXISTS g2p ("
+            "norm_text TEXT NOT NULL, dict_hash TEXT NOT NULL, raise_yomi_error INTEGER NOT NULL, "
+            "phones TEXT NOT NULL, tones TEXT NOT NULL, word2ph TEXT NOT NULL, "
+            "PRIMARY KEY (norm_text, dict_hash, raise_yomi_error)) WITHOUT ROWID"
+        )
+        self.__conn.execute(
+            "CREATE TABLE IF NOT EXISTS bert_text ("
+            "norm_text TEXT NOT NULL, dict_hash TEXT NOT NULL, bert_text TEXT NOT NULL, "
+            "PRIMARY KEY (norm_text, dict_hash)) WITHOUT ROWID"
+        )
+
+    def get_g2p(
+        self, norm_text: str, dict_hash: str, raise_yomi_error: bool
+    ) -> Optional[tuple[list[str], list[int], list[int]]]:
+        try:
+            with self.__lock:
+                row = self.__conn.execute(
+                    "SELECT phones, tones, word2ph FROM g2p "
+                    "WHERE norm_text = ? AND dict_hash = ? AND raise_yomi_error = ?",
+                    (norm_text, dict_hash, int(raise_yomi_error)),
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to read g2p cache: {e}")
+            return None
+        if row is None:
+            return None
+        return json.loads(row[0]), json.loads(row[1]), json.loads(row[2])
+
+    def put_g2p(
+        self,
+        norm_text: str,
+        dict_hash: str,
+        raise_yomi_error: bool,
+        phones: list[str],
+        tones: list[int],
+        word2ph: list[int],
+    ) -> None:
+        try:
+            with self.__lock:
+                self.__conn.execute(
+                    "INSERT OR REPLACE INTO g2p VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        norm_text,
+                        dict_hash,
+                        int(raise_yomi_error),
+                        json.dumps(phones, ensure_ascii=False),
+                        json.dumps(tones),
+                        json.dumps(word2ph),
+                    ),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to write g2p cache: {e}")
+
+    def get_bert_text(self, norm_text: str, dict_hash: str) -> Optional[str]:
+        try:
+            with self.__lock:
+                row = self.__conn.execute(
+                    "SELECT bert_text FROM bert_text WHERE norm_text = ? AND dict_hash = ?",
+                    (norm_text, dict_hash),
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to read g2p cache: {e}")
+            return None
+        return None if row is None else row[0]
+
+    def put_bert_text(self, norm_text: str, dict_hash: str, bert_text: str) -> None:
+        try:
+            with self.__lock:
+                self.__conn.execute(
+                    "INSERT OR REPLACE INTO bert_text VALUES (?, ?, ?)",
+                    (norm_text, dict_hash, bert_text),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to write g2p cache: {e}")
+
+    def prune(self, dict_hash: str) -> int:
+        """
+        指定した辞書のハッシュ以外による結果を削除する。
+
+        Args:
+            dict_hash (str): 残す結果の辞書のハッシュ
+
+        Returns:
+            int: 削除した結果の数
+        """
+
+        count = 0
+        try:
+            with self.__lock:
+                for table in ("g2p", "bert_text"):
+                    count += self.__conn.execute(
+                        f"DELETE FROM {table} WHERE dict_hash != ?", (dict_hash,)
+                    ).rowcount
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to prune g2p cache: {e}")
+        return count
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return self.__conn.execute("SELECT COUNT(*) FROM g2p").fetchone()[0]
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__conn.close()
+
+
+# プロセス内で共有する永続キャッシュ (open_g2p_store() で開くまでは使わない)
+G2P_STORE: Optional[G2PStore] = None
+
+
+def open_g2p_store(path: Path) -> Optional[G2PStore]:
+    """
+    g2p の永続キャッシュを開き、以後 g2p_with_cache() や clean_text() から使うようにする。
+    ファイルを開けない場合は警告のみ出力し、永続キャッシュを使わずに処理を続ける。
+
+    Args:
+        path (Path): SQLite のファイルのパス (通常はアセットのルートディレクトリの G2P_STORE_FILENAME)
+
+    Returns:
+        Optional[G2PStore]: 開いた永続キャッシュ
+    """
+
+    global G2P_STORE
+    if G2P_STORE is not None:
+        if G2P_STORE.path == path:
+            return G2P_STORE
+        G2P_STORE.close()
+        G2P_STORE = None
+    try:
+        G2P_STORE = G2PStore(path)
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"Failed to open g2p cache {path}: {e}")
+        return None
+    logger.info(f"g2p cache: {path}")
+    return G2P_STORE
+
+
+def close_g2p_store() -> None:
+    global G2P_STORE
+    if G2P_STORE is not None:
+        G2P_STORE.close()
+        G2P_STORE = None
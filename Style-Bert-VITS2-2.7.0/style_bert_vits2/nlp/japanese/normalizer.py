@@ -1,5 +1,6 @@
 import re
 import unicodedata
+from collections.abc import Iterable
 
 from num2words import num2words
 
@@ -61,10 +62,10 @@ __REPLACE_MAP = {
 }
 # 記号類の正規化パターン
 __REPLACE_PATTERN = re.compile("|".join(re.escape(p) for p in __REPLACE_MAP))
-# 句読点等の正規化パターン
-__PUNCTUATION_CLEANUP_PATTERN = re.compile(
+# 正規化後のテキストに残る文字
+__ALLOWED_CHARS = (
     # ↓ ひらがな、カタカナ、漢字
-    r"[^\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF\u3400-\u4DBF\u3005"
+    r"\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF\u3400-\u4DBF\u3005"
     # ↓ 半角アルファベット（大文字と小文字）
     + r"\u0041-\u005A\u0061-\u007A"
     # ↓ 全角アルファベット（大文字と小文字）
@@ -72,8 +73,10 @@ __PUNCTUATION_CLEANUP_PATTERN = re.compile(
     # ↓ ギリシャ文字
     + r"\u0370-\u03FF\u1F00-\u1FFF"
     # ↓ "!", "?", "…", ",", ".", "'", "-", 但し`…`はすでに`...`に変換されている
-    + "".join(PUNCTUATIONS) + r"]+",  # fmt: skip
-)
+    + "".join(PUNCTUATIONS)
+)  # fmt: skip
+# 句読点等の正規化パターン
+__PUNCTUATION_CLEANUP_PATTERN = re.compile(r"[^" + __ALLOWED_CHARS + r"]+")
 # 数字・通貨記号の正規化パターン
 __CURRENCY_MAP = {"$": "ドル", "¥": "円", "£": "ポンド", "€": "ユーロ"}
 __CURRENCY_PATTERN = re.compile(r"([$¥£€])([0-9.]*[0-9])")
@@ -81,6 +84,80 @@ __NUMBER_PATTERN = re.compile(r"[0-9]+(\.[0-9]+)?")
 __NUMBER_WITH_SEPARATOR_PATTERN = re.compile("[0-9]{1,3}(,[0-9]{3})+")
 
 
+def __build_fast_path_map() -> dict[str, str]:
+    """
+    高速パスで扱える文字から、正規化後の文字への対応を作る。
+    NFKC 正規化後に 1 文字になり、その文字が正規化後のテキストに残るか、記号類の正規化マップ等で 1 文字ずつ置換される文字のみを含む。
+    - 結合文字 (濁点・半濁点等) やそれと合成される文字は、前後の文字によって NFKC 正規化の結果が変わるため除外する
+    - 「·」「・」は「···」「・・・」の一部の場合があり、「$」は数字が続くと通貨記号として扱われるため除外する
+    CJK 統合漢字 (U+4E00-U+9FFF, U+3400-U+4DBF) は NFKC 正規化で変化しないため、ここには含めず範囲で扱う。
+
+    Returns:
+        dict[str, str]: 正規化前の文字から正規化後の文字列への対応
+    """
+
+    # 「～」と「〜」と「~」も長音記号として扱う
+    replace_map = {"~": "ー", "～": "ー", "〜": "ー"} | {
+        k: v
+        for k, v in __REPLACE_MAP.items()
+        if len(k) == 1 and k not in ("·", "・", "$")
+    }
+    allowed_pattern = re.compile(r"[" + __ALLOWED_CHARS + r"]")
+    fast_path_map: dict[str, str] = {}
+    # ASCII・ラテン文字・ギリシャ文字、一般句読点・記号、CJK の記号・かな、全角・半角形
+    for start, end in [
+        (0x0000, 0x0400),
+        (0x1F00, 0x2000),
+        (0x2000, 0x2E80),
+        (0x3000, 0x3100),
+        (0xFF00, 0xFFF0),
+    ]:
+        for code in range(start, end):
+            char = chr(code)
+            normalized = unicodedata.normalize("NFKC", char)
+            if (
+                len(normalized) != 1
+                or unicodedata.combining(char) != 0
+                or unicodedata.combining(normalized) != 0
+                or normalized in ("\u3099", "\u309a", "・")
+            ):
+                continue
+            if normalized in replace_map:
+                fast_path_map[char] = replace_map[normalized]
+            elif allowed_pattern.fullmatch(normalized):
+                fast_path_map[char] = normalized
+    return fast_path_map
+
+
+def __to_char_class(chars: Iterable[str]) -> str:
+    """文字の集合を、連続する文字を範囲にまとめた正規表現の文字クラスの中身に変換する。"""
+
+    codes = sorted(ord(c) for c in chars)
+    ranges: list[tuple[int, int]] = []
+    for code in codes:
+        if ranges and ranges[-1][1] == code - 1:
+            ranges[-1] = (ranges[-1][0], code)
+        else:
+            ranges.append((code, code))
+    return "".join(
+        re.escape(chr(first)) + ("-" + re.escape(chr(last)) if last > first else "")
+        for first, last in ranges
+    )
+
+
+# 高速パスで扱える文字から、正規化後の文字列への対応 (漢字を除く)
+__FAST_PATH_MAP = __build_fast_path_map()
+# 高速パスで扱えない文字 (数字・通貨記号・結合文字・正規化マップにない記号等) にマッチするパターン
+## このパターンにマッチしないテキストは、NFKC 正規化と数字の変換と記号の置換を順に行っても、1 文字ずつ置換した結果と同じになる
+__SLOW_PATH_PATTERN = re.compile(
+    r"[^" + __to_char_class(__FAST_PATH_MAP) + r"\u4E00-\u9FFF\u3400-\u4DBF]"
+)
+# 高速パスで別の文字に置換される文字にマッチするパターン
+__FAST_PATH_REPLACE_PATTERN = re.compile(
+    r"[" + __to_char_class(k for k, v in __FAST_PATH_MAP.items() if k != v) + r"]"
+)
+
+
 def normalize_text(text: str) -> str:
     """
     日本語のテキストを正規化する。
@@ -109,6 +186,26 @@ def normalize_text(text: str) -> str:
         str: 正規化されたテキスト
     """
 
+    # LLM の出力等、大半のテキストはかなと漢字と句読点のみからなる
+    # そのようなテキストは 1 回の走査で判定し、NFKC 正規化や数字の変換、正規表現による記号の置換をスキップする
+    if __SLOW_PATH_PATTERN.search(text) is None:
+        for char in set(__FAST_PATH_REPLACE_PATTERN.findall(text)):
+            text = text.replace(char, __FAST_PATH_MAP[char])
+        return text
+    return __normalize_text_full(text)
+
+
+def __normalize_text_full(text: str) -> str:
+    """
+    高速パスの判定を行わず、全ての正規化を順に行う。
+
+    Args:
+        text (str): 正規化するテキスト
+
+    Returns:
+        str: 正規化されたテキスト
+    """
+
     res = unicodedata.normalize("NFKC", text)  # ここでアルファベットは半角になる
     res = __convert_numbers_to_words(res)  # 「100円」→「百円」等
     # 「～」と「〜」と「~」も長音記号として扱う
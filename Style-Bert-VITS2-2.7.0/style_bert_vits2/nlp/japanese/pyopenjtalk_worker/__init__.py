@@ -7,10 +7,15 @@ from typing import Any, Optional
 
 from style_bert_vits2.logging import logger
 from style_bert_vits2.nlp.japanese.pyopenjtalk_worker.worker_client import WorkerClient
-from style_bert_vits2.nlp.japanese.pyopenjtalk_worker.worker_common import WORKER_PORT
+from style_bert_vits2.nlp.japanese.pyopenjtalk_worker.worker_common import (
+    WORKER_PORT,
+    WorkerAddress,
+    get_worker_address,
+)
+from style_bert_vits2.nlp.japanese.pyopenjtalk_worker.worker_pool import WorkerPool
 
 
-WORKER_CLIENT: Optional[WorkerClient] = None
+WORKER_CLIENT: Optional[WorkerPool] = None
 
 
 # pyopenjtalk interface
@@ -41,8 +46,22 @@ def make_label(njd_features: Any) -> list[str]:
         return pyopenjtalk.make_label(njd_features)
 
 
+def extract_fullcontext(text: str) -> list[str]:
+    # same as make_label(run_frontend(text)), but the NJD features never leave the worker
+    if WORKER_CLIENT is not None:
+        ret = WORKER_CLIENT.dispatch_pyopenjtalk("extract_fullcontext", text)
+        assert isinstance(ret, list)
+        return ret
+    else:
+        # without worker
+        import pyopenjtalk
+
+        return pyopenjtalk.extract_fullcontext(text)
+
+
 def mecab_dict_index(path: str, out_path: str, dn_mecab: Optional[str] = None) -> None:
     if WORKER_CLIENT is not None:
+        # compiling once is enough, the result is a file
         WORKER_CLIENT.dispatch_pyopenjtalk("mecab_dict_index", path, out_path, dn_mecab)
     else:
         # without worker
@@ -53,82 +72,143 @@ def mecab_dict_index(path: str, out_path: str, dn_mecab: Optional[str] = None) -
 
 def update_global_jtalk_with_user_dict(path: str) -> None:
     if WORKER_CLIENT is not None:
-        WORKER_CLIENT.dispatch_pyopenjtalk("update_global_jtalk_with_user_dict", path)
+        # every worker must use the same dictionary
+        WORKER_CLIENT.broadcast_pyopenjtalk("update_global_jtalk_with_user_dict", path)
     else:
         # without worker
-        import pyopenjtalk
+        from style_bert_vits2.nlp.japanese.pyopenjtalk_worker import worker_server
+
+        worker_server.PYOPENJTALK_FUNC_DICT["update_global_jtalk_with_user_dict"](path)
+
+
+def update_global_jtalk_with_user_dicts(
+    paths: list[str], state_path: Optional[str] = None
+) -> bool:
+    """
+    Load multiple compiled user dictionaries, skipping the workers that already use them.
+    The workers also watch state_path, so the workers this process is not connected to
+    (e.g. workers of a larger pool started by another process) reload them as well.
+
+    Returns:
+        bool: True if any worker (re)loaded the dictionaries
+    """
+
+    if WORKER_CLIENT is not None:
+        # every worker must use the same dictionary
+        ret = WORKER_CLIENT.broadcast_pyopenjtalk(
+            "update_global_jtalk_with_user_dicts", paths, state_path
+        )
+        return any(ret)
+    else:
+        # without worker
+        from style_bert_vits2.nlp.japanese.pyopenjtalk_worker import worker_server
 
-        pyopenjtalk.update_global_jtalk_with_user_dict(path)
+        return worker_server.update_global_jtalk_with_user_dicts(paths, state_path)
 
 
 def unset_user_dict() -> None:
     if WORKER_CLIENT is not None:
-        WORKER_CLIENT.dispatch_pyopenjtalk("unset_user_dict")
+        WORKER_CLIENT.broadcast_pyopenjtalk("unset_user_dict")
     else:
         # without worker
-        import pyopenjtalk
+        from style_bert_vits2.nlp.japanese.pyopenjtalk_worker import worker_server
 
-        pyopenjtalk.unset_user_dict()
+        worker_server.PYOPENJTALK_FUNC_DICT["unset_user_dict"]()
 
 
 # initialize module when imported
 
 
-def initialize_worker(port: int = WORKER_PORT) -> None:
+def __start_worker_process(port: int, index: int) -> None:
+    import os
+    import subprocess
+    import sys
+
+    worker_pkg_path = os.path.relpath(os.path.dirname(__file__), os.getcwd()).replace(
+        os.sep, "."
+    )
+    args = [
+        sys.executable,
+        "-m",
+        worker_pkg_path,
+        "--port",
+        str(port),
+        "--index",
+        str(index),
+    ]
+    # new session, new process group
+    if sys.platform.startswith("win"):
+        cf = subprocess.CREATE_NEW_CONSOLE | subprocess.CREATE_NEW_PROCESS_GROUP  # type: ignore
+        si = subprocess.STARTUPINFO()  # type: ignore
+        si.dwFlags |= subprocess.STARTF_USESHOWWINDOW  # type: ignore
+        si.wShowWindow = subprocess.SW_HIDE  # type: ignore
+        subprocess.Popen(args, creationflags=cf, startupinfo=si)
+    else:
+        # align with Windows behavior
+        # start_new_session is same as specifying setsid in preexec_fn
+        subprocess.Popen(
+            args,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+
+def __connect_worker(address: WorkerAddress) -> WorkerClient:
+    import time
+
+    # wait until server listening
+    count = 0
+    while True:
+        try:
+            return WorkerClient(address)
+        except OSError:
+            time.sleep(0.5)
+            count += 1
+            # 20: max number of retries
+            if count == 20:
+                raise TimeoutError("サーバーに接続できませんでした")
+
+
+def initialize_worker(port: int = WORKER_PORT, num_workers: int = 1) -> None:
+    """
+    Connect to the pyopenjtalk worker pool, starting the workers that are not running yet.
+
+    Args:
+        port (int): identifies the worker pool (TCP base port when Unix domain sockets are unavailable)
+        num_workers (int): number of worker processes
+    """
+
     import atexit
     import signal
     import socket
-    import sys
-    import time
 
     global WORKER_CLIENT
     if WORKER_CLIENT:
         return
 
-    client = None
-    try:
-        client = WorkerClient(port)
-    except (OSError, socket.timeout):
-        logger.debug("try starting pyopenjtalk worker server")
-        import os
-        import subprocess
-
-        worker_pkg_path = os.path.relpath(
-            os.path.dirname(__file__), os.getcwd()
-        ).replace(os.sep, ".")
-        args = [sys.executable, "-m", worker_pkg_path, "--port", str(port)]
-        # new session, new process group
-        if sys.platform.startswith("win"):
-            cf = subprocess.CREATE_NEW_CONSOLE | subprocess.CREATE_NEW_PROCESS_GROUP  # type: ignore
-            si = subprocess.STARTUPINFO()  # type: ignore
-            si.dwFlags |= subprocess.STARTF_USESHOWWINDOW  # type: ignore
-            si.wShowWindow = subprocess.SW_HIDE  # type: ignore
-            subprocess.Popen(args, creationflags=cf, startupinfo=si)
-        else:
-            # align with Windows behavior
-            # start_new_session is same as specifying setsid in preexec_fn
-            subprocess.Popen(
-                args,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                start_new_session=True,
-            )
-
-        # wait until server listening
-        count = 0
-        while True:
-            try:
-                client = WorkerClient(port)
-                break
-            except OSError:
-                time.sleep(0.5)
-                count += 1
-                # 20: max number of retries
-                if count == 20:
-                    raise TimeoutError("サーバーに接続できませんでした")
-
-    logger.debug("pyopenjtalk worker server started")
-    WORKER_CLIENT = client
+    num_workers = max(1, num_workers)
+    clients: list[Optional[WorkerClient]] = []
+    for index in range(num_workers):
+        try:
+            clients.append(WorkerClient(get_worker_address(port, index)))
+        except (OSError, socket.timeout):
+            logger.debug(f"try starting pyopenjtalk worker server #{index}")
+            __start_worker_process(port, index)
+            clients.append(None)
+
+    # the workers start in parallel, so wait for them only after all are spawned
+    control_clients = [
+        (
+            client
+            if client is not None
+            else __connect_worker(get_worker_address(port, index))
+        )
+        for index, client in enumerate(clients)
+    ]
+
+    logger.debug(f"pyopenjtalk worker server started ({num_workers} workers)")
+    WORKER_CLIENT = WorkerPool(control_clients)
     atexit.register(terminate_worker)
 
     # when the process is killed
@@ -149,12 +229,5 @@ def terminate_worker() -> None:
     if not WORKER_CLIENT:
         return
 
-    # prepare for unexpected errors
-    try:
-        if WORKER_CLIENT.status() == 1:
-            WORKER_CLIENT.quit_server()
-    except Exception as e:
-        logger.error(e)
-
-    WORKER_CLIENT.close()
+    WORKER_CLIENT.terminate()
     WORKER_CLIENT = None
@@ -1,15 +1,19 @@
 import argparse
 
-from style_bert_vits2.nlp.japanese.pyopenjtalk_worker.worker_common import WORKER_PORT
+from style_bert_vits2.nlp.japanese.pyopenjtalk_worker.worker_common import (
+    WORKER_PORT,
+    get_worker_address,
+)
 from style_bert_vits2.nlp.japanese.pyopenjtalk_worker.worker_server import WorkerServer
 
 
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("--port", type=int, default=WORKER_PORT)
+    parser.add_argument("--index", type=int, default=0)
     args = parser.parse_args()
     server = WorkerServer()
-    server.start_server(port=args.port)
+    server.start_server(address=get_worker_address(args.port, args.index))
 
 
 if __name__ == "__main__":
@@ -1,9 +1,10 @@
-import socket
 from typing import Any, cast
 
 from style_bert_vits2.logging import logger
 from style_bert_vits2.nlp.japanese.pyopenjtalk_worker.worker_common import (
     RequestType,
+    WorkerAddress,
+    create_socket,
     receive_data,
     send_data,
 )
@@ -12,11 +13,16 @@ from style_bert_vits2.nlp.japanese.pyopenjtalk_worker.worker_common import (
 class WorkerClient:
     """pyopenjtalk worker client"""
 
-    def __init__(self, port: int) -> None:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    def __init__(self, address: WorkerAddress) -> None:
+        sock = create_socket(address)
         # timeout: 60 seconds
         sock.settimeout(60)
-        sock.connect((socket.gethostname(), port))
+        try:
+            sock.connect(address)
+        except Exception:
+            sock.close()
+            raise
+        self.address = address
         self.sock = sock
 
     def __enter__(self) -> "WorkerClient":
@@ -28,33 +34,28 @@ class WorkerClient:
     def close(self) -> None:
         self.sock.close()
 
+    # request-type is sent as a plain int because the receiver only accepts plain data
+    def __request(self, data: dict[str, Any]) -> dict[str, Any]:
+        logger.trace(f"client sends request: {data}")
+        send_data(self.sock, data)
+        logger.trace("client sent request successfully")
+        response = receive_data(self.sock)
+        logger.trace(f"client received response: {response}")
+        return response
+
     def dispatch_pyopenjtalk(self, func: str, *args: Any, **kwargs: Any) -> Any:
         data = {
-            "request-type": RequestType.PYOPENJTALK,
+            "request-type": int(RequestType.PYOPENJTALK),
             "func": func,
             "args": args,
             "kwargs": kwargs,
         }
-        logger.trace(f"client sends request: {data}")
-        send_data(self.sock, data)
-        logger.trace("client sent request successfully")
-        response = receive_data(self.sock)
-        logger.trace(f"client received response: {response}")
-        return response.get("return")
+        return self.__request(data).get("return")
 
     def status(self) -> int:
-        data = {"request-type": RequestType.STATUS}
-        logger.trace(f"client sends request: {data}")
-        send_data(self.sock, data)
-        logger.trace("client sent request successfully")
-        response = receive_data(self.sock)
-        logger.trace(f"client received response: {response}")
-        return cast(int, response.get("client-count"))
+        data = {"request-type": int(RequestType.STATUS)}
+        return cast(int, self.__request(data).get("client-count"))
 
     def quit_server(self) -> None:
-        data = {"request-type": RequestType.QUIT_SERVER}
-        logger.trace(f"client sends request: {data}")
-        send_data(self.sock, data)
-        logger.trace("client sent request successfully")
-        response = receive_data(self.sock)
-        logger.trace(f"client received response: {response}")
+        data = {"request-type": int(RequestType.QUIT_SERVER)}
+        self.__request(data)
@@ -1,11 +1,25 @@
-import json
+import io
+import os
+import pickle
 import socket
+import tempfile
 from enum import IntEnum, auto
-from typing import Any, Final
+from typing import Any, Final, Union
 
 
 WORKER_PORT: Final[int] = 7861
 HEADER_SIZE: Final[int] = 4
+# pickle protocol 5 is available on Python >= 3.8
+PICKLE_PROTOCOL: Final[int] = 5
+# loopback address for the TCP fallback
+# (socket.gethostname() requires a name resolution on every connect)
+LOOPBACK_HOST: Final[str] = "127.0.0.1"
+
+# Unix domain sockets are used whenever the platform supports them
+USE_UNIX_SOCKET: Final[bool] = hasattr(socket, "AF_UNIX")
+
+# str: Unix domain socket path, tuple: (host, port) for TCP
+WorkerAddress = Union[str, tuple[str, int]]
 
 
 class RequestType(IntEnum):
@@ -18,28 +32,74 @@ class ConnectionClosedException(Exception):
     pass
 
 
+# worker addressing
+
+
+def get_worker_address(port: int, index: int = 0) -> WorkerAddress:
+    """
+    Returns the address that the index-th worker of the pool listens on.
+    The port number identifies the pool, so several pools can coexist.
+    """
+
+    if USE_UNIX_SOCKET:
+        return os.path.join(
+            tempfile.gettempdir(), f"sbv2-pyopenjtalk-{port}-{index}.sock"
+        )
+    return (LOOPBACK_HOST, port + index)
+
+
+def create_socket(address: WorkerAddress) -> socket.socket:
+    if isinstance(address, str):
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)  # type: ignore
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # requests are small and latency bound
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+# binary encoding
+# Only plain data (dict / list / tuple / str / int / float / bool / None) is exchanged.
+# pickle is used as a compact binary format, but global lookups are rejected on load
+# so that the payload can never instantiate arbitrary objects.
+
+
+class _PlainDataUnpickler(pickle.Unpickler):
+    def find_class(self, module: str, name: str) -> Any:
+        raise pickle.UnpicklingError(f"global '{module}.{name}' is forbidden")
+
+
+def encode_data(data: dict[str, Any]) -> bytes:
+    return pickle.dumps(data, protocol=PICKLE_PROTOCOL)
+
+
+def decode_data(body: bytes) -> dict[str, Any]:
+    return _PlainDataUnpickler(io.BytesIO(body)).load()
+
+
 # socket communication
 
 
 def send_data(sock: socket.socket, data: dict[str, Any]):
-    json_data = json.dumps(data).encode()
-    header = len(json_data).to_bytes(HEADER_SIZE, byteorder="big")
-    sock.sendall(header + json_data)
+    body = encode_data(data)
+    header = len(body).to_bytes(HEADER_SIZE, byteorder="big")
+    sock.sendall(header + body)
 
 
 def __receive_until(sock: socket.socket, size: int):
-    data = b""
-    while len(data) < size:
-        part = sock.recv(size - len(data))
-        if part == b"":
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
             raise ConnectionClosedException("接続が閉じられました")
-        data += part
+        received += n
 
-    return data
+    return buf
 
 
 def receive_data(sock: socket.socket) -> dict[str, Any]:
     header = __receive_until(sock, HEADER_SIZE)
     data_length = int.from_bytes(header, byteorder="big")
     body = __receive_until(sock, data_length)
-    return json.loads(body.decode())
+    return decode_data(body)
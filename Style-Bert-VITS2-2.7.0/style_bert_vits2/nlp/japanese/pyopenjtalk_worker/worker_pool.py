@@ -0,0 +1,139 @@
+import threading
+import time
+import weakref
+from typing import Any, Optional
+
+from style_bert_vits2.logging import logger
+from style_bert_vits2.nlp.japanese.pyopenjtalk_worker.worker_client import WorkerClient
+
+
+class _ThreadClients:
+    """per-thread connections, kept in a thread-local so they are released when the thread exits"""
+
+    def __init__(self, size: int) -> None:
+        self.clients: list[Optional[WorkerClient]] = [None] * size
+
+
+def _close_clients(clients: list[Optional[WorkerClient]]) -> None:
+    for index, client in enumerate(clients):
+        if client is not None:
+            client.close()
+            clients[index] = None
+
+
+class WorkerPool:
+    """
+    pool of pyopenjtalk worker servers
+
+    Every worker is a separate process, so requests from different threads run in parallel.
+    Each thread owns its own connection to each worker, so no socket is ever shared,
+    and requests are dispatched to the worker with the fewest requests in flight.
+    """
+
+    def __init__(self, control_clients: list[WorkerClient]) -> None:
+        assert len(control_clients) > 0
+        # control connections keep the workers alive (a worker quits when it has no client)
+        # and are used for status / quit / broadcast requests
+        self.control_clients = control_clients
+        self.__control_lock = threading.Lock()
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.__in_flight = [0] * len(control_clients)
+        self.__next_index = 0
+        # finalizers closing the connections of each thread, called when the thread exits or on terminate
+        self.__finalizers: list[weakref.finalize] = []
+
+    @property
+    def size(self) -> int:
+        return len(self.control_clients)
+
+    def __get_thread_client(self, index: int) -> WorkerClient:
+        thread_clients: Optional[_ThreadClients] = getattr(
+            self.__local, "clients", None
+        )
+        if thread_clients is None:
+            thread_clients = _ThreadClients(self.size)
+            self.__local.clients = thread_clients
+            # the worker keeps a connection open until the client closes it,
+            # so close them as soon as the thread-local is released (i.e. the thread exits)
+            finalizer = weakref.finalize(
+                thread_clients, _close_clients, thread_clients.clients
+            )
+            with self.__lock:
+                self.__finalizers = [f for f in self.__finalizers if f.alive]
+                self.__finalizers.append(finalizer)
+        client = thread_clients.clients[index]
+        if client is None:
+            client = WorkerClient(self.control_clients[index].address)
+            thread_clients.clients[index] = client
+        return client
+
+    def __acquire(self) -> int:
+        # least-loaded dispatch, ties are broken in round-robin order
+        with self.__lock:
+            index = min(
+                ((self.__next_index + i) % self.size for i in range(self.size)),
+                key=lambda i: self.__in_flight[i],
+            )
+            self.__in_flight[index] += 1
+            self.__next_index = (index + 1) % self.size
+        return index
+
+    def __release(self, index: int) -> None:
+        with self.__lock:
+            self.__in_flight[index] -= 1
+
+    def dispatch_pyopenjtalk(self, func: str, *args: Any, **kwargs: Any) -> Any:
+        index = self.__acquire()
+        try:
+            client = self.__get_thread_client(index)
+            return client.dispatch_pyopenjtalk(func, *args, **kwargs)
+        finally:
+            self.__release(index)
+
+    def broadcast_pyopenjtalk(self, func: str, *args: Any, **kwargs: Any) -> list[Any]:
+        """
+        Call the function on every worker.
+        Used for functions that change the worker state (e.g. user dictionary).
+        """
+
+        with self.__control_lock:
+            return [
+                client.dispatch_pyopenjtalk(func, *args, **kwargs)
+                for client in self.control_clients
+            ]
+
+    def terminate(self) -> None:
+        """
+        Close all connections and quit the workers that no other process uses.
+        """
+
+        with self.__lock:
+            finalizers = self.__finalizers
+            self.__finalizers = []
+            self.__local = threading.local()
+        for finalizer in finalizers:
+            finalizer()
+
+        with self.__control_lock:
+            for client in self.control_clients:
+                # prepare for unexpected errors
+                try:
+                    # only the control connection of this process is left
+                    if self.__wait_for_sole_client(client):
+                        client.quit_server()
+                except Exception as e:
+                    logger.error(e)
+                client.close()
+
+    @staticmethod
+    def __wait_for_sole_client(client: WorkerClient, timeout: float = 1.0) -> bool:
+        # the worker may not have noticed the per-thread connections closed just now
+        deadline = time.time() + timeout
+        while True:
+            if client.status() == 1:
+                return True
+            if time.time() > deadline:
+                # other processes are still using the worker
+                return False
+            time.sleep(0.05)
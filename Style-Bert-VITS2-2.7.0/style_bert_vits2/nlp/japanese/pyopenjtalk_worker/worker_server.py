@@ -1,7 +1,9 @@
-import select
+import json
+import os
+import selectors
 import socket
 import time
-from typing import Any, cast
+from typing import Any, Optional, cast
 
 import pyopenjtalk
 
@@ -9,20 +11,125 @@ from style_bert_vits2.logging import logger
 from style_bert_vits2.nlp.japanese.pyopenjtalk_worker.worker_common import (
     ConnectionClosedException,
     RequestType,
+    WorkerAddress,
+    create_socket,
     receive_data,
     send_data,
 )
 
 
+# user dictionaries currently loaded, and the state file listing the dictionaries to load
+# the state file lets workers that did not receive the broadcast (e.g. workers of a larger pool
+# started by another process) notice the update and reload the dictionaries by themselves
+__user_dicts: Optional[tuple[str, ...]] = None
+__user_dict_state_path: Optional[str] = None
+__user_dict_state_stat: Optional[tuple[int, int, int]] = None
+
+
+def __stat_key(path: str) -> Optional[tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    # the state file is replaced atomically, so the inode changes even within the mtime resolution
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def update_global_jtalk_with_user_dicts(
+    paths: list[str], state_path: Optional[str] = None
+) -> bool:
+    """
+    Load multiple compiled user dictionaries at once (MeCab accepts a comma-separated userdic).
+    Nothing is done if the same dictionaries are already loaded.
+
+    Args:
+        paths (list[str]): paths to the compiled user dictionaries (an empty list unsets the user dictionary)
+        state_path (Optional[str]): JSON file listing the dictionaries to load; reloaded when it changes
+
+    Returns:
+        bool: True if the dictionaries were (re)loaded
+    """
+
+    global __user_dicts, __user_dict_state_path, __user_dict_state_stat
+
+    if state_path is not None:
+        __user_dict_state_path = state_path
+        __user_dict_state_stat = __stat_key(state_path)
+
+    new_dicts = tuple(paths)
+    if new_dicts == __user_dicts:
+        return False
+    for path in new_dicts:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"no such file or directory: {path}")
+        if "," in path:
+            raise ValueError(f"user dictionary path must not contain a comma: {path}")
+
+    if len(new_dicts) == 0:
+        pyopenjtalk.unset_user_dict()
+    elif len(new_dicts) == 1:
+        pyopenjtalk.update_global_jtalk_with_user_dict(new_dicts[0])
+    else:
+        # update_global_jtalk_with_user_dict() only accepts a single existing file
+        pyopenjtalk.unset_user_dict()
+        pyopenjtalk._global_jtalk = pyopenjtalk.OpenJTalk(  # type: ignore
+            dn_mecab=pyopenjtalk.OPEN_JTALK_DICT_DIR,
+            userdic=",".join(new_dicts).encode("utf-8"),
+        )
+    __user_dicts = new_dicts
+    logger.info(f"user dictionaries loaded: {list(new_dicts)}")
+    return True
+
+
+def reload_user_dicts_if_changed() -> bool:
+    """
+    Reload the user dictionaries if the state file was updated by another process.
+
+    Returns:
+        bool: True if the dictionaries were reloaded
+    """
+
+    global __user_dict_state_stat
+
+    state_path = __user_dict_state_path
+    if state_path is None or __stat_key(state_path) == __user_dict_state_stat:
+        return False
+    try:
+        with open(state_path, encoding="utf-8") as f:
+            paths = json.load(f)["dicts"]
+        return update_global_jtalk_with_user_dicts(paths, state_path)
+    except Exception as e:
+        # keep the current dictionaries, and do not retry until the file changes again
+        logger.warning(f"failed to reload user dictionaries: {e}")
+        __user_dict_state_stat = __stat_key(state_path)
+        return False
+
+
+def __update_global_jtalk_with_user_dict(path: str) -> None:
+    global __user_dicts
+    pyopenjtalk.update_global_jtalk_with_user_dict(path)
+    __user_dicts = (path,)
+
+
+def __unset_user_dict() -> None:
+    global __user_dicts
+    pyopenjtalk.unset_user_dict()
+    __user_dicts = ()
+
+
 # To make it as fast as possible
 # Probably faster than calling getattr every time
 PYOPENJTALK_FUNC_DICT = {
     "run_frontend": pyopenjtalk.run_frontend,
     "make_label": pyopenjtalk.make_label,
+    "extract_fullcontext": pyopenjtalk.extract_fullcontext,
     "mecab_dict_index": pyopenjtalk.mecab_dict_index,
-    "update_global_jtalk_with_user_dict": pyopenjtalk.update_global_jtalk_with_user_dict,
-    "unset_user_dict": pyopenjtalk.unset_user_dict,
+    "update_global_jtalk_with_user_dict": __update_global_jtalk_with_user_dict,
+    "update_global_jtalk_with_user_dicts": update_global_jtalk_with_user_dicts,
+    "unset_user_dict": __unset_user_dict,
 }
+# functions whose result depends on the user dictionaries
+USER_DICT_DEPENDENT_FUNCS = {"run_frontend", "extract_fullcontext"}
 
 
 class WorkerServer:
@@ -56,9 +163,11 @@ class WorkerServer:
                 func_name = request.get("func")
                 assert isinstance(func_name, str)
                 func = PYOPENJTALK_FUNC_DICT[func_name]
+                if func_name in USER_DICT_DEPENDENT_FUNCS:
+                    reload_user_dicts_if_changed()
                 args = request.get("args")
                 kwargs = request.get("kwargs")
-                assert isinstance(args, list)
+                assert isinstance(args, (list, tuple))
                 assert isinstance(kwargs, dict)
                 ret = func(*args, **kwargs)
                 response = {"success": True, "return": ret}
@@ -68,57 +177,111 @@ class WorkerServer:
 
         return response
 
-    def start_server(self, port: int, no_client_timeout: int = 30) -> None:
-        logger.info("start pyopenjtalk worker server")
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
-            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            server_socket.bind((socket.gethostname(), port))
+    def start_server(
+        self,
+        address: WorkerAddress,
+        no_client_timeout: int = 30,
+    ) -> None:
+        logger.info(f"start pyopenjtalk worker server: {address}")
+
+        if isinstance(address, str) and os.path.exists(address):
+            if self.__is_listening(address):
+                # another worker (e.g. started by another process at the same time) owns the socket
+                logger.info(f"pyopenjtalk worker server is already running: {address}")
+                return
+            # stale socket file left by a worker that was killed
+            os.unlink(address)
+
+        with create_socket(address) as server_socket:
+            if not isinstance(address, str):
+                server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server_socket.bind(address)
             server_socket.listen()
-            sockets = [server_socket]
-            no_client_since = time.time()
-            while True:
-                if self.client_count == 0:
-                    if no_client_since is None:
-                        no_client_since = time.time()
-                    elif (time.time() - no_client_since) > no_client_timeout:
-                        logger.info("quit because there is no client")
-                        return
+            # the socket file may be replaced by another worker after this one quits
+            socket_ino = os.stat(address).st_ino if isinstance(address, str) else None
+            try:
+                self.__serve(server_socket, no_client_timeout)
+            finally:
+                if socket_ino is not None:
+                    try:
+                        if os.stat(address).st_ino == socket_ino:
+                            os.unlink(address)
+                    except OSError:
+                        pass
+
+    @staticmethod
+    def __is_listening(address: str) -> bool:
+        with create_socket(address) as sock:
+            sock.settimeout(1)
+            try:
+                sock.connect(address)
+            except (ConnectionRefusedError, FileNotFoundError):
+                return False
+            except OSError:
+                # e.g. the backlog is full, the server is alive but busy
+                return True
+            return True
+
+    def __serve(self, server_socket: socket.socket, no_client_timeout: int) -> None:
+        # selectors uses epoll / kqueue where available, which is not limited to FD_SETSIZE (1024) like select()
+        selector = selectors.DefaultSelector()
+        selector.register(server_socket, selectors.EVENT_READ)
+        try:
+            self.__serve_loop(selector, server_socket, no_client_timeout)
+        finally:
+            for key in list(selector.get_map().values()):
+                if key.fileobj is not server_socket:
+                    cast(socket.socket, key.fileobj).close()
+            selector.close()
+
+    def __serve_loop(
+        self,
+        selector: selectors.BaseSelector,
+        server_socket: socket.socket,
+        no_client_timeout: int,
+    ) -> None:
+        no_client_since = time.time()
+        while True:
+            if self.client_count == 0:
+                if no_client_since is None:
+                    no_client_since = time.time()
+                elif (time.time() - no_client_since) > no_client_timeout:
+                    logger.info("quit because there is no client")
+                    return
+            else:
+                no_client_since = None
+
+            for key, _ in selector.select(0.1):
+                sock = cast(socket.socket, key.fileobj)
+                if sock is server_socket:
+                    logger.info("new client connected")
+                    client_socket, _ = server_socket.accept()
+                    selector.register(client_socket, selectors.EVENT_READ)
+                    self.client_count += 1
                 else:
-                    no_client_since = None
-
-                ready_sockets, _, _ = select.select(sockets, [], [], 0.1)
-                for sock in ready_sockets:
-                    if sock is server_socket:
-                        logger.info("new client connected")
-                        client_socket, _ = server_socket.accept()
-                        sockets.append(client_socket)
-                        self.client_count += 1
-                    else:
-                        # client
-                        try:
-                            request = receive_data(sock)
-                        except Exception as e:
-                            sock.close()
-                            sockets.remove(sock)
-                            self.client_count -= 1
-                            # unexpected disconnections
-                            if not isinstance(e, ConnectionClosedException):
-                                logger.error(e)
-
-                            logger.info("close connection")
-                            continue
-
-                        logger.trace(f"server received request: {request}")
-
-                        response = self.handle_request(request)
-                        logger.trace(f"server sends response: {response}")
-                        try:
-                            send_data(sock, response)
-                            logger.trace("server sent response successfully")
-                        except Exception:
-                            logger.warning(
-                                "an exception occurred during sending responce"
-                            )
-                        if self.quit:
-                            logger.info("quit pyopenjtalk worker server")
-                            return
+                    # client
+                    try:
+                        request = receive_data(sock)
+                    except Exception as e:
+                        selector.unregister(sock)
+                        sock.close()
+                        self.client_count -= 1
+                        # unexpected disconnections
+                        if not isinstance(e, ConnectionClosedException):
+                            logger.error(e)
+
+                        logger.info("close connection")
+                        continue
+
+                    logger.trace(f"server received request: {request}")
+
+                    response = self.handle_request(request)
+                    logger.trace(f"server sends response: {response}")
+                    try:
+                        send_data(sock, response)
+                        logger.trace("server sent response successfully")
+                    except Exception:
+                        logger.warning("an exception occurred during sending responce")
+                    if self.quit:
+                        logger.info("quit pyopenjtalk worker server")
+                        return
@@ -5,6 +5,8 @@
 詳しくは、このファイルと同じフォルダにある README.md を参照してください。
 """
 
+import hashlib
+import importlib.metadata
 import json
 import sys
 import traceback
@@ -16,7 +18,9 @@ import numpy as np
 from fastapi import HTTPException
 
 from style_bert_vits2.constants import DEFAULT_USER_DICT_DIR
+from style_bert_vits2.nlp.japanese import g2p_store
 from style_bert_vits2.nlp.japanese import pyopenjtalk_worker as pyopenjtalk
+from style_bert_vits2.nlp.japanese.g2p_batch import G2P_CACHE
 from style_bert_vits2.nlp.japanese.user_dict.part_of_speech_data import (
     MAX_PRIORITY,
     MIN_PRIORITY,
@@ -71,6 +75,164 @@ def _write_to_json(user_dict: Dict[str, UserDictWord], user_dict_path: Path) ->
     user_dict_path.write_text(user_dict_json, encoding="utf-8")
 
 
+def _word_to_csv_row(word: UserDictWord) -> str:
+    """
+    ユーザー辞書の単語を MeCab の辞書 CSV の 1 行に変換する
+    Parameters
+    ----------
+    word : UserDictWord
+        単語情報
+    Returns
+    -------
+    row : str
+        改行を含む CSV の 1 行
+    """
+    return (
+        "{surface},{context_id},{context_id},{cost},{part_of_speech},"
+        + "{part_of_speech_detail_1},{part_of_speech_detail_2},"
+        + "{part_of_speech_detail_3},{inflectional_type},"
+        + "{inflectional_form},{stem},{yomi},{pronunciation},"
+        + "{accent_type}/{mora_count},{accent_associative_rule}\n"
+    ).format(
+        surface=word.surface,
+        context_id=word.context_id,
+        cost=_priority2cost(word.context_id, word.priority),
+        part_of_speech=word.part_of_speech,
+        part_of_speech_detail_1=word.part_of_speech_detail_1,
+        part_of_speech_detail_2=word.part_of_speech_detail_2,
+        part_of_speech_detail_3=word.part_of_speech_detail_3,
+        inflectional_type=word.inflectional_type,
+        inflectional_form=word.inflectional_form,
+        stem=word.stem,
+        yomi=word.yomi,
+        pronunciation=word.pronunciation,
+        accent_type=word.accent_type,
+        mora_count=word.mora_count,
+        accent_associative_rule=word.accent_associative_rule,
+    )
+
+
+def _get_dict_compiler_version() -> str:
+    """
+    辞書をコンパイルする pyopenjtalk のバージョン
+    システム辞書が変わるとコンパイル済み辞書を使い回せないため、コンパイル済み辞書のハッシュに含める
+    """
+    for name in ("pyopenjtalk-dict", "pyopenjtalk-plus", "pyopenjtalk"):
+        try:
+            return f"{name}=={importlib.metadata.version(name)}"
+        except importlib.metadata.PackageNotFoundError:
+            continue
+    return ""
+
+
+def _compile_dict(csv_text: str, compiled_dict_path: Path, kind: str) -> Path:
+    """
+    辞書 CSV をコンパイルする
+    コンパイル済み辞書は CSV の内容のハッシュを含むファイル名で保存し、既に存在する場合はコンパイルせずに再利用する
+    Parameters
+    ----------
+    csv_text : str
+        辞書 CSV の内容
+    compiled_dict_path : Path
+        コンパイル済み辞書ファイルのパス (実際のファイル名には kind とハッシュが付く)
+    kind : str
+        辞書の種類 ("default" または "words")
+    Returns
+    -------
+    path : Path
+        コンパイル済み辞書ファイルのパス
+    """
+    digest = hashlib.sha256(
+        f"{_get_dict_compiler_version()}\n{csv_text}".encode("utf-8")
+    ).hexdigest()[:16]
+    out_path = compiled_dict_path.with_name(
+        f"{compiled_dict_path.stem}.{kind}.{digest}.dic"
+    )
+    if out_path.is_file():
+        return out_path
+
+    random_string = uuid4()
+    tmp_csv_path = out_path.with_suffix(
+        f".dict_csv-{random_string}.tmp"
+    )  # csv形式辞書データの一時保存ファイル
+    tmp_compiled_path = out_path.with_suffix(
+        f".dict_compiled-{random_string}.tmp"
+    )  # コンパイル済み辞書データの一時保存ファイル
+    try:
+        tmp_csv_path.write_text(csv_text, encoding="utf-8")
+        # 辞書.csvをOpenJTalk用にコンパイル
+        pyopenjtalk.mecab_dict_index(str(tmp_csv_path), str(tmp_compiled_path))
+        if not tmp_compiled_path.is_file():
+            raise RuntimeError("辞書のコンパイル時にエラーが発生しました。")
+        tmp_compiled_path.replace(out_path)
+    finally:
+        if tmp_csv_path.exists():
+            tmp_csv_path.unlink()
+        if tmp_compiled_path.exists():
+            tmp_compiled_path.unlink()
+    return out_path
+
+
+def _write_dict_state(state_path: Path, dict_paths: List[str]) -> bool:
+    """
+    読み込むべきコンパイル済み辞書の一覧を状態ファイルに書き込む
+    ワーカーは状態ファイルの更新を検知して辞書を読み込み直すため、内容が変わらない場合は書き込まない
+    Parameters
+    ----------
+    state_path : Path
+        状態ファイルのパス
+    dict_paths : List[str]
+        コンパイル済み辞書ファイルのパスのリスト
+    Returns
+    -------
+    changed : bool
+        状態ファイルを書き換えた場合 True
+    """
+    state_text = json.dumps({"dicts": dict_paths}, ensure_ascii=False)
+    try:
+        if state_path.read_text(encoding="utf-8") == state_text:
+            return False
+    except (OSError, UnicodeDecodeError):
+        pass
+    tmp_state_path = state_path.with_suffix(f".json-{uuid4()}.tmp")
+    tmp_state_path.write_text(state_text, encoding="utf-8")
+    tmp_state_path.replace(state_path)
+    return True
+
+
+def get_dict_state_path(compiled_dict_path: Path = compiled_dict_path) -> Path:
+    """
+    読み込むべきコンパイル済み辞書の一覧を書き込む状態ファイルのパス
+    Parameters
+    ----------
+    compiled_dict_path : Path
+        コンパイル済み辞書ファイルのパス
+    Returns
+    -------
+    state_path : Path
+        状態ファイルのパス
+    """
+    return compiled_dict_path.with_name(f"{compiled_dict_path.stem}.state.json")
+
+
+def _remove_stale_dicts(compiled_dict_path: Path, dict_paths: List[str]) -> None:
+    """
+    使われなくなったコンパイル済み辞書ファイルを削除する
+    他のプロセスが読み込み中で削除できない場合 (Windows) は、次回以降の更新時に削除する
+    """
+    in_use = {Path(path).name for path in dict_paths}
+    for kind in ("default", "words"):
+        for path in compiled_dict_path.parent.glob(
+            f"{compiled_dict_path.stem}.{kind}.*.dic"
+        ):
+            if path.name in in_use:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
 # @mutex_wrapper(mutex_openjtalk_dict)
 def update_dict(
     default_dict_path: Path = default_dict_path,
@@ -79,6 +241,8 @@ def update_dict(
 ) -> None:
     """
     辞書の更新
+    デフォルト辞書とユーザー辞書は別々にコンパイルし、内容が変わっていない辞書はコンパイル済みのものを再利用する
+    全てのワーカーが既に同じ辞書を読み込んでいる場合は何もしない
     Parameters
     ----------
     default_dict_path : Path
@@ -86,85 +250,49 @@ def update_dict(
     user_dict_path : Path
         ユーザー辞書ファイルのパス
     compiled_dict_path : Path
-        コンパイル済み辞書ファイルのパス
+        コンパイル済み辞書ファイルのパス (実際の辞書はこのパスに種類とハッシュを付けた名前で保存される)
     """
 
-    random_string = uuid4()
-    tmp_csv_path = compiled_dict_path.with_suffix(
-        f".dict_csv-{random_string}.tmp"
-    )  # csv形式辞書データの一時保存ファイル
-    tmp_compiled_path = compiled_dict_path.with_suffix(
-        f".dict_compiled-{random_string}.tmp"
-    )  # コンパイル済み辞書データの一時保存ファイル
-
     try:
-        # 辞書.csvを作成
-        csv_text = ""
-
-        # デフォルト辞書データの追加
+        # デフォルト辞書データのコンパイル
         if not default_dict_path.is_file():
             print("Warning: Cannot find default dictionary.", file=sys.stderr)
             return
         default_dict = default_dict_path.read_text(encoding="utf-8")
         if default_dict == default_dict.rstrip():
             default_dict += "\n"
-        csv_text += default_dict
+        dict_paths = [_compile_dict(default_dict, compiled_dict_path, "default")]
 
-        # ユーザー辞書データの追加
+        # ユーザー辞書データは、単語の追加や削除のたびにデフォルト辞書を再コンパイルしないよう別の辞書にする
         user_dict = read_dict(user_dict_path=user_dict_path)
-        for word_uuid in user_dict:
-            word = user_dict[word_uuid]
-            csv_text += (
-                "{surface},{context_id},{context_id},{cost},{part_of_speech},"
-                + "{part_of_speech_detail_1},{part_of_speech_detail_2},"
-                + "{part_of_speech_detail_3},{inflectional_type},"
-                + "{inflectional_form},{stem},{yomi},{pronunciation},"
-                + "{accent_type}/{mora_count},{accent_associative_rule}\n"
-            ).format(
-                surface=word.surface,
-                context_id=word.context_id,
-                cost=_priority2cost(word.context_id, word.priority),
-                part_of_speech=word.part_of_speech,
-                part_of_speech_detail_1=word.part_of_speech_detail_1,
-                part_of_speech_detail_2=word.part_of_speech_detail_2,
-                part_of_speech_detail_3=word.part_of_speech_detail_3,
-                inflectional_type=word.inflectional_type,
-                inflectional_form=word.inflectional_form,
-                stem=word.stem,
-                yomi=word.yomi,
-                pronunciation=word.pronunciation,
-                accent_type=word.accent_type,
-                mora_count=word.mora_count,
-                accent_associative_rule=word.accent_associative_rule,
-            )
-        # 辞書データを辞書.csv へ一時保存
-        tmp_csv_path.write_text(csv_text, encoding="utf-8")
-
-        # 辞書.csvをOpenJTalk用にコンパイル
-        # pyopenjtalk.create_user_dict(str(tmp_csv_path), str(tmp_compiled_path))
-        pyopenjtalk.mecab_dict_index(str(tmp_csv_path), str(tmp_compiled_path))
-        if not tmp_compiled_path.is_file():
-            raise RuntimeError("辞書のコンパイル時にエラーが発生しました。")
-
-        # コンパイル済み辞書の置き換え・読み込み
-        pyopenjtalk.unset_user_dict()
-        tmp_compiled_path.replace(compiled_dict_path)
-        if compiled_dict_path.is_file():
-            # pyopenjtalk.set_user_dict(str(compiled_dict_path.resolve(strict=True)))
-            pyopenjtalk.update_global_jtalk_with_user_dict(str(compiled_dict_path))
+        if len(user_dict) > 0:
+            user_csv = "".join(_word_to_csv_row(word) for word in user_dict.values())
+            dict_paths.append(_compile_dict(user_csv, compiled_dict_path, "words"))
+
+        # コンパイル済み辞書の読み込み
+        # 状態ファイルを先に書き換え、このプロセスが接続していないワーカーにも更新を検知させる
+        dict_path_strs = [str(path) for path in dict_paths]
+        state_path = get_dict_state_path(compiled_dict_path)
+        changed = _write_dict_state(state_path, dict_path_strs)
+        reloaded = pyopenjtalk.update_global_jtalk_with_user_dicts(
+            dict_path_strs, str(state_path)
+        )
+        # 辞書の更新前の読みやアクセントによる g2p の結果を破棄
+        # 他のプロセスによる辞書の更新も、状態ファイルの変更から検知して破棄する
+        if changed or reloaded:
+            G2P_CACHE.clear()
+        G2P_CACHE.watch(state_path)
+        # 永続キャッシュの古い辞書による結果は使われないため削除する
+        if changed and g2p_store.G2P_STORE is not None and G2P_CACHE.dict_hash:
+            g2p_store.G2P_STORE.prune(G2P_CACHE.dict_hash)
+        if changed:
+            _remove_stale_dicts(compiled_dict_path, dict_path_strs)
 
     except Exception as e:
         print("Error: Failed to update dictionary.", file=sys.stderr)
         traceback.print_exc(file=sys.stderr)
         raise e
 
-    finally:
-        # 後処理
-        if tmp_csv_path.exists():
-            tmp_csv_path.unlink()
-        if tmp_compiled_path.exists():
-            tmp_compiled_path.unlink()
-
 
 # @mutex_wrapper(mutex_user_dict)
 def read_dict(user_dict_path: Path = user_dict_path) -> Dict[str, UserDictWord]:
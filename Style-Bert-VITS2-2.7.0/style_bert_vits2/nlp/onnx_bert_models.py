@@ -17,6 +17,7 @@ from typing import Any, Optional, Union
 
 import onnxruntime
 from huggingface_hub import hf_hub_download
+from huggingface_hub.utils import EntryNotFoundError
 from transformers import (
     AutoTokenizer,
     DebertaV2TokenizerFast,
@@ -26,6 +27,7 @@ from transformers import (
 
 from style_bert_vits2.constants import DEFAULT_ONNX_BERT_MODEL_PATHS, Languages
 from style_bert_vits2.logging import logger
+from style_bert_vits2.utils import get_quantized_onnx_model_path, is_cpu_onnx_providers
 
 
 # 各言語ごとのロード済みの BERT モデルを格納する辞書
@@ -38,6 +40,39 @@ __loaded_tokenizers: dict[
 ] = {}
 
 
+def __find_quantized_model(
+    language: Languages,
+    repo_id: str,
+    cache_dir: Optional[str],
+    revision: str,
+) -> Optional[Path]:
+    """
+    Hugging Face のリポジトリ名が指定された場合に、INT8 量子化した ONNX 版 BERT モデルを探す。
+    quantize_onnx.py --bert で量子化したモデル (デフォルトのパスに保存される) を優先し、なければリポジトリからのダウンロードを試みる。
+    リポジトリに量子化したモデルが公開されているとは限らないため、見つからない場合は警告を出して None を返す。
+    """
+
+    local_path = get_quantized_onnx_model_path(
+        DEFAULT_ONNX_BERT_MODEL_PATHS[language] / "model.onnx"
+    )
+    if local_path.exists():
+        return local_path
+    try:
+        return Path(
+            hf_hub_download(
+                repo_id=repo_id,
+                filename=local_path.name,
+                cache_dir=cache_dir,
+                revision=revision,
+            )
+        )
+    except EntryNotFoundError:
+        logger.warning(
+            f"Quantized {language.name} ONNX BERT model not found in {local_path.parent} or {repo_id}, so use the non-quantized model. Run quantize_onnx.py --bert --language {language.name} to create it."
+        )
+        return None
+
+
 def load_model(
     language: Languages,
     pretrained_model_name_or_path: Optional[str] = None,
@@ -45,6 +80,9 @@ def load_model(
     cache_dir: Optional[str] = None,
     revision: str = "main",
     enable_cpu_mem_arena: bool | None = None,
+    intra_op_num_threads: int = 0,
+    inter_op_num_threads: int = 0,
+    use_quantized_model: Optional[bool] = None,
 ) -> onnxruntime.InferenceSession:  # fmt: skip
     """
     指定された言語の ONNX 版 BERT モデルをロードし、ロード済みの ONNX 版 BERT モデルを返す。
@@ -64,6 +102,11 @@ def load_model(
         cache_dir (Optional[str]): モデルのキャッシュディレクトリ。指定しない場合はデフォルトのキャッシュディレクトリが利用される (デフォルト: None)
         revision (str): モデルの Hugging Face 上の Git リビジョン。指定しない場合は最新の main ブランチの内容が利用される (デフォルト: None)
         enable_cpu_mem_arena (bool | None): CPU 推論時にもメモリアリーナを有効化するかどうか。デフォルトでは GPU 推論時のみ有効化される (デフォルト: None)
+        intra_op_num_threads (int): 1 つの演算に使うスレッド数。0 のときは ONNX Runtime の既定値が利用される (デフォルト: 0)
+        inter_op_num_threads (int): 演算を並列に実行するスレッド数。0 のときは ONNX Runtime の既定値が利用される (デフォルト: 0)
+        use_quantized_model (Optional[bool]): quantize_onnx.py で INT8 量子化したモデル (model_int8.onnx) を利用するかどうか。
+            None のときは、CPU 推論時かつローカルに量子化したモデルが存在する場合のみ利用される。
+            リポジトリ名を指定して True のときは、ローカルで量子化したモデルかリポジトリの model_int8.onnx を利用し、どちらもなければ警告を出して量子化前のモデルを利用する (デフォルト: None)
 
     Returns:
         onnxruntime.InferenceSession: ロード済みの BERT モデル
@@ -82,14 +125,20 @@ def load_model(
     # pretrained_model_name_or_path に Hugging Face のリポジトリ名が指定された場合 (aaaa/bbbb のフォーマットを想定):
     # 指定された revision の ONNX 版 BERT モデルを cache_dir にダウンロードする (既にダウンロード済みの場合は何も行われない)
     if len(pretrained_model_name_or_path.split("/")) == 2:
-        model_path = Path(
-            hf_hub_download(
-                repo_id=pretrained_model_name_or_path,
-                filename="model_fp16.onnx",
-                cache_dir=cache_dir,
-                revision=revision,
+        model_path = None
+        if use_quantized_model is True:
+            model_path = __find_quantized_model(
+                language, pretrained_model_name_or_path, cache_dir, revision
+            )
+        if model_path is None:
+            model_path = Path(
+                hf_hub_download(
+                    repo_id=pretrained_model_name_or_path,
+                    filename="model_fp16.onnx",
+                    cache_dir=cache_dir,
+                    revision=revision,
+                )
             )
-        )
         # 英語用 BERT のみ、spm.model もダウンロードする
         # Fast 版の BERT トークナイザーでは不要なはずだが、念のため
         if language == Languages.EN:
@@ -102,7 +151,21 @@ def load_model(
     # pretrained_model_name_or_path にファイルパスが指定された場合:
     # 既にダウンロード済みという前提のもと、モデルへのローカルパスを model_path に格納する
     else:
-        model_path = Path(pretrained_model_name_or_path).resolve() / "model_fp16.onnx"
+        model_dir = Path(pretrained_model_name_or_path).resolve()
+        model_path = model_dir / "model_fp16.onnx"
+        # INT8 量子化したモデルは CPU 推論時のみ高速なため、既定では CPU 推論時のみ利用する
+        quantized_model_path = get_quantized_onnx_model_path(model_dir / "model.onnx")
+        if use_quantized_model is None:
+            use_quantized_model = (
+                is_cpu_onnx_providers(onnx_providers) and quantized_model_path.exists()
+            )
+        if use_quantized_model is True:
+            if quantized_model_path.exists():
+                model_path = quantized_model_path
+            else:
+                logger.warning(
+                    f"Quantized {language.name} ONNX BERT model {quantized_model_path} not found, so use the non-quantized model. Run quantize_onnx.py --bert --language {language.name} to create it."
+                )
 
     # 推論時に一番優先される ExecutionProvider の名前を取得
     assert len(onnx_providers) > 0
@@ -118,6 +181,11 @@ def load_model(
     ## 本来は log_severity_level = 3 だけで効くはずだが、なぜか CUDA 系のログが抑制できないので set_default_logger_severity() も呼び出している
     sess_options.log_severity_level = 3
     onnxruntime.set_default_logger_severity(3)
+    ## スレッド数が指定されている場合のみ設定する
+    if intra_op_num_threads > 0:
+        sess_options.intra_op_num_threads = intra_op_num_threads
+    if inter_op_num_threads > 0:
+        sess_options.inter_op_num_threads = inter_op_num_threads
 
     # CPU 推論時のみ enable_cpu_mem_arena を無効化し、BERT モデルの推論セッションより富豪的なメモリ消費を防止する
     ## 既に RunOptions の memory.enable_memory_arena_shrinkage や、ProviderOptions の "arena_extend_strategy": "kSameAsRequested" を指定して
@@ -142,7 +210,7 @@ def load_model(
         providers=onnx_providers,
     )
     logger.info(
-        f"Loaded the {language.name} ONNX BERT model from {pretrained_model_name_or_path} ({time.time() - start_time:.2f}s)"
+        f"Loaded the {language.name} ONNX BERT model from {pretrained_model_name_or_path} ({model_path.name}) ({time.time() - start_time:.2f}s)"
     )
 
     return __loaded_models[language]
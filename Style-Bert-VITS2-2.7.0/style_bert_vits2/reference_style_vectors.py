@@ -0,0 +1,156 @@
+"""
+参照音声から推論したスタイルベクトルの永続キャッシュ。
+
+TTSModel.infer() に reference_audio_path を指定すると、話者埋め込みモデル (pyannote) で音声からスタイルベクトルを推論する。
+同じ参照音声を繰り返し使う場合に毎回推論しないよう、推論結果 (重みを適用する前のベクトル) を音声ファイルの内容のハッシュごとに保存する。
+キャッシュは下記のように style_vectors.npy と同じディレクトリに保存され、1 つの参照音声が 1 つのファイルになる。
+```
+model_assets/model-name
+├── style_vectors.npy
+└── reference_style_vectors
+    └── wespeaker-voxceleb-resnet34-LM  (話者埋め込みモデル名)
+        ├── 0a1b2c....npy  (音声ファイルの内容の SHA-256)
+        └── ...
+```
+ハッシュはそのまま参照音声の ID として使われ、登録済みの参照音声は TTSModel.infer() の reference_audio_id で指定できる。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Any, Optional, Union
+
+import numpy as np
+from numpy.typing import NDArray
+
+
+# スタイルベクトルの推論に使う話者埋め込みモデル
+STYLE_EMBEDDING_MODEL = "pyannote/wespeaker-voxceleb-resnet34-LM"
+
+# style_vectors.npy と同じディレクトリに作られる、キャッシュのディレクトリ名
+REFERENCE_STYLE_VECTORS_DIR = "reference_style_vectors"
+
+# 参照音声の ID (音声ファイルの内容の SHA-256)
+__REFERENCE_ID_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+def get_reference_audio_id(audio: Union[str, Path, bytes]) -> str:
+    """
+    参照音声の ID (音声ファイルの内容の SHA-256) を返す。
+
+    Args:
+        audio (Union[str, Path, bytes]): 音声ファイルのパス、または音声ファイルの内容
+
+    Returns:
+        str: 参照音声の ID
+    """
+
+    if isinstance(audio, bytes):
+        return hashlib.sha256(audio).hexdigest()
+    digest = hashlib.sha256()
+    with open(audio, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_reference_audio_id(reference_id: str) -> bool:
+    """文字列が参照音声の ID として正しい形式かどうか (ファイル名に使うため、それ以外の文字列は受け付けない)"""
+    return __REFERENCE_ID_PATTERN.fullmatch(reference_id) is not None
+
+
+class ReferenceStyleVectorCache:
+    """
+    参照音声から推論したスタイルベクトルを、参照音声の ID ごとに保存するキャッシュ。
+    ファイルへの書き込みは 1 つの参照音声につき 1 ファイルで、一時ファイルからの置き換えで行うため、
+    同じディレクトリを複数のプロセスから読み書きしても壊れない (他のプロセスが登録したものも読み込める) 。
+    """
+
+    def __init__(self, cache_dir: Optional[Path]) -> None:
+        """
+        Args:
+            cache_dir (Optional[Path]): キャッシュのディレクトリ (通常は style_vectors.npy と同じディレクトリの reference_style_vectors)。
+                None のときはファイルに保存せず、メモリ上にのみ保持する
+        """
+
+        self.cache_dir: Optional[Path] = (
+            None
+            if cache_dir is None
+            else cache_dir / STYLE_EMBEDDING_MODEL.split("/")[-1]
+        )
+        self.__vectors: dict[str, NDArray[Any]] = {}
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def for_style_vectors(cls, style_vec_path: Path) -> ReferenceStyleVectorCache:
+        """style_vectors.npy と同じディレクトリに保存するキャッシュを返す"""
+        return cls(style_vec_path.parent / REFERENCE_STYLE_VECTORS_DIR)
+
+    def __contains__(self, reference_id: str) -> bool:
+        return self.get(reference_id) is not None
+
+    def get(self, reference_id: str) -> Optional[NDArray[Any]]:
+        """
+        参照音声の ID に対応するスタイルベクトルを返す。
+
+        Args:
+            reference_id (str): 参照音声の ID
+
+        Returns:
+            Optional[NDArray[Any]]: スタイルベクトル (重みを適用する前のもの)。登録されていなければ None
+        """
+
+        if not is_reference_audio_id(reference_id):
+            return None
+        with self.__lock:
+            vector = self.__vectors.get(reference_id)
+        if vector is not None or self.cache_dir is None:
+            return vector
+
+        path = self.cache_dir / f"{reference_id}.npy"
+        if not path.exists():
+            return None
+        vector = np.load(path)
+        with self.__lock:
+            self.__vectors[reference_id] = vector
+        return vector
+
+    def add(self, reference_id: str, vector: NDArray[Any]) -> None:
+        """
+        スタイルベクトルを登録し、ファイルに保存する。
+
+        Args:
+            reference_id (str): 参照音声の ID
+            vector (NDArray[Any]): スタイルベクトル (重みを適用する前のもの)
+        """
+
+        if not is_reference_audio_id(reference_id):
+            raise ValueError(f"Invalid reference audio id: {reference_id}")
+        with self.__lock:
+            self.__vectors[reference_id] = vector
+        if self.cache_dir is None:
+            return
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self.cache_dir / f"{reference_id}.npy"
+        tmp_path = path.with_name(f".{reference_id}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, vector)
+        os.replace(tmp_path, path)
+
+    def ids(self) -> list[str]:
+        """登録されている参照音声の ID の一覧"""
+
+        with self.__lock:
+            ids = set(self.__vectors)
+        if self.cache_dir is not None and self.cache_dir.exists():
+            ids.update(
+                path.stem
+                for path in self.cache_dir.glob("*.npy")
+                if is_reference_audio_id(path.stem)
+            )
+        return sorted(ids)
@@ -0,0 +1,634 @@
+"""
+音声合成のマルチプロセスワーカープール。
+
+1 つのプロセスで音声合成を行うと、GIL と単一の PyTorch スレッドプールに律速され、多コアの CPU を使い切れない。
+そこで、音声合成を複数のワーカープロセスで並列に実行する。
+
+- 各ワーカーは PyTorch のスレッド数を固定し、ワーカー同士で CPU コアを奪い合わないようにする
+- 音声合成モデルの重みは (CPU 推論時は) メモリマップで読み込まれるため、同じモデルを読み込んだワーカー間で共有される
+- g2p は全ワーカーが同じ pyopenjtalk ワーカーに接続して行う (ユーザー辞書もフロントエンドが適用したものが共有される)
+- 合成した音声データは pickle せず、ワーカーごとの共有メモリを介してフロントエンドに渡す
+
+リクエストは到着順に、空いているワーカーのうち対象のモデルを既にロードしているワーカーへ優先的に割り当てられる。
+フロントエンド (API サーバー) からは、InferenceScheduler と同じく infer() を await して使う。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from multiprocessing import get_context, shared_memory
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional, Sequence, Union
+
+import numpy as np
+from numpy.typing import NDArray
+
+from style_bert_vits2.constants import Languages
+from style_bert_vits2.inference_scheduler import QueueFullError, wait_for_result
+from style_bert_vits2.logging import logger
+from style_bert_vits2.nlp.japanese.pyopenjtalk_worker.worker_common import WORKER_PORT
+from style_bert_vits2.tts_model import TTSModel, TTSModelHolder
+
+
+# 合成結果を受け渡す共有メモリのワーカーあたりのサイズ (バイト)
+## 44.1kHz の 16bit PCM で約 6 分。これを超える音声は pickle してパイプで受け渡す
+RESULT_BUFFER_SIZE = 32 * 1024**2
+
+# 異常終了したワーカーを再起動するまでの待ち時間 (秒)。連続して異常終了するたびに倍にする
+RESPAWN_BASE_DELAY = 1.0
+RESPAWN_MAX_DELAY = 60.0
+# この回数だけ連続して異常終了したワーカーは再起動しない
+MAX_CONSECUTIVE_RESPAWNS = 5
+# この秒数以上動き続けた後の異常終了は、連続した異常終了として数えない
+RESPAWN_RESET_SEC = 300.0
+
+
+class SynthesisWorkerError(Exception):
+    """ワーカープロセスでの処理に失敗した、またはワーカープロセスが終了した"""
+
+
+@dataclass
+class SynthesisWorkerConfig:
+    """各ワーカープロセスで TTSModelHolder と TTSModel を構築するための設定"""
+
+    model_dir: Path
+    device: str
+    onnx_providers: Sequence[Union[str, tuple[str, dict[str, Any]]]]
+    # ワーカーあたりの PyTorch のスレッド数
+    num_threads: int = 1
+    memory_budget: Optional[int] = None
+    pinned_model_names: list[str] = field(default_factory=list)
+    use_quantized_onnx: Optional[bool] = None
+    # TTSModel() に渡す追加の引数
+    model_kwargs: dict[str, Any] = field(default_factory=dict)
+    pyopenjtalk_port: int = WORKER_PORT
+    pyopenjtalk_workers: int = 1
+    # g2p の結果の永続キャッシュのパス (None の場合は使わない)
+    g2p_store_path: Optional[Path] = None
+
+
+@dataclass(eq=False)
+class _Call:
+    method: str
+    args: tuple[Any, ...]
+    # 対象のモデルのパス (ワーカーの割り当てに使う)
+    model_key: Optional[str]
+    # 指定された場合、このワーカーでのみ実行する
+    worker_index: Optional[int]
+    future: Future[Any] = field(default_factory=Future)
+
+
+@dataclass
+class _WorkerHandle:
+    index: int
+    process: BaseProcess
+    connection: Connection
+    buffer: shared_memory.SharedMemory
+    current: Optional[_Call] = None
+    alive: bool = True
+    # ワーカーがロードしているモデルのパスと、その合計サイズ
+    resident_models: set[str] = field(default_factory=set)
+    resident_memory_size: int = 0
+    # 異常終了して再起動を待っているかどうかと、再起動後にロードし直すモデルのパス
+    respawning: bool = False
+    models_to_restore: set[str] = field(default_factory=set)
+    # 連続して異常終了した回数と、ワーカープロセスを起動した時刻
+    consecutive_exits: int = 0
+    started_at: float = field(default_factory=time.time)
+
+
+class SynthesisWorkerPool:
+    """
+    音声合成を複数のワーカープロセスで実行するプール。
+    start() でワーカーを起動し、asyncio のイベントループ上から infer() を await して使う。
+    broadcast() / broadcast_async() は全ワーカーで同じ処理を行う (モデルのロードなど) 。
+    異常終了したワーカー (メモリ不足など) は間隔を空けて再起動し、ロードしていたモデルをロードし直す。
+    """
+
+    def __init__(
+        self,
+        config: SynthesisWorkerConfig,
+        num_workers: int,
+        max_queue_size: int = 32,
+    ) -> None:
+        """
+        Args:
+            config (SynthesisWorkerConfig): 各ワーカーの設定
+            num_workers (int): ワーカープロセス数
+            max_queue_size (int): 待機できるリクエストの最大数 (超えると QueueFullError)
+        """
+
+        self.config = config
+        self.num_workers = max(1, num_workers)
+        self.max_queue_size = max_queue_size
+        self.__lock = threading.Lock()
+        self.__workers: list[_WorkerHandle] = []
+        self.__pending: deque[_Call] = deque()
+        self.__closing = False
+        self.__started = False
+        # load_model() で固定されたモデルのパス (再起動したワーカーでも固定する)
+        self.__pinned_models: set[str] = set()
+
+    @property
+    def queue_depth(self) -> int:
+        """推論待ちのリクエスト数 (推論中のものは含まない)"""
+        return len(self.__pending)
+
+    @property
+    def resident_models(self) -> set[str]:
+        """いずれかのワーカーがロードしているモデルのパス"""
+        return set().union(*(worker.resident_models for worker in self.__workers))
+
+    @property
+    def resident_memory_size(self) -> int:
+        """全ワーカーがロードしているモデルの合計サイズ (バイト)"""
+        return sum(worker.resident_memory_size for worker in self.__workers)
+
+    def start(self) -> None:
+        """
+        ワーカープロセスを起動し、全てのワーカーで BERT モデルと音声合成モデルの一覧の読み込みが終わるまで待つ。
+        pyopenjtalk ワーカーは事前に起動しておく必要がある。
+        """
+
+        start_calls: list[_Call] = []
+        for index in range(self.num_workers):
+            buffer = shared_memory.SharedMemory(create=True, size=RESULT_BUFFER_SIZE)
+            # ワーカーは初期化が終わると最初の応答を返すため、それを起動処理の結果として待つ
+            start_call = _Call("start", (), None, index)
+            start_calls.append(start_call)
+            process, connection = self.__spawn(index, buffer)
+            worker = _WorkerHandle(
+                index=index,
+                process=process,
+                connection=connection,
+                buffer=buffer,
+                current=start_call,
+            )
+            self.__workers.append(worker)
+            self.__start_receiver(worker)
+
+        for start_call in start_calls:
+            start_call.future.result()
+        self.__started = True
+        logger.info(
+            f"Started {self.num_workers} synthesis workers ({self.config.num_threads} threads each)"
+        )
+
+    def __spawn(
+        self, index: int, buffer: shared_memory.SharedMemory
+    ) -> tuple[BaseProcess, Connection]:
+        context = get_context("spawn")
+        connection, child_connection = context.Pipe()
+        process = context.Process(
+            target=_worker_main,
+            args=(self.config, child_connection, buffer.name),
+            name=f"synthesis-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        child_connection.close()
+        return process, connection
+
+    def __start_receiver(self, worker: _WorkerHandle) -> None:
+        threading.Thread(
+            target=self.__receive,
+            args=(worker, worker.connection),
+            name=f"synthesis-worker-{worker.index}-receiver",
+            daemon=True,
+        ).start()
+
+    async def infer(
+        self,
+        model_key: str,
+        timeout: Optional[float] = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        **kwargs: Any,
+    ) -> tuple[int, NDArray[Any]]:
+        """
+        音声合成リクエストをキューに積み、いずれかのワーカーでの合成結果を待つ。
+
+        Args:
+            model_key (str): 音声合成に使うモデルのパス (TTSModelHolder.model_files_dict の先頭のファイル)
+            timeout (Optional[float]): 制限時間 (秒)。None のときは無制限
+            is_disconnected (Optional[Callable[[], Awaitable[bool]]]): クライアントが切断されたかを返す関数
+            **kwargs: TTSModel.infer() に渡す引数
+
+        Returns:
+            tuple[int, NDArray[Any]]: サンプリングレートと音声データ (16bit PCM)
+
+        Raises:
+            QueueFullError: 待ち行列が上限に達している
+            InferenceTimeoutError: 制限時間内に完了しなかった
+            InferenceCancelledError: クライアントが切断された
+            SynthesisWorkerError: ワーカーでの音声合成に失敗した
+        """
+
+        if self.max_queue_size > 0 and self.queue_depth >= self.max_queue_size:
+            raise QueueFullError(
+                f"Too many pending requests (max_queue_size={self.max_queue_size})"
+            )
+
+        call = self.__submit(_Call("infer", (model_key, kwargs), model_key, None))
+        try:
+            return await wait_for_result(
+                asyncio.wrap_future(call.future), timeout, is_disconnected
+            )
+        finally:
+            # まだワーカーに割り当てられていなければ取り消す (合成中の場合は結果を破棄する)
+            if call.future.cancel():
+                with self.__lock:
+                    if call in self.__pending:
+                        self.__pending.remove(call)
+
+    def broadcast(self, method: str, *args: Any) -> list[Any]:
+        """
+        全てのワーカーで同じ処理を実行し、結果を待つ。
+        各ワーカーが実行中の音声合成の完了を待つため、イベントループ上からは broadcast_async() を使う。
+
+        Args:
+            method (str): ワーカーで実行する処理 (_SynthesisWorker のメソッド名)
+            *args: メソッドに渡す引数
+
+        Returns:
+            list[Any]: 各ワーカーでの実行結果
+        """
+
+        return [call.future.result() for call in self.__submit_broadcast(method, args)]
+
+    async def broadcast_async(self, method: str, *args: Any) -> list[Any]:
+        """
+        broadcast() と同じく全てのワーカーで同じ処理を実行し、イベントループを止めずに結果を待つ。
+        """
+
+        calls = self.__submit_broadcast(method, args)
+        return list(
+            await asyncio.gather(*(asyncio.wrap_future(call.future) for call in calls))
+        )
+
+    def __submit_broadcast(self, method: str, args: tuple[Any, ...]) -> list[_Call]:
+        with self.__lock:
+            # 再起動したワーカーでも同じモデルを固定するため、固定されたモデルを覚えておく
+            if method == "load_model" and len(args) >= 2 and args[1]:
+                self.__pinned_models.add(args[0])
+            elif method == "unload_model":
+                self.__pinned_models.discard(args[0])
+            # 再起動を待っているワーカーには、再起動後に実行する
+            workers = [w for w in self.__workers if w.alive or w.respawning]
+        return [
+            self.__submit(_Call(method, args, None, worker.index)) for worker in workers
+        ]
+
+    def shutdown(self) -> None:
+        """全てのワーカーを終了し、共有メモリを解放する"""
+
+        self.__closing = True
+        for worker in self.__workers:
+            try:
+                worker.connection.send(None)
+            except OSError:
+                pass
+        for worker in self.__workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.buffer.close()
+            worker.buffer.unlink()
+        self.__workers = []
+
+    def __submit(self, call: _Call) -> _Call:
+        with self.__lock:
+            if not any(worker.alive or worker.respawning for worker in self.__workers):
+                raise SynthesisWorkerError("No synthesis worker is running")
+            self.__pending.append(call)
+            self.__dispatch()
+        return call
+
+    def __dispatch(self) -> None:
+        # self.__lock を取得した状態で呼び出す
+        for call in list(self.__pending):
+            idle_workers = [
+                worker
+                for worker in self.__workers
+                if worker.alive
+                and worker.current is None
+                and call.worker_index in (None, worker.index)
+            ]
+            if len(idle_workers) == 0:
+                continue
+            self.__pending.remove(call)
+            if not call.future.set_running_or_notify_cancel():
+                continue
+            # 対象のモデルをロード済みのワーカーを優先し、なければロード済みのモデルが最も少ないワーカーに割り当てる
+            worker = min(
+                idle_workers,
+                key=lambda w: (
+                    call.model_key not in w.resident_models,
+                    len(w.resident_models),
+                ),
+            )
+            worker.current = call
+            try:
+                worker.connection.send((call.method, call.args))
+            except OSError as e:
+                worker.current = None
+                call.future.set_exception(SynthesisWorkerError(str(e)))
+
+    def __receive(self, worker: _WorkerHandle, connection: Connection) -> None:
+        # ワーカープロセスごとのスレッドで、ワーカーからの応答を受け取り続ける
+        # (ワーカーが再起動すると worker.connection は新しいプロセスとの接続に置き換わる)
+        while True:
+            try:
+                ok, payload, resident_models, resident_memory_size = connection.recv()
+            except (EOFError, OSError):
+                self.__on_worker_exit(worker)
+                return
+
+            # 共有メモリはワーカーが次の処理を始めると上書きされるため、割り当てを解除する前にコピーする
+            result: Any = payload
+            if ok and isinstance(payload, _AudioResult):
+                result = (payload.sampling_rate, payload.read(worker.buffer))
+
+            with self.__lock:
+                call = worker.current
+                worker.current = None
+                worker.resident_models = set(resident_models)
+                worker.resident_memory_size = resident_memory_size
+                self.__dispatch()
+            assert call is not None
+            if ok:
+                call.future.set_result(result)
+            else:
+                call.future.set_exception(SynthesisWorkerError(payload))
+
+    def __on_worker_exit(self, worker: _WorkerHandle) -> None:
+        with self.__lock:
+            worker.alive = False
+            respawn = (
+                self.__started and not self.__closing and self.__count_exit(worker)
+            )
+            worker.respawning = respawn
+            if respawn:
+                worker.models_to_restore |= worker.resident_models
+            worker.resident_models = set()
+            worker.resident_memory_size = 0
+            # 実行中の処理は異常終了の原因かもしれないため、再起動後に再実行せず失敗させる
+            failed = [worker.current] if worker.current is not None else []
+            worker.current = None
+            # 再起動しない場合は、このワーカーでのみ実行できる処理と、実行できるワーカーがいなくなった処理を失敗させる
+            no_worker_left = not any(w.alive or w.respawning for w in self.__workers)
+            for call in list(self.__pending):
+                if (
+                    call.worker_index == worker.index and not respawn
+                ) or no_worker_left:
+                    self.__pending.remove(call)
+                    if call.future.set_running_or_notify_cancel():
+                        failed.append(call)
+        if not self.__closing:
+            logger.error(f"Synthesis worker #{worker.index} exited unexpectedly")
+        for call in failed:
+            if call.future.done():
+                continue
+            call.future.set_exception(
+                SynthesisWorkerError(f"Synthesis worker #{worker.index} exited")
+            )
+        if respawn:
+            delay = min(
+                RESPAWN_MAX_DELAY,
+                RESPAWN_BASE_DELAY * 2 ** (worker.consecutive_exits - 1),
+            )
+            logger.warning(
+                f"Respawning synthesis worker #{worker.index} in {delay:.1f}s (attempt {worker.consecutive_exits})"
+            )
+            timer = threading.Timer(delay, self.__respawn, args=(worker,))
+            timer.daemon = True
+            timer.start()
+
+    def __count_exit(self, worker: _WorkerHandle) -> bool:
+        # self.__lock を取得した状態で呼び出す。再起動する場合は True を返す
+        if time.time() - worker.started_at >= RESPAWN_RESET_SEC:
+            worker.consecutive_exits = 0
+        if worker.consecutive_exits >= MAX_CONSECUTIVE_RESPAWNS:
+            logger.error(
+                f"Synthesis worker #{worker.index} exited {worker.consecutive_exits} times in a row, so it will not be respawned"
+            )
+            return False
+        worker.consecutive_exits += 1
+        return True
+
+    def __respawn(self, worker: _WorkerHandle) -> None:
+        if self.__closing:
+            return
+        worker.process.join(timeout=5)
+        worker.connection.close()
+        try:
+            process, connection = self.__spawn(worker.index, worker.buffer)
+        except Exception as e:
+            logger.error(f"Failed to respawn synthesis worker #{worker.index}: {e}")
+            self.__on_worker_exit(worker)
+            return
+
+        start_call = _Call("start", (), None, worker.index)
+        with self.__lock:
+            if self.__closing:
+                process.terminate()
+                return
+            worker.process = process
+            worker.connection = connection
+            worker.current = start_call
+            worker.alive = True
+            worker.respawning = False
+            worker.started_at = time.time()
+            # 異常終了する前にロードしていたモデルを、待っている処理よりも先にロードし直す
+            restore_calls = [
+                _Call(
+                    "load_model",
+                    (model_key, model_key in self.__pinned_models),
+                    model_key,
+                    worker.index,
+                )
+                for model_key in sorted(worker.models_to_restore)
+            ]
+            worker.models_to_restore = set()
+            self.__pending.extendleft(reversed(restore_calls))
+        for call in restore_calls:
+            call.future.add_done_callback(self.__log_restore_failure)
+        self.__start_receiver(worker)
+        logger.info(f"Respawned synthesis worker #{worker.index}")
+
+    @staticmethod
+    def __log_restore_failure(future: Future[Any]) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(
+                f"Failed to reload a model on the respawned synthesis worker: {future.exception()}"
+            )
+
+
+@dataclass
+class _AudioResult:
+    """共有メモリに書き込んだ音声データの情報 (共有メモリに収まらない場合は data に音声データそのものを持つ)"""
+
+    sampling_rate: int
+    dtype: str
+    shape: tuple[int, ...]
+    data: Optional[NDArray[Any]] = None
+
+    @classmethod
+    def write(
+        cls, sampling_rate: int, audio: NDArray[Any], buffer: shared_memory.SharedMemory
+    ) -> _AudioResult:
+        if audio.nbytes > buffer.size:
+            return cls(sampling_rate, audio.dtype.str, audio.shape, audio)
+        np.ndarray(audio.shape, dtype=audio.dtype, buffer=buffer.buf)[...] = audio
+        return cls(sampling_rate, audio.dtype.str, audio.shape)
+
+    def read(self, buffer: shared_memory.SharedMemory) -> NDArray[Any]:
+        if self.data is not None:
+            return self.data
+        return np.ndarray(
+            self.shape, dtype=np.dtype(self.dtype), buffer=buffer.buf
+        ).copy()
+
+
+class _SynthesisWorker:
+    """ワーカープロセス内で音声合成モデルを管理し、フロントエンドから依頼された処理を行う"""
+
+    def __init__(self, config: SynthesisWorkerConfig) -> None:
+        import torch
+
+        from style_bert_vits2.nlp import bert_models
+        from style_bert_vits2.nlp.japanese import pyopenjtalk_worker as pyopenjtalk
+        from style_bert_vits2.nlp.japanese.g2p_batch import G2P_CACHE
+        from style_bert_vits2.nlp.japanese.g2p_store import open_g2p_store
+        from style_bert_vits2.nlp.japanese.user_dict import get_dict_state_path
+
+        # ワーカー同士で CPU コアを奪い合わないよう、スレッド数を固定する
+        torch.set_num_threads(config.num_threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # 既に並列処理が行われた後は変更できない
+            pass
+
+        # フロントエンドが起動した pyopenjtalk ワーカーに接続する
+        pyopenjtalk.initialize_worker(
+            port=config.pyopenjtalk_port, num_workers=config.pyopenjtalk_workers
+        )
+        # 辞書の更新はフロントエンドが行うため、g2p の結果のキャッシュは辞書の状態ファイルの監視のみ行う
+        G2P_CACHE.watch(get_dict_state_path())
+        if config.g2p_store_path is not None:
+            open_g2p_store(config.g2p_store_path)
+        bert_models.load_model(Languages.JP, device_map=config.device)
+        bert_models.load_tokenizer(Languages.JP)
+
+        self.config = config
+        self.model_holder = TTSModelHolder(
+            config.model_dir,
+            config.device,
+            config.onnx_providers,
+            memory_budget=config.memory_budget,
+            pinned_model_names=config.pinned_model_names,
+            use_quantized_onnx=config.use_quantized_onnx,
+        )
+        self.models: dict[str, TTSModel] = {}
+        self.refresh()
+
+    @property
+    def resident_models(self) -> list[str]:
+        return [key for key, model in self.models.items() if model.is_loaded]
+
+    def refresh(self) -> None:
+        # フロントエンドの load_models() と同じく、各モデルの先頭のファイルを使う
+        for model in self.models.values():
+            self.model_holder.unload_model(model)
+        self.model_holder.refresh()
+        self.models = {}
+        for model_name, model_paths in self.model_holder.model_files_dict.items():
+            model_dir = self.model_holder.root_dir / model_name
+            self.models[str(model_paths[0])] = TTSModel(
+                model_path=model_paths[0],
+                config_path=model_dir / "config.json",
+                style_vec_path=model_dir / "style_vectors.npy",
+                device=self.model_holder.device,
+                onnx_providers=self.model_holder.onnx_providers,
+                **self.config.model_kwargs,
+            )
+
+    def infer(self, model_key: str, kwargs: dict[str, Any]) -> tuple[int, NDArray[Any]]:
+        model = self.models[model_key]
+        with self.model_holder.use_model(model):
+            return model.infer(**kwargs)
+
+    def load_model(self, model_key: str, pin: bool = False) -> None:
+        model = self.models[model_key]
+        if pin:
+            self.model_holder.pin_model(self.model_holder.get_model_name(model))
+        self.model_holder.load_model(model)
+
+    def unload_model(self, model_key: str) -> bool:
+        model = self.models[model_key]
+        self.model_holder.unpin_model(self.model_holder.get_model_name(model))
+        return self.model_holder.unload_model(model)
+
+    def warm_up(self, text: str, language: Languages) -> None:
+        from style_bert_vits2.nlp import clean_text, extract_bert_feature
+
+        # ロード済みのモデルがなければ、g2p と BERT 特徴量の抽出だけを行う
+        models = [model for model in self.models.values() if model.is_loaded]
+        if len(models) > 0:
+            for model in models:
+                with self.model_holder.use_model(model):
+                    model.infer(text=text, language=language)
+        else:
+            norm_text, _, _, word2ph = clean_text(text, language)
+            extract_bert_feature(norm_text, word2ph, language, self.config.device)
+
+
+def _worker_main(
+    config: SynthesisWorkerConfig, connection: Connection, buffer_name: str
+) -> None:
+    """ワーカープロセスのエントリーポイント"""
+
+    buffer = shared_memory.SharedMemory(name=buffer_name)
+    worker = _SynthesisWorker(config)
+    logger.info(f"Synthesis worker started (pid={os.getpid()})")
+
+    def reply(ok: bool, payload: Any) -> None:
+        connection.send(
+            (
+                ok,
+                payload,
+                worker.resident_models,
+                worker.model_holder.resident_memory_size,
+            )
+        )
+
+    # 初期化の完了を通知する
+    reply(True, None)
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        # None は終了の合図
+        if message is None:
+            break
+        method, args = message
+        try:
+            result = getattr(worker, method)(*args)
+            if method == "infer":
+                sampling_rate, audio = result
+                result = _AudioResult.write(sampling_rate, audio, buffer)
+        except Exception as e:
+            logger.exception(f"Synthesis worker failed ({method}): {e}")
+            reply(False, f"{type(e).__name__}: {e}")
+        else:
+            reply(True, result)
+    buffer.close()
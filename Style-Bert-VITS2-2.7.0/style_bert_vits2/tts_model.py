@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 import gc
+import threading
 import time
-from collections.abc import Sequence
+from collections import OrderedDict
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
 from pathlib import Path
 from typing import TYPE_CHECKING, Any, Optional, Union
 
@@ -25,16 +28,31 @@ from style_bert_vits2.constants import (
 )
 from style_bert_vits2.logging import logger
 from style_bert_vits2.models.hyper_parameters import HyperParameters
-from style_bert_vits2.voice import adjust_voice
+from style_bert_vits2.reference_style_vectors import (
+    STYLE_EMBEDDING_MODEL,
+    ReferenceStyleVectorCache,
+    get_reference_audio_id,
+)
+from style_bert_vits2.utils import (
+    get_quantized_onnx_model_path,
+    is_cpu_onnx_providers,
+    is_quantized_onnx_model_path,
+)
+from style_bert_vits2.voice import F0Method, adjust_voice
 
 
 if TYPE_CHECKING:
+    from style_bert_vits2.models.infer_onnx import OnnxSynthesisEngine
     from style_bert_vits2.models.models import SynthesizerTrn
     from style_bert_vits2.models.models_jp_extra import (
         SynthesizerTrn as SynthesizerTrnJPExtra,
     )
 
 
+# reuse_raw_audio=True のとき、モデルごとに保持するピッチ・抑揚の調整前の音声の数
+RAW_AUDIO_CACHE_SIZE = 4
+
+
 class NullModelParam(BaseModel):
     """
     ヌルモデルのパラメータを表す Pydantic モデル。
@@ -62,6 +80,10 @@ class TTSModel:
         style_vec_path: Union[Path, NDArray[Any]],
         device: str = "cpu",
         onnx_providers: Sequence[Union[str, tuple[str, dict[str, Any]]]] = [("CPUExecutionProvider", {"arena_extend_strategy": "kSameAsRequested"})],
+        onnx_intra_op_num_threads: int = 0,
+        onnx_inter_op_num_threads: int = 0,
+        optimize_for_inference: bool = True,
+        use_bf16: bool = False,
     ) -> None:  # fmt: skip
         """
         Style-Bert-VITS2 の音声合成モデルを初期化する。
@@ -73,11 +95,21 @@ class TTSModel:
             style_vec_path (Union[Path, NDArray[Any]]): スタイルベクトル (style_vectors.npy) のパス (直接 NDArray を指定することも可能)
             device (str): PyTorch 推論での音声合成時に利用するデバイス (cpu, cuda, mps など)
             onnx_providers (list[str]): ONNX 推論で利用する ExecutionProvider (CPUExecutionProvider, CUDAExecutionProvider など)
+            onnx_intra_op_num_threads (int): ONNX 推論で 1 つの演算に使うスレッド数 (0 のときは ONNX Runtime の既定値)
+            onnx_inter_op_num_threads (int): ONNX 推論で演算を並列に実行するスレッド数 (0 のときは ONNX Runtime の既定値)
+            optimize_for_inference (bool): PyTorch 推論時、推論で使わないモジュールを破棄し、weight norm を畳み込んで torch.inference_mode() で推論する
+            use_bf16 (bool): PyTorch の CPU 推論時、CPU が対応していれば畳み込みと行列積を bfloat16 で計算する
         """
 
         self.model_path: Path = model_path
         self.device: str = device
         self.onnx_providers: Sequence[Union[str, tuple[str, dict[str, Any]]]] = onnx_providers  # fmt: skip
+        self.onnx_intra_op_num_threads: int = onnx_intra_op_num_threads
+        self.onnx_inter_op_num_threads: int = onnx_inter_op_num_threads
+        self.optimize_for_inference: bool = optimize_for_inference
+        self.use_bf16: bool = use_bf16
+        # CPU が bfloat16 に対応しているかはロード時に判定する
+        self.__bf16_enabled: bool = False
 
         # ONNX 形式のモデルかどうか
         if self.model_path.suffix == ".onnx":
@@ -97,13 +129,19 @@ class TTSModel:
             )
 
         # スタイルベクトルの NDArray が直接指定された
+        ## 参照音声から推論したスタイルベクトルは、ファイルに保存せずメモリ上にのみ保持する
         if isinstance(style_vec_path, np.ndarray):
             self.style_vec_path: Path = Path("")  # 互換性のため空の Path を設定
             self.style_vectors: NDArray[Any] = style_vec_path
+            self.reference_style_cache = ReferenceStyleVectorCache(None)
         # スタイルベクトルのパスが指定された
+        ## 参照音声から推論したスタイルベクトルは、style_vectors.npy と同じディレクトリに保存する
         else:
             self.style_vec_path: Path = style_vec_path
             self.style_vectors: NDArray[Any] = np.load(self.style_vec_path)
+            self.reference_style_cache = ReferenceStyleVectorCache.for_style_vectors(
+                self.style_vec_path
+            )
 
         self.spk2id: dict[str, int] = self.hyper_parameters.data.spk2id
         self.id2spk: dict[int, str] = {v: k for k, v in self.spk2id.items()}
@@ -128,8 +166,32 @@ class TTSModel:
         self.net_g: Union[SynthesizerTrn, SynthesizerTrnJPExtra, None] = None
         self.null_model_params: Optional[dict[int, NullModelParam]] = None
 
-        # onnx_session は ONNX 推論時のみ遅延初期化される
+        # onnx_session / onnx_engine は ONNX 推論時のみ遅延初期化される
         self.onnx_session: Optional[onnxruntime.InferenceSession] = None
+        self.onnx_engine: Optional[OnnxSynthesisEngine] = None
+
+        # reuse_raw_audio=True で合成した、ピッチ・抑揚の調整前の音声
+        self.__raw_audio_cache: OrderedDict[tuple[Any, ...], NDArray[Any]] = (
+            OrderedDict()
+        )
+        self.__raw_audio_lock = threading.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        """
+        音声合成モデルがデバイスにロードされているかどうか。
+        """
+        return self.net_g is not None or self.onnx_session is not None
+
+    @property
+    def model_size(self) -> int:
+        """
+        ロード時に消費するメモリ量の目安 (モデルファイルのバイト数)。
+        """
+        try:
+            return self.model_path.stat().st_size
+        except OSError:
+            return 0
 
     def load(self) -> None:
         """
@@ -148,6 +210,10 @@ class TTSModel:
                 version=self.hyper_parameters.version,
                 device=self.device,
                 hps=self.hyper_parameters,
+                for_inference=self.optimize_for_inference,
+                # ヌルモデルは weight_g / weight_v 単位でマージするため、マージ後に畳み込む
+                # ヌルモデルがない場合は畳み込んだ重みをファイルからメモリマップし、合成ワーカー間で共有する
+                folded=self.optimize_for_inference and self.null_model_params is None,
             )
             logger.info(
                 f'Model loaded successfully from {self.model_path} to "{self.device}" device ({time.time() - start_time:.2f}s)'
@@ -155,6 +221,7 @@ class TTSModel:
 
             # ここからはヌルモデルのロード用パラメータが指定されている場合のみ
             if self.null_model_params is None:
+                self.__optimize_net_g(fold=False)
                 return
 
             # 推論対象のモデルの重みとヌルモデルの重みをマージ
@@ -165,6 +232,7 @@ class TTSModel:
                     version=self.hyper_parameters.version,
                     device=self.device,
                     hps=self.hyper_parameters,
+                    for_inference=self.optimize_for_inference,
                 )
                 # 愚直。もっと上手い方法ありそう
                 params = zip(
@@ -196,9 +264,13 @@ class TTSModel:
             logger.info(
                 f"Null models merged successfully ({time.time() - start_time:.2f}s)"
             )
+            # weight norm の畳み込みはヌルモデルのマージ後に行う
+            self.__optimize_net_g()
 
         # ONNX 推論時
         else:
+            from style_bert_vits2.models.infer_onnx import OnnxSynthesisEngine
+
             # 推論時に一番優先される ExecutionProvider の名前を取得
             assert len(self.onnx_providers) > 0
             first_provider_name = (
@@ -219,6 +291,11 @@ class TTSModel:
             ## 本来は log_severity_level = 3 だけで効くはずだが、なぜか CUDA 系のログが抑制できないので set_default_logger_severity() も呼び出している
             sess_options.log_severity_level = 3
             onnxruntime.set_default_logger_severity(3)
+            ## スレッド数が指定されている場合のみ設定する (0 のときは ONNX Runtime が物理コア数から決める)
+            if self.onnx_intra_op_num_threads > 0:
+                sess_options.intra_op_num_threads = self.onnx_intra_op_num_threads
+            if self.onnx_inter_op_num_threads > 0:
+                sess_options.inter_op_num_threads = self.onnx_inter_op_num_threads
 
             # ONNX モデルをロードし、推論セッションを初期化
             self.onnx_session = onnxruntime.InferenceSession(
@@ -226,10 +303,59 @@ class TTSModel:
                 sess_options=sess_options,
                 providers=self.onnx_providers,
             )
+            # 入力バッファと IOBinding を使い回す推論エンジンを初期化
+            self.onnx_engine = OnnxSynthesisEngine(
+                self.onnx_session, self.onnx_providers, self.hyper_parameters
+            )
             logger.info(
                 f"Model loaded successfully from {self.model_path} to {self.onnx_session.get_providers()[0]} ({time.time() - start_time:.2f}s)"
             )
 
+    def __optimize_net_g(self, fold: bool = True) -> None:
+        """
+        ロードした PyTorch モデルを推論向けに最適化する。
+
+        Args:
+            fold (bool): weight norm を畳み込むかどうか (get_net_g() で畳み込み済みの場合は False)
+        """
+
+        from style_bert_vits2.models.infer import (
+            fold_weight_norm,
+            is_cpu_bf16_supported,
+        )
+
+        assert self.net_g is not None
+        if self.optimize_for_inference and fold:
+            fold_weight_norm(self.net_g)
+
+        self.__bf16_enabled = False
+        if self.use_bf16:
+            if self.device != "cpu":
+                logger.warning(
+                    "bfloat16 inference is only supported on CPU, so disabled"
+                )
+            elif not is_cpu_bf16_supported():
+                logger.warning("This CPU does not support bfloat16, so disabled")
+            else:
+                self.__bf16_enabled = True
+
+    @contextmanager
+    def __inference_context(self) -> Iterator[None]:
+        """
+        PyTorch 推論時の勾配計算の無効化と、bfloat16 の自動キャストを行うコンテキスト。
+        bfloat16 では重みは float32 のまま保持し、autocast により畳み込みや行列積などの演算のみを bfloat16 で計算する
+        (正規化や softmax など精度が必要な演算は float32 で計算される)。
+        """
+
+        import torch
+
+        with torch.inference_mode() if self.optimize_for_inference else torch.no_grad():
+            if self.__bf16_enabled:
+                with torch.autocast(device_type="cpu", dtype=torch.bfloat16):
+                    yield
+            else:
+                yield
+
     def unload(self) -> None:
         """
         音声合成モデルをデバイスからアンロードする。
@@ -251,6 +377,8 @@ class TTSModel:
 
         # ONNX 推論時
         if self.onnx_session is not None:
+            # 推論エンジンも推論セッションを参照しているため、先に破棄する
+            self.onnx_engine = None
             del self.onnx_session
             self.onnx_session = None
 
@@ -278,6 +406,7 @@ class TTSModel:
     ) -> NDArray[Any]:
         """
         音声からスタイルベクトルを推論する。
+        推論結果は音声ファイルの内容ごとにキャッシュされ、同じ音声ファイルでは推論を省略する。
 
         Args:
             audio_path (str): 音声ファイルのパス
@@ -286,6 +415,51 @@ class TTSModel:
             NDArray[Any]: スタイルベクトル
         """
 
+        reference_id = self.register_reference_audio(audio_path)
+        return self.get_style_vector_from_reference_id(reference_id, weight)
+
+    def register_reference_audio(self, audio_path: Union[str, Path]) -> str:
+        """
+        音声からスタイルベクトルを推論して登録し、参照音声の ID を返す。
+        登録した参照音声は、infer() の reference_audio_id に ID を指定して使える。
+        既に登録されている音声ファイルの場合は推論を省略する。
+
+        Args:
+            audio_path (Union[str, Path]): 音声ファイルのパス
+
+        Returns:
+            str: 参照音声の ID (音声ファイルの内容の SHA-256)
+        """
+
+        reference_id = get_reference_audio_id(audio_path)
+        if reference_id not in self.reference_style_cache:
+            self.reference_style_cache.add(
+                reference_id, self.__infer_style_vector(audio_path)
+            )
+        return reference_id
+
+    def get_style_vector_from_reference_id(
+        self, reference_id: str, weight: float = 1.0
+    ) -> NDArray[Any]:
+        """
+        登録済みの参照音声のスタイルベクトルを取得する。
+
+        Args:
+            reference_id (str): register_reference_audio() が返した参照音声の ID
+            weight (float, optional): スタイルベクトルの重み. Defaults to 1.0.
+
+        Returns:
+            NDArray[Any]: スタイルベクトル
+        """
+
+        xvec = self.reference_style_cache.get(reference_id)
+        if xvec is None:
+            raise ValueError(f"Reference audio {reference_id} is not registered")
+        mean = self.style_vectors[0]
+        xvec = mean + (xvec - mean) * weight
+        return xvec
+
+    def __infer_style_vector(self, audio_path: Union[str, Path]) -> NDArray[Any]:
         if self.style_vector_inference is None:
 
             # pyannote.audio は scikit-learn などの大量の重量級ライブラリに依存しているため、
@@ -301,18 +475,13 @@ class TTSModel:
             import torch
 
             self.style_vector_inference = pyannote.audio.Inference(
-                model=pyannote.audio.Model.from_pretrained(
-                    "pyannote/wespeaker-voxceleb-resnet34-LM"
-                ),
+                model=pyannote.audio.Model.from_pretrained(STYLE_EMBEDDING_MODEL),
                 window="whole",
             )
             self.style_vector_inference.to(torch.device(self.device))
 
         # 音声からスタイルベクトルを推論
-        xvec = self.style_vector_inference(audio_path)
-        mean = self.style_vectors[0]
-        xvec = mean + (xvec - mean) * weight
-        return xvec
+        return self.style_vector_inference(str(audio_path))
 
     @staticmethod
     def convert_to_16_bit_wav(data: NDArray[Any]) -> NDArray[Any]:
@@ -377,6 +546,9 @@ class TTSModel:
         intonation_scale: float = 1.0,
         null_model_params: Optional[dict[int, NullModelParam]] = None,
         force_reload_model: bool = False,
+        f0_method: F0Method = "harvest",
+        reuse_raw_audio: bool = False,
+        reference_audio_id: Optional[str] = None,
     ) -> tuple[int, NDArray[Any]]:
         """
         テキストから音声を合成する。
@@ -403,6 +575,10 @@ class TTSModel:
             intonation_scale (float, optional): 抑揚の平均からの変化幅 (1.0 から変更すると若干音質が低下する). Defaults to 1.0.
             null_model_params (Optional[dict[int, NullModelParam]], optional): 推論時に使用するヌルモデルの情報。ONNX 推論では無視される。
             force_reload_model (bool, optional): モデルを強制的に再ロードするかどうか. Defaults to False.
+            f0_method (F0Method, optional): ピッチ・抑揚の調整時に f0 の推定に使うアルゴリズム ("dio" は高速だが推定を誤りやすい). Defaults to "harvest".
+            reuse_raw_audio (bool, optional): ピッチ・抑揚以外の引数が同じ直近の呼び出しで合成した音声を再利用するかどうか。
+                エディターでピッチ・抑揚だけを繰り返し変える場合に、音声合成と WORLD による分析を省略できる (同じ引数では毎回同じ音声になる). Defaults to False.
+            reference_audio_id (Optional[str], optional): register_reference_audio() で登録した参照音声の ID (reference_audio_path が優先される). Defaults to None.
         Returns:
             tuple[int, NDArray[Any]]: サンプリングレートと音声データ (16bit PCM)
         """
@@ -414,23 +590,63 @@ class TTSModel:
             )
         if reference_audio_path == "":
             reference_audio_path = None
+        if reference_audio_id == "":
+            reference_audio_id = None
         if assist_text == "" or not use_assist_text:
             assist_text = None
 
+        # ピッチ・抑揚の調整前の音声を再利用できる場合は、音声合成を省略する
+        ## モデルを読み込み直す場合は、以前の重みで合成した音声を破棄する
+        if force_reload_model:
+            with self.__raw_audio_lock:
+                self.__raw_audio_cache.clear()
+        raw_audio_key: Optional[tuple[Any, ...]] = None
+        if reuse_raw_audio and null_model_params is None and not force_reload_model:
+            raw_audio_key = (
+                text,
+                language,
+                speaker_id,
+                reference_audio_path,
+                reference_audio_id,
+                sdp_ratio,
+                noise,
+                noise_w,
+                length,
+                line_split,
+                split_interval,
+                assist_text,
+                assist_text_weight,
+                style,
+                style_weight,
+                tuple(given_phone) if given_phone is not None else None,
+                tuple(given_tone) if given_tone is not None else None,
+            )
+            with self.__raw_audio_lock:
+                raw_audio = self.__raw_audio_cache.get(raw_audio_key)
+                if raw_audio is not None:
+                    self.__raw_audio_cache.move_to_end(raw_audio_key)
+            if raw_audio is not None:
+                logger.info("Reusing the audio data generated with the same parameters")
+                return self.__postprocess_audio(
+                    raw_audio, pitch_scale, intonation_scale, f0_method
+                )
+
         # スタイルベクトルを取得
-        if reference_audio_path is None:
-            style_id = self.style2id[style]
-            style_vector = self.get_style_vector(style_id, style_weight)
-        else:
+        if reference_audio_path is not None:
             style_vector = self.get_style_vector_from_audio(
                 reference_audio_path, style_weight
             )
+        elif reference_audio_id is not None:
+            style_vector = self.get_style_vector_from_reference_id(
+                reference_audio_id, style_weight
+            )
+        else:
+            style_id = self.style2id[style]
+            style_vector = self.get_style_vector(style_id, style_weight)
 
         # PyTorch 推論時
         start_time = time.time()
         if not self.is_onnx_model:
-            import torch
-
             from style_bert_vits2.models.infer import infer
 
             if null_model_params is not None:
@@ -449,7 +665,7 @@ class TTSModel:
 
             # 通常のテキストから音声を生成
             if not line_split:
-                with torch.no_grad():
+                with self.__inference_context():
                     audio = infer(
                         text=text,
                         sdp_ratio=sdp_ratio,
@@ -470,47 +686,43 @@ class TTSModel:
 
             # 改行ごとに分割して音声を生成
             else:
+                from style_bert_vits2.models.infer import infer_multi
+
+                # BERT 特徴量は全ての行についてまとめて抽出する
                 texts = [t for t in text.split("\n") if t != ""]
-                audios = []
-                with torch.no_grad():
-                    for i, t in enumerate(texts):
-                        audios.append(
-                            infer(
-                                text=t,
-                                sdp_ratio=sdp_ratio,
-                                noise_scale=noise,
-                                noise_scale_w=noise_w,
-                                length_scale=length,
-                                sid=speaker_id,
-                                language=language,
-                                hps=self.hyper_parameters,
-                                net_g=self.net_g,
-                                device=self.device,
-                                assist_text=assist_text,
-                                assist_text_weight=assist_text_weight,
-                                style_vec=style_vector,
-                            )
-                        )
-                        if i != len(texts) - 1:
-                            audios.append(np.zeros(int(44100 * split_interval)))
-                    audio = np.concatenate(audios)
+                with self.__inference_context():
+                    line_audios = infer_multi(
+                        texts=texts,
+                        sdp_ratio=sdp_ratio,
+                        noise_scale=noise,
+                        noise_scale_w=noise_w,
+                        length_scale=length,
+                        sid=speaker_id,
+                        language=language,
+                        hps=self.hyper_parameters,
+                        net_g=self.net_g,
+                        device=self.device,
+                        assist_text=assist_text,
+                        assist_text_weight=assist_text_weight,
+                        style_vec=style_vector,
+                    )
+                audio = self.__join_lines(line_audios, split_interval)
 
         # ONNX 推論時
         else:
-            from style_bert_vits2.models.infer_onnx import infer_onnx
-
             # force_reload_model が True のとき、メモリ上に保持されているモデルを破棄する
             if force_reload_model is True:
+                self.onnx_engine = None
                 self.onnx_session = None
 
             # モデルがロードされていない場合はロードする
-            if self.onnx_session is None:
+            if self.onnx_session is None or self.onnx_engine is None:
                 self.load()
-            assert self.onnx_session is not None
+            assert self.onnx_engine is not None
 
             # 通常のテキストから音声を生成
             if not line_split:
-                audio = infer_onnx(
+                audio = self.onnx_engine.infer(
                     text=text,
                     sdp_ratio=sdp_ratio,
                     noise_scale=noise,
@@ -518,9 +730,6 @@ class TTSModel:
                     length_scale=length,
                     sid=speaker_id,
                     language=language,
-                    hps=self.hyper_parameters,
-                    onnx_session=self.onnx_session,
-                    onnx_providers=self.onnx_providers,
                     assist_text=assist_text,
                     assist_text_weight=assist_text_weight,
                     style_vec=style_vector,
@@ -530,44 +739,213 @@ class TTSModel:
 
             # 改行ごとに分割して音声を生成
             else:
+                # BERT 特徴量は全ての行についてまとめて抽出する
                 texts = [t for t in text.split("\n") if t != ""]
-                audios = []
-                for i, t in enumerate(texts):
-                    audios.append(
-                        infer_onnx(
-                            text=t,
-                            sdp_ratio=sdp_ratio,
-                            noise_scale=noise,
-                            noise_scale_w=noise_w,
-                            length_scale=length,
-                            sid=speaker_id,
-                            language=language,
-                            hps=self.hyper_parameters,
-                            onnx_session=self.onnx_session,
-                            onnx_providers=self.onnx_providers,
-                            assist_text=assist_text,
-                            assist_text_weight=assist_text_weight,
-                            style_vec=style_vector,
-                        )
-                    )
-                    if i != len(texts) - 1:
-                        audios.append(np.zeros(int(44100 * split_interval)))
-                audio = np.concatenate(audios)
+                line_audios = self.onnx_engine.infer_multi(
+                    texts=texts,
+                    sdp_ratio=sdp_ratio,
+                    noise_scale=noise,
+                    noise_scale_w=noise_w,
+                    length_scale=length,
+                    sid=speaker_id,
+                    language=language,
+                    assist_text=assist_text,
+                    assist_text_weight=assist_text_weight,
+                    style_vec=style_vector,
+                )
+                audio = self.__join_lines(line_audios, split_interval)
 
         logger.info(
             f"Audio data generated successfully ({time.time() - start_time:.2f}s)"
         )
 
+        if raw_audio_key is not None:
+            with self.__raw_audio_lock:
+                self.__raw_audio_cache[raw_audio_key] = audio
+                while len(self.__raw_audio_cache) > RAW_AUDIO_CACHE_SIZE:
+                    self.__raw_audio_cache.popitem(last=False)
+        return self.__postprocess_audio(audio, pitch_scale, intonation_scale, f0_method)
+
+    @staticmethod
+    def __join_lines(
+        line_audios: list[NDArray[Any]], split_interval: float
+    ) -> NDArray[Any]:
+        # 行ごとの音声の間に split_interval 秒の無音を挟んで連結する
+        audios = []
+        for i, line_audio in enumerate(line_audios):
+            audios.append(line_audio)
+            if i != len(line_audios) - 1:
+                audios.append(np.zeros(int(44100 * split_interval)))
+        return np.concatenate(audios)
+
+    def __postprocess_audio(
+        self,
+        audio: NDArray[Any],
+        pitch_scale: float,
+        intonation_scale: float,
+        f0_method: F0Method,
+    ) -> tuple[int, NDArray[Any]]:
         if not (pitch_scale == 1.0 and intonation_scale == 1.0):
             _, audio = adjust_voice(
                 fs=self.hyper_parameters.data.sampling_rate,
                 wave=audio,
                 pitch_scale=pitch_scale,
                 intonation_scale=intonation_scale,
+                f0_method=f0_method,
             )
         audio = self.convert_to_16_bit_wav(audio)
         return (self.hyper_parameters.data.sampling_rate, audio)
 
+    def infer_batch(
+        self,
+        texts: list[str],
+        language: Languages = Languages.JP,
+        speaker_ids: Optional[list[int]] = None,
+        styles: Optional[list[str]] = None,
+        style_weights: Optional[list[float]] = None,
+        assist_texts: Optional[list[Optional[str]]] = None,
+        assist_text_weight: float = DEFAULT_ASSIST_TEXT_WEIGHT,
+        sdp_ratio: float = DEFAULT_SDP_RATIO,
+        noise: float = DEFAULT_NOISE,
+        noise_w: float = DEFAULT_NOISEW,
+        length: float = DEFAULT_LENGTH,
+        given_tones: Optional[list[Optional[list[int]]]] = None,
+        pitch_scales: Optional[list[float]] = None,
+        intonation_scales: Optional[list[float]] = None,
+        f0_method: F0Method = "harvest",
+    ) -> list[tuple[int, NDArray[Any]]]:
+        """
+        複数のテキストから音声をまとめて合成する。
+        PyTorch 推論時はテキストをパディングして 1 つのバッチとして推論し、ONNX 推論時は 1 件ずつ infer() を呼び出す。
+        話者・スタイル・補助テキスト・アクセント・ピッチ・抑揚はテキストごとに、それ以外のパラメータはバッチ全体で共通に指定する。
+
+        Args:
+            texts (list[str]): 読み上げるテキストのリスト (改行による分割は行わない)
+            language (Languages, optional): 言語. Defaults to Languages.JP.
+            speaker_ids (Optional[list[int]], optional): テキストごとの話者 ID. Defaults to None (すべて 0).
+            styles (Optional[list[str]], optional): テキストごとの音声スタイル. Defaults to None (すべて DEFAULT_STYLE).
+            style_weights (Optional[list[float]], optional): テキストごとの音声スタイルの強さ. Defaults to None (すべて DEFAULT_STYLE_WEIGHT).
+            assist_texts (Optional[list[Optional[str]]], optional): テキストごとの感情表現の補助テキスト. Defaults to None.
+            assist_text_weight (float, optional): 感情表現の補助テキストを適用する強さ. Defaults to DEFAULT_ASSIST_TEXT_WEIGHT.
+            sdp_ratio (float, optional): DP と SDP の混合比. Defaults to DEFAULT_SDP_RATIO.
+            noise (float, optional): DP に与えられるノイズ. Defaults to DEFAULT_NOISE.
+            noise_w (float, optional): SDP に与えられるノイズ. Defaults to DEFAULT_NOISEW.
+            length (float, optional): 生成音声の長さ（話速）のパラメータ. Defaults to DEFAULT_LENGTH.
+            given_tones (Optional[list[Optional[list[int]]]], optional): テキストごとのアクセントのトーンのリスト. Defaults to None (すべて指定なし).
+            pitch_scales (Optional[list[float]], optional): テキストごとのピッチの高さ. Defaults to None (すべて 1.0).
+            intonation_scales (Optional[list[float]], optional): テキストごとの抑揚の平均からの変化幅. Defaults to None (すべて 1.0).
+            f0_method (F0Method, optional): ピッチ・抑揚の調整時に f0 の推定に使うアルゴリズム. Defaults to "harvest".
+        Returns:
+            list[tuple[int, NDArray[Any]]]: テキストごとのサンプリングレートと音声データ (16bit PCM)
+        """
+
+        num_texts = len(texts)
+        if speaker_ids is None:
+            speaker_ids = [0] * num_texts
+        if styles is None:
+            styles = [DEFAULT_STYLE] * num_texts
+        if style_weights is None:
+            style_weights = [DEFAULT_STYLE_WEIGHT] * num_texts
+        if assist_texts is None:
+            assist_texts = [None] * num_texts
+        assist_texts = [t if t != "" else None for t in assist_texts]
+        if given_tones is None:
+            given_tones = [None] * num_texts
+        if pitch_scales is None:
+            pitch_scales = [1.0] * num_texts
+        if intonation_scales is None:
+            intonation_scales = [1.0] * num_texts
+
+        # ONNX 推論時は 1 件ずつ推論する
+        if self.is_onnx_model:
+            return [
+                self.infer(
+                    text=text,
+                    language=language,
+                    speaker_id=speaker_id,
+                    sdp_ratio=sdp_ratio,
+                    noise=noise,
+                    noise_w=noise_w,
+                    length=length,
+                    line_split=False,
+                    assist_text=assist_text,
+                    assist_text_weight=assist_text_weight,
+                    use_assist_text=assist_text is not None,
+                    style=style,
+                    style_weight=style_weight,
+                    given_tone=given_tone,
+                    pitch_scale=pitch_scale,
+                    intonation_scale=intonation_scale,
+                    f0_method=f0_method,
+                )
+                for (
+                    text,
+                    speaker_id,
+                    style,
+                    style_weight,
+                    assist_text,
+                    given_tone,
+                    pitch_scale,
+                    intonation_scale,
+                ) in zip(
+                    texts,
+                    speaker_ids,
+                    styles,
+                    style_weights,
+                    assist_texts,
+                    given_tones,
+                    pitch_scales,
+                    intonation_scales,
+                )
+            ]
+
+        logger.info(f"Start generating audio data from {num_texts} texts in a batch")
+        if language != "JP" and self.hyper_parameters.version.endswith("JP-Extra"):
+            raise ValueError(
+                "The model is trained with JP-Extra, but the language is not JP"
+            )
+
+        from style_bert_vits2.models.infer import infer_batch
+
+        start_time = time.time()
+        # バッチ推論ではヌルモデルを使用しない
+        if self.net_g is None or self.null_model_params is not None:
+            self.null_model_params = None
+            self.load()
+        assert self.net_g is not None
+
+        style_vectors = [
+            self.get_style_vector(self.style2id[style], style_weight)
+            for style, style_weight in zip(styles, style_weights)
+        ]
+        with self.__inference_context():
+            audios = infer_batch(
+                texts=texts,
+                style_vecs=style_vectors,
+                sdp_ratio=sdp_ratio,
+                noise_scale=noise,
+                noise_scale_w=noise_w,
+                length_scale=length,
+                sids=speaker_ids,
+                language=language,
+                hps=self.hyper_parameters,
+                net_g=self.net_g,
+                device=self.device,
+                assist_texts=assist_texts,
+                assist_text_weight=assist_text_weight,
+                given_tones=given_tones,
+            )
+        logger.info(
+            f"Audio data generated successfully ({time.time() - start_time:.2f}s)"
+        )
+
+        return [
+            self.__postprocess_audio(audio, pitch_scale, intonation_scale, f0_method)
+            for audio, pitch_scale, intonation_scale in zip(
+                audios, pitch_scales, intonation_scales
+            )
+        ]
+
 
 class TTSModelInfo(BaseModel):
     name: str
@@ -576,10 +954,34 @@ class TTSModelInfo(BaseModel):
     speakers: list[str]
 
 
+class _ResidentModel:
+    """
+    TTSModelHolder が管理するロード済み (またはロード中) のモデルの状態。
+    """
+
+    def __init__(self, model: TTSModel) -> None:
+        self.model = model
+        # 推論中のリクエスト数 (0 より大きい間はアンロードしない)
+        self.in_use = 0
+        self.last_used = time.time()
+        # 同じモデルを複数のスレッドから同時にロードしないためのロック
+        self.load_lock = threading.Lock()
+        # ロード中のモデルのために確保したメモリ量 (ロードが終わるまで常駐中のモデルと同様に数える)
+        self.reserved_size = 0
+        # 推論が終わり次第アンロードするかどうか (get_model() で別のモデルに切り替えられた場合)
+        self.unload_when_idle = False
+
+
 class TTSModelHolder:
     """
     Style-Bert-VITS2 の音声合成モデルを管理するクラス。
     model_holder.models_info から指定されたディレクトリ内にある音声合成モデルの一覧を取得できる。
+
+    use_model() / load_model() でロードされたモデルはメモリ上に常駐し、
+    memory_budget を超える場合は使われていない期間が最も長いモデルから順にアンロードされる (LRU)。
+    pin_model() で固定されたモデルはアンロードされない。
+    常駐するモデルはモデルファイルのパスごとに 1 つで、get_model() は常駐中のインスタンスを返す。
+    memory_budget が None の場合、get_model() で別のモデルに切り替えると以前のモデルは使い終わり次第アンロードされる。
     """
 
     def __init__(
@@ -588,6 +990,9 @@ class TTSModelHolder:
         device: str,
         onnx_providers: Sequence[Union[str, tuple[str, dict[str, Any]]]],
         ignore_onnx: bool = False,
+        memory_budget: Optional[int] = None,
+        pinned_model_names: Optional[Sequence[str]] = None,
+        use_quantized_onnx: Optional[bool] = None,
     ) -> None:
         """
         Style-Bert-VITS2 の音声合成モデルを管理するクラスを初期化する。
@@ -610,12 +1015,26 @@ class TTSModelHolder:
             device (str): PyTorch 推論での音声合成時に利用するデバイス (cpu, cuda, mps など)
             onnx_providers (list[str]): ONNX 推論で利用する ExecutionProvider (CPUExecutionProvider, CUDAExecutionProvider など)
             ignore_onnx (bool, optional): ONNX モデルを除外するかどうか. Defaults to False.
+            memory_budget (Optional[int], optional): 常駐させるモデルの合計サイズの上限 (バイト)。None のときは無制限. Defaults to None.
+            pinned_model_names (Optional[Sequence[str]], optional): アンロードしないモデルの名前. Defaults to None.
+            use_quantized_onnx (Optional[bool], optional): INT8 量子化した ONNX モデル (*_int8.onnx) を量子化前のモデルの代わりに使うかどうか。
+                None のときは CPU 推論時のみ使う. Defaults to None.
         """
 
+        self.memory_budget: Optional[int] = memory_budget
+        self.pinned_model_names: set[str] = set(pinned_model_names or [])
+        # モデルファイルのパス -> 常駐するモデル
+        self.__resident_models: OrderedDict[Path, _ResidentModel] = OrderedDict()
+        self.__residency_lock = threading.Lock()
+        # ロード中のモデルの確保量が解放されるのを待つための条件変数
+        self.__residency_changed = threading.Condition(self.__residency_lock)
         self.root_dir: Path = model_root_dir
         self.device: str = device
         self.onnx_providers: Sequence[Union[str, tuple[str, dict[str, Any]]]] = onnx_providers  # fmt: skip
         self.ignore_onnx: bool = ignore_onnx
+        if use_quantized_onnx is None:
+            use_quantized_onnx = is_cpu_onnx_providers(onnx_providers)
+        self.use_quantized_onnx: bool = use_quantized_onnx
         self.model_files_dict: dict[str, list[Path]] = {}
         self.current_model: Optional[TTSModel] = None
         self.model_names: list[str] = []
@@ -632,6 +1051,14 @@ class TTSModelHolder:
         self.current_model = None
         self.models_info = []
 
+        # 一覧の更新後は新しい TTSModel が作られるため、推論中でないモデルはアンロードしておく
+        with self.__residency_lock:
+            for key, resident in list(self.__resident_models.items()):
+                if resident.in_use == 0:
+                    if resident.model.is_loaded:
+                        resident.model.unload()
+                    del self.__resident_models[key]
+
         model_dirs = sorted([d for d in self.root_dir.iterdir() if d.is_dir()])
         for model_dir in model_dirs:
             if model_dir.name.startswith("."):
@@ -650,6 +1077,7 @@ class TTSModelHolder:
                 key=lambda f: f.stat().st_mtime,
                 reverse=True,
             )
+            model_files = self.__select_quantized_onnx_models(model_files)
             if len(model_files) == 0:
                 logger.warning(f"No model files found in {model_dir}, so skip it")
                 continue
@@ -675,6 +1103,269 @@ class TTSModelHolder:
                 )
             )
 
+    def __select_quantized_onnx_models(self, model_files: list[Path]) -> list[Path]:
+        """
+        INT8 量子化した ONNX モデルは量子化前のモデルの別バージョンとして扱い、一覧には片方だけを残す。
+        use_quantized_onnx が True のときは量子化したモデルを、False のときは量子化前のモデルを残す。
+        量子化前のモデルが存在しない場合は、量子化したモデルをそのまま残す。
+        """
+
+        model_file_set = set(model_files)
+        # 量子化前のモデルが存在する、量子化したモデルのパス
+        quantized_files_with_original = {
+            get_quantized_onnx_model_path(model_file)
+            for model_file in model_files
+            if model_file.suffix == ".onnx"
+            and not is_quantized_onnx_model_path(model_file)
+        }
+        selected: list[Path] = []
+        for model_file in model_files:
+            if model_file in quantized_files_with_original:
+                if self.use_quantized_onnx:
+                    selected.append(model_file)
+            elif (
+                self.use_quantized_onnx
+                and get_quantized_onnx_model_path(model_file) in model_file_set
+            ):
+                # 量子化したモデルで置き換えられる
+                continue
+            else:
+                selected.append(model_file)
+        return selected
+
+    @staticmethod
+    def get_model_name(model: TTSModel) -> str:
+        """
+        モデルの名前 (model_root_dir 直下のディレクトリ名) を取得する。
+        """
+        return model.model_path.parent.name
+
+    def is_pinned(self, model: TTSModel) -> bool:
+        return self.get_model_name(model) in self.pinned_model_names
+
+    def pin_model(self, model_name: str) -> None:
+        """
+        指定された名前のモデルを、メモリ上限を超えてもアンロードされないよう固定する。
+        """
+        with self.__residency_lock:
+            self.pinned_model_names.add(model_name)
+
+    def unpin_model(self, model_name: str) -> None:
+        """
+        モデルの固定を解除する。
+        """
+        with self.__residency_lock:
+            self.pinned_model_names.discard(model_name)
+            self.__evict(0)
+
+    @property
+    def resident_memory_size(self) -> int:
+        """
+        ロード済みのモデルの合計サイズ (バイト)。
+        """
+        with self.__residency_lock:
+            return self.__get_resident_memory_size()
+
+    def __get_resident_memory_size(self) -> int:
+        # 同時に別のモデルをロードする際に上限を超えないよう、ロード中のモデルの確保量も含める
+        return sum(
+            (
+                resident.model.model_size
+                if resident.model.is_loaded
+                else resident.reserved_size
+            )
+            for resident in self.__resident_models.values()
+        )
+
+    def __evict(
+        self, required_size: int, keep: Optional[TTSModel] = None, warn: bool = True
+    ) -> None:
+        # 呼び出し元で __residency_lock を取得していること
+        if self.memory_budget is None:
+            return
+        current_size = self.__get_resident_memory_size()
+        # OrderedDict の先頭ほど最後に使われたのが古い
+        for resident in list(self.__resident_models.values()):
+            if current_size + required_size <= self.memory_budget:
+                return
+            model = resident.model
+            if (
+                model is keep
+                or not model.is_loaded
+                or resident.in_use > 0
+                or self.is_pinned(model)
+            ):
+                continue
+            logger.info(
+                f"Unloading {self.get_model_name(model)} to keep the memory budget (idle for {time.time() - resident.last_used:.0f}s)"
+            )
+            current_size -= model.model_size
+            model.unload()
+        if warn and current_size + required_size > self.memory_budget:
+            logger.warning(
+                f"Memory budget exceeded ({(current_size + required_size) / 1024**2:.0f}MB > {self.memory_budget / 1024**2:.0f}MB): all resident models are pinned or in use"
+            )
+
+    def __reserve(self, resident: _ResidentModel) -> None:
+        # 呼び出し元で __residency_lock を取得していること
+        required_size = resident.model.model_size
+        while True:
+            self.__evict(required_size, keep=resident.model, warn=False)
+            if (
+                self.memory_budget is None
+                or self.__get_resident_memory_size() + required_size
+                <= self.memory_budget
+                or not any(r.reserved_size > 0 for r in self.__resident_models.values())
+            ):
+                break
+            # 他のモデルのロードが終われば、そのモデルや他のモデルをアンロードできる可能性がある
+            self.__residency_changed.wait()
+        self.__evict(required_size, keep=resident.model)
+        resident.reserved_size = required_size
+
+    def acquire_model(self, model: TTSModel) -> None:
+        """
+        モデルを推論に使うことを宣言し、ロードされていなければロードする。
+        release_model() が呼ばれるまで、このモデルはアンロードされない。
+        """
+
+        key = model.model_path
+        with self.__residency_lock:
+            resident = self.__resident_models.get(key)
+            if resident is not None and resident.model is not model:
+                # 同じパスの別のインスタンス (refresh() の前に作られたものなど) は置き換える
+                ## 推論中の場合、古いインスタンスは参照されなくなった時点で解放される
+                if resident.in_use == 0 and resident.model.is_loaded:
+                    resident.model.unload()
+                resident = None
+            if resident is None:
+                resident = _ResidentModel(model)
+                self.__resident_models[key] = resident
+                # memory_budget が None の場合に常駐し続けるのは current_model のみとし、
+                # get_model() で切り替えられた後に使われたモデルは使い終わり次第アンロードする
+                resident.unload_when_idle = (
+                    self.memory_budget is None
+                    and self.current_model is not None
+                    and self.current_model is not model
+                    and not self.is_pinned(model)
+                )
+            resident.in_use += 1
+            resident.last_used = time.time()
+            self.__resident_models.move_to_end(key)
+
+        try:
+            with resident.load_lock:
+                if not model.is_loaded:
+                    # ロード前にメモリを確保しておき、同時に行われる他のモデルのロードが上限を超えないようにする
+                    with self.__residency_lock:
+                        self.__reserve(resident)
+                    try:
+                        model.load()
+                    finally:
+                        with self.__residency_lock:
+                            resident.reserved_size = 0
+                            self.__residency_changed.notify_all()
+        except Exception:
+            self.release_model(model)
+            raise
+
+    def release_model(self, model: TTSModel) -> None:
+        """
+        acquire_model() で宣言したモデルの使用を終了する。
+        """
+
+        with self.__residency_lock:
+            resident = self.__resident_models.get(model.model_path)
+            if resident is None or resident.model is not model:
+                return
+            resident.in_use = max(0, resident.in_use - 1)
+            resident.last_used = time.time()
+            if resident.unload_when_idle and resident.in_use == 0:
+                self.__drop(resident)
+            # 全モデルが使用中でメモリ上限を超えていた場合に備え、使い終わった時点で再度整理する
+            self.__evict(0)
+            self.__residency_changed.notify_all()
+
+    @contextmanager
+    def use_model(self, model: TTSModel) -> Iterator[TTSModel]:
+        """
+        with 文の間、モデルをロードした状態に保つ。
+        """
+
+        self.acquire_model(model)
+        try:
+            yield model
+        finally:
+            self.release_model(model)
+
+    def load_model(self, model: TTSModel) -> None:
+        """
+        モデルを事前にロードし、常駐させる (メモリ上限を超える場合は LRU でアンロードされうる)。
+        """
+
+        with self.use_model(model):
+            pass
+
+    def unload_model(self, model: TTSModel) -> bool:
+        """
+        モデルをアンロードする。推論中の場合はアンロードせずに False を返す。
+        """
+
+        with self.__residency_lock:
+            resident = self.__resident_models.get(model.model_path)
+            if resident is not None and resident.model is model:
+                if resident.in_use > 0:
+                    return False
+                del self.__resident_models[model.model_path]
+            if model.is_loaded:
+                model.unload()
+        return True
+
+    def __drop(self, resident: _ResidentModel) -> None:
+        # 呼び出し元で __residency_lock を取得していること
+        if self.__resident_models.get(resident.model.model_path) is resident:
+            del self.__resident_models[resident.model.model_path]
+        if resident.model.is_loaded:
+            resident.model.unload()
+
+    def __switch_current_model(self, model_name: str, model_path: Path) -> TTSModel:
+        """
+        current_model を指定されたモデルに切り替える。常駐中のモデルがあればそのインスタンスを使う。
+        memory_budget が None の場合は LRU でアンロードされないため、切り替え前のモデルは推論が終わり次第アンロードする。
+        """
+
+        previous = self.current_model
+        with self.__residency_lock:
+            resident = self.__resident_models.get(model_path)
+            if resident is not None:
+                resident.unload_when_idle = False
+                model = resident.model
+            else:
+                model = TTSModel(
+                    model_path=model_path,
+                    config_path=self.root_dir / model_name / "config.json",
+                    style_vec_path=self.root_dir / model_name / "style_vectors.npy",
+                    device=self.device,
+                    onnx_providers=self.onnx_providers,
+                )
+            if (
+                previous is not None
+                and previous is not model
+                and self.memory_budget is None
+                and not self.is_pinned(previous)
+            ):
+                previous_resident = self.__resident_models.get(previous.model_path)
+                if previous_resident is None or previous_resident.model is not previous:
+                    # use_model() を経ずにロードされたモデル (Gradio の推論タブなど)
+                    if previous.is_loaded:
+                        previous.unload()
+                elif previous_resident.in_use > 0:
+                    previous_resident.unload_when_idle = True
+                else:
+                    self.__drop(previous_resident)
+        self.current_model = model
+        return model
+
     def get_model(self, model_name: str, model_path_str: str) -> TTSModel:
         """
         指定された音声合成モデルのインスタンスを取得する。
@@ -694,13 +1385,7 @@ class TTSModelHolder:
         if model_path not in self.model_files_dict[model_name]:
             raise ValueError(f"Model file `{model_path}` is not found")
         if self.current_model is None or self.current_model.model_path != model_path:
-            self.current_model = TTSModel(
-                model_path=model_path,
-                config_path=self.root_dir / model_name / "config.json",
-                style_vec_path=self.root_dir / model_name / "style_vectors.npy",
-                device=self.device,
-                onnx_providers=self.onnx_providers,
-            )
+            return self.__switch_current_model(model_name, model_path)
 
         return self.current_model
 
@@ -724,15 +1409,9 @@ class TTSModelHolder:
                 gr.Button(interactive=True, value="音声合成"),
                 gr.Dropdown(choices=speakers, value=speakers[0]),
             )
-        self.current_model = TTSModel(
-            model_path=model_path,
-            config_path=self.root_dir / model_name / "config.json",
-            style_vec_path=self.root_dir / model_name / "style_vectors.npy",
-            device=self.device,
-            onnx_providers=self.onnx_providers,
-        )
-        speakers = list(self.current_model.spk2id.keys())
-        styles = list(self.current_model.style2id.keys())
+        model = self.__switch_current_model(model_name, model_path)
+        speakers = list(model.spk2id.keys())
+        styles = list(model.style2id.keys())
         return (
             gr.Dropdown(choices=styles, value=styles[0]),
             gr.Button(interactive=True, value="音声合成"),
@@ -1,9 +1,14 @@
 from collections.abc import Sequence
+from pathlib import Path
 from typing import Any, Union
 
 import onnxruntime
 
 
+# INT8 量子化した ONNX モデルのファイル名の接尾辞 (例: model.onnx -> model_int8.onnx)
+QUANTIZED_ONNX_MODEL_SUFFIX = "_int8"
+
+
 def torch_device_to_onnx_providers(
     device: str,
 ) -> Sequence[Union[str, tuple[str, dict[str, Any]]]]:
@@ -116,3 +121,57 @@ def get_onnx_device_options(
             run_options.add_run_config_entry("memory.enable_memory_arena_shrinkage", f"cpu:0;gpu:{device_id}")  # fmt: skip
 
     return device_type, device_id, run_options
+
+
+def is_cpu_onnx_providers(
+    onnx_providers: Sequence[Union[str, tuple[str, dict[str, Any]]]],
+) -> bool:
+    """
+    ExecutionProvider のリストの先頭 (推論時に一番優先されるもの) が CPUExecutionProvider かどうかを返す
+
+    Args:
+        onnx_providers (Sequence[Union[str, tuple[str, dict[str, Any]]]]): ExecutionProvider のリスト
+
+    Returns:
+        bool: CPU で推論する場合は True
+    """
+
+    if len(onnx_providers) == 0:
+        return False
+    first_provider = onnx_providers[0]
+    first_provider_name = (
+        first_provider if isinstance(first_provider, str) else first_provider[0]
+    )
+    return first_provider_name == "CPUExecutionProvider"
+
+
+def get_quantized_onnx_model_path(model_path: Path) -> Path:
+    """
+    ONNX モデルのパスから、INT8 量子化したモデルのパスを取得する
+
+    Args:
+        model_path (Path): 量子化前の ONNX モデルのパス
+
+    Returns:
+        Path: INT8 量子化した ONNX モデルのパス (存在するとは限らない)
+    """
+
+    return model_path.with_name(
+        f"{model_path.stem}{QUANTIZED_ONNX_MODEL_SUFFIX}{model_path.suffix}"
+    )
+
+
+def is_quantized_onnx_model_path(model_path: Path) -> bool:
+    """
+    INT8 量子化した ONNX モデルのパスかどうかを返す
+
+    Args:
+        model_path (Path): ONNX モデルのパス
+
+    Returns:
+        bool: INT8 量子化した ONNX モデルのパスなら True
+    """
+
+    return model_path.suffix == ".onnx" and model_path.stem.endswith(
+        QUANTIZED_ONNX_MODEL_SUFFIX
+    )
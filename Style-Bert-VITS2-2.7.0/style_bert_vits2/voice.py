@@ -1,25 +1,99 @@
-from typing import Any
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Literal
 
 import numpy as np
 import pyworld
 from numpy.typing import NDArray
 
 
+# f0 の推定に使うアルゴリズム
+## harvest: 高品質だが遅い / dio: stonemask で補正して使う。harvest より大幅に速いが、推定を誤りやすい
+F0Method = Literal["harvest", "dio"]
+
+# WORLD による分析結果を保持する音声の数
+## スペクトル包絡と非周期性指標は 10 秒の 44.1kHz の音声で合計 30MB 程度になる
+ANALYSIS_CACHE_SIZE = 4
+
+
+@dataclass
+class WorldFeatures:
+    """WORLD による音声の分析結果"""
+
+    # 基本周波数 (無声のフレームは 0)
+    f0: NDArray[np.float64]
+    # スペクトル包絡
+    sp: NDArray[np.float64]
+    # 非周期性指標
+    ap: NDArray[np.float64]
+
+
+__analysis_cache: OrderedDict[tuple[bytes, int, str], WorldFeatures] = OrderedDict()
+__analysis_cache_lock = threading.Lock()
+
+
+def analyze_voice(
+    fs: int, wave: NDArray[Any], f0_method: F0Method = "harvest"
+) -> WorldFeatures:
+    """
+    WORLD で音声を分析し、f0・スペクトル包絡・非周期性指標を返す。
+    分析結果は音声データの内容ごとにキャッシュされ、同じ音声に対して再度呼び出された場合は分析を省略する。
+
+    Args:
+        fs (int): 音声のサンプリング周波数
+        wave (NDArray[Any]): 音声データ
+        f0_method (F0Method, optional): f0 の推定に使うアルゴリズム. Defaults to "harvest".
+
+    Returns:
+        WorldFeatures: 分析結果 (呼び出し側で変更してはならない)
+    """
+
+    wave = np.ascontiguousarray(wave, dtype=np.double)
+    key = (hashlib.blake2b(wave.tobytes(), digest_size=16).digest(), fs, f0_method)
+    with __analysis_cache_lock:
+        features = __analysis_cache.get(key)
+        if features is not None:
+            __analysis_cache.move_to_end(key)
+            return features
+
+    if f0_method == "dio":
+        f0, t = pyworld.dio(wave, fs)
+        f0 = pyworld.stonemask(wave, f0, t, fs)
+    else:
+        f0, t = pyworld.harvest(wave, fs)
+    features = WorldFeatures(
+        f0=f0,
+        sp=pyworld.cheaptrick(wave, f0, t, fs),
+        ap=pyworld.d4c(wave, f0, t, fs),
+    )
+
+    with __analysis_cache_lock:
+        __analysis_cache[key] = features
+        while len(__analysis_cache) > ANALYSIS_CACHE_SIZE:
+            __analysis_cache.popitem(last=False)
+    return features
+
+
 def adjust_voice(
     fs: int,
     wave: NDArray[Any],
     pitch_scale: float = 1.0,
     intonation_scale: float = 1.0,
+    f0_method: F0Method = "harvest",
 ) -> tuple[int, NDArray[Any]]:
     """
     音声のピッチと抑揚を調整する。
     変更すると若干音質が劣化するので、どちらも初期値のままならそのまま返す。
+    WORLD による分析結果はキャッシュされるため、同じ音声に対してピッチと抑揚だけを変えて繰り返し呼び出す場合は、2 回目以降は再合成のみが行われる。
 
     Args:
         fs (int): 音声のサンプリング周波数
         wave (NDArray[Any]): 音声データ
         pitch_scale (float, optional): ピッチの高さ. Defaults to 1.0.
         intonation_scale (float, optional): 抑揚の平均からの変更比率. Defaults to 1.0.
+        f0_method (F0Method, optional): f0 の推定に使うアルゴリズム. Defaults to "harvest".
 
     Returns:
         tuple[int, NDArray[Any]]: 調整後の音声データのサンプリング周波数と音声データ
@@ -31,22 +105,19 @@ def adjust_voice(
 
     # pyworld で f0 を加工して合成
     # pyworld よりもよいのがあるかもしれないが……
+    features = analyze_voice(fs, wave, f0_method)
 
-    wave = wave.astype(np.double)
-
-    # 質が高そうだしとりあえずharvestにしておく
-    f0, t = pyworld.harvest(wave, fs)
-
-    sp = pyworld.cheaptrick(wave, f0, t, fs)
-    ap = pyworld.d4c(wave, f0, t, fs)
-
-    non_zero_f0 = [f for f in f0 if f != 0]
-    f0_mean = sum(non_zero_f0) / len(non_zero_f0)
-
-    for i, f in enumerate(f0):
-        if f == 0:
-            continue
-        f0[i] = pitch_scale * f0_mean + intonation_scale * (f - f0_mean)
+    # 有声のフレームのみ、平均を基準にピッチと抑揚を変える
+    voiced = features.f0 != 0
+    if not voiced.any():
+        # 有声のフレームがなければ変えるものがない
+        return fs, wave
+    f0_mean = features.f0[voiced].mean()
+    f0 = np.where(
+        voiced,
+        pitch_scale * f0_mean + intonation_scale * (features.f0 - f0_mean),
+        0.0,
+    )
 
-    wave = pyworld.synthesize(f0, sp, ap, fs)
+    wave = pyworld.synthesize(f0, features.sp, features.ap, fs)
     return fs, wave
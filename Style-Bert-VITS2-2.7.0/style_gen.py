@@ -1,6 +1,8 @@
 import argparse
-from concurrent.futures import ThreadPoolExecutor
-from typing import Any
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Optional
 
 import numpy as np
 import torch
@@ -9,6 +11,12 @@ from pyannote.audio import Inference, Model
 from tqdm import tqdm
 
 from config import get_config
+from feature_store import (
+    STYLE_VECTOR_DIM,
+    FeatureStore,
+    get_digest,
+    get_style_store_path,
+)
 from style_bert_vits2.logging import logger
 from style_bert_vits2.models.hyper_parameters import HyperParameters
 from style_bert_vits2.utils.stdout_wrapper import SAFE_STDOUT
@@ -22,6 +30,10 @@ device = torch.device(config.style_gen_config.device)
 inference.to(device)
 
 
+# バッチで推論したスタイルベクトルと 1 件ずつ推論したスタイルベクトルの差の許容値
+BATCH_DEVIATION_TOLERANCE = 1e-4
+
+
 class NaNValueError(ValueError):
     """カスタム例外クラス。NaN値が見つかった場合に使用されます。"""
 
@@ -46,13 +58,203 @@ def save_style_vector(wav_path: str):
     np.save(f"{wav_path}.npy", style_vec)  # `test.wav` -> `test.wav.npy`
 
 
-def process_line(line: str):
-    wav_path = line.split("|")[0]
+def load_fbank(wav_path: str) -> torch.Tensor:
+    """
+    音声ファイルを埋め込みモデルのサンプリングレートで読み込み、埋め込みモデルの入力となる fbank 特徴量を求める。
+    fbank 特徴量の平均の正規化はファイルごとに行う必要があるため、パディングする前に求める。
+
+    Returns:
+        torch.Tensor: (フレーム数, 次元数) の fbank 特徴量
+    """
+
     try:
-        save_style_vector(wav_path)
-        return line, None
-    except NaNValueError:
-        return line, "nan_error"
+        waveform, _ = model.audio(wav_path)
+        with torch.inference_mode():
+            return model.compute_fbank(waveform[None].to(device))[0]
+    except Exception as e:
+        print("\n")
+        logger.error(f"Error occurred with file: {wav_path}, Details:\n{e}\n")
+        raise
+
+
+def get_style_vectors_batch(fbanks: list[torch.Tensor]) -> list[NDArray[Any]]:
+    """
+    フレーム数が等しい複数の音声ファイルの fbank 特徴量をまとめ、埋め込みモデルで一度に推論する。
+    パディングが不要なため、1 件ずつ推論した場合 (get_style_vector()) と同じスタイルベクトルになる
+    (フレーム数が異なるとパディング部分が畳み込みの受容野にかかり、結果が変わるため受け付けない)。
+
+    Args:
+        fbanks (list[torch.Tensor]): load_fbank() で求めた、フレーム数が等しい fbank 特徴量のリスト
+
+    Returns:
+        list[NDArray[Any]]: スタイルベクトルのリスト
+    """
+
+    assert all(fbank.shape == fbanks[0].shape for fbank in fbanks)
+    with torch.inference_mode():
+        embeddings = model.resnet(torch.stack(fbanks))[1]
+    return list(embeddings.cpu().numpy())
+
+
+def check_batch_deviation(
+    fbanks: list[torch.Tensor], style_vecs: list[NDArray[Any]]
+) -> float:
+    """
+    バッチで推論したスタイルベクトルと、1 件ずつ推論したスタイルベクトルの差の絶対値の最大値を求める。
+    """
+
+    return max(
+        float(np.abs(get_style_vectors_batch([fbank])[0] - style_vec).max())
+        for fbank, style_vec in zip(fbanks, style_vecs)
+    )
+
+
+def get_wav_digest(wav_path: str) -> str:
+    # 音声ファイルが更新された場合はスタイルベクトルを計算し直す
+    stat = Path(wav_path).stat()
+    return get_digest(stat.st_mtime_ns, stat.st_size)
+
+
+def load_npy_if_fresh(wav_path: str) -> Optional[NDArray[Any]]:
+    # 以前に保存された、音声ファイルより新しい .npy があれば計算せずに使う
+    npy_path = Path(f"{wav_path}.npy")
+    try:
+        if npy_path.stat().st_mtime_ns < Path(wav_path).stat().st_mtime_ns:
+            return None
+        style_vec = np.load(npy_path)
+    except (OSError, ValueError):
+        return None
+    if style_vec.shape != (STYLE_VECTOR_DIM,):
+        return None
+    return style_vec
+
+
+def generate_style_vectors(
+    lines: list[str],
+    store: FeatureStore,
+    batch_size: int,
+    num_processes: int,
+    save_npy: bool,
+) -> list[tuple[str, Optional[str]]]:
+    """
+    書き起こしファイルの各行の音声ファイルのスタイルベクトルを計算してストアに追記する。
+    音声ファイルが更新されていなければ計算済みのスタイルベクトルはスキップし、残りは長さ順に並べ、
+    fbank 特徴量のフレーム数が等しい音声ファイルをバッチにまとめて推論する (パディングしないため 1 件ずつ推論した場合と同じ結果になる)。
+    音声ファイルの読み込みと fbank 特徴量の計算は num_processes 個のスレッドで並列に、数バッチ先まで先読みして行う。
+
+    Args:
+        lines (list[str]): 書き起こしファイルの行のリスト
+        store (FeatureStore): 書き込み可能なスタイルベクトルのストア
+        batch_size (int): 一度に推論する音声ファイルの数
+        num_processes (int): 音声ファイルを読み込むスレッド数
+        save_npy (bool): 音声ファイルごとの .npy も保存するかどうか
+
+    Returns:
+        list[tuple[str, Optional[str]]]: 各行と、エラー (NaN が含まれていた場合は "nan_error"、それ以外は None)
+    """
+
+    results: dict[str, Optional[str]] = {}
+    pending: list[tuple[str, str]] = []
+    for line in lines:
+        wav_path = line.split("|")[0]
+        digest = get_wav_digest(wav_path)
+        if store.is_current(wav_path, digest):
+            if save_npy and not Path(f"{wav_path}.npy").exists():
+                np.save(f"{wav_path}.npy", store.get(wav_path)[0])
+            results[line] = None
+            continue
+        style_vec = load_npy_if_fresh(wav_path)
+        if style_vec is not None and not np.isnan(style_vec).any():
+            store.append(wav_path, style_vec[None], digest)
+            results[line] = None
+            continue
+        pending.append((line, digest))
+    store.flush()
+
+    # フレーム数が等しい音声ファイルが連続するよう、音声ファイルの長さ順に並べてからバッチにまとめる
+    pending.sort(key=lambda x: Path(x[0].split("|")[0]).stat().st_size)
+    # 推論中も num_processes 個のスレッドが読み込み続けられるよう、数バッチ先まで読み込んでおく
+    prefetch = max(batch_size, num_processes) * 2
+    with ThreadPoolExecutor(max_workers=num_processes) as executor, tqdm(
+        total=len(pending), file=SAFE_STDOUT, dynamic_ncols=True
+    ) as pbar:
+        futures: deque[Future[torch.Tensor]] = deque()
+        next_index = 0
+        group: list[tuple[tuple[str, str], torch.Tensor]] = []
+        checked = batch_size <= 1
+
+        def run_group() -> None:
+            nonlocal checked, batch_size
+            if len(group) == 0:
+                return
+            fbanks = [fbank for _, fbank in group]
+            style_vecs = get_style_vectors_batch(fbanks)
+            if not checked and len(group) > 1:
+                # 環境によってはバッチでの推論結果が 1 件ずつの推論と一致しないことがあるため、最初のバッチで確認する
+                checked = True
+                deviation = check_batch_deviation(fbanks, style_vecs)
+                logger.info(f"Max deviation of batched style vectors: {deviation:.2e}")
+                if deviation > BATCH_DEVIATION_TOLERANCE:
+                    logger.warning(
+                        f"Batched style vectors deviate from per-file ones by {deviation:.2e}, so falling back to batch_size=1"
+                    )
+                    batch_size = 1
+                    style_vecs = [get_style_vectors_batch([f])[0] for f in fbanks]
+            for ((line, digest), _), style_vec in zip(group, style_vecs):
+                wav_path = line.split("|")[0]
+                # 値にNaNが含まれていると悪影響なのでチェックする
+                if np.isnan(style_vec).any():
+                    print("\n")
+                    logger.warning(f"NaN value found in style vector: {wav_path}")
+                    results[line] = "nan_error"
+                    continue
+                store.append(wav_path, style_vec[None], digest)
+                if save_npy:
+                    # `test.wav` -> `test.wav.npy`
+                    np.save(f"{wav_path}.npy", style_vec)
+                results[line] = None
+            store.flush()
+            pbar.update(len(group))
+            group.clear()
+
+        while next_index < len(pending) or futures:
+            while next_index < len(pending) and len(futures) < prefetch:
+                wav_path = pending[next_index][0].split("|")[0]
+                futures.append(executor.submit(load_fbank, wav_path))
+                next_index += 1
+            item = pending[next_index - len(futures)]
+            fbank = futures.popleft().result()
+            # フレーム数が変わるか、バッチが一杯になったらまとめて推論する
+            if group and (fbank.shape != group[0][1].shape or len(group) >= batch_size):
+                run_group()
+            group.append((item, fbank))
+        run_group()
+
+    return [(line, results[line]) for line in lines]
+
+
+def process_lines(
+    filelist_path: str, batch_size: int, num_processes: int, save_npy: bool
+) -> tuple[list[str], list[str]]:
+    with open(filelist_path, encoding="utf-8") as f:
+        lines = [line for line in f.readlines() if line.strip() != ""]
+    store = FeatureStore(
+        get_style_store_path(filelist_path),
+        dim=STYLE_VECTOR_DIM,
+        dtype="float32",
+        writable=True,
+    )
+    try:
+        results = generate_style_vectors(
+            lines, store, batch_size, num_processes, save_npy
+        )
+        # 書き起こしファイルから削除された音声ファイルのスタイルベクトルと、置き換えられた古い領域を取り除く
+        store.compact(line.split("|")[0] for line in lines)
+    finally:
+        store.close()
+    ok_lines = [line for line, error in results if error is None]
+    nan_lines = [line for line, error in results if error == "nan_error"]
+    return ok_lines, nan_lines
 
 
 if __name__ == "__main__":
@@ -63,63 +265,49 @@ if __name__ == "__main__":
     parser.add_argument(
         "--num_processes", type=int, default=config.style_gen_config.num_processes
     )
+    parser.add_argument(
+        "--batch_size", type=int, default=config.style_gen_config.batch_size
+    )
+    parser.add_argument(
+        "--save_npy",
+        action=argparse.BooleanOptionalAction,
+        default=config.style_gen_config.save_npy,
+        help="音声ファイルごとの .npy も保存する (スタイルベクトルの作成タブなどで使われる)",
+    )
     args, _ = parser.parse_known_args()
     config_path: str = args.config
     num_processes: int = args.num_processes
 
     hps = HyperParameters.load_from_json(config_path)
 
-    device = config.style_gen_config.device
-
-    training_lines: list[str] = []
-    with open(hps.data.training_files, encoding="utf-8") as f:
-        training_lines.extend(f.readlines())
-    with ThreadPoolExecutor(max_workers=num_processes) as executor:
-        training_results = list(
-            tqdm(
-                executor.map(process_line, training_lines),
-                total=len(training_lines),
-                file=SAFE_STDOUT,
-                dynamic_ncols=True,
-            )
-        )
-    ok_training_lines = [line for line, error in training_results if error is None]
-    nan_training_lines = [
-        line for line, error in training_results if error == "nan_error"
-    ]
+    ok_training_lines, nan_training_lines = process_lines(
+        hps.data.training_files, args.batch_size, num_processes, args.save_npy
+    )
     if nan_training_lines:
         nan_files = [line.split("|")[0] for line in nan_training_lines]
         logger.warning(
             f"Found NaN value in {len(nan_training_lines)} files: {nan_files}, so they will be deleted from training data."
         )
 
-    val_lines: list[str] = []
-    with open(hps.data.validation_files, encoding="utf-8") as f:
-        val_lines.extend(f.readlines())
-
-    with ThreadPoolExecutor(max_workers=num_processes) as executor:
-        val_results = list(
-            tqdm(
-                executor.map(process_line, val_lines),
-                total=len(val_lines),
-                file=SAFE_STDOUT,
-                dynamic_ncols=True,
-            )
-        )
-    ok_val_lines = [line for line, error in val_results if error is None]
-    nan_val_lines = [line for line, error in val_results if error == "nan_error"]
+    ok_val_lines, nan_val_lines = process_lines(
+        hps.data.validation_files, args.batch_size, num_processes, args.save_npy
+    )
     if nan_val_lines:
         nan_files = [line.split("|")[0] for line in nan_val_lines]
         logger.warning(
             f"Found NaN value in {len(nan_val_lines)} files: {nan_files}, so they will be deleted from validation data."
         )
 
-    with open(hps.data.training_files, "w", encoding="utf-8") as f:
-        f.writelines(ok_training_lines)
-
-    with open(hps.data.validation_files, "w", encoding="utf-8") as f:
-        f.writelines(ok_val_lines)
+    # bert_gen.py と並行して実行された場合に書き込み途中のファイルが読まれないよう、一時ファイルから置き換える
+    for filelist_path, ok_lines in (
+        (hps.data.training_files, ok_training_lines),
+        (hps.data.validation_files, ok_val_lines),
+    ):
+        tmp_path = Path(f"{filelist_path}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(ok_lines)
+        tmp_path.replace(filelist_path)
 
     ok_num = len(ok_training_lines) + len(ok_val_lines)
 
-    logger.info(f"Finished generating style vectors! total: {ok_num} npy files.")
+    logger.info(f"Finished generating style vectors! total: {ok_num} style vectors.")
@@ -0,0 +1,54 @@
+from pathlib import Path
+
+import numpy as np
+
+from feature_store import DATA_FILENAME, FeatureStore
+
+
+DIM = 4
+
+
+def make_feature(value: float, rows: int) -> np.ndarray:
+    return np.full((rows, DIM), value, dtype=np.float32)
+
+
+def test_compact_prunes_removed_keys_and_dead_rows(tmp_path: Path) -> None:
+    path = tmp_path / "train.style"
+    store = FeatureStore(path, dim=DIM, dtype="float32", writable=True)
+    for i in range(4):
+        store.append(f"{i}.wav", make_feature(i, 3), "a")
+    # 置き換えられた特徴量の 3 行と、書き起こしファイルから削除されたキーの 3 行が使われなくなる
+    store.append("0.wav", make_feature(10, 2), "b")
+    store.compact(["0.wav", "1.wav", "2.wav"])
+
+    assert len(store) == 3 and "3.wav" not in store
+    assert (path / DATA_FILENAME).stat().st_size == (2 + 3 + 3) * DIM * 4
+    # 書き直した後も追記でき、開き直しても同じ特徴量が読める
+    store.append("4.wav", make_feature(4, 1), "a")
+    store.close()
+    store = FeatureStore(path, dim=DIM, dtype="float32")
+    assert len(store) == 4 and "3.wav" not in store
+    assert store.is_current("0.wav", "b")
+    np.testing.assert_array_equal(store.get("0.wav"), make_feature(10, 2))
+    np.testing.assert_array_equal(store.get("2.wav"), make_feature(2, 3))
+    np.testing.assert_array_equal(store.get("4.wav"), make_feature(4, 1))
+
+
+def test_compact_keeps_data_below_dead_row_ratio(tmp_path: Path) -> None:
+    path = tmp_path / "train.bert"
+    store = FeatureStore(path, dim=DIM, dtype="float32", writable=True)
+    for i in range(10):
+        store.append(f"{i}.wav", make_feature(i, 1), "a")
+    store.append("0.wav", make_feature(10, 1), "b")
+    store.compact([f"{i}.wav" for i in range(10)])
+    # 使われていない行が少なければデータファイルは書き直さない
+    assert (path / DATA_FILENAME).stat().st_size == 11 * DIM * 4
+    store.close()
+
+    # 削除されたキーはインデックスから取り除かれ、開き直しても現れない
+    store = FeatureStore(path, dim=DIM, dtype="float32", writable=True)
+    store.compact([f"{i}.wav" for i in range(9)])
+    store.close()
+    store = FeatureStore(path, dim=DIM, dtype="float32")
+    assert len(store) == 9 and "9.wav" not in store
+    np.testing.assert_array_equal(store.get("0.wav"), make_feature(10, 1))
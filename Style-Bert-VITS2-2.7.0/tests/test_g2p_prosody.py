@@ -0,0 +1,120 @@
+import random
+import re
+from typing import Any, Callable
+
+import pytest
+
+
+try:
+    import pyopenjtalk
+except Exception as e:
+    pytest.skip(f"pyopenjtalk is not available: {e}", allow_module_level=True)
+
+from style_bert_vits2.nlp.japanese import g2p
+
+
+# ランダムな文を構成する語句
+WORDS = [
+    "今日", "明日", "私", "あなた", "彼女", "先生", "学校", "東京", "音声合成", "機械学習",
+    "天気", "桜", "猫", "コーヒー", "テキスト", "技術", "言語", "構造", "モデル", "声",
+    "は", "が", "を", "に", "で", "と", "の", "から", "まで", "も", "って", "けど",
+    "行く", "行きました", "食べる", "食べたい", "見て", "聞いた", "話しましょう", "できる",
+    "思う", "しています", "生成します", "再現する", "解析し", "綺麗だ", "嬉しい", "悲しかった",
+    "とても", "少し", "本当に", "もっと", "すぐに", "ゆっくり", "えっ", "ああ", "ふーん", "うーん",
+    "、", "。", "！", "？", "…", "「", "」", "ー", "っ",
+]  # fmt: skip
+SAMPLE_TEXTS = [
+    "こんにちは。",
+    "こんにちは、初めまして。あなたの名前はなんていうの？",
+    "桜の樹の下には屍体が埋まっている！これは信じていいことなんだよ。",
+    "えっ、本当に？それならもっと早く教えてくれればよかったのに……。",
+    "音声合成は、機械学習を活用して、テキストから人の声を再現する技術です。この技術は、言語の構造を解析し、それに基づいて音声を生成します。",
+    "？",
+    "ああああああああああああああああああああああああ",
+]
+
+A1_PATTERN = re.compile(r"/A:([0-9\-]+)\+")
+A2_PATTERN = re.compile(r"\+(\d+)\+")
+A3_PATTERN = re.compile(r"\+(\d+)/")
+E3_PATTERN = re.compile(r"!(\d+)_")
+F1_PATTERN = re.compile(r"/F:(\d+)_")
+P3_PATTERN = re.compile(r"\-(.*?)\+")
+
+
+def reference_g2p_prosody(text: str, drop_unvoiced_vowels: bool = True) -> list[str]:
+    """特徴量ごとにラベルを正規表現で検索する、従来の __pyopenjtalk_g2p_prosody() の実装"""
+
+    def _numeric_feature_by_regex(pattern: re.Pattern[str], s: str) -> int:
+        match = pattern.search(s)
+        if match is None:
+            return -50
+        return int(match.group(1))
+
+    labels = pyopenjtalk.extract_fullcontext(text)
+    N = len(labels)
+
+    phones = []
+    for n in range(N):
+        lab_curr = labels[n]
+        p3 = P3_PATTERN.search(lab_curr).group(1)  # type: ignore
+        if drop_unvoiced_vowels and p3 in "AEIOU":
+            p3 = p3.lower()
+        if p3 == "sil":
+            assert n == 0 or n == N - 1
+            if n == 0:
+                phones.append("^")
+            elif n == N - 1:
+                e3 = _numeric_feature_by_regex(E3_PATTERN, lab_curr)
+                if e3 == 0:
+                    phones.append("$")
+                elif e3 == 1:
+                    phones.append("?")
+            continue
+        elif p3 == "pau":
+            phones.append("_")
+            continue
+        else:
+            phones.append(p3)
+        a1 = _numeric_feature_by_regex(A1_PATTERN, lab_curr)
+        a2 = _numeric_feature_by_regex(A2_PATTERN, lab_curr)
+        a3 = _numeric_feature_by_regex(A3_PATTERN, lab_curr)
+        f1 = _numeric_feature_by_regex(F1_PATTERN, lab_curr)
+        a2_next = _numeric_feature_by_regex(A2_PATTERN, labels[n + 1])
+        if a3 == 1 and a2_next == 1 and p3 in "aeiouAEIOUNcl":
+            phones.append("#")
+        elif a1 == 0 and a2_next == a2 + 1 and a2 != f1:
+            phones.append("]")
+        elif a2 == 1 and a2_next == 2:
+            phones.append("[")
+
+    return phones
+
+
+def run_g2p_prosody(func: Callable[..., list[str]], *args: Any) -> Any:
+    # 従来の実装で例外が発生する文では、同じ例外が発生することを確認する
+    try:
+        return func(*args)
+    except Exception as e:
+        return type(e)
+
+
+def random_sentence(rng: random.Random) -> str:
+    return "".join(rng.choice(WORDS) for _ in range(rng.randint(1, 30)))
+
+
+@pytest.mark.parametrize("text", SAMPLE_TEXTS)
+@pytest.mark.parametrize("drop_unvoiced_vowels", [True, False])
+def test_g2p_prosody_samples(text: str, drop_unvoiced_vowels: bool):
+    assert run_g2p_prosody(
+        g2p.__pyopenjtalk_g2p_prosody, text, drop_unvoiced_vowels
+    ) == run_g2p_prosody(reference_g2p_prosody, text, drop_unvoiced_vowels)
+
+
+def test_g2p_prosody_random_corpus():
+    # 一度の走査で特徴量を取り出しても結果が変わらないことを、乱数で生成した大量の文で確認する
+    rng = random.Random(0)
+    for _ in range(3000):
+        text = random_sentence(rng)
+        assert run_g2p_prosody(g2p.__pyopenjtalk_g2p_prosody, text) == run_g2p_prosody(
+            reference_g2p_prosody, text
+        ), text
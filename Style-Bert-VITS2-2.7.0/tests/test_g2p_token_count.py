@@ -0,0 +1,56 @@
+import random
+from typing import Any
+
+import pytest
+
+
+try:
+    from style_bert_vits2.constants import Languages
+    from style_bert_vits2.nlp import bert_models
+    from style_bert_vits2.nlp.japanese import g2p
+except Exception as e:
+    pytest.skip(f"g2p is not available: {e}", allow_module_level=True)
+
+
+# g2p() で単語ごとにトークン数を求める語句 (漢字・かな・英数字・全角文字・記号を含む)
+WORDS = [
+    "今日", "明日", "私", "あなた", "音声合成", "機械学習", "コーヒー", "テキスト", "ふーん", "うーん",
+    "は", "が", "を", "に", "って", "行きました", "食べたい", "話しましょう", "生成します", "綺麗だ",
+    "ABC", "abc", "Style-Bert-VITS2", "ＡＢＣ", "１２３", "123", "3.14", "ｶﾀｶﾅ", "ヴァイオリン", "〜",
+    "♪", "①", "𠮷野家", "髙橋", "ゔ", "ー", "っ",
+]  # fmt: skip
+
+
+def load_default_tokenizer() -> Any:
+    return bert_models.load_tokenizer(Languages.JP)
+
+
+def load_fast_tokenizer() -> Any:
+    # Fast トークナイザーでは、キャッシュにない単語をまとめてトークナイズする経路を通る
+    from transformers import PreTrainedTokenizerFast
+
+    tokenizer_file = (
+        bert_models.DEFAULT_BERT_MODEL_PATHS[Languages.JP] / "tokenizer.json"
+    )
+    return PreTrainedTokenizerFast(tokenizer_file=str(tokenizer_file))
+
+
+@pytest.fixture(params=[load_default_tokenizer, load_fast_tokenizer])
+def tokenizer(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> Any:
+    try:
+        tokenizer = request.param()
+    except Exception as e:
+        pytest.skip(f"The JP BERT tokenizer is not available: {e}")
+    monkeypatch.setattr(bert_models, "load_tokenizer", lambda language: tokenizer)
+    return tokenizer
+
+
+def test_count_tokens_matches_tokenize(tokenizer: Any) -> None:
+    # 単語ごとに tokenize() した従来の結果と、キャッシュやまとめてのトークナイズを使った結果が一致することを確認する
+    count_tokens = getattr(g2p, "__count_tokens")
+    rng = random.Random(0)
+    for _ in range(20):
+        words = rng.choices(WORDS, k=rng.randint(1, 30))
+        expected = [len(tokenizer.tokenize(word)) for word in words]
+        assert count_tokens(words) == expected, words
+    assert count_tokens([]) == []
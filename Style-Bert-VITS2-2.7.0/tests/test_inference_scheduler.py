@@ -0,0 +1,121 @@
+import asyncio
+import threading
+from typing import Any
+
+import numpy as np
+import pytest
+
+from style_bert_vits2 import inference_scheduler
+from style_bert_vits2.inference_scheduler import (
+    InferenceCancelledError,
+    InferenceScheduler,
+    InferenceTimeoutError,
+    QueueFullError,
+)
+
+
+class FakeModel:
+    """TTSModel の代わりに、テキストの長さを音声データとして返すモデル"""
+
+    is_onnx_model = False
+
+    def __init__(self) -> None:
+        self.calls: list[list[str]] = []
+        # set() されるまで推論を止めておく
+        self.gate = threading.Event()
+        self.gate.set()
+        self.started = threading.Event()
+
+    def infer(self, text: str, **kwargs: Any) -> tuple[int, np.ndarray]:
+        return self.infer_batch([text])[0]
+
+    def infer_batch(self, texts: list[str], **kwargs: Any) -> list[Any]:
+        self.started.set()
+        self.gate.wait()
+        self.calls.append(texts)
+        return [(44100, np.array([len(text)])) for text in texts]
+
+
+async def wait_until_started(model: FakeModel) -> None:
+    await asyncio.get_running_loop().run_in_executor(None, model.started.wait)
+
+
+def test_requests_are_batched_by_batch_key() -> None:
+    async def main() -> None:
+        model = FakeModel()
+        scheduler = InferenceScheduler(max_batch_size=4, batch_window=0.1)
+        # sdp_ratio が異なるリクエストは同じバッチにまとめない
+        requests = [("a", 0.2), ("bb", 0.2), ("ccc", 0.5), ("dddd", 0.2)]
+        results = await asyncio.gather(
+            *(
+                scheduler.infer("model", model, text=text, sdp_ratio=sdp_ratio)
+                for text, sdp_ratio in requests
+            )
+        )
+        scheduler.shutdown()
+        assert model.calls == [["a", "bb", "dddd"], ["ccc"]]
+        assert [int(audio[0]) for _, audio in results] == [1, 2, 3, 4]
+
+    asyncio.run(main())
+
+
+def test_queue_full_error() -> None:
+    async def main() -> None:
+        model = FakeModel()
+        model.gate.clear()
+        scheduler = InferenceScheduler(max_batch_size=1, max_queue_size=1)
+        running = asyncio.create_task(scheduler.infer("model", model, text="a"))
+        await wait_until_started(model)
+        # 推論中のリクエストは数えず、待機中のリクエストが上限に達したら受け付けない
+        queued = asyncio.create_task(scheduler.infer("model", model, text="b"))
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth == 1
+        with pytest.raises(QueueFullError):
+            await scheduler.infer("model", model, text="c")
+        model.gate.set()
+        await asyncio.gather(running, queued)
+        scheduler.shutdown()
+        assert model.calls == [["a"], ["b"]]
+
+    asyncio.run(main())
+
+
+def test_inference_timeout_error() -> None:
+    async def main() -> None:
+        model = FakeModel()
+        model.gate.clear()
+        scheduler = InferenceScheduler(max_batch_size=1)
+        with pytest.raises(InferenceTimeoutError):
+            await scheduler.infer("model", model, timeout=0.05, text="a")
+        model.gate.set()
+        scheduler.shutdown()
+
+    asyncio.run(main())
+
+
+def test_request_is_cancelled_on_disconnect(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(inference_scheduler, "DISCONNECT_POLL_INTERVAL", 0.01)
+
+    async def main() -> None:
+        model = FakeModel()
+        model.gate.clear()
+        scheduler = InferenceScheduler(max_batch_size=1)
+        running = asyncio.create_task(scheduler.infer("model", model, text="a"))
+        await wait_until_started(model)
+
+        async def is_disconnected() -> bool:
+            return True
+
+        # 切断されたクライアントのリクエストはキューから取り除かれ、推論されない
+        with pytest.raises(InferenceCancelledError):
+            await scheduler.infer(
+                "model", model, is_disconnected=is_disconnected, text="b"
+            )
+        assert scheduler.queue_depth == 0
+        model.gate.set()
+        await running
+        await asyncio.sleep(0.05)
+        scheduler.shutdown()
+        assert model.calls == [["a"]]
+
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+from style_bert_vits2.nlp.japanese import normalizer
+from style_bert_vits2.nlp.japanese.normalizer import normalize_text
+
+
+# ランダムなテキストを構成する文字の候補 (大半を占めるかなと漢字と句読点、まれに現れる数字や記号等)
+COMMON_CHARS = (
+    "あいうえおかきくけこがぎぐげごさしすせそっゃゅょんアイウエオカキクケコガギグゲゴャュョッンー"
+    "日本語音声合成今天気私人何時"
+    "、。！？「」"
+)
+RARE_CHARS = (
+    "0123456789０１２３４５６７８９,.$¥£€~～〜・·…―—–-−"
+    '：；，．“”‘’"（）()《》【】[]\n \t　'
+    "ABCabcＡＢＣａｂｃαβγΩἀ"
+    "゙゚ｶﾞﾊﾟｱ"
+    "é①㍻㌔!?'#%&*+/<=>@^_`{|}😀"
+)
+SAMPLE_TEXTS = [
+    "",
+    "こんにちは、初めまして。あなたの名前はなんていうの？",
+    "えっ、本当に？それならもっと早く教えてくれればよかったのに……。",
+    "1,100円、$52.34、¥1,000、£3、€4.5",
+    "なるほど…。・・・そうかも···",
+    "あ゛ーーー！！〜～~",
+    "ｶﾞｷﾞｸﾞ　ＡＢＣ　①②③",
+    "「こんにちは」（笑）【注意】《題名》[括弧]",
+]
+
+
+def random_text(rng: random.Random) -> str:
+    length = rng.randint(0, 40)
+    rare_ratio = rng.choice([0.0, 0.0, 0.02, 0.1, 0.5])
+    return "".join(
+        (
+            rng.choice(RARE_CHARS)
+            if rng.random() < rare_ratio
+            else rng.choice(COMMON_CHARS)
+        )
+        for _ in range(length)
+    )
+
+
+@pytest.mark.parametrize("text", SAMPLE_TEXTS)
+def test_normalize_text_samples(text: str):
+    assert normalize_text(text) == normalizer.__normalize_text_full(text)
+
+
+def test_normalize_text_random_corpus():
+    # 高速パスの有無で結果が変わらないことを、乱数で生成した大量のテキストで確認する
+    rng = random.Random(0)
+    for _ in range(50000):
+        text = random_text(rng)
+        assert normalize_text(text) == normalizer.__normalize_text_full(text), text
+
+
+def test_normalize_text_all_bmp_chars():
+    # 高速パスで扱う文字の判定漏れがないよう、BMP の全ての文字をかなや記号と組み合わせて確認する
+    for code in range(0x10000):
+        if 0xD800 <= code <= 0xDFFF:
+            continue
+        char = chr(code)
+        for text in (char, f"か{char}あ{char}{char}", f"ー{char}。{char}ｶ"):
+            assert normalize_text(text) == normalizer.__normalize_text_full(text), repr(
+                text
+            )
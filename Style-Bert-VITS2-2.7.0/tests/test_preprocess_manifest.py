@@ -0,0 +1,78 @@
+from pathlib import Path
+
+from preprocess_manifest import StageManifest, get_manifest_path
+
+
+PARAMS = {"sr": 44100}
+
+
+def run_stage(
+    input_dir: Path, output_dir: Path, params: dict = PARAMS, force: bool = False
+) -> list[str]:
+    # 入力ファイルごとに同名の出力ファイルを書き出すステージとして実行し、処理した入力ファイルを返す
+    manifest = StageManifest(get_manifest_path(output_dir, "test"), output_dir, params)
+    if force:
+        manifest.invalidate()
+    files = {file.name: file for file in sorted(input_dir.iterdir())}
+    pending, skipped = manifest.plan(files)
+    assert skipped == len(files) - len(pending)
+    for key, file, file_hash in pending:
+        output = output_dir / f"{file.stem}.out"
+        output.write_bytes(file.read_bytes())
+        manifest.record(key, file, file_hash, [output])
+    manifest.save()
+    return [key for key, _, _ in pending]
+
+
+def make_dirs(tmp_path: Path) -> tuple[Path, Path]:
+    input_dir = tmp_path / "input"
+    output_dir = tmp_path / "output"
+    input_dir.mkdir()
+    output_dir.mkdir()
+    for name in ["a", "b", "c"]:
+        (input_dir / f"{name}.wav").write_bytes(name.encode())
+    return input_dir, output_dir
+
+
+def test_unchanged_inputs_are_skipped(tmp_path: Path) -> None:
+    input_dir, output_dir = make_dirs(tmp_path)
+    assert run_stage(input_dir, output_dir) == ["a.wav", "b.wav", "c.wav"]
+    assert run_stage(input_dir, output_dir) == []
+    # 内容が同じまま更新日時のみ変わったファイルもスキップする
+    (input_dir / "a.wav").write_bytes(b"a")
+    assert run_stage(input_dir, output_dir) == []
+    # 出力ファイルが失われた入力ファイルは処理し直す
+    (output_dir / "b.out").unlink()
+    assert run_stage(input_dir, output_dir) == ["b.wav"]
+
+
+def test_outputs_of_changed_and_removed_inputs_are_deleted(tmp_path: Path) -> None:
+    input_dir, output_dir = make_dirs(tmp_path)
+    run_stage(input_dir, output_dir)
+    # 変更された入力ファイルは処理し直し、削除された入力ファイルの出力ファイルは削除する
+    (input_dir / "a.wav").write_bytes(b"changed")
+    (input_dir / "c.wav").unlink()
+    manifest = StageManifest(get_manifest_path(output_dir, "test"), output_dir, PARAMS)
+    pending, skipped = manifest.plan({file.name: file for file in input_dir.iterdir()})
+    assert [key for key, _, _ in pending] == ["a.wav"] and skipped == 1
+    assert sorted(p.name for p in output_dir.iterdir()) == ["b.out"]
+
+
+def test_param_change_reprocesses_all_inputs(tmp_path: Path) -> None:
+    input_dir, output_dir = make_dirs(tmp_path)
+    run_stage(input_dir, output_dir)
+    (input_dir / "c.wav").unlink()
+    # パラメータが変わった場合は全て処理し直し、削除された入力ファイルの出力ファイルも削除する
+    assert run_stage(input_dir, output_dir, {"sr": 22050}) == ["a.wav", "b.wav"]
+    assert sorted(p.name for p in output_dir.iterdir()) == ["a.out", "b.out"]
+    assert run_stage(input_dir, output_dir, {"sr": 22050}) == []
+
+
+def test_force_reprocesses_and_deletes_outputs_of_removed_inputs(
+    tmp_path: Path,
+) -> None:
+    input_dir, output_dir = make_dirs(tmp_path)
+    run_stage(input_dir, output_dir)
+    (input_dir / "c.wav").unlink()
+    assert run_stage(input_dir, output_dir, force=True) == ["a.wav", "b.wav"]
+    assert sorted(p.name for p in output_dir.iterdir()) == ["a.out", "b.out"]
@@ -0,0 +1,63 @@
+from pathlib import Path
+
+from preprocess_pipeline import Stage, fingerprint, run_pipeline
+
+
+def test_fingerprint_of_directory(tmp_path: Path) -> None:
+    store_path = tmp_path / "train.bert"
+    store_path.mkdir()
+    (store_path / "index.jsonl").write_text("a\n", encoding="utf-8")
+    # ディレクトリのパスのみを指定した場合も、ファイルがない場合と区別され、ファイルの変更が反映される
+    before = fingerprint([store_path])
+    assert before != fingerprint([tmp_path / "missing"])
+    assert before == fingerprint([(store_path, "**/*")])
+    (store_path / "index.jsonl").write_text("a\nb\n", encoding="utf-8")
+    assert fingerprint([store_path]) != before
+
+
+def test_run_pipeline_skips_up_to_date_stages(tmp_path: Path) -> None:
+    source = tmp_path / "train.list"
+    store_path = tmp_path / "train.bert"
+    source.write_text("1\n", encoding="utf-8")
+    state_path = tmp_path / "preprocess_pipeline.json"
+    runs: list[str] = []
+
+    def gen() -> tuple[bool, str]:
+        runs.append("gen")
+        store_path.mkdir(exist_ok=True)
+        (store_path / "data.bin").write_text(source.read_text(), encoding="utf-8")
+        return True, ""
+
+    def count() -> tuple[bool, str]:
+        runs.append("count")
+        return True, ""
+
+    def make_stages(param: int) -> list[Stage]:
+        return [
+            Stage(
+                "gen",
+                gen,
+                inputs=[source],
+                outputs=[store_path],
+                params={"param": param},
+            ),
+            Stage("count", count, deps=["gen"], inputs=[store_path]),
+        ]
+
+    def run(param: int = 0) -> list[str]:
+        runs.clear()
+        success, reports = run_pipeline(make_stages(param), state_path)
+        assert success
+        return [report.status for report in reports]
+
+    assert run() == ["done", "done"] and runs == ["gen", "count"]
+    # 入力も出力も変わっていなければ全てスキップする
+    assert run() == ["skipped", "skipped"] and runs == []
+    # 入力・パラメータが変わった場合や出力が消された場合は実行し直す
+    source.write_text("2\n", encoding="utf-8")
+    assert run() == ["done", "done"] and runs == ["gen", "count"]
+    # 出力のファイルが書き直されると、それに依存するステージも実行し直す
+    assert run(param=1) == ["done", "done"] and runs == ["gen", "count"]
+    assert run(param=1) == ["skipped", "skipped"] and runs == []
+    (store_path / "data.bin").unlink()
+    assert run(param=1) == ["done", "done"] and runs == ["gen", "count"]
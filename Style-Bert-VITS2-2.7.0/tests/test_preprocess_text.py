@@ -0,0 +1,44 @@
+import pytest
+
+
+try:
+    from preprocess_text import split_train_val
+except Exception as e:
+    pytest.skip(f"preprocess_text is not available: {e}", allow_module_level=True)
+
+
+def make_lines(spk: str, num_utts: int) -> list[str]:
+    return [f"Data/wavs/{spk}_{i}.wav|{spk}|JP|テスト\n" for i in range(num_utts)]
+
+
+def test_small_speakers_keep_training_utterances() -> None:
+    spk_utt_map = {
+        "large": make_lines("large", 10),
+        "small": make_lines("small", 3),
+        "single": make_lines("single", 1),
+    }
+    train_list, val_list = split_train_val(spk_utt_map, 4, 100)
+
+    # 発話が val_per_lang 個以下の話者も、学習用に 1 個以上の発話が残る
+    for spk, num_val in [("large", 4), ("small", 2), ("single", 0)]:
+        assert sum(f"|{spk}|" in line for line in val_list) == num_val
+        assert sum(f"|{spk}|" in line for line in train_list) >= 1
+    assert sorted(train_list + val_list) == sorted(sum(spk_utt_map.values(), []))
+
+
+def test_split_is_stable_when_utterances_are_added() -> None:
+    lines = make_lines("spk", 20)
+    _, val_list = split_train_val({"spk": lines}, 4, 100)
+    assert split_train_val({"spk": lines}, 4, 100)[1] == val_list
+    # 発話を追加しても、既存の発話が学習用からバリデーション用に移ることはない
+    _, new_val_list = split_train_val(
+        {"spk": lines + make_lines("spk", 25)[20:]}, 4, 100
+    )
+    assert len(new_val_list) == 4
+    assert all(line in val_list for line in new_val_list if line in lines)
+
+
+def test_validation_is_capped_by_max_val_total() -> None:
+    spk_utt_map = {spk: make_lines(spk, 10) for spk in ["a", "b", "c"]}
+    train_list, val_list = split_train_val(spk_utt_map, 4, 5)
+    assert len(val_list) == 5 and len(train_list) == 25
@@ -0,0 +1,91 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+
+try:
+    from style_bert_vits2.models.hyper_parameters import HyperParameters
+    from style_bert_vits2.tts_model import TTSModel, TTSModelHolder
+except Exception as e:
+    pytest.skip(f"tts_model is not available: {e}", allow_module_level=True)
+
+
+CONFIG_PATH = Path(__file__).parent.parent / "configs" / "config.json"
+
+
+@pytest.fixture
+def model_holder(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> TTSModelHolder:
+    # 実際の重みは読み込まず、ロード状態のみを切り替える
+    monkeypatch.setattr(TTSModel, "load", lambda self: setattr(self, "net_g", object()))
+    monkeypatch.setattr(TTSModel, "unload", lambda self: setattr(self, "net_g", None))
+    num_styles = HyperParameters.load_from_json(CONFIG_PATH).data.num_styles
+    for name in ("model-a", "model-b"):
+        model_dir = tmp_path / name
+        model_dir.mkdir()
+        shutil.copy(CONFIG_PATH, model_dir / "config.json")
+        np.save(model_dir / "style_vectors.npy", np.zeros((num_styles, 256)))
+        (model_dir / f"{name}.safetensors").write_bytes(b"\0" * 100)
+    return TTSModelHolder(tmp_path, "cpu", [])
+
+
+def get_model(model_holder: TTSModelHolder, name: str) -> TTSModel:
+    return model_holder.get_model(name, str(model_holder.model_files_dict[name][0]))
+
+
+def test_switching_models_without_budget_keeps_one_resident(
+    model_holder: TTSModelHolder,
+) -> None:
+    loaded: list[TTSModel] = []
+    for name in ["model-a", "model-b", "model-a", "model-b"]:
+        model = get_model(model_holder, name)
+        with model_holder.use_model(model):
+            assert model.is_loaded
+        loaded.append(model)
+        # 切り替え前のモデルはアンロードされ、常駐するのは最後に使ったモデルのみ
+        assert model_holder.resident_memory_size == 100
+        assert [m for m in loaded if m.is_loaded] == [model]
+
+
+def test_switched_model_is_unloaded_after_inference(
+    model_holder: TTSModelHolder,
+) -> None:
+    model_a = get_model(model_holder, "model-a")
+    with model_holder.use_model(model_a):
+        # 推論中に切り替えられたモデルは、推論が終わるまでアンロードしない
+        model_b = get_model(model_holder, "model-b")
+        assert model_a.is_loaded
+    assert not model_a.is_loaded
+    with model_holder.use_model(model_b):
+        pass
+    assert model_holder.resident_memory_size == 100
+
+
+def test_resident_instance_is_reused_with_budget(
+    model_holder: TTSModelHolder,
+) -> None:
+    model_holder.memory_budget = 1000
+    model_a = get_model(model_holder, "model-a")
+    model_holder.load_model(model_a)
+    model_holder.load_model(get_model(model_holder, "model-b"))
+    # 上限内であれば両方常駐し、元のモデルに戻すと同じインスタンスが使われる
+    assert model_holder.resident_memory_size == 200
+    assert get_model(model_holder, "model-a") is model_a and model_a.is_loaded
+
+
+def test_model_used_after_switching_is_unloaded_when_idle(
+    model_holder: TTSModelHolder,
+) -> None:
+    # エディターの複数行の合成のように、切り替え前のモデルを続けて使う場合も使い終わればアンロードされる
+    model_a = get_model(model_holder, "model-a")
+    model_b = get_model(model_holder, "model-b")
+    model_holder.acquire_model(model_a)
+    model_holder.acquire_model(model_b)
+    with model_holder.use_model(model_a):
+        pass
+    assert model_a.is_loaded and model_b.is_loaded
+    model_holder.release_model(model_a)
+    model_holder.release_model(model_b)
+    assert not model_a.is_loaded and model_b.is_loaded
+    assert model_holder.resident_memory_size == 100
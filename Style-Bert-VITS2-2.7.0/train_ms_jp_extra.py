@@ -20,8 +20,9 @@ import default_style
 from config import get_config
 from data_utils import (
     DistributedBucketSampler,
+    PackedTextAudioSpeakerLoader,
     TextAudioSpeakerCollate,
-    TextAudioSpeakerLoader,
+    create_dataset,
 )
 from losses import WavLMLoss, discriminator_loss, feature_loss, generator_loss, kl_loss
 from mel_processing import mel_spectrogram_torch, spec_to_mel_torch
@@ -104,6 +105,11 @@ def run():
         help="Don't use custom batch sampler for training, which was used in the version < 2.5",
         action="store_true",
     )
+    parser.add_argument(
+        "--use_packed_dataset",
+        help="Load the training data packed by pack_dataset.py if it is up to date.",
+        action="store_true",
+    )
     args = parser.parse_args()
 
     # Set log file
@@ -218,7 +224,16 @@ def run():
         utils.check_git_hash(model_dir)
         writer = SummaryWriter(log_dir=model_dir)
         writer_eval = SummaryWriter(log_dir=os.path.join(model_dir, "eval"))
-    train_dataset = TextAudioSpeakerLoader(hps.data.training_files, hps.data)
+    train_dataset = create_dataset(
+        hps.data.training_files, hps.data, args.use_packed_dataset
+    )
+    # pack_dataset.py でまとめた学習データはワーカー間で memmap のページを共有するため、ワーカーを増やしてもメモリ消費量はほぼ増えない
+    if isinstance(train_dataset, PackedTextAudioSpeakerLoader):
+        num_workers = max(
+            1, min(config.train_ms_config.num_workers, (os.cpu_count() or 2) // 2)
+        )
+    else:
+        num_workers = 1
     collate_fn = TextAudioSpeakerCollate(use_jp_extra=True)
     if not args.not_use_custom_batch_sampler:
         train_sampler = DistributedBucketSampler(
@@ -231,9 +246,8 @@ def run():
         )
         train_loader = DataLoader(
             train_dataset,
-            # メモリ消費量を減らそうとnum_workersを1にしてみる
-            # num_workers=min(config.train_ms_config.num_workers, os.cpu_count() // 2),
-            num_workers=1,
+            # メモリ消費量を減らそうとnum_workersを1にしてみる (まとめた学習データの場合を除く)
+            num_workers=num_workers,
             shuffle=False,
             pin_memory=True,
             collate_fn=collate_fn,
@@ -254,9 +268,8 @@ def run():
         )
         train_loader = DataLoader(
             train_dataset,
-            # メモリ消費量を減らそうとnum_workersを1にしてみる
-            # num_workers=min(config.train_ms_config.num_workers, os.cpu_count() // 2),
-            num_workers=1,
+            # メモリ消費量を減らそうとnum_workersを1にしてみる (まとめた学習データの場合を除く)
+            num_workers=num_workers,
             # shuffle=True,
             pin_memory=True,
             collate_fn=collate_fn,
@@ -273,7 +286,9 @@ def run():
     eval_dataset = None
     eval_loader = None
     if rank == 0 and not args.speedup:
-        eval_dataset = TextAudioSpeakerLoader(hps.data.validation_files, hps.data)
+        eval_dataset = create_dataset(
+            hps.data.validation_files, hps.data, args.use_packed_dataset
+        )
         eval_loader = DataLoader(
             eval_dataset,
             num_workers=0,
@@ -15,6 +15,8 @@ class TtsConfig:
     output_dir: str = "outputs"
     timeout_sec: float = 30.0
     retry_max: int = 2
+    # 503 (サーバの初期化中 / 混雑中) の間は retry_max に関係なく、この秒数まで待ってから諦める
+    ready_timeout_sec: float = 180.0
     text_limit: int | None = None
 
 
@@ -64,6 +66,13 @@ class TtsClient:
             start = end
         return out
 
+    @staticmethod
+    def _retry_after_sec(response: requests.Response, max_sec: float = 5.0) -> float:
+        try:
+            return min(max(float(response.headers.get("Retry-After", 1)), 0.0), max_sec)
+        except ValueError:
+            return 1.0
+
     def synthesize_to_wav(self, text: str) -> Path:
         if self.cfg.text_limit and len(text) > self.cfg.text_limit:
             text = text[: self.cfg.text_limit]
@@ -78,19 +87,27 @@ class TtsClient:
         if self.cfg.style:
             params["style"] = self.cfg.style
 
-        last_error: Exception | None = None
-        for _ in range(max(self.cfg.retry_max, 1)):
+        deadline = time.monotonic() + self.cfg.ready_timeout_sec
+        attempts = 0
+        while True:
+            attempts += 1
             try:
                 r = requests.post(url, params=params, timeout=self.cfg.timeout_sec)
                 r.raise_for_status()
                 out_path.write_bytes(r.content)
                 return out_path
             except Exception as exc:
-                last_error = exc
-
-        if last_error:
-            raise last_error
-        return out_path
+                # 503: サーバの初期化中 / 混雑中。期限まで Retry-After ずつ待って再試行する
+                response = getattr(exc, "response", None)
+                if response is not None and response.status_code == 503:
+                    wait_sec = self._retry_after_sec(response)
+                    if time.monotonic() + wait_sec >= deadline:
+                        raise
+                    time.sleep(wait_sec)
+                    continue
+                # それ以外のエラーは retry_max 回まで。最後の試行の後は待たずに諦める
+                if attempts >= max(self.cfg.retry_max, 1):
+                    raise
 
     def synthesize_to_wavs(self, text: str) -> list[Path]:
         chunks = self._split_text(text)
@@ -36,6 +36,31 @@ def tts_health_check(base_url: str, timeout_sec: float = 2.0) -> TtsServerStatus
     return TtsServerStatus(ok=False, detail="unreachable")
 
 
+def tts_ready_check(base_url: str, timeout_sec: float = 2.0) -> TtsServerStatus:
+    """/ready による初期化完了の確認。
+
+    サーバは起動直後からリッスンし、BERT やモデルのロードはバックグラウンドで行うため、
+    生存確認 (/health) が通っても音声合成を受け付けられるとは限らない。
+    /ready を持たない古いサーバは、到達できれば準備完了とみなす。
+    """
+    base = (base_url or "").rstrip("/")
+    if not base:
+        return TtsServerStatus(ok=False, detail="base_url is empty")
+    try:
+        r = requests.get(base + "/ready", timeout=timeout_sec)
+    except Exception:
+        return TtsServerStatus(ok=False, detail="unreachable")
+    if r.status_code == 404:
+        return TtsServerStatus(ok=True, detail="ready: /ready not supported")
+    if r.status_code == 200:
+        return TtsServerStatus(ok=True, detail="ready")
+    try:
+        stage = r.json().get("stage", "")
+    except Exception:
+        stage = ""
+    return TtsServerStatus(ok=False, detail=f"not ready ({stage or r.status_code})")
+
+
 def try_start_tts_server(start_cmd: list[str], cwd: Optional[str] = None) -> bool:
     """Best-effort server startup.
 
@@ -59,8 +84,12 @@ def try_start_tts_server(start_cmd: list[str], cwd: Optional[str] = None) -> boo
         return False
 
 
-def ensure_tts_server(base_url: str, start_cmd: list[str], cwd: Optional[str] = None, wait_sec: float = 5.0) -> TtsServerStatus:
-    """起動済みならOK、未起動なら起動を試みて再チェックする。"""
+def ensure_tts_server(base_url: str, start_cmd: list[str], cwd: Optional[str] = None, wait_sec: float = 30.0) -> TtsServerStatus:
+    """起動済みならOK、未起動なら起動を試みて再チェックする。
+
+    サーバがリッスンを開始した時点で返す (モデル等の初期化完了は待たない)。
+    初期化中のリクエストには 503 が返り、TtsClient が Retry-After に従って再試行する。
+    """
     hs = tts_health_check(base_url)
     if hs.ok:
         return hs
@@ -13,7 +13,7 @@ from app.infra.installer import ensure_style_bert_vits2_installed, StyleBertVits
 from app.infra.llm_client import LlmClient, LlmClientConfig
 from app.infra.tts_client import TtsClient, TtsConfig
 from app.infra.audio_player import play_wav_best_effort
-from app.infra.tts_server import ensure_tts_server
+from app.infra.tts_server import ensure_tts_server, tts_ready_check
 
 from app.domain.prompt_builder import PromptBuilder
 from app.domain.memory_manager import MemoryManager
@@ -136,6 +136,9 @@ def main() -> None:
             print("[INFO] TTSサーバへ接続できません。音声出力は無効のまま続行します。")
             print("[INFO] config.yaml の tts.base_url / tts.server_start_cmd を確認してください。")
             return
+        rs = tts_ready_check(conv.settings.tts_base_url)
+        if not rs.ok:
+            print(f"[INFO] TTSサーバは初期化中です: {rs.detail}（準備ができ次第、音声出力されます）")
         try:
             effective_limit = conv.settings.tts_text_limit
             if conv.settings.tts_server_limit and (